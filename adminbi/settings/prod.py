@@ -136,19 +136,24 @@ RQ_DEFAULT_TIMEOUT = int(os.getenv("RQ_DEFAULT_TIMEOUT", 28800))  # 8h por defec
 RQ_RESULT_TTL = int(os.getenv("RQ_RESULT_TTL", 86400))  # 24h
 RQ_FAILURE_TTL = int(os.getenv("RQ_FAILURE_TTL", 86400))  # 24h
 
+_RQ_CONNECTION = {
+    "HOST": "redis",
+    "PORT": 6379,
+    "DB": 0,
+    # Nota: Las tareas ya especifican timeout explícito (p.ej. 7200s). Este DEFAULT_TIMEOUT
+    # es un límite superior por defecto y debe ser >= al timeout especificado en los @job.
+    "DEFAULT_TIMEOUT": RQ_DEFAULT_TIMEOUT,
+    "RESULT_TTL": RQ_RESULT_TTL,
+    "FAILURE_TTL": RQ_FAILURE_TTL,
+    # "JOB_TIMEOUT": RQ_DEFAULT_TIMEOUT,  # Opcional: mantener igual al default
+    "CONNECTION_TIMEOUT": 30,
+}
+
+# 'default' se mantiene para jobs ya encolados y tareas programadas; las demás
+# son las clases de scripts.services.task_queues, cada una con su pool de workers.
 RQ_QUEUES = {
-    "default": {
-        "HOST": "redis",
-        "PORT": 6379,
-        "DB": 0,
-        # Nota: Las tareas ya especifican timeout explícito (p.ej. 7200s). Este DEFAULT_TIMEOUT
-        # es un límite superior por defecto y debe ser >= al timeout especificado en los @job.
-        "DEFAULT_TIMEOUT": RQ_DEFAULT_TIMEOUT,
-        "RESULT_TTL": RQ_RESULT_TTL,
-        "FAILURE_TTL": RQ_FAILURE_TTL,
-        # "JOB_TIMEOUT": RQ_DEFAULT_TIMEOUT,  # Opcional: mantener igual al default
-        "CONNECTION_TIMEOUT": 30,
-    },
+    name: dict(_RQ_CONNECTION)
+    for name in ("default", "interactive", "bulk_load", "long_extract", "external_wait")
 }
 
 
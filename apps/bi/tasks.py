@@ -11,6 +11,8 @@ from typing import Dict, Any, Optional, Callable, TypeVar
 from django_rq import job
 from rq import get_current_job
 
+from scripts.services.task_queues import QUEUE_EXTERNAL_WAIT
+
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
@@ -36,7 +38,7 @@ T = TypeVar("T")
 ResultDict = Dict[str, Any]
 
 
-@job("default", timeout=DEFAULT_TIMEOUT)
+@job(QUEUE_EXTERNAL_WAIT, timeout=DEFAULT_TIMEOUT)
 def actualiza_bi_task(
     database_name: str,
     IdtReporteIni: str,
@@ -15,7 +15,9 @@ from apps.home.tasks import (
     cargue_maestras_task,
     cargue_tabla_individual_task,
     cargue_infoproducto_task,
+    enqueue_task,
 )
+from scripts.services.task_queues import QueueAdmissionError
 from scripts.config import ConfigBasic
 from scripts.StaticPage import StaticPage, DinamicPage
 import re
@@ -83,7 +85,7 @@ class UploadZipView(BaseView):
             # cargue_zip = CargueZip(database_name)
             # cargue_zip.procesar_zip()
             print("aqui estoy listo para iniciar la tarea asicrona")
-            task = cargue_zip_task.delay(database_name, zip_file_path)
+            task = enqueue_task(cargue_zip_task, database_name, zip_file_path)
 
             # Guardamos el ID de la tarea en la sesión del usuario
             request.session["task_id"] = task.id
@@ -180,7 +182,7 @@ class UploadPlanoFilesView(BaseView):
 
         try:
             print("aqui estoy listo para iniciar la tarea asicrona")
-            task = cargue_plano_task.delay(database_name)
+            task = enqueue_task(cargue_plano_task, database_name)
             # Guardamos el ID de la tarea en la sesión del usuario
             request.session["task_id"] = task.id
             return JsonResponse(
@@ -371,7 +373,8 @@ class ReporteGenericoCarguePage(BaseView):
             del excel_file  # Eliminar referencia para evitar problemas de pickle
 
             # Lanzar tarea asíncrona
-            task = self.task_func.delay(
+            task = enqueue_task(
+                self.task_func,
                 temp_path,
                 database_name,
                 IdtReporteIni,
@@ -531,13 +534,15 @@ class UploadMaestrasView(ReporteGenericoCarguePage):
             # Determinar tipo de carga y lanzar tarea
             if len(tablas_seleccionadas) == 1:
                 tabla = tablas_seleccionadas[0]
-                task = cargue_tabla_individual_task.delay(
+                task = enqueue_task(
+                    cargue_tabla_individual_task,
                     database_name=database_name,
                     nombre_tabla=tabla
                 )
                 task_description = f'Carga de tabla {tabla}'
             else:
-                task = cargue_maestras_task.delay(
+                task = enqueue_task(
+                    cargue_maestras_task,
                     database_name=database_name,
                     tablas_seleccionadas=tablas_seleccionadas
                 )
@@ -740,11 +745,21 @@ class UploadInfoProductoView(BaseView):
             messages.error(request, mensaje)
             return self.get(request, *args, **kwargs)
 
-        tarea = cargue_infoproducto_task.delay(
-            database_name=database_name,
-            fecha_reporte=fecha_reporte,
-            archivos=archivos_preparados,
-        )
+        try:
+            tarea = enqueue_task(
+                cargue_infoproducto_task,
+                database_name=database_name,
+                fecha_reporte=fecha_reporte,
+                archivos=archivos_preparados,
+            )
+        except QueueAdmissionError as exc:
+            if is_ajax:
+                return JsonResponse(
+                    {"success": False, "error": str(exc), "running_task_id": exc.job_id},
+                    status=429,
+                )
+            messages.error(request, str(exc))
+            return self.get(request, *args, **kwargs)
 
         request.session["task_id"] = tarea.id
 
@@ -947,13 +962,15 @@ class CargueArchivosMaestrosView(BaseView):
             # Lanzar tarea
             if len(tablas_seleccionadas) == 1:
                 tabla = tablas_seleccionadas[0]
-                task = cargue_tabla_individual_task.delay(
+                task = enqueue_task(
+                    cargue_tabla_individual_task,
                     database_name=database_name,
                     nombre_tabla=tabla
                 )
                 task_description = f'Carga de tabla {tabla}'
             else:
-                task = cargue_maestras_task.delay(
+                task = enqueue_task(
+                    cargue_maestras_task,
                     database_name=database_name,
                     tablas_seleccionadas=tablas_seleccionadas
                 )
@@ -1038,11 +1055,21 @@ class CargueArchivosMaestrosView(BaseView):
             messages.error(request, mensaje)
             return self.get(request)
 
-        tarea = cargue_infoproducto_task.delay(
-            database_name=database_name,
-            fecha_reporte=fecha_reporte,
-            archivos=archivos_preparados,
-        )
+        try:
+            tarea = enqueue_task(
+                cargue_infoproducto_task,
+                database_name=database_name,
+                fecha_reporte=fecha_reporte,
+                archivos=archivos_preparados,
+            )
+        except QueueAdmissionError as exc:
+            if is_ajax:
+                return JsonResponse(
+                    {"success": False, "error": str(exc), "running_task_id": exc.job_id},
+                    status=429,
+                )
+            messages.error(request, str(exc))
+            return self.get(request)
 
         request.session["task_id"] = tarea.id
 
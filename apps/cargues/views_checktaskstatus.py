@@ -7,6 +7,8 @@ from django_rq import get_connection
 import time
 import os
 import traceback
+from scripts.services.job_progress import job_progress_meta
+from scripts.services.result_envelope import attach_detached
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -38,7 +40,7 @@ class CheckCargueTaskStatusView(View):
             job = Job.fetch(task_id, connection=connection)
             print(f"[CHECKTASKSTATUS] Job status: {job.get_status()} | job_id={job.id}")
             if job.is_finished:
-                result = job.result
+                result = attach_detached(job.result)
                 print(f"[CHECKTASKSTATUS] Job terminado. Resultado: {result}")
                 job_info = {
                     "execution_time": (
@@ -105,14 +107,15 @@ class CheckCargueTaskStatusView(View):
                 progress = 0
                 stage = "En cola"
                 meta = {}
-                if hasattr(job, "meta") and job.meta:
-                    meta = job.meta.copy()
-                    if "progress" in job.meta:
-                        progress = job.meta.get("progress")
-                    if "stage" in job.meta:
-                        stage = job.meta.get("stage")
-                    if "status" in job.meta:
-                        stage = job.meta.get("status")
+                job_meta = job_progress_meta(job)
+                if job_meta:
+                    meta = job_meta.copy()
+                    if "progress" in job_meta:
+                        progress = job_meta.get("progress")
+                    if "stage" in job_meta:
+                        stage = job_meta.get("stage")
+                    if "status" in job_meta:
+                        stage = job_meta.get("status")
                 elapsed_time = 0
                 if job.started_at:
                     elapsed_time = time.time() - job.started_at.timestamp()
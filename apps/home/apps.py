@@ -6,16 +6,37 @@ class HomeConfig(AppConfig):
     name = 'apps.home'
 
     def ready(self):
+        # Precalentar la configuración de empresas al arrancar workers y servidores web.
+        # CONFIG_PREWARM=1 lo fuerza en cualquier proceso; CONFIG_PREWARM=0 lo desactiva.
+        import os
+        import sys
+
+        argv0 = os.path.basename(sys.argv[0]) if sys.argv else ""
+        server = (
+            "rqworker" in sys.argv
+            or "rqpool" in sys.argv
+            or argv0.startswith(("gunicorn", "uwsgi"))
+            # uWSGI expone el módulo ``uwsgi`` solo dentro de sus procesos.
+            or "uwsgi" in sys.modules
+        )
+        if server or os.getenv("CONFIG_PREWARM") == "1":
+            from scripts.config import prewarm_default_service_async
+
+            prewarm_default_service_async()
+
         # Programar limpieza periódica de media/ con django-rq-scheduler
         try:
             from django_rq import get_scheduler
             from datetime import datetime, timedelta
-            from apps.home.views import clean_old_media_files
+            from apps.home.utils import clean_old_media_files
 
             scheduler = get_scheduler('default')
             # Evita duplicados: elimina trabajos previos de limpieza
             for job in scheduler.get_jobs():
-                if job.func_name == 'apps.home.views.clean_old_media_files':
+                if job.func_name in (
+                    'apps.home.views.clean_old_media_files',
+                    'apps.home.utils.clean_old_media_files',
+                ):
                     scheduler.cancel(job)
             # Programa la tarea cada hora
             scheduler.schedule(
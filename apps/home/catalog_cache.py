@@ -0,0 +1,204 @@
+"""Caché compartida de los catálogos maestros (agencias, categorías, marcas, productos).
+
+Las páginas de Venta Cero, Rutero, Preventa y Faltantes consultaban
+``SELECT DISTINCT ... ORDER BY`` en MariaDB en cada carga, en cada lookup
+AJAX y en cada validación del POST. Estos catálogos cambian como mucho una
+vez al día, así que se cargan completos una sola vez por origen y se
+guardan en Redis (caché de Django) como un :class:`Catalog`:
+
+* los ítems en el orden del ``ORDER BY`` original;
+* un índice de prefijos: arreglo ordenado de textos normalizados (código y
+  cada palabra de la etiqueta, sin tildes ni mayúsculas) que se recorre con
+  ``bisect``, de modo que el *typeahead* no toca la base;
+* el conjunto de códigos para validar los valores del POST.
+
+Cada proceso conserva además los catálogos ya deserializados en una
+``TTLCache`` local indexada por la clave versionada, así un lookup cuesta
+una lectura de la versión en Redis.
+
+El ``scope`` de la clave es el origen de los datos, no la empresa: los
+catálogos de ``powerbi_bimbo`` son tablas compartidas que ningún proceso de
+esta aplicación carga, así que todas las empresas servidas por el mismo
+servidor comparten una copia. Para no depender de un aviso de quien las
+carga, cada catálogo guarda una firma de su tabla de origen
+(:func:`table_checksum`) que se compara como mucho cada
+``CATALOG_SOURCE_CHECK_SECONDS`` (5 min por defecto) en todo el despliegue;
+si cambió se incrementa la versión del ``scope`` y se recarga. El TTL
+(``CATALOG_CACHE_TTL``, 24 h por defecto) es el último respaldo.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from cachetools import TTLCache  # type: ignore[import]
+from django.core.cache import cache
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TTL", 24 * 60 * 60))
+CATALOG_SOURCE_CHECK_SECONDS = int(os.getenv("CATALOG_SOURCE_CHECK_SECONDS", 5 * 60))
+_VERSION_KEY = "catalog_version:{scope}"
+_DATA_KEY = "catalog:{version}:{scope}:{name}"
+_CHECK_KEY = "catalog_checked:{scope}:{name}"
+
+_local_catalogs: TTLCache = TTLCache(maxsize=256, ttl=300)
+_local_lock = threading.Lock()
+
+CatalogLoader = Callable[[], Iterable[Dict[str, str]]]
+SignatureLoader = Callable[[], object]
+
+
+def normalize(value: object) -> str:
+    """Texto comparable: sin tildes, en minúsculas y sin espacios sobrantes."""
+
+    text = unicodedata.normalize("NFKD", str(value or ""))
+    return "".join(c for c in text if not unicodedata.combining(c)).casefold().strip()
+
+
+class Catalog:
+    """Ítems ``{"id", "label"}`` de un catálogo con índice de prefijos."""
+
+    __slots__ = ("items", "_keys", "_positions", "_ids", "signature")
+
+    def __init__(self, items: Iterable[Dict[str, str]], signature: object = None) -> None:
+        # Firma de la tabla de origen al cargar (ver :func:`table_checksum`).
+        self.signature = signature
+        self.items: Tuple[Dict[str, str], ...] = tuple(
+            {"id": str(item["id"]), "label": str(item["label"])} for item in items
+        )
+        entries = set()
+        for pos, item in enumerate(self.items):
+            entries.add((normalize(item["id"]), pos))
+            label = normalize(item["label"])
+            entries.add((label, pos))
+            for word in label.split()[1:]:
+                entries.add((word, pos))
+        ordered = sorted(entries)
+        self._keys: List[str] = [key for key, _ in ordered]
+        self._positions: List[int] = [pos for _, pos in ordered]
+        self._ids: FrozenSet[str] = frozenset(normalize(item["id"]) for item in self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def search(self, prefix: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """Ítems cuyo código o alguna palabra de la etiqueta empieza por ``prefix``.
+
+        Sin ``prefix`` retorna los primeros ``limit`` ítems; los resultados
+        conservan el orden del catálogo.
+        """
+
+        needle = normalize(prefix)
+        if not needle:
+            return list(self.items[:limit] if limit else self.items)
+        start = bisect_left(self._keys, needle)
+        matches = set()
+        for idx in range(start, len(self._keys)):
+            if not self._keys[idx].startswith(needle):
+                break
+            matches.add(self._positions[idx])
+        ordered = sorted(matches)
+        if limit:
+            ordered = ordered[:limit]
+        return [self.items[pos] for pos in ordered]
+
+    def contains(self, value: object) -> bool:
+        """¿Existe el código? Sin distinguir mayúsculas ni tildes, como la collation ``_ci``."""
+
+        return normalize(value) in self._ids
+
+
+def _data_key(scope: str, name: str) -> str:
+    version = cache.get(_VERSION_KEY.format(scope=scope), 0)
+    return _DATA_KEY.format(version=version, scope=scope, name=name)
+
+
+def table_checksum(engine, table: str) -> object:
+    """Firma de ``table`` con ``CHECKSUM TABLE`` (las tablas de catálogo son pequeñas)."""
+
+    with engine.connect() as conn:
+        row = conn.execute(text(f"CHECKSUM TABLE {table}")).fetchone()
+    return None if row is None else row[1]
+
+
+def _source_changed(scope: str, name: str, catalog: Catalog, signature: SignatureLoader) -> bool:
+    """¿Cambió la tabla de origen? Solo un proceso la consulta por intervalo."""
+
+    try:
+        if not cache.add(_CHECK_KEY.format(scope=scope, name=name), 1, CATALOG_SOURCE_CHECK_SECONDS):
+            return False
+        current = signature()
+    except Exception as exc:
+        logger.warning("No se pudo verificar el origen del catálogo %s de %s: %s", name, scope, exc)
+        return False
+    if current == getattr(catalog, "signature", None):
+        return False
+    logger.info("Catálogo %s de %s cambió en el origen; se recarga", name, scope)
+    return True
+
+
+def get_catalog(
+    scope: str,
+    name: str,
+    loader: CatalogLoader,
+    signature: Optional[SignatureLoader] = None,
+) -> Catalog:
+    """Catálogo ``name`` del origen ``scope``; ``loader`` solo se llama si no está en caché.
+
+    Con ``signature`` se recarga cuando la firma del origen cambia (ver el
+    docstring del módulo).
+    """
+
+    key = _data_key(scope, name)
+    with _local_lock:
+        catalog = _local_catalogs.get(key)
+    if catalog is None:
+        try:
+            catalog = cache.get(key)
+        except Exception as exc:
+            logger.warning("No se pudo leer el catálogo %s de %s: %s", name, scope, exc)
+            catalog = None
+    if catalog is not None and signature is not None and _source_changed(scope, name, catalog, signature):
+        # Versión nueva: los demás procesos dejan de usar su copia local.
+        bump_catalog_version(scope)
+        key = _data_key(scope, name)
+        catalog = None
+    if catalog is None:
+        start = time.perf_counter()
+        # La firma se toma antes de leer: un cambio durante la carga se ve en la próxima verificación.
+        source = None
+        if signature is not None:
+            try:
+                source = signature()
+            except Exception as exc:
+                logger.warning("No se pudo firmar el origen del catálogo %s de %s: %s", name, scope, exc)
+        catalog = Catalog(loader(), source)
+        logger.info(
+            "Catálogo %s de %s cargado: %s ítems en %.2fs",
+            name,
+            scope,
+            len(catalog),
+            time.perf_counter() - start,
+        )
+        try:
+            cache.set(key, catalog, CATALOG_CACHE_TIMEOUT)
+        except Exception as exc:
+            logger.warning("No se pudo guardar el catálogo %s de %s: %s", name, scope, exc)
+    with _local_lock:
+        _local_catalogs[key] = catalog
+    return catalog
+
+
+def bump_catalog_version(scope: str) -> None:
+    """Invalida los catálogos de ``scope``."""
+
+    # time_ns evita reutilizar una versión antigua si la clave fue desalojada.
+    cache.set(_VERSION_KEY.format(scope=scope), time.time_ns(), None)
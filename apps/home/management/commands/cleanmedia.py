@@ -1,6 +1,6 @@
 import logging
 from django.core.management.base import BaseCommand
-from apps.home.views import clean_old_media_files
+from apps.home.utils import clean_old_media_files
 
 logger = logging.getLogger(__name__)
 
@@ -0,0 +1,55 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scripts.conexion import Conexion as con
+from scripts.config import ConfigBasic
+from scripts.services.calendar_service import CalendarService
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Materializa la tabla dim_calendario (días hábiles y festivos de Colombia) en la base BI de una empresa."
+
+    def add_arguments(self, parser):
+        parser.add_argument("database_name", help="Nombre (name) de la empresa en conf_empresas")
+        parser.add_argument("--desde", type=int, default=2015, help="Año inicial (default: 2015)")
+        parser.add_argument("--hasta", type=int, default=2035, help="Año final (default: 2035)")
+        parser.add_argument(
+            "--sin-sabados",
+            action="store_true",
+            help="No considerar los sábados como días hábiles",
+        )
+        parser.add_argument(
+            "--tabla", default="dim_calendario", help="Nombre de la tabla destino"
+        )
+
+    def handle(self, *args, **options):
+        database_name = options["database_name"]
+        config = ConfigBasic(database_name).config
+        required_keys = ["nmUsrIn", "txPassIn", "hostServerIn", "portServerIn", "dbBi"]
+        if not all(config.get(key) for key in required_keys):
+            raise CommandError(f"Configuración de conexión BI incompleta para {database_name}")
+
+        engine = con.ConexionMariadb3(
+            str(config["nmUsrIn"]),
+            str(config["txPassIn"]),
+            str(config["hostServerIn"]),
+            int(config["portServerIn"]),
+            str(config["dbBi"]),
+        )
+        service = CalendarService(incluir_sabados=not options["sin_sabados"])
+        try:
+            filas = service.materializar_dim_calendario(
+                engine, options["desde"], options["hasta"], tabla=options["tabla"]
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{options['tabla']} generada en {config['dbBi']}: {filas} filas "
+                f"({options['desde']}-{options['hasta']})"
+            )
+        )
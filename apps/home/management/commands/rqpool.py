@@ -0,0 +1,24 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from scripts.services.task_queues import POOL_ALL, QUEUE_CLASSES, worker_queues
+
+
+class Command(BaseCommand):
+    help = (
+        "Inicia un worker RQ del pool de una clase de cola (interactive, bulk_load, long_extract, "
+        "external_wait) o de todas (all, para desarrollo local)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("pool", choices=sorted([*QUEUE_CLASSES, POOL_ALL]), help="Clase de cola del pool")
+        parser.add_argument(
+            "--with-scheduler",
+            action="store_true",
+            help="Procesa también los jobs programados de las colas del pool",
+        )
+
+    def handle(self, *args, **options):
+        queues = worker_queues(options["pool"])
+        self.stdout.write(f"Pool {options['pool']}: atendiendo colas {', '.join(queues)}")
+        call_command("rqworker", *queues, with_scheduler=options["with_scheduler"])
@@ -0,0 +1,275 @@
+"""Caché de artefactos de reportes indexada por parámetros.
+
+Cuando un usuario vuelve a pedir el mismo reporte (misma empresa, mismo
+rango y mismos filtros de permisos) se reutiliza el archivo ya generado en
+lugar de encolar otra tarea. La clave combina:
+
+* el nombre de la tarea y sus parámetros normalizados,
+* los filtros de permisos del usuario (``proveedores``/``macrozonas``), que
+  cambian el contenido del reporte aunque los parámetros sean iguales,
+* una versión de datos por empresa que se incrementa al terminar los cargues
+  (``extrae_bi_task``, ``cargue_zip_task``, ``cargue_infoventas_task``).
+
+Igual que en ``apps.users.empresas_cache``, invalidar es solo incrementar la
+versión: las entradas viejas dejan de leerse y expiran solas.
+
+La vista entrega al cliente un token ``report-cache:<digest>`` en lugar de un
+``job_id``; ``CheckTaskStatusView`` lo reconoce y responde de inmediato con el
+resultado guardado. Como el resultado del job, la entrada se guarda reducida
+(``scripts.services.result_envelope``).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.core.cache import cache
+
+from scripts.services.result_envelope import detach_large_parts
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_TIMEOUT = int(os.getenv("REPORT_CACHE_TTL", 30 * 60))
+TOKEN_PREFIX = "report-cache:"
+_VERSION_KEY = "report_cache_version:{database_name}"
+_ENTRY_KEY = "report_cache:{digest}"
+
+ParamsBuilder = Callable[..., Tuple[str, Optional[int], Dict[str, Any]]]
+
+
+def _periodo_params(
+    database_name,
+    IdtReporteIni,
+    IdtReporteFin,
+    user_id,
+    report_id,
+    batch_size=None,
+):
+    # batch_size no cambia el contenido del archivo.
+    return database_name, user_id, {
+        "ini": IdtReporteIni,
+        "fin": IdtReporteFin,
+        "report_id": report_id,
+    }
+
+
+def _venta_cero_params(
+    database_name,
+    ceves_code,
+    IdtReporteIni,
+    IdtReporteFin,
+    user_id,
+    procedure_name,
+    filter_type,
+    filter_value,
+    extra_params=None,
+    batch_size=None,
+):
+    return database_name, user_id, {
+        "ceves_code": ceves_code,
+        "ini": IdtReporteIni,
+        "fin": IdtReporteFin,
+        "procedure": procedure_name,
+        "filter_type": filter_type,
+        "filter_value": filter_value,
+        "extra_params": extra_params or {},
+    }
+
+
+def _preventa_params(
+    database_name,
+    ceves_code,
+    IdtReporteIni,
+    IdtReporteFin,
+    user_id,
+    batch_size=None,
+):
+    return database_name, user_id, {
+        "ceves_code": ceves_code,
+        "ini": IdtReporteIni,
+        "fin": IdtReporteFin,
+    }
+
+
+def _faltantes_params(
+    database_name,
+    ceves_code,
+    IdtReporteIni,
+    IdtReporteFin,
+    user_id,
+    filter_type,
+    filter_value,
+    extra_params=None,
+    batch_size=None,
+):
+    return database_name, user_id, {
+        "ceves_code": ceves_code,
+        "ini": IdtReporteIni,
+        "fin": IdtReporteFin,
+        "filter_type": filter_type,
+        "filter_value": filter_value,
+        "extra_params": extra_params or {},
+    }
+
+
+# Tareas cuyo resultado es un archivo determinado solo por sus parámetros.
+_PARAMS_BUILDERS: Dict[str, ParamsBuilder] = {
+    "cubo_ventas_task": _periodo_params,
+    "interface_task": _periodo_params,
+    "interface_siigo_task": _periodo_params,
+    "matrix_task": _periodo_params,
+    "venta_cero_task": _venta_cero_params,
+    # Dashboards: el resultado lleva además KPIs y la matriz paginada.
+    "preventa_task": _preventa_params,
+    "faltantes_task": _faltantes_params,
+}
+
+
+def is_cacheable(task_name: str) -> bool:
+    return task_name in _PARAMS_BUILDERS
+
+
+def is_token(task_id: Optional[str]) -> bool:
+    return bool(task_id) and str(task_id).startswith(TOKEN_PREFIX)
+
+
+def permission_filters(database_name: str, user_id: Optional[int]) -> Dict[str, Any]:
+    """Filtros de permisos resueltos del usuario: lo que distingue su reporte del de otro."""
+
+    from scripts.config import ConfigBasic
+
+    config = ConfigBasic(database_name, user_id).config
+    return {
+        "proveedores": sorted(str(p) for p in config.get("proveedores") or []),
+        "macrozonas": sorted(str(m) for m in config.get("macrozonas") or []),
+    }
+
+
+def _data_version(database_name: str) -> int:
+    return cache.get(_VERSION_KEY.format(database_name=database_name), 0)
+
+
+def build_digest(task_name: str, *args: Any, **kwargs: Any) -> Optional[str]:
+    """Digest de la llamada ``task_name(*args, **kwargs)`` o ``None`` si no aplica.
+
+    Recibe exactamente los mismos argumentos que ``task.delay``, así la vista y
+    la tarea calculan la misma clave.
+    """
+
+    builder = _PARAMS_BUILDERS.get(task_name)
+    if builder is None:
+        return None
+    database_name, user_id, params = builder(*args, **kwargs)
+    if not database_name:
+        return None
+    payload = {
+        "task": task_name,
+        "database_name": database_name,
+        "version": _data_version(database_name),
+        "params": params,
+        "filters": permission_filters(database_name, user_id),
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _artifact_signature(file_path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def store(digest: str, result: Dict[str, Any]) -> None:
+    """Guarda el resultado exitoso junto con la firma del archivo generado."""
+
+    file_path = result.get("file_path")
+    if not result.get("success") or not file_path:
+        return
+    signature = _artifact_signature(file_path)
+    if signature is None:
+        return
+    entry = {"result": result, "signature": signature, "stored_at": time.time()}
+    cache.set(_ENTRY_KEY.format(digest=digest), entry, REPORT_CACHE_TIMEOUT)
+
+
+def _load(digest: str) -> Optional[Dict[str, Any]]:
+    entry = cache.get(_ENTRY_KEY.format(digest=digest))
+    if not entry:
+        return None
+    result = entry["result"]
+    # Si el archivo se borró o se sobrescribió con otro contenido (p. ej. por
+    # la limpieza de media/), la entrada deja de ser válida.
+    if _artifact_signature(result.get("file_path", "")) != tuple(entry["signature"]):
+        cache.delete(_ENTRY_KEY.format(digest=digest))
+        return None
+    return result
+
+
+def lookup(task_name: str, *args: Any, **kwargs: Any) -> Optional[str]:
+    """Token del resultado guardado para esta llamada, o ``None`` si hay que encolar."""
+
+    try:
+        digest = build_digest(task_name, *args, **kwargs)
+    except Exception as exc:
+        logger.warning("No se pudo calcular la clave de caché de %s: %s", task_name, exc)
+        return None
+    if digest is None or _load(digest) is None:
+        return None
+    return f"{TOKEN_PREFIX}{digest}"
+
+
+def get_cached_result(token: str) -> Optional[Dict[str, Any]]:
+    if not is_token(token):
+        return None
+    result = _load(token[len(TOKEN_PREFIX):])
+    if result is None:
+        return None
+    return {**result, "cached": True}
+
+
+def bump_data_version(database_name: str) -> None:
+    """Invalida los reportes de la empresa tras un cargue de datos."""
+
+    # time_ns evita reutilizar una versión antigua si la clave fue desalojada.
+    cache.set(_VERSION_KEY.format(database_name=database_name), time.time_ns(), None)
+
+
+def cache_report_result(f: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+    """Decorador para tareas RQ: guarda el resultado exitoso en la caché.
+
+    La clave se calcula al *iniciar* la tarea, de modo que un cargue que
+    termine mientras el reporte corre deja la entrada en una versión vieja.
+    """
+
+    task_name = f.__name__
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        try:
+            digest = build_digest(task_name, *args, **kwargs)
+        except Exception as exc:
+            logger.warning("No se pudo calcular la clave de caché de %s: %s", task_name, exc)
+            digest = None
+
+        result = f(*args, **kwargs)
+
+        if digest and isinstance(result, dict) and result.get("success"):
+            # La entrada también vive en Redis: se guarda (y se retorna) ya
+            # sin la previsualización ni el dashboard, que van a un artefacto.
+            _, user_id, _ = _PARAMS_BUILDERS[task_name](*args, **kwargs)
+            result = detach_large_parts(result, name=f"{task_name}_{digest[:12]}_resultado", owner=user_id)
+            try:
+                store(digest, result)
+            except Exception as exc:
+                logger.warning("No se pudo guardar %s en la caché de reportes: %s", task_name, exc)
+        return result
+
+    return wrapper
@@ -1,5 +1,7 @@
 import os
 import time
+import uuid
+import inspect
 import logging
 import traceback
 from datetime import datetime
@@ -7,8 +9,9 @@ from functools import wraps
 from typing import Dict, Any, Optional, Callable, TypeVar, List
 
 # RQ Imports
-from django_rq import job
+from django_rq import get_connection, get_queue, job
 from rq import get_current_job
+from rq.job import Job
 
 # Project Script Imports
 from scripts.extrae_bi.cubo import CuboVentas
@@ -29,6 +32,28 @@ from scripts.extrae_bi.cargue_maestras import cargar_tablas_maestras, cargar_tab
 from scripts.extrae_bi.cargue_plano_tsol import CarguePlano
 from scripts.extrae_bi.extrae_bi_insert import ExtraeBiConfig, ExtraeBiExtractor
 from apps.home.utils import clean_old_media_files
+from apps.home.report_cache import bump_data_version, cache_report_result, permission_filters
+from scripts.services.job_progress import TERMINAL_STATUSES, release_reporter, reporter_for
+from scripts.services.result_envelope import detach_large_parts
+from scripts.services.row_estimator import RunHistory
+from scripts.services import task_telemetry
+from apps.monitor.telemetry import record_task_run
+from scripts.services.task_queues import (
+    ADMISSION_GRACE_SECONDS,
+    QUEUE_BULK_LOAD,
+    QUEUE_CLASSES,
+    QUEUE_INTERACTIVE,
+    QUEUE_LONG_EXTRACT,
+    SIZE_AWARE_TASKS,
+    CompanyAdmission,
+    admit,
+    claim_job,
+    date_span_days,
+    release_claims,
+    release_on_failure,
+    release_on_success,
+    route_task,
+)
 
 # Configuración de logging
 logger = logging.getLogger(__name__)
@@ -63,10 +88,15 @@ def update_job_progress(
     progress: int,
     status: str = "processing",  # Cambiado default a 'processing'
     meta: Optional[Dict[str, Any]] = None,
+    force: bool = False,
 ) -> None:
     """
     Actualiza el progreso y metadatos de un trabajo RQ en ejecución.
     Intenta obtener el job actual si no se proporciona job_id.
+
+    Las llamadas se agrupan (ver ``scripts.services.job_progress``): solo se
+    escriben en Redis los campos que cambiaron, con un intervalo y un avance
+    mínimos, salvo en cambios de etapa/estado o con ``force=True``.
     """
     current_job = get_current_job()
     target_job_id = job_id or (current_job.id if current_job else None)
@@ -82,53 +112,101 @@ def update_job_progress(
         current_job if current_job and current_job.id == target_job_id else None
     )
 
-    print(
-        f"[update_job_progress] job_id={job_id}, progress={progress}, status={status}, meta={meta}"
-    )
     if job_to_update:
-        if not meta:
-            meta = {}
-        print(f"[update_job_progress] Updating job meta for job_id={target_job_id}")
-        # Asegurar que 'status' y 'progress' estén en meta para RQ
-        # Usar meta.get para evitar sobreescribir valores existentes si no se proporcionan nuevos
-        current_meta = job_to_update.meta or {}
-        updated_meta = {
-            **current_meta,  # Mantener meta existente
-            **meta,  # Añadir/Sobreescribir con nuevos meta
-            "progress": max(0, min(100, progress)),
-            "status": status,
-            "updated_at": time.time(),
-        }
-        job_to_update.meta.update(updated_meta)
-        try:
-            job_to_update.save_meta()
-            print(
-                f"[update_job_progress] Meta saved for job_id={target_job_id}: progress={updated_meta.get('progress')}% status={status}"
-            )
+        reporter = reporter_for(job_to_update)
+        if reporter.update(progress, status, meta, force=force):
             logger.debug(
-                f"RQ Job {target_job_id} progress updated: {status} - {updated_meta.get('progress')}%"
-            )
-        except Exception as e:
-            print(
-                f"[update_job_progress] Error saving meta for job_id={target_job_id}: {e}"
+                f"RQ Job {target_job_id} progress updated: {status} - {progress}%"
             )
-            logger.error(f"Error al guardar meta para RQ Job {target_job_id}: {e}")
+        if status in TERMINAL_STATUSES:
+            release_reporter(target_job_id)
     else:
-        print(
-            f"[update_job_progress] No job found to update for job_id={target_job_id}"
-        )
         # Si no estamos en el job actual (poco común para progreso), necesitaríamos fetch el job
         # Esto es menos eficiente y generalmente no necesario para updates de progreso
         logger.warning(
             f"Intento de actualizar progreso para Job {target_job_id} fuera de su contexto directo."
         )
-        # Podría implementarse fetching el job por ID si es estrictamente necesario
+
+
+def _call_arguments(f: Callable[..., Any], args, kwargs) -> Dict[str, Any]:
+    """Argumentos de la llamada por nombre (vacío si no calzan con la firma)."""
+    try:
+        return dict(inspect.signature(f).bind_partial(*args, **kwargs).arguments)
+    except TypeError:
+        return {}
+
+
+def _result_owner(f: Callable[..., Any], args, kwargs) -> Optional[int]:
+    """``user_id`` de la llamada, dueño de los artefactos que genere el resultado."""
+    return _call_arguments(f, args, kwargs).get("user_id")
+
+
+def _slim_result(job, task_name: str, f: Callable[..., Any], args, kwargs, result):
+    """Saca de Redis las partes grandes del resultado (ver scripts.services.result_envelope)."""
+    if not job:
+        # Ejecución síncrona: el resultado no pasa por Redis.
+        return result
+    return detach_large_parts(
+        result,
+        name=f"{task_name}_{job.id}_resultado",
+        owner=_result_owner(f, args, kwargs),
+    )
+
+
+def _result_rows(result) -> int:
+    metadata = result.get("metadata")
+    return (metadata.get("total_records") if isinstance(metadata, dict) else None) or 0
+
+
+def _result_bytes(result) -> int:
+    path = result.get("file_path")
+    try:
+        return os.path.getsize(path) if path else 0
+    except OSError:
+        return 0
+
+
+def _record_telemetry(telemetry, f: Callable[..., Any], args, kwargs, result) -> None:
+    """Persiste tiempos por etapa, filas, bytes, espera en BD y pico de RSS (ver apps.monitor.telemetry)."""
+    if telemetry is None:
+        return
+    record = telemetry.finish(rows=_result_rows(result), size=_result_bytes(result))
+    arguments = _call_arguments(f, args, kwargs)
+    record_task_run(
+        record,
+        arguments,
+        success=bool(result.get("success")),
+        span_days=date_span_days(arguments.get("IdtReporteIni"), arguments.get("IdtReporteFin")),
+    )
+
+
+def _record_run(job, task_name: str, f: Callable[..., Any], args, kwargs, result, execution_time: float) -> None:
+    """Guarda filas y duración de la corrida para estimar las siguientes (ver scripts.services.row_estimator)."""
+    if not job or not result.get("success"):
+        return
+    rows = _result_rows(result)
+    if not rows:
+        return
+    arguments = _call_arguments(f, args, kwargs)
+    RunHistory(job.connection).record(
+        task_name,
+        arguments.get("database_name"),
+        arguments.get("report_id"),
+        date_span_days(arguments.get("IdtReporteIni"), arguments.get("IdtReporteFin")),
+        rows,
+        execution_time,
+    )
 
 
 def task_handler(f: Callable[..., T]) -> Callable[..., ResultDict]:
     """
     Decorador que estandariza el manejo de errores y resultados para tareas RQ.
     Proporciona logging, manejo de excepciones, formato de respuesta y tiempo de ejecución.
+    Las partes grandes del resultado (previsualización, dashboard, traceback) se
+    guardan como artefacto y el resultado del job solo lleva la referencia.
+    Las corridas exitosas con ``metadata.total_records`` quedan en la historia
+    que usan las estimaciones de filas y ETA, y toda corrida en un job deja su
+    telemetría (etapas, filas, bytes, espera en BD, RSS) en apps.monitor.
     """
 
     @wraps(f)
@@ -137,11 +215,16 @@ def task_handler(f: Callable[..., T]) -> Callable[..., ResultDict]:
         job = get_current_job()
         task_name = f.__name__
         job_id = job.id if job else "N/A"
+        telemetry = task_telemetry.TaskTelemetry(task_name, job.id) if job else None
+        task_telemetry.activate(telemetry)
 
         # Inicializa el progreso
         if job:
             update_job_progress(
-                job_id, 0, "starting", meta={"stage": "Inicializando tarea"}
+                job_id,
+                0,
+                "starting",
+                meta={"stage": "Inicializando tarea", "started_at": start_time},
             )
 
         logger.info(
@@ -185,8 +268,9 @@ def task_handler(f: Callable[..., T]) -> Callable[..., ResultDict]:
                         job_id,
                         100,
                         "completed",
-                        meta={"result": result, "stage": final_stage},
+                        meta={"stage": final_stage},
                     )
+                _record_run(job, task_name, f, args, kwargs, result, execution_time)
             else:
                 final_stage = result.get("metadata", {}).get(
                     "stage", "Fallido"
@@ -199,10 +283,11 @@ def task_handler(f: Callable[..., T]) -> Callable[..., ResultDict]:
                         job_id,
                         100,
                         "failed",
-                        meta={"result": result, "stage": final_stage},
+                        meta={"stage": final_stage},
                     )
 
-            return result
+            _record_telemetry(telemetry, f, args, kwargs, result)
+            return _slim_result(job, task_name, f, args, kwargs, result)
 
         except Exception as e:
             execution_time = time.time() - start_time
@@ -225,20 +310,103 @@ def task_handler(f: Callable[..., T]) -> Callable[..., ResultDict]:
                     "failed",
                     meta={"error": str(e), "stage": "Error Crítico"},
                 )
-            return final_result
+            _record_telemetry(telemetry, f, args, kwargs, final_result)
+            return _slim_result(job, task_name, f, args, kwargs, final_result)
+        finally:
+            task_telemetry.activate(None)
 
     return wrapper
 
 
+def enqueue_task(task_func: Callable[..., Any], *args, estimated_rows: Optional[int] = None, **kwargs):
+    """
+    Encola una tarea RQ en la cola de su clase (ver scripts.services.task_queues).
+
+    Reemplaza a ``task_func.delay(...)``: la cola se elige por tipo de tarea y,
+    en los reportes sensibles al tamaño, por los días entre IdtReporteIni e
+    IdtReporteFin o por ``estimated_rows``. Sin ``estimated_rows`` se usan las
+    filas estimadas por la historia de corridas de la empresa y el reporte.
+
+    Si ya hay un job activo con la misma tarea y argumentos (doble clic, dos
+    usuarios con los mismos permisos) se retorna ese job en lugar de encolar
+    otro. Si otra tarea del
+    mismo grupo de conflicto está activa para la empresa se lanza
+    QueueConflictError, y si la empresa no tiene cupo en la clase,
+    QueueAdmissionError; en ambos casos no se encola nada.
+    """
+    task_name = task_func.__name__
+    bound = inspect.signature(task_func).bind_partial(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = bound.arguments
+    company = arguments.get("database_name")
+    days = date_span_days(arguments.get("IdtReporteIni"), arguments.get("IdtReporteFin"))
+    if estimated_rows is None and company and task_name in SIZE_AWARE_TASKS:
+        estimate = RunHistory(get_connection()).estimate(
+            task_name, company, arguments.get("report_id"), days
+        )
+        estimated_rows = estimate.rows if estimate else None
+    queue_name = route_task(task_name, days=days, estimated_rows=estimated_rows)
+    queue_class = QUEUE_CLASSES[queue_name]
+    queue = get_queue(queue_name)
+    connection = queue.connection
+    job_id = str(uuid.uuid4())
+    scope = None
+    if company and arguments.get("user_id") is not None:
+        try:
+            scope = permission_filters(company, arguments["user_id"])
+        except Exception as e:
+            # Sin permisos resueltos se deduplica por usuario.
+            logger.warning(f"No se pudieron resolver los permisos de {arguments['user_id']} en {company}: {e}")
+
+    existing_id, claims = claim_job(
+        connection,
+        task_name,
+        arguments,
+        job_id,
+        ttl=queue_class.timeout + ADMISSION_GRACE_SECONDS,
+        company=company,
+        scope=scope,
+    )
+    if existing_id:
+        logger.info(f"Tarea {task_name} duplicada: se reutiliza el job activo {existing_id}")
+        return Job.fetch(existing_id, connection=connection)
+
+    meta = {"claims": claims}
+    try:
+        if company:
+            meta["admission"] = admit(connection, queue_name, company, job_id)
+        rq_job = queue.enqueue_call(
+            task_func,
+            args=args,
+            kwargs=kwargs,
+            timeout=queue_class.timeout,
+            result_ttl=3600,
+            job_id=job_id,
+            meta=meta,
+            on_success=release_on_success,
+            on_failure=release_on_failure,
+        )
+    except Exception:
+        release_claims(connection, job_id, claims)
+        if "admission" in meta:
+            CompanyAdmission(connection).release(queue_name, company, job_id)
+        raise
+    logger.info(
+        f"Tarea {task_name} encolada en '{queue_name}' (Job ID: {job_id}, empresa={company}, dias={days})"
+    )
+    return rq_job
+
+
 # --- Tareas RQ ---
 
 from django.db import connection
 
 
 @job(
-    "default", timeout=DEFAULT_TIMEOUT, result_ttl=3600
-)  # Usar cola 'default' o una específica, resultado se mantiene 1h
+    QUEUE_INTERACTIVE, timeout=DEFAULT_TIMEOUT, result_ttl=3600
+)  # Cola por clase de tarea (ver scripts.services.task_queues), resultado 1h
 @task_handler  # Aplicar decorador estándar
+@cache_report_result
 def cubo_ventas_task(
     database_name,
     IdtReporteIni,
@@ -269,22 +437,24 @@ def cubo_ventas_task(
     # Estimación inicial de pasos (puede ajustarse en CuboVentas si es necesario)
     # total_steps_estimate = 5 # No usado directamente aquí
 
-    def rq_update_progress(stage, progress_percent, current_rec=None, total_rec=None):
-        """Callback para actualizar el estado de la tarea RQ."""
+    def rq_update_progress(stage, progress_percent, current_rec=None, total_rec=None, meta=None):
+        """Callback para actualizar el estado de la tarea RQ (``meta``: ETA estimado)."""
         # Construir meta data
-        meta = {
+        meta_dict = {
             "stage": stage,
             # 'current_step': current_step, # Podría añadirse si CuboVentas lo reporta
             # 'total_steps': total_steps_estimate,
         }
         if current_rec is not None:
-            meta["records_processed"] = current_rec
+            meta_dict["records_processed"] = current_rec
         if total_rec is not None:
-            meta["total_records_estimate"] = total_rec
+            meta_dict["total_records_estimate"] = total_rec
+        if meta is not None:
+            meta_dict.update(meta)
 
         # Llamar a la función helper de RQ
         update_job_progress(
-            job_id, int(progress_percent), status="processing", meta=meta
+            job_id, int(progress_percent), status="processing", meta=meta_dict
         )
 
     print("[cubo_ventas_task] Instanciando CuboVentas...")
@@ -348,8 +518,9 @@ def cubo_ventas_task(
     # El decorador @task_handler añadirá execution_time y manejará el estado final.
     return result_data
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_INTERACTIVE, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
+@cache_report_result
 def matrix_task(
     database_name,
     IdtReporteIni,
@@ -436,8 +607,9 @@ def matrix_task(
 
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_INTERACTIVE, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
+@cache_report_result
 def interface_task(
     database_name,
     IdtReporteIni,
@@ -470,22 +642,25 @@ def interface_task(
         total_rec=None,
         hoja_idx=None,
         total_hojas=None,
+        meta=None,
     ):
-        meta = {"stage": stage}
+        meta_dict = {"stage": stage}
         if current_rec is not None:
-            meta["records_processed"] = current_rec
+            meta_dict["records_processed"] = current_rec
         if total_rec is not None:
-            meta["total_records_estimate"] = total_rec
+            meta_dict["total_records_estimate"] = total_rec
         if hoja_idx is not None and total_hojas is not None:
-            meta["hoja_actual"] = hoja_idx
-            meta["total_hojas"] = total_hojas
+            meta_dict["hoja_actual"] = hoja_idx
+            meta_dict["total_hojas"] = total_hojas
             global_percent = int((hoja_idx / total_hojas) * 100)
         else:
             global_percent = progress_percent
+        if meta is not None:
+            meta_dict.update(meta)
         print(
             f"[interface_task][progreso] stage={stage}, hoja_idx={hoja_idx}, total_hojas={total_hojas}, global_percent={global_percent}"
         )
-        update_job_progress(job_id, int(global_percent), status="processing", meta=meta)
+        update_job_progress(job_id, int(global_percent), status="processing", meta=meta_dict)
 
     print("[interface_task] Instanciando InterfaceContable...")
     # Instanciar y ejecutar la lógica principal, pasando el callback adaptado para RQ
@@ -523,8 +698,9 @@ def interface_task(
     return result_data
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_INTERACTIVE, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
+@cache_report_result
 def interface_siigo_task(
     database_name,
     IdtReporteIni,
@@ -601,8 +777,9 @@ def interface_siigo_task(
     return result_data
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_INTERACTIVE, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
+@cache_report_result
 def venta_cero_task(
     database_name,
     ceves_code,
@@ -688,7 +865,7 @@ def venta_cero_task(
     return result_data
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_INTERACTIVE, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
 def rutero_task(database_name, ceves_code, user_id, batch_size=DEFAULT_BATCH_SIZE):
     """Tarea RQ para generar el Rutero."""
@@ -730,8 +907,9 @@ def rutero_task(database_name, ceves_code, user_id, batch_size=DEFAULT_BATCH_SIZ
     return result_data
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_INTERACTIVE, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
+@cache_report_result
 def preventa_task(database_name, ceves_code, IdtReporteIni, IdtReporteFin, user_id, batch_size=DEFAULT_BATCH_SIZE):
     """Tarea RQ para generar Preventa."""
     from scripts.extrae_bi.preventa import PreventaReport
@@ -772,8 +950,9 @@ def preventa_task(database_name, ceves_code, IdtReporteIni, IdtReporteFin, user_
     return result_data
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_INTERACTIVE, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
+@cache_report_result
 def faltantes_task(
     database_name,
     ceves_code,
@@ -830,7 +1009,7 @@ def faltantes_task(
     return result_data
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_INTERACTIVE, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
 def plano_task(
     database_name,
@@ -949,7 +1128,7 @@ def plano_task(
     return resultado
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_BULK_LOAD, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
 def cargue_zip_task(database_name: str, zip_file_path: str) -> ResultDict:
     """
@@ -982,12 +1161,14 @@ def cargue_zip_task(database_name: str, zip_file_path: str) -> ResultDict:
     # Asume que procesar_zip devuelve ResultDict o puede fallar
     resultado = cargue_zip.procesar_zip()
     print(f"[cargue_zip_task] RESULTADO: {resultado}")
+    if isinstance(resultado, dict) and resultado.get("success"):
+        bump_data_version(database_name)
     update_job_progress(job_id, 90, meta={"stage": "Finalizando procesamiento ZIP"})
     print("[cargue_zip_task] FIN")
     return resultado
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_BULK_LOAD, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
 def cargue_plano_task(database_name: str) -> ResultDict:
     """
@@ -1012,7 +1193,7 @@ def cargue_plano_task(database_name: str) -> ResultDict:
     return resultado
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_LONG_EXTRACT, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
 def extrae_bi_task(
     database_name: str,
@@ -1055,6 +1236,8 @@ def extrae_bi_task(
     update_job_progress(job_id, 15, meta={"stage": "Ejecutando extractor principal"})
     result = extractor.run()
     print(f"[extrae_bi_task] RESULTADO: {result}")
+    if isinstance(result, dict) and result.get("success"):
+        bump_data_version(database_name)
     update_job_progress(job_id, 95, meta={"stage": "Finalizando extracción BI"})
     print("[extrae_bi_task] FIN")
     return result
@@ -1069,7 +1252,7 @@ def clean_media_periodic(hours=4):
     return removed
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_BULK_LOAD, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
 def cargue_infoventas_task(
     temp_path, database_name, IdtReporteIni, IdtReporteFin, user_id=None
@@ -1147,11 +1330,13 @@ def cargue_infoventas_task(
                     f"[cargue_infoventas_task][WARNING] No se pudo eliminar el archivo temporal {temp_path}: {str(e)}"
                 )
 
+    if resultado.get("success"):
+        bump_data_version(database_name)
     print(f"[cargue_infoventas_task] FIN: {resultado}")
     return resultado
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_BULK_LOAD, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
 def cargue_maestras_task(database_name, tablas_seleccionadas=None):
     """
@@ -1292,7 +1477,7 @@ def cargue_maestras_task(database_name, tablas_seleccionadas=None):
     return resultado
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_BULK_LOAD, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler
 def cargue_infoproducto_task(
     database_name: str,
@@ -1389,7 +1574,7 @@ def cargue_infoproducto_task(
     return resultado
 
 
-@job("default", timeout=DEFAULT_TIMEOUT, result_ttl=3600)
+@job(QUEUE_BULK_LOAD, timeout=DEFAULT_TIMEOUT, result_ttl=3600)
 @task_handler  
 def cargue_tabla_individual_task(database_name, nombre_tabla):
     """
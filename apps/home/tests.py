@@ -1,3 +1,523 @@
-from django.test import TestCase
+import datetime as dt
+import json
+import os
+import time
+import unittest
+from contextlib import contextmanager
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.test import SimpleTestCase
+
+from scripts.services import task_queues
+from scripts.services.task_queues import (
+    QUEUE_BULK_LOAD,
+    QUEUE_CLASSES,
+    QUEUE_EXTERNAL_WAIT,
+    QUEUE_INTERACTIVE,
+    QUEUE_LONG_EXTRACT,
+    ADMISSION_HEARTBEAT_SECONDS,
+    LONG_EXTRACT_MIN_DAYS,
+    LONG_EXTRACT_MIN_ROWS,
+    CompanyAdmission,
+    QueueAdmissionError,
+    QueueConflictError,
+    admit,
+    claim_job,
+    date_span_days,
+    dedup_key,
+    release_job,
+    route_task,
+    worker_queues,
+)
+from rq.utils import utcformat
+
+from sqlalchemy import create_engine, text
+
+from scripts.services.sql_filters import InFilter, build_filter_plan, inject_predicates
+from scripts.services.calendar_service import (
+    festivos_del_anno,
+    get_calendar_service,
+    validar_anno,
+)
+from scripts.services.row_estimator import Estimate, EtaTracker, RunHistory, rows_from_explain
+from scripts.repositories.config_repository import (
+    Credential,
+    DateWindow,
+    EmpresaConfig,
+    ServerConfig,
+)
+from scripts.services.config_cache import SharedConfigCache
+from scripts.config import ConfigBasic
+from scripts.services.config_service import ConfigData, ConfigService
+
+try:
+    import fakeredis
+
+    FAKEREDIS_AVAILABLE = True
+except ImportError:
+    FAKEREDIS_AVAILABLE = False
+
+
+class RouteTaskTests(SimpleTestCase):
+    def test_rutas_por_tipo_de_tarea(self):
+        self.assertEqual(route_task("rutero_task"), QUEUE_INTERACTIVE)
+        self.assertEqual(route_task("cargue_zip_task"), QUEUE_BULK_LOAD)
+        self.assertEqual(route_task("extrae_bi_task"), QUEUE_LONG_EXTRACT)
+        self.assertEqual(route_task("actualiza_bi_task"), QUEUE_EXTERNAL_WAIT)
+        self.assertEqual(route_task("tarea_desconocida"), QUEUE_INTERACTIVE)
+
+    def test_reporte_grande_pasa_a_long_extract(self):
+        self.assertEqual(route_task("cubo_ventas_task", days=31), QUEUE_INTERACTIVE)
+        self.assertEqual(
+            route_task("cubo_ventas_task", days=LONG_EXTRACT_MIN_DAYS), QUEUE_LONG_EXTRACT
+        )
+        self.assertEqual(
+            route_task("matrix_task", estimated_rows=LONG_EXTRACT_MIN_ROWS), QUEUE_LONG_EXTRACT
+        )
+
+    def test_tamano_no_afecta_tareas_no_sensibles(self):
+        # Rutero y faltantes siempre son interactivos; los cargues no cambian de clase.
+        self.assertEqual(route_task("faltantes_task", days=400), QUEUE_INTERACTIVE)
+        self.assertEqual(
+            route_task("cargue_infoventas_task", estimated_rows=LONG_EXTRACT_MIN_ROWS),
+            QUEUE_BULK_LOAD,
+        )
+
+    def test_pool_all_atiende_todas_las_colas(self):
+        queues = worker_queues("all")
+        self.assertEqual(len(queues), len(set(queues)))
+        for queue_class in QUEUE_CLASSES.values():
+            self.assertTrue(set(queue_class.listens) <= set(queues))
+        self.assertEqual(queues[0], QUEUE_INTERACTIVE)
+
+    def test_date_span_days(self):
+        self.assertEqual(date_span_days("2024-01-01", "2024-01-31"), 31)
+        self.assertEqual(date_span_days("2024-01-31", "2024-01-01"), 31)
+        self.assertIsNone(date_span_days("2024-01-01", None))
+        self.assertIsNone(date_span_days("no-es-fecha", "2024-01-01"))
+
+
+@contextmanager
+def _zona_horaria(tz):
+    """Zona horaria local del proceso durante el bloque (como ``TIME_ZONE`` de Django)."""
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = tz
+    time.tzset()
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop("TZ", None)
+        else:
+            os.environ["TZ"] = previous
+        time.tzset()
+
+
+def _utcparse_naive(value):
+    # rq 1.15 (requirements) retorna el latido como datetime UTC sin zona.
+    return dt.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+@unittest.skipUnless(FAKEREDIS_AVAILABLE, "fakeredis no está instalado")
+class CompanyAdmissionTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.now = 1_000_000.0
+        self.admission = CompanyAdmission(self.redis, clock=lambda: self.now)
+
+    def test_respeta_el_limite_por_empresa(self):
+        self.assertEqual(self.admission.acquire(QUEUE_BULK_LOAD, "emp_a", "j1", limit=2, ttl=60), (True, 0))
+        self.assertEqual(self.admission.acquire(QUEUE_BULK_LOAD, "emp_a", "j2", limit=2, ttl=60), (True, 1))
+        self.assertEqual(self.admission.acquire(QUEUE_BULK_LOAD, "emp_a", "j3", limit=2, ttl=60), (False, 2))
+        self.assertEqual(self.admission.active(QUEUE_BULK_LOAD, "emp_a"), 2)
+
+    def test_limite_independiente_por_empresa_y_clase(self):
+        self.assertTrue(self.admission.acquire(QUEUE_BULK_LOAD, "emp_a", "j1", limit=1, ttl=60)[0])
+        self.assertTrue(self.admission.acquire(QUEUE_BULK_LOAD, "emp_b", "j2", limit=1, ttl=60)[0])
+        self.assertTrue(self.admission.acquire(QUEUE_INTERACTIVE, "emp_a", "j3", limit=1, ttl=60)[0])
+        self.assertFalse(self.admission.acquire(QUEUE_BULK_LOAD, "emp_a", "j4", limit=1, ttl=60)[0])
+
+    def test_liberar_devuelve_el_cupo(self):
+        self.admission.acquire(QUEUE_BULK_LOAD, "emp_a", "j1", limit=1, ttl=60)
+        self.admission.release(QUEUE_BULK_LOAD, "emp_a", "j1")
+        self.assertTrue(self.admission.acquire(QUEUE_BULK_LOAD, "emp_a", "j2", limit=1, ttl=60)[0])
+
+    def test_cupo_vencido_no_cuenta(self):
+        # Un worker caído sin liberar no bloquea a la empresa tras el TTL.
+        self.admission.acquire(QUEUE_LONG_EXTRACT, "emp_a", "j1", limit=1, ttl=60)
+        self.now += 61
+        self.assertEqual(self.admission.active(QUEUE_LONG_EXTRACT, "emp_a"), 0)
+        self.assertEqual(self.admission.acquire(QUEUE_LONG_EXTRACT, "emp_a", "j2", limit=1, ttl=60), (True, 0))
+        self.assertEqual(self.redis.zcard("rq:admission:long_extract:emp_a"), 1)
+
+    def test_admit_lanza_error_y_release_job_libera(self):
+        limit = QUEUE_CLASSES[QUEUE_BULK_LOAD].company_limit
+        metas = [admit(self.redis, QUEUE_BULK_LOAD, "emp_a", f"j{i}") for i in range(limit)]
+        with self.assertRaises(QueueAdmissionError) as ctx:
+            admit(self.redis, QUEUE_BULK_LOAD, "emp_a", "extra")
+        self.assertEqual(ctx.exception.active, limit)
+
+        job = type("Job", (), {"id": "j0", "meta": {"admission": metas[0]}, "connection": self.redis})()
+        release_job(job)
+        release_job(job)  # idempotente
+        self.assertEqual(admit(self.redis, QUEUE_BULK_LOAD, "emp_a", "nuevo"), metas[0])
+
+    def test_admit_libera_cupos_de_jobs_muertos(self):
+        # Fuera de UTC (America/Bogota en settings) el latido no debe verse más reciente.
+        with _zona_horaria("America/Bogota"), mock.patch.object(task_queues, "utcparse", _utcparse_naive):
+            self._admit_libera_cupos_de_jobs_muertos()
+
+    def _admit_libera_cupos_de_jobs_muertos(self):
+        # Work-horse muerto sin correr los callbacks: el job quedó fallido o sin latido.
+        limit = QUEUE_CLASSES[QUEUE_BULK_LOAD].company_limit
+        for i in range(limit):
+            admit(self.redis, QUEUE_BULK_LOAD, "emp_a", f"j{i}")
+            self.redis.hset(f"rq:job:j{i}", "status", "failed")
+        admit(self.redis, QUEUE_BULK_LOAD, "emp_a", "vivo")
+
+        self.redis.hset("rq:job:vivo", mapping={"status": "started", "last_heartbeat": utcformat(dt.datetime.now(dt.timezone.utc))})
+        with self.assertRaises(QueueAdmissionError):
+            admit(self.redis, QUEUE_BULK_LOAD, "emp_a", "extra")
+        stale = dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=ADMISSION_HEARTBEAT_SECONDS + 1)
+        self.redis.hset("rq:job:vivo", "last_heartbeat", utcformat(stale))
+        admit(self.redis, QUEUE_BULK_LOAD, "emp_a", "extra")
+
+    def test_release_job_sin_admision_no_falla(self):
+        job = type("Job", (), {"id": "j1", "meta": {}, "connection": self.redis})()
+        release_job(job)
+
+
+class DedupKeyTests(SimpleTestCase):
+    def test_normaliza_argumentos(self):
+        a = dedup_key("extrae_bi_task", {"database_name": "emp_a ", "IdtReporteIni": "2024-01-01", "batch_size": 1})
+        b = dedup_key("extrae_bi_task", {"IdtReporteIni": "2024-01-01", "database_name": "emp_a", "batch_size": 2})
+        self.assertEqual(a, b)
+
+    def test_usuario_cuenta_salvo_con_los_mismos_permisos(self):
+        args = {"database_name": "emp_a", "IdtReporteIni": "2024-01-01"}
+        scope = {"proveedores": ["10"], "macrozonas": []}
+        self.assertNotEqual(
+            dedup_key("cubo_ventas_task", {**args, "user_id": 1}),
+            dedup_key("cubo_ventas_task", {**args, "user_id": 2}),
+        )
+        self.assertEqual(
+            dedup_key("cubo_ventas_task", {**args, "user_id": 1}, scope),
+            dedup_key("cubo_ventas_task", {**args, "user_id": 2}, dict(scope)),
+        )
+
+    def test_distingue_tarea_y_argumentos(self):
+        base = {"database_name": "emp_a", "IdtReporteIni": "2024-01-01"}
+        self.assertNotEqual(dedup_key("extrae_bi_task", base), dedup_key("cubo_ventas_task", base))
+        self.assertNotEqual(
+            dedup_key("extrae_bi_task", base),
+            dedup_key("extrae_bi_task", {**base, "IdtReporteIni": "2024-02-01"}),
+        )
+
+
+@unittest.skipUnless(FAKEREDIS_AVAILABLE, "fakeredis no está instalado")
+class ClaimJobTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+
+    def _set_status(self, job_id, status):
+        self.redis.hset(f"rq:job:{job_id}", "status", status)
+
+    def _claim(self, task, job_id, **arguments):
+        arguments.setdefault("database_name", "emp_a")
+        return claim_job(
+            self.redis, task, arguments, job_id, ttl=60, company=arguments["database_name"]
+        )
+
+    def test_duplicado_se_une_al_job_activo(self):
+        existing, claims = self._claim("cargue_maestras_task", "j1")
+        self.assertIsNone(existing)
+        self.assertEqual(len(claims), 2)  # idempotencia + lock del grupo
+        self._set_status("j1", "queued")
+        self.assertEqual(self._claim("cargue_maestras_task", "j2"), ("j1", []))
+
+    def test_usuarios_con_permisos_distintos_no_comparten_job(self):
+        restringido = {"proveedores": ["10"], "macrozonas": []}
+        total = {"proveedores": [], "macrozonas": []}
+        args = {"database_name": "emp_a", "IdtReporteIni": "2024-01-01"}
+
+        def claim(job_id, user_id, scope):
+            arguments = {**args, "user_id": user_id}
+            return claim_job(self.redis, "cubo_ventas_task", arguments, job_id, ttl=60, company="emp_a", scope=scope)
+
+        self.assertIsNone(claim("j1", 1, total)[0])
+        self._set_status("j1", "started")
+        self.assertIsNone(claim("j2", 2, restringido)[0])
+        self._set_status("j2", "started")
+        # Un tercer usuario con los mismos permisos que el primero sí se une a su job.
+        self.assertEqual(claim("j3", 3, dict(total)), ("j1", []))
+
+    def test_job_terminado_libera_la_clave(self):
+        self._claim("extrae_bi_task", "j1", IdtReporteIni="2024-01-01")
+        self._set_status("j1", "finished")
+        existing, claims = self._claim("extrae_bi_task", "j2", IdtReporteIni="2024-01-01")
+        self.assertIsNone(existing)
+        self.assertTrue(claims)
+
+    def test_cargues_en_conflicto_se_excluyen_por_empresa(self):
+        self._claim("cargue_zip_task", "j1", zip_file_path="a.zip")
+        self._set_status("j1", "started")
+        with self.assertRaises(QueueConflictError) as ctx:
+            self._claim("cargue_infoventas_task", "j2", temp_path="b.xlsx")
+        self.assertEqual(ctx.exception.job_id, "j1")
+        self.assertIsInstance(ctx.exception, QueueAdmissionError)
+        # Otra empresa y tareas fuera del grupo no se bloquean.
+        self.assertIsNone(self._claim("cargue_infoventas_task", "j3", database_name="emp_b")[0])
+        self.assertIsNone(self._claim("cubo_ventas_task", "j4")[0])
+
+    def test_release_job_borra_solo_claves_propias(self):
+        _, claims = self._claim("cargue_plano_task", "j1")
+        self._set_status("j1", "started")
+        job = type("Job", (), {"id": "j1", "meta": {"claims": claims}, "connection": self.redis})()
+        release_job(job)
+        self.assertFalse(any(self.redis.exists(key) for key in claims))
+        # Si otro job ya tomó la clave, liberar no la borra.
+        self.redis.set(claims[0], "j9")
+        release_job(job)
+        self.assertEqual(self.redis.get(claims[0]), b"j9")
+
+
+@unittest.skipUnless(FAKEREDIS_AVAILABLE, "fakeredis no está instalado")
+class RunHistoryTests(SimpleTestCase):
+    def setUp(self):
+        self.history = RunHistory(fakeredis.FakeRedis())
+        self.history.record("cubo_ventas_task", "emp_a", 2, 30, 300_000, 60)
+        self.history.record("cubo_ventas_task", "emp_a", 2, 10, 100_000, 20)
+        self.history.record("cubo_ventas_task", "emp_a", 3, 30, 10, 1)
+
+    def test_mismo_rango_usa_la_mediana_directa(self):
+        estimate = self.history.estimate("cubo_ventas_task", "emp_a", 2, 30)
+        self.assertEqual((estimate.rows, estimate.source), (300_000, "historial"))
+        self.assertAlmostEqual(estimate.seconds, 60)
+
+    def test_otro_rango_escala_por_dia(self):
+        self.assertEqual(self.history.estimate("cubo_ventas_task", "emp_a", 2, 90).rows, 900_000)
+
+    def test_sin_corridas_del_reporte(self):
+        self.assertIsNone(self.history.estimate("cubo_ventas_task", "emp_a", 7, 30))
+        self.assertIsNone(self.history.estimate("cubo_ventas_task", "emp_b", 2, 30))
+
+
+class EtaTrackerTests(SimpleTestCase):
+    def test_refina_con_el_ritmo_observado(self):
+        now = [0.0]
+        tracker = EtaTracker(Estimate(1000, "explain"), clock=lambda: now[0])
+        self.assertEqual(tracker.update(0), (1000, None))
+        now[0] = 10.0
+        self.assertEqual(tracker.update(250), (1000, 30.0))
+        # Si se leen más filas que las estimadas, el total las sigue.
+        self.assertEqual(tracker.update(1500)[0], 1500)
+
+    def test_explain_multiplica_filas_del_select_principal(self):
+        explain = [
+            {"id": 1, "table": "v", "rows": 1000, "filtered": 50},
+            {"id": 1, "table": "p", "rows": 1, "filtered": 100},
+            {"id": 1, "table": "<subquery2>", "rows": 300, "filtered": 100},
+        ]
+        self.assertEqual(rows_from_explain(explain), 500)
+
+
+def _empresa(name):
+    fields = {field: None for field in EmpresaConfig.__dataclass_fields__}
+    fields.update(name=name, nb_server_sidis="1", raw={"name": name, "id": 7})
+    return EmpresaConfig(**fields)
+
+
+@unittest.skipUnless(FAKEREDIS_AVAILABLE, "fakeredis no está instalado")
+class ConfigSharedCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.repository = mock.Mock()
+        self.repository.get_empresa_configs.return_value = {"emp_a": _empresa("emp_a")}
+        self.repository.get_server_configs.return_value = {
+            "1": ServerConfig(1, "sidis", "5", "db.local", 3306, Credential("usr", "clave-sql"))
+        }
+        self.repository.get_credentials_many.side_effect = lambda tipos: {
+            tipo: Credential(f"usr{tipo}", f"clave-{tipo}")
+            for tipo in tipos
+            if tipo in {"3", "5", "11"}
+        }
+        self.repository.get_date_windows.return_value = {
+            "emp_a": DateWindow("2024-01-01", "2024-01-31")
+        }
+
+    def _service(self):
+        shared = SharedConfigCache(self.redis)
+        with mock.patch.object(shared, "subscribe"):
+            return ConfigService(lambda: self.repository, lambda *_: {}, shared_cache=shared)
+
+    def test_redis_guarda_json_sin_credenciales(self):
+        self._service().get_configs(["emp_a"])
+        values = [self.redis.get(key) for key in self.redis.keys("datazenith:config:empresa:*")]
+        self.assertEqual(len(values), 1)
+        self.assertEqual(json.loads(values[0])["server_out"]["host"], "db.local")
+        for secret in (b"clave-sql", b"clave-3", b"clave-11"):
+            self.assertNotIn(secret, values[0])
+
+    def test_otro_proceso_completa_credenciales_desde_la_base(self):
+        self._service().get_configs(["emp_a"])
+        config = self._service().get_configs(["emp_a"])["emp_a"]
+        self.assertEqual(config.server_out.host, "db.local")
+        self.assertEqual(config.server_out.credential, Credential("usr5", "clave-5"))
+        self.assertEqual(config.powerbi_credentials.password, "clave-3")
+        self.assertEqual(config.empresa.raw, {"name": "emp_a", "id": 7})
+        # El segundo proceso no relee la empresa: solo las credenciales, en una consulta.
+        self.assertEqual(self.repository.get_empresa_configs.call_count, 1)
+        self.assertEqual(
+            sorted(self.repository.get_credentials_many.call_args.args[0]), ["11", "3", "5"]
+        )
+
+
+class ConfigBasicBulkTests(SimpleTestCase):
+    def test_usa_la_carga_agrupada_y_omite_empresas_inexistentes(self):
+        service = mock.Mock()
+        service.get_configs.return_value = {
+            "emp_a": ConfigData(_empresa("emp_a"), None, None, None, None, None, {})
+        }
+        with mock.patch("scripts.config.get_default_service", return_value=service):
+            configs = ConfigBasic.bulk(["emp_a", "no_existe"], user_id=3)
+        self.assertEqual(list(configs), ["emp_a"])
+        self.assertEqual(configs["emp_a"].config["name"], "emp_a")
+        self.assertEqual(configs["emp_a"].config["user_id"], 3)
+        service.get_config.assert_not_called()
+
+
+class SqlFiltersTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE TABLE ventas (id INTEGER, prov INTEGER, zona TEXT, valor INTEGER)"))
+            conn.execute(
+                text("INSERT INTO ventas VALUES (:id, :prov, :zona, :valor)"),
+                [
+                    {"id": 1, "prov": 1, "zona": "A", "valor": 10},
+                    {"id": 2, "prov": 2, "zona": "A", "valor": 20},
+                    {"id": 3, "prov": 1, "zona": "B", "valor": 30},
+                    {"id": 4, "prov": 2, "zona": "B", "valor": 40},
+                    {"id": 5, "prov": 1, "zona": "C", "valor": 50},
+                ],
+            )
+
+    def _rows(self, sql, predicates=("prov = 1",)):
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(text(inject_predicates(sql, list(predicates))))]
+
+    def test_where_con_or_conserva_la_precedencia(self):
+        sql = "SELECT prov, SUM(valor) FROM ventas WHERE zona = 'A' OR zona = 'B' GROUP BY prov"
+        self.assertEqual(self._rows(sql), [(1, 40)])
+
+    def test_sin_where_se_agrega_antes_de_order_by(self):
+        sql = "SELECT id FROM ventas ORDER BY id DESC;"
+        self.assertEqual(self._rows(sql), [(5,), (3,), (1,)])
+
+    def test_comentarios_y_literales_no_cortan_la_condicion(self):
+        sql = (
+            "SELECT id FROM ventas\n"
+            "WHERE zona <> 'X GROUP BY Y' /* ORDER BY */ -- solo ventas reales\n"
+            "ORDER BY id"
+        )
+        self.assertEqual(self._rows(sql), [(1,), (3,), (5,)])
+
+    def test_cte_filtra_el_select_principal(self):
+        sql = (
+            "WITH base AS (SELECT * FROM ventas WHERE valor > 10 GROUP BY id)\n"
+            "SELECT id FROM base ORDER BY id"
+        )
+        inyectada = inject_predicates(sql, ["prov = 1"])
+        self.assertIn("WHERE valor > 10 GROUP BY id)", inyectada)
+        self.assertEqual(self._rows(sql), [(3,), (5,)])
+
+    def test_union_se_filtra_como_tabla_derivada(self):
+        sql = (
+            "SELECT id, prov FROM ventas WHERE zona = 'A'\n"
+            "UNION ALL\n"
+            "SELECT id, prov FROM ventas WHERE zona = 'C'"
+        )
+        self.assertTrue(inject_predicates(sql, ["prov = 1"]).startswith("SELECT * FROM ("))
+        self.assertEqual(sorted(self._rows(sql)), [(1, 1), (5, 1)])
+
+    def test_marcador_tiene_prioridad(self):
+        sql = "SELECT id FROM ventas WHERE zona = 'A' -- FILTERS_HERE\nORDER BY id"
+        self.assertIn("zona = 'A'  AND prov = 1", inject_predicates(sql, ["prov = 1"]))
+        self.assertEqual(self._rows(sql), [(1,)])
+
+    def test_in_expandido_con_pocos_valores(self):
+        plan = build_filter_plan(
+            "SELECT id FROM ventas WHERE zona = :zona ORDER BY id",
+            {"zona": "B"},
+            [InFilter("prov", [2, None, 2, 9], "prov")],
+        )
+        self.assertEqual(plan.expanding, ["prov"])
+        self.assertEqual(plan.params, {"zona": "B", "prov": [2, 9]})
+        self.assertEqual(plan.temp_tables, [])
+        with self.engine.connect() as conn:
+            self.assertEqual([row.id for row in conn.execute(plan.query(), plan.params)], [4])
+
+    def test_muchos_valores_usan_tabla_temporal(self):
+        plan = build_filter_plan(
+            "SELECT id FROM ventas", {}, [InFilter("prov", [1, 2, 3], "prov")], threshold=2
+        )
+        (temp,) = plan.temp_tables
+        self.assertEqual((temp.source, temp.values), ("ventas", [1, 2, 3]))
+        self.assertIn(f"prov IN (SELECT v FROM {temp.table})", plan.sql)
+        self.assertNotIn("prov", plan.params)
+
+
+class CalendarServiceTests(SimpleTestCase):
+    def test_festivos_2024(self):
+        self.assertEqual(
+            [fecha.isoformat() for fecha in festivos_del_anno(2024)],
+            [
+                "2024-01-01",
+                "2024-01-08",  # Reyes, trasladado a lunes
+                "2024-03-25",  # San José, trasladado a lunes
+                "2024-03-28",
+                "2024-03-29",
+                "2024-05-01",
+                "2024-05-13",  # Ascensión: Pascua (31/03) + 43
+                "2024-06-03",  # Corpus Christi: Pascua + 64
+                "2024-06-10",  # Sagrado Corazón: Pascua + 71
+                "2024-07-01",
+                "2024-07-20",
+                "2024-08-07",
+                "2024-08-19",
+                "2024-10-14",
+                "2024-11-04",
+                "2024-11-11",
+                "2024-12-08",
+                "2024-12-25",
+            ],
+        )
+
+    def test_contar_habiles_incluye_extremos(self):
+        conteo = get_calendar_service().contar_habiles(
+            ["2024-03-25", "2024-03-25", "2024-04-05", None],
+            ["2024-03-31", "2024-03-25", "2024-04-01", "2024-04-01"],
+        )
+        # Semana Santa: martes, miércoles y sábado; un festivo solo cuenta 0; invertido es negativo.
+        self.assertEqual(conteo.tolist()[:3], [3, 0, -5])
+        self.assertIs(conteo.iloc[3], pd.NA)
+        self.assertEqual(
+            get_calendar_service(False).contar_habiles(["2024-03-25"], ["2024-03-31"]).tolist(),
+            [2],
+        )
+
+    def test_sumar_habiles_salta_festivos_y_cambia_de_anno(self):
+        fechas = get_calendar_service().sumar_habiles(
+            ["2024-12-31", "2024-03-28", "2024-12-24"], [1, 0, 1]
+        )
+        self.assertEqual(
+            [fecha.date().isoformat() for fecha in fechas],
+            ["2025-01-02", "2024-03-30", "2024-12-26"],
+        )
+
+    def test_validar_anno(self):
+        validar_anno(2024)
+        for anno in (1899, 2101, "2024"):
+            with self.assertRaises(ValueError):
+                validar_anno(anno)
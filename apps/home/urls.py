@@ -79,6 +79,16 @@ urlpatterns = [
         views.CheckTaskStatusView.as_view(),
         name="check_task_status",
     ),
+    path(
+        "task-progress/<str:task_id>/",
+        views.TaskProgressView.as_view(),
+        name="task_progress",
+    ),
+    path(
+        "task-progress/<str:task_id>/stream/",
+        views.TaskProgressStreamView.as_view(),
+        name="task_progress_stream",
+    ),
     path("amovildesk/", views.AmovildeskPage.as_view(), name="amovildesk"),
     path("reporte-list/", views.ReporteListView.as_view(), name="reporte_list"),
     path(
@@ -131,6 +141,11 @@ urlpatterns = [
         views.FaltantesPage.as_view(),
         name="faltantes",
     ),
+    path(
+        "dashboard-matrix/<str:artifact_id>/",
+        views.DashboardMatrixView.as_view(),
+        name="dashboard_matrix",
+    ),
     path(
         "planos-bimbo/",
         views.PlanosBimboPage.as_view(),
@@ -3,19 +3,33 @@ import time
 from pathlib import Path
 import logging
 
+from scripts.services.artifact_store import get_artifact_store
+
 logger = logging.getLogger(__name__)
 
+# Archivos que aún se escriben sueltos en media/ fuera del almacén de artefactos:
+# salidas y BD temporales de interface_sqlite/interface_chunk y ZIP subidos en cargues.
+# Los insumos fijos (p. ej. media/PROVEE-TSOL.xlsx) no coinciden y no se tocan.
+LEGACY_MEDIA_PATTERNS = ("Interface_Contable_*", "temp_*.db", "*.zip")
+
 def clean_old_media_files(hours=4):
     """
-    Elimina archivos en la carpeta media/ con extensiones permitidas
-    (.xlsx, .db, .zip, .csv, .txt) que tengan más de 'hours' horas de modificados.
+    Expira los artefactos sin acceso en las últimas 'hours' horas (consulta al
+    índice del almacén, sin listar directorios) y elimina los archivos sueltos
+    de media/ que coinciden con LEGACY_MEDIA_PATTERNS y tienen más de 'hours'
+    horas de modificados.
     """
+    removed = get_artifact_store().expire(hours * 3600)
+    for path in removed:
+        logger.info(f"[clean_old_media_files] Artefacto expirado: {path}")
+
     MEDIA_DIR = Path("media")
-    EXTENSIONS = {".xlsx", ".db", ".zip", ".csv", ".txt"}
     now = time.time()
-    removed = []
-    for file in MEDIA_DIR.iterdir():
-        if file.is_file() and file.suffix.lower() in EXTENSIONS:
+    legacy_files = {
+        file for pattern in LEGACY_MEDIA_PATTERNS for file in MEDIA_DIR.glob(pattern)
+    }
+    for file in sorted(legacy_files):
+        if file.is_file():
             mtime = file.stat().st_mtime
             age_hours = (now - mtime) / 3600
             if age_hours > hours:
@@ -7,8 +7,9 @@ import os, time
 import time  # Para mediciÃ³n de tiempos
 import logging
 import traceback
+import json
 from typing import Dict, List
-from django.http import HttpResponse, FileResponse, JsonResponse
+from django.http import HttpResponse, FileResponse, JsonResponse, StreamingHttpResponse
 from django.db import connections
 import io
 from django.views.generic import View, TemplateView
@@ -39,7 +40,9 @@ from .tasks import (
     rutero_task,
     preventa_task,
     faltantes_task,
+    enqueue_task,
 )
+from scripts.services.task_queues import QueueAdmissionError
 from apps.users.models import UserPermission
 from django.views.decorators.cache import cache_page
 from django.core.cache import cache
@@ -53,6 +56,17 @@ from rq.exceptions import NoSuchJobError
 from django_rq import get_connection
 from django.utils.translation import gettext_lazy as _
 from .utils import clean_old_media_files
+from . import report_cache
+from .catalog_cache import get_catalog, table_checksum
+from scripts.services.job_progress import (
+    TERMINAL_STATUSES,
+    job_progress_meta,
+    read_progress,
+    stream_progress,
+)
+from scripts.services.artifact_store import get_artifact_store
+from scripts.services import dashboard_matrix
+from scripts.services.result_envelope import attach_detached
 
 logger = logging.getLogger(__name__)
 
@@ -862,6 +876,99 @@ class HomePanelInterfacePage(BaseView):
         return interfaces
 
 
+def _resolve_artifact(request, artifact_id=None):
+    """
+    Artefacto pedido por id (parÃ¡metro o sesiÃ³n) si el usuario puede verlo; si no, None.
+    El id guardado en sesiÃ³n lo asignÃ³ el servidor (tarea propia o cachÃ© de reportes
+    con los mismos permisos), por eso solo se valida el dueÃ±o de los ids recibidos.
+    """
+    granted_id = request.session.get("artifact_id")
+    artifact_id = artifact_id or granted_id
+    if not artifact_id:
+        return None
+    artifact = get_artifact_store().get(artifact_id)
+    if artifact is None:
+        return None
+    # Sin dueño (p. ej. de la caché de reportes) solo se entrega si el id fue concedido en sesión.
+    if artifact_id != granted_id and artifact.owner != request.user.id:
+        logger.warning(
+            f"Usuario {request.user.id} intentÃ³ acceder al artefacto {artifact_id} de otro usuario"
+        )
+        return None
+    return artifact
+
+
+def _delete_artifact_response(request):
+    """Elimina el artefacto del usuario y limpia las referencias en sesiÃ³n."""
+    start_time = time.time()
+    user_id = request.user.id
+    artifact = _resolve_artifact(request, request.POST.get("artifact_id"))
+    if artifact is None:
+        logger.warning(
+            f"Intento de eliminar artefacto inexistente o ajeno por usuario {user_id}"
+        )
+        return JsonResponse(
+            {"success": False, "error_message": "El archivo no existe."}
+        )
+    try:
+        get_artifact_store().delete(artifact.id)
+    except Exception as e:
+        logger.error(
+            f"Error al eliminar artefacto {artifact.id}: {str(e)} por usuario {user_id}"
+        )
+        return JsonResponse({"success": False, "error_message": f"Error: {str(e)}"})
+
+    if request.session.get("artifact_id") == artifact.id:
+        for key in ("artifact_id", "file_path", "file_name"):
+            request.session.pop(key, None)
+    logger.info(
+        f"Archivo eliminado: {artifact.name} ({artifact.size/1024:.2f}KB, artefacto {artifact.id}) por usuario {user_id} en {time.time() - start_time:.2f}s"
+    )
+    return JsonResponse({"success": True})
+
+
+def _remember_dashboard_matrix(request, result):
+    """Autoriza en sesión la matriz paginada del dashboard entregado (Preventa/Faltantes)."""
+    dashboard = result.get("dashboard") if isinstance(result, dict) else None
+    if isinstance(dashboard, dict) and dashboard.get("matrix_artifact_id"):
+        request.session["dashboard_artifact_id"] = dashboard["matrix_artifact_id"]
+
+
+class DashboardMatrixView(LoginRequiredMixin, View):
+    """Página ``offset``/``limit`` de la matriz de un dashboard guardada como artefacto."""
+
+    login_url = reverse_lazy("users_app:user-login")
+
+    def get(self, request, artifact_id):
+        if artifact_id == request.session.get("dashboard_artifact_id"):
+            # Asignado por el servidor al entregar el resultado (propio o de la caché).
+            artifact = get_artifact_store().get(artifact_id)
+        else:
+            artifact = _resolve_artifact(request, artifact_id)
+        if artifact is None:
+            return JsonResponse(
+                {"success": False, "error_message": "La matriz ya no está disponible."},
+                status=404,
+            )
+        try:
+            offset = int(request.GET.get("offset", 0))
+            limit = int(request.GET.get("limit", dashboard_matrix.MATRIX_PAGE_SIZE))
+        except ValueError:
+            return JsonResponse(
+                {"success": False, "error_message": "Parámetros de paginación inválidos."},
+                status=400,
+            )
+        try:
+            page = dashboard_matrix.read_matrix_page(artifact.path, offset, limit)
+        except Exception as exc:
+            logger.error("Error leyendo la matriz %s: %s", artifact_id, exc)
+            return JsonResponse(
+                {"success": False, "error_message": "No se pudo leer la matriz."},
+                status=500,
+            )
+        return JsonResponse({"success": True, **page})
+
+
 class DownloadFileView(LoginRequiredMixin, View):
     """
     Vista optimizada para la descarga segura y eficiente de archivos.
@@ -886,20 +993,21 @@ class DownloadFileView(LoginRequiredMixin, View):
         """
         start_time = time.time()  # MediciÃ³n de tiempo para diagnÃ³stico
         template_name = request.session.get("template_name", "home/panel_cubo.html")
-        file_path = request.session.get("file_path")
-        file_name = request.session.get("file_name")
         user_id = request.user.id
 
-        # ValidaciÃ³n inicial de parÃ¡metros
-        if not file_path or not file_name:
+        # El archivo se resuelve por id en el almacÃ©n, nunca por una ruta de la sesiÃ³n
+        artifact = _resolve_artifact(request, request.GET.get("artifact_id"))
+        if artifact is None:
             messages.error(
                 request, "Archivo no encontrado o no especificado correctamente"
             )
             logger.warning(
-                f"Intento de descarga sin archivo especificado por usuario {user_id}"
+                f"Intento de descarga sin artefacto vÃ¡lido por usuario {user_id}"
             )
             # Redirect to cubo panel on error
             return redirect("home_app:panel_cubo")
+        file_path = artifact.path
+        file_name = artifact.name
 
         # Validaciones de seguridad
         try:
@@ -1020,128 +1128,10 @@ class DownloadFileView(LoginRequiredMixin, View):
 
     def post(self, request):
         """
-        Maneja la solicitud POST para eliminar un archivo.
-        Implementa validaciones de seguridad y registro detallado.
+        Maneja la solicitud POST para eliminar el archivo descargado.
+        El archivo se resuelve por id en el almacÃ©n de artefactos.
         """
-        start_time = time.time()  # MediciÃ³n de tiempo para diagnÃ³stico
-        template_name = request.session.get("template_name")
-        file_path = request.session.get("file_path")
-        file_name = request.session.get("file_name")
-        user_id = request.user.id
-
-        # ValidaciÃ³n inicial
-        if file_path is None:
-            logger.warning(
-                f"Intento de eliminar archivo sin ruta especificada por usuario {user_id}"
-            )
-            return JsonResponse(
-                {"success": False, "error_message": "No hay archivo para eliminar."}
-            )
-
-        try:
-            # Normalizar la ruta para evitar ataques de path traversal
-            file_path = os.path.normpath(file_path)
-
-            # Validar extensiÃ³n del archivo
-            _, extension = os.path.splitext(file_path)
-            if extension.lower() not in self.allowed_extensions:
-                logger.warning(
-                    f"Intento de eliminar tipo de archivo no permitido: {file_path} por usuario {user_id}"
-                )
-                return JsonResponse(
-                    {"success": False, "error_message": "Tipo de archivo no permitido."}
-                )
-
-            # Validar que el archivo existe
-            if not os.path.exists(file_path):
-                logger.warning(
-                    f"Intento de eliminar archivo inexistente: {file_path} por usuario {user_id}"
-                )
-                return JsonResponse(
-                    {"success": False, "error_message": "El archivo no existe."}
-                )
-
-            # Validar que es un archivo regular (no directorio, enlace simbÃ³lico, etc.)
-            if not os.path.isfile(file_path):
-                logger.warning(
-                    f"Intento de eliminar algo que no es un archivo: {file_path} por usuario {user_id}"
-                )
-                return JsonResponse(
-                    {
-                        "success": False,
-                        "error_message": "La ruta no corresponde a un archivo.",
-                    }
-                )
-
-            # Comprobar permisos del archivo
-            if not os.access(file_path, os.W_OK):
-                logger.warning(
-                    f"Sin permisos para eliminar archivo: {file_path} por usuario {user_id}"
-                )
-                return JsonResponse(
-                    {
-                        "success": False,
-                        "error_message": "Sin permisos para eliminar el archivo.",
-                    }
-                )
-
-            # Registrar informaciÃ³n del archivo antes de eliminarlo
-            file_size = os.path.getsize(file_path)
-            file_mod_time = os.path.getmtime(file_path)
-
-            # Eliminar el archivo
-            os.remove(file_path)
-
-            # Limpiar la sesiÃ³n
-            del request.session["file_path"]
-            del request.session["file_name"]
-
-            # Registrar la eliminaciÃ³n exitosa
-            logger.info(
-                f"Archivo eliminado: {file_path} ({file_size/1024:.2f}KB, modificado: {time.ctime(file_mod_time)}) por usuario {user_id} en {time.time() - start_time:.2f}s"
-            )
-
-            # Limpieza automÃ¡tica de archivos viejos tras cada borrado manual
-            removed_auto = clean_old_media_files(hours=4)
-            return JsonResponse({"success": True, "auto_cleaned_files": removed_auto})
-
-        except FileNotFoundError:
-            logger.warning(
-                f"Archivo no encontrado al intentar eliminar: {file_path} por usuario {user_id}"
-            )
-            return JsonResponse(
-                {"success": False, "error_message": "El archivo no existe."}
-            )
-        except PermissionError as e:
-            logger.error(
-                f"Error de permisos al eliminar {file_path}: {str(e)} por usuario {user_id}"
-            )
-            return JsonResponse(
-                {"success": False, "error_message": f"Error de permisos: {str(e)}"}
-            )
-        except OSError as e:
-            logger.error(
-                f"Error del sistema de archivos al eliminar {file_path}: {str(e)} por usuario {user_id}"
-            )
-            return JsonResponse(
-                {
-                    "success": False,
-                    "error_message": f"Error del sistema de archivos: {str(e)}",
-                }
-            )
-        except Exception as e:
-            logger.error(
-                f"Error inesperado al eliminar {file_path}: {str(e)} por usuario {user_id}"
-            )
-            return JsonResponse(
-                {
-                    "success": False,
-                    "error_message": f"Error: no se pudo eliminar el archivo. RazÃ³n: {str(e)}",
-                }
-            )
-        finally:
-            # In case of any fallback, ensure redirect to cubo panel
-            pass
+        return _delete_artifact_response(request)
 
 
 class DeleteFileView(BaseView):
@@ -1161,81 +1151,7 @@ class DeleteFileView(BaseView):
     ]  # Extensiones permitidas
 
     def post(self, request):
-
-        start_time = time.time()
-        user_id = request.user.id
-
-        # Obtener el nombre del archivo desde POST o sesiÃ³n
-        file_name = request.POST.get("file_name") or request.session.get("file_name")
-        logger.info(f"[DeleteFileView] file_name recibido: {file_name}")
-        # Construir la ruta segura (solo permite archivos en media/)
-        file_path = os.path.join("media", file_name) if file_name else None
-        logger.info(f"[DeleteFileView] file_path construido: {file_path}")
-        # Validar que el archivo estÃ© dentro de media/
-        media_root = os.path.abspath("media")
-        abs_file_path = os.path.abspath(file_path) if file_path else None
-        logger.info(
-            f"[DeleteFileView] abs_file_path: {abs_file_path}, media_root: {media_root}"
-        )
-        if not abs_file_path.startswith(media_root):
-            logger.warning(
-                f"Intento de eliminar archivo fuera de media/: {abs_file_path} por usuario {user_id}"
-            )
-            return JsonResponse(
-                {"success": False, "error_message": "Ruta de archivo no permitida."}
-            )
-
-        # Validar extensiÃ³n
-        _, extension = os.path.splitext(file_path)
-        if extension.lower() not in self.allowed_extensions:
-            logger.warning(
-                f"Intento de eliminar tipo de archivo no permitido: {file_path} por usuario {user_id}"
-            )
-            return JsonResponse(
-                {"success": False, "error_message": "Tipo de archivo no permitido."}
-            )
-
-        # Validar existencia y permisos
-        if not os.path.exists(file_path) or not os.path.isfile(file_path):
-            logger.warning(
-                f"Intento de eliminar archivo inexistente: {file_path} por usuario {user_id}"
-            )
-            return JsonResponse(
-                {"success": False, "error_message": "El archivo no existe."}
-            )
-        if not os.access(file_path, os.W_OK):
-            logger.warning(
-                f"Sin permisos para eliminar archivo: {file_path} por usuario {user_id}"
-            )
-            return JsonResponse(
-                {
-                    "success": False,
-                    "error_message": "Sin permisos para eliminar el archivo.",
-                }
-            )
-
-        # Eliminar el archivo
-        try:
-            logger.info(f"[DeleteFileView] Intentando eliminar archivo: {file_path}")
-            file_size = os.path.getsize(file_path)
-            file_mod_time = os.path.getmtime(file_path)
-            os.remove(file_path)
-            logger.info(f"[DeleteFileView] Archivo eliminado exitosamente: {file_path}")
-            # Limpiar la sesiÃ³n solo si coincide
-            if request.session.get("file_name") == file_name:
-                request.session.pop("file_path", None)
-                request.session.pop("file_name", None)
-            logger.info(
-                f"Archivo eliminado: {file_path} ({file_size/1024:.2f}KB, modificado: {time.ctime(file_mod_time)}) por usuario {user_id} en {time.time() - start_time:.2f}s"
-            )
-            # Limpieza automÃ¡tica de archivos viejos tras cada borrado manual
-            removed_auto = clean_old_media_files(hours=4)
-            return JsonResponse({"success": True, "auto_cleaned_files": removed_auto})
-        except Exception as e:
-            logger.error(
-                f"Error al eliminar archivo {file_path}: {str(e)} por usuario {user_id}"
-            )
-            return JsonResponse({"success": False, "error_message": f"Error: {str(e)}"})
+        return _delete_artifact_response(request)
 
 
 class CheckTaskStatusView(BaseView):
@@ -1253,7 +1169,21 @@ class CheckTaskStatusView(BaseView):
             print("[CheckTaskStatusView] No task_id proporcionado")
             return JsonResponse({"error": "No task ID provided"}, status=400)
 
+        if report_cache.is_token(task_id):
+            return self._cached_report_response(request, task_id)
+
         connection = get_connection()
+
+        # Mientras el worker reporte progreso no terminal basta el hash: se
+        # evita Job.fetch (deserializar el job completo) en cada sondeo.
+        state = read_progress(connection, task_id)
+        if state and state.get("status") not in TERMINAL_STATUSES:
+            rq_status = _rq_status(connection, task_id)
+            if rq_status in ("queued", "started", "deferred", "scheduled"):
+                payload = _progress_payload(state, rq_status)
+                payload["estado"] = self._get_readable_status(rq_status)
+                return JsonResponse(payload)
+
         try:
             print("[CheckTaskStatusView] Intentando fetch del job...")
             job = Job.fetch(task_id, connection=connection)
@@ -1261,7 +1191,8 @@ class CheckTaskStatusView(BaseView):
 
             if job.is_finished:
                 print(f"[CheckTaskStatusView] Job {task_id} terminado")
-                result = job.result
+                # Las partes grandes (previsualización, dashboard) viven en un artefacto.
+                result = attach_detached(job.result)
                 print(f"[CheckTaskStatusView] Resultado del job: {result}")
 
                 task_name = (
@@ -1349,6 +1280,8 @@ class CheckTaskStatusView(BaseView):
                     )
                     request.session["file_path"] = result["file_path"]
                     request.session["file_name"] = result["file_name"]
+                    request.session["artifact_id"] = result.get("artifact_id")
+                    _remember_dashboard_matrix(request, result)
 
                 job_info = {
                     "execution_time": result.get("execution_time", 0),
@@ -1437,31 +1370,33 @@ class CheckTaskStatusView(BaseView):
                 stage = "En cola"
                 meta = {}
 
-                if hasattr(job, "meta") and job.meta:
-                    meta = job.meta.copy()
-                    if "progress" in job.meta:
-                        progress = job.meta.get("progress")
-                    if "stage" in job.meta:
-                        stage = job.meta.get("stage")
-                    if "status" in job.meta:
-                        meta["status"] = job.meta.get("status")
+                # Progreso agrupado del worker (hash en Redis) sobre job.meta.
+                job_meta = job_progress_meta(job)
+                if job_meta:
+                    meta = job_meta.copy()
+                    if "progress" in job_meta:
+                        progress = job_meta.get("progress")
+                    if "stage" in job_meta:
+                        stage = job_meta.get("stage")
+                    if "status" in job_meta:
+                        meta["status"] = job_meta.get("status")
 
                 file_ready = False
-                if hasattr(job, "meta") and job.meta and "file_path" in job.meta:
-                    file_path = job.meta.get("file_path")
+                if "file_path" in job_meta:
+                    file_path = job_meta.get("file_path")
                     if file_path and os.path.exists(file_path):
                         file_ready = True
-                        if "file_name" in job.meta:
+                        if "file_name" in job_meta:
                             print(
                                 f"[CheckTaskStatusView] Archivo parcial listo: {file_path}"
                             )
                             request.session["file_path"] = file_path
-                            request.session["file_name"] = job.meta.get("file_name")
+                            request.session["file_name"] = job_meta.get("file_name")
                             meta["file_ready"] = True
 
                 # Calcular tiempos usando el reloj del worker cuando sea posible
                 started_ts = job.started_at.timestamp() if job.started_at else None
-                now_ts = job.meta.get("updated_at") if hasattr(job, "meta") and job.meta else None
+                now_ts = job_meta.get("updated_at")
                 if not now_ts:
                     now_ts = time.time()
                 elapsed_time = 0
@@ -1541,6 +1476,33 @@ class CheckTaskStatusView(BaseView):
         }
         return status_map.get(status, status)
 
+    def _cached_report_response(self, request, token):
+        """Responde como una tarea completada usando el resultado de la cachÃ© de reportes."""
+        result = attach_detached(report_cache.get_cached_result(token))
+        if result is None:
+            # La entrada expirÃ³ o el archivo ya no existe: el cliente debe relanzar.
+            return JsonResponse(
+                {
+                    "status": "failed",
+                    "state": "FAILED",
+                    "error_message": "El reporte en cachÃ© ya no estÃ¡ disponible. Por favor, genÃ©relo de nuevo.",
+                },
+                status=200,
+            )
+        request.session["file_path"] = result["file_path"]
+        request.session["file_name"] = result.get("file_name", "")
+        request.session["artifact_id"] = result.get("artifact_id")
+        _remember_dashboard_matrix(request, result)
+        return JsonResponse(
+            {
+                "status": "completed",
+                "state": "COMPLETED",
+                "result": result,
+                "progress": 100,
+                "meta": result.get("metadata", {}),
+            }
+        )
+
     def _generate_summary(self, job, result):
         """
         Genera un resumen legible para el usuario basado en el tipo de tarea y su resultado.
@@ -1744,6 +1706,131 @@ class CheckTaskStatusView(BaseView):
         }
 
 
+TASK_PROGRESS_SSE_ENABLED = os.getenv("TASK_PROGRESS_SSE", "false").lower() in ("1", "true", "yes")
+_RQ_DONE_STATUSES = ("finished", "failed", "stopped", "canceled")
+
+
+def _rq_status(connection, task_id):
+    """Estado RQ del job con un solo HGET (sin deserializar el job ni su resultado)."""
+    try:
+        status = connection.hget(Job.key_for(task_id), "status")
+    except Exception as exc:
+        logger.warning(f"No se pudo leer el estado RQ de {task_id}: {exc}")
+        return None
+    if isinstance(status, bytes):
+        status = status.decode("utf-8")
+    return status
+
+
+def _progress_payload(state, rq_status=None):
+    """Respuesta compacta de progreso a partir del hash del worker."""
+    progress = state.get("progress") or 0
+    started_at = state.get("started_at")
+    updated_at = state.get("updated_at") or time.time()
+    elapsed_time = max(0, updated_at - started_at) if started_at else 0
+    eta = None
+    if state.get("eta_seconds") is not None and progress < 100:
+        # ETA del worker (filas estimadas y ritmo observado), descontando lo
+        # transcurrido desde que lo calculó.
+        eta = state["eta_seconds"] - max(0, time.time() - (state.get("eta_at") or updated_at))
+    if (eta is None or eta <= 0) and progress and elapsed_time > 0 and progress < 100:
+        eta = (elapsed_time / progress) * (100 - progress)
+    done = state.get("status") in TERMINAL_STATUSES or rq_status in _RQ_DONE_STATUSES
+    return {
+        "status": rq_status or "started",
+        "state": (rq_status or "started").upper(),
+        "progress": progress,
+        "stage": state.get("stage", "En cola"),
+        "meta": state,
+        "elapsed_time": elapsed_time,
+        "eta": eta,
+        # El cliente pide el resultado final (check_task_status) una sola vez.
+        "done": done,
+    }
+
+
+class TaskProgressView(BaseView):
+    """
+    Estado de una tarea leyendo solo el hash de progreso: respaldo barato del
+    stream SSE. El resultado final se obtiene con CheckTaskStatusView.
+    """
+
+    def get(self, request, task_id, *args, **kwargs):
+        if report_cache.is_token(task_id):
+            return JsonResponse({"status": "finished", "state": "FINISHED", "progress": 100, "done": True})
+        connection = get_connection()
+        state = read_progress(connection, task_id)
+        rq_status = _rq_status(connection, task_id)
+        if not state and rq_status is None:
+            return JsonResponse({"status": "notfound", "state": "NOTFOUND", "done": True})
+        return JsonResponse(_progress_payload(state, rq_status))
+
+
+class TaskProgressStreamView(BaseView):
+    """
+    Stream SSE con el progreso de una tarea, alimentado por el pub/sub del
+    worker. Cada conexiÃ³n ocupa un hilo web mientras dura (mÃ¡x. ~1 min, luego
+    el navegador se reconecta), por eso se habilita con TASK_PROGRESS_SSE
+    solo cuando gunicorn corre con workers gthread/gevent. Deshabilitado
+    responde 204 y el cliente pasa a consultar TaskProgressView.
+    """
+
+    heartbeat_seconds = 15
+    max_seconds = 55
+
+    def get(self, request, task_id, *args, **kwargs):
+        if not TASK_PROGRESS_SSE_ENABLED or report_cache.is_token(task_id):
+            return HttpResponse(status=204)
+        response = StreamingHttpResponse(
+            self._events(get_connection(), task_id), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # nginx: no acumular el stream
+        return response
+
+    def _events(self, connection, task_id):
+        yield "retry: 3000\n\n"
+        last_state = None
+        for state in stream_progress(
+            connection,
+            task_id,
+            heartbeat_seconds=self.heartbeat_seconds,
+            max_seconds=self.max_seconds,
+        ):
+            if state is None:
+                # Sin publicaciones: si el worker murió (OOM, SIGKILL, job detenido)
+                # nunca llegará un estado terminal; manda el estado RQ.
+                done_event = self._done_event(connection, task_id, last_state)
+                if done_event:
+                    yield done_event
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            last_state = state
+            payload = _progress_payload(state)
+            event = "done" if payload["done"] else "progress"
+            yield f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+            if payload["done"]:
+                return
+        # Fin del stream sin estado terminal: el job puede no existir, haber
+        # terminado hace rato o haber muerto sin publicarlo.
+        done_event = self._done_event(connection, task_id, last_state)
+        if done_event:
+            yield done_event
+
+    @staticmethod
+    def _done_event(connection, task_id, state):
+        """Evento ``done`` si RQ ya no ejecuta el job; ``None`` si sigue en curso."""
+        rq_status = _rq_status(connection, task_id)
+        if rq_status is not None and rq_status not in _RQ_DONE_STATUSES:
+            return None
+        if state and rq_status:
+            payload = _progress_payload(state, rq_status)
+        else:
+            payload = {"status": rq_status or "notfound", "done": True}
+        return f"event: done\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
 class ReporteGenericoPage(BaseView):
     """
     Vista genÃ©rica para reportes tipo Cubo y Proveedor.
@@ -1827,7 +1914,7 @@ class ReporteGenericoPage(BaseView):
             print(
                 f"[ReporteGenericoPage] post: Llamando a task_func.delay con database_name={database_name}, IdtReporteIni={IdtReporteIni}, IdtReporteFin={IdtReporteFin}, user_id={user_id}, id_reporte={self.id_reporte}, batch_size={batch_size}"
             )
-            task = self.task_func.delay(
+            task_args = (
                 database_name,
                 IdtReporteIni,
                 IdtReporteFin,
@@ -1835,8 +1922,20 @@ class ReporteGenericoPage(BaseView):
                 id_reporte,
                 batch_size,
             )
+            cached_token = report_cache.lookup(self.task_func.__name__, *task_args)
+            if cached_token:
+                print(f"[ReporteGenericoPage] post: Reporte servido desde cachÃ© ({cached_token})")
+                return JsonResponse(
+                    {"success": True, "task_id": cached_token, "cached": True}
+                )
+            task = enqueue_task(self.task_func, *task_args)
             print(f"[ReporteGenericoPage] post: Tarea lanzada con task_id={task.id}")
             return JsonResponse({"success": True, "task_id": task.id})
+        except QueueAdmissionError as e:
+            return JsonResponse(
+                {"success": False, "error_message": str(e), "running_task_id": e.job_id},
+                status=429,
+            )
         except Exception as e:
             print(
                 f"[ReporteGenericoPage] post: Error al iniciar la tarea de reporte: {e}"
@@ -1968,6 +2067,23 @@ class InterfacePage(ReporteGenericoPage):
         return super().dispatch(request, *args, **kwargs)
 
 
+def _shared_catalog(view, database_name, user_id, name, table, sql):
+    """Catálogo de una tabla compartida (``powerbi_bimbo``) desde la caché.
+
+    La clave es el servidor BI de la empresa, no la empresa: las que usan el
+    mismo servidor comparten la copia, que se recarga cuando cambia la tabla
+    (ver ``apps.home.catalog_cache``).
+    """
+    config = ConfigBasic(database_name, user_id).config
+    scope = f"{table.split('.')[0]}@{config.get('hostServerIn')}:{config.get('portServerIn')}"
+    return get_catalog(
+        scope,
+        name,
+        lambda: view._fetch_distinct(database_name, user_id, sql, all_rows=True),
+        signature=lambda: table_checksum(view._get_engine(database_name, user_id), table),
+    )
+
+
 class RuteroPage(BaseView):
     """Página SSR para el Informe de Rutero (Maestro Rutas + Clientes)."""
 
@@ -2001,15 +2117,19 @@ class RuteroPage(BaseView):
             str(config["dbBi"]),
         )
 
-    def _fetch_distinct(self, database_name: str, user_id: int, sql: str, params=None):
+    def _fetch_distinct(self, database_name: str, user_id: int, sql: str, params=None, all_rows=False):
         params = params or []
         engine = self._get_engine(database_name, user_id)
-        query = text(f"{sql} LIMIT :limit")
         bind_params = {"limit": int(self.LOOKUP_LIMIT)}
         if params:
             for idx, value in enumerate(params):
                 bind_params[f"p{idx}"] = value
                 sql = sql.replace("%s", f":p{idx}", 1)
+        # all_rows: catálogo completo para la caché (sin LIMIT).
+        if all_rows:
+            bind_params.pop("limit")
+            query = text(sql)
+        else:
             query = text(f"{sql} LIMIT :limit")
 
         with engine.connect() as conn:
@@ -2033,7 +2153,8 @@ class RuteroPage(BaseView):
             "WHERE CEVE IS NOT NULL AND CEVE <> '' ORDER BY CEVE"
         )
         try:
-            return self._fetch_distinct(database_name, user_id, sql)
+            catalog = _shared_catalog(self, database_name, user_id, "agencias", self.AGENCIAS_TABLE, sql)
+            return catalog.search(limit=self.LOOKUP_LIMIT)
         except Exception as exc:
             self._ceves_catalog_error = str(exc)
             logger.exception("No se pudo cargar el catálogo de CEVES")
@@ -2080,12 +2201,19 @@ class RuteroPage(BaseView):
 
         print(f"[rutero][POST] Launching task for CEVE={ceves_code}", flush=True)
 
-        job = rutero_task.delay(
-            database_name=database_name,
-            ceves_code=ceves_code,
-            user_id=user_id,
-            batch_size=batch_size,
-        )
+        try:
+            job = enqueue_task(
+                rutero_task,
+                database_name=database_name,
+                ceves_code=ceves_code,
+                user_id=user_id,
+                batch_size=batch_size,
+            )
+        except QueueAdmissionError as exc:
+            return JsonResponse(
+                {"success": False, "error_message": str(exc), "running_task_id": exc.job_id},
+                status=429,
+            )
 
         return JsonResponse({"success": True, "job_id": job.id})
 
@@ -2124,14 +2252,26 @@ class PreventaPage(RuteroPage):
                 status=400,
             )
 
-        job = preventa_task.delay(
-            database_name=database_name,
-            ceves_code=ceves_code,
-            IdtReporteIni=IdtReporteIni,
-            IdtReporteFin=IdtReporteFin,
-            user_id=user_id,
-            batch_size=batch_size,
-        )
+        task_kwargs = {
+            "database_name": database_name,
+            "ceves_code": ceves_code,
+            "IdtReporteIni": IdtReporteIni,
+            "IdtReporteFin": IdtReporteFin,
+            "user_id": user_id,
+            "batch_size": batch_size,
+        }
+        # Mismo CEVE y fechas: el dashboard ya calculado se sirve de la caché.
+        cached_token = report_cache.lookup("preventa_task", **task_kwargs)
+        if cached_token:
+            return JsonResponse({"success": True, "job_id": cached_token, "cached": True})
+
+        try:
+            job = enqueue_task(preventa_task, **task_kwargs)
+        except QueueAdmissionError as exc:
+            return JsonResponse(
+                {"success": False, "error_message": str(exc), "running_task_id": exc.job_id},
+                status=429,
+            )
 
         return JsonResponse({"success": True, "job_id": job.id})
 
@@ -2196,17 +2336,28 @@ class FaltantesPage(RuteroPage):
                 status=400,
             )
 
-        job = faltantes_task.delay(
-            database_name=database_name,
-            ceves_code=ceves_code,
-            IdtReporteIni=IdtReporteIni,
-            IdtReporteFin=IdtReporteFin,
-            user_id=user_id,
-            filter_type=filter_type,
-            filter_value=filter_value,
-            extra_params={},
-            batch_size=batch_size,
-        )
+        task_kwargs = {
+            "database_name": database_name,
+            "ceves_code": ceves_code,
+            "IdtReporteIni": IdtReporteIni,
+            "IdtReporteFin": IdtReporteFin,
+            "user_id": user_id,
+            "filter_type": filter_type,
+            "filter_value": filter_value,
+            "extra_params": {},
+            "batch_size": batch_size,
+        }
+        cached_token = report_cache.lookup("faltantes_task", **task_kwargs)
+        if cached_token:
+            return JsonResponse({"success": True, "job_id": cached_token, "cached": True})
+
+        try:
+            job = enqueue_task(faltantes_task, **task_kwargs)
+        except QueueAdmissionError as exc:
+            return JsonResponse(
+                {"success": False, "error_message": str(exc), "running_task_id": exc.job_id},
+                status=429,
+            )
 
         return JsonResponse({"success": True, "job_id": job.id})
 
@@ -2342,13 +2493,8 @@ class VentaCeroPage(BaseView):
         self._ceves_catalog_error = None
         if not database_name:
             return []
-        sql = (
-            f"SELECT CEVE AS id, CONCAT_WS(' - ', CEVE, Nombre, nmOficinaV) AS label "
-            f"FROM {self.AGENCIAS_TABLE} "
-            "WHERE CEVE IS NOT NULL AND CEVE <> '' ORDER BY CEVE"
-        )
         try:
-            return self._fetch_distinct(database_name, user_id, sql)
+            return self._agencias_catalog(database_name, user_id).search(limit=self.LOOKUP_LIMIT)
         except Exception as exc:
             self._ceves_catalog_error = str(exc)
             logger.exception("No se pudo cargar el catÃ¡logo de CEVES")
@@ -2357,7 +2503,7 @@ class VentaCeroPage(BaseView):
     # ------------------------------------------------------------------
     # Lookups livianos por catÃ¡logo (evitar texto libre)
     # ------------------------------------------------------------------
-    def _fetch_distinct(self, database_name: str, user_id: int, sql: str, params=None):
+    def _fetch_distinct(self, database_name: str, user_id: int, sql: str, params=None, all_rows=False):
         params = params or []
         engine = self._get_engine(database_name, user_id)
         query = text(f"{sql} LIMIT :limit")
@@ -2370,6 +2516,12 @@ class VentaCeroPage(BaseView):
             for idx in range(len(params)):
                 sql_named = sql_named.replace("%s", f":p{idx}", 1)
             query = text(f"{sql_named} LIMIT :limit")
+        else:
+            sql_named = sql
+        # all_rows: catálogo completo para la caché (sin LIMIT).
+        if all_rows:
+            bind_params.pop("limit")
+            query = text(sql_named)
 
         with engine.connect() as conn:
             result = conn.execute(query, bind_params)
@@ -2385,25 +2537,37 @@ class VentaCeroPage(BaseView):
     def _lookup_proveedores(self, database_name, user_id: int):
         return [{"id": self.PROVEEDOR_BIMBO, "label": self.PROVEEDOR_BIMBO}]
 
-    def _lookup_categorias(self, database_name, user_id: int):
+    def _catalog(self, database_name: str, user_id: int, name: str, table: str, sql: str):
+        """Catálogo completo de ``table`` desde la caché compartida (ver ``_shared_catalog``)."""
+        return _shared_catalog(self, database_name, user_id, name, table, sql)
+
+    def _agencias_catalog(self, database_name: str, user_id: int):
+        sql = (
+            f"SELECT CEVE AS id, CONCAT_WS(' - ', CEVE, Nombre, nmOficinaV) AS label "
+            f"FROM {self.AGENCIAS_TABLE} "
+            "WHERE CEVE IS NOT NULL AND CEVE <> '' ORDER BY CEVE"
+        )
+        return self._catalog(database_name, user_id, "agencias", self.AGENCIAS_TABLE, sql)
+
+    def _categorias_catalog(self, database_name, user_id: int):
         sql = (
             f"SELECT DISTINCT `CategorÃ­a` AS id, `CategorÃ­a` AS label "
             f"FROM {self.PRODUCTOS_TABLE} "
             "WHERE `CategorÃ­a` IS NOT NULL AND `CategorÃ­a` <> '' "
             "ORDER BY `CategorÃ­a`"
         )
-        return self._fetch_distinct(database_name, user_id, sql)
+        return self._catalog(database_name, user_id, "categorias", self.PRODUCTOS_TABLE, sql)
 
-    def _lookup_subcategorias(self, database_name, user_id: int, categoria=None):
+    def _marcas_catalog(self, database_name, user_id: int):
         sql = (
             f"SELECT DISTINCT `Marca` AS id, `Marca` AS label "
             f"FROM {self.PRODUCTOS_TABLE} "
             "WHERE `Marca` IS NOT NULL AND `Marca` <> '' "
             "ORDER BY `Marca`"
         )
-        return self._fetch_distinct(database_name, user_id, sql)
+        return self._catalog(database_name, user_id, "marcas", self.PRODUCTOS_TABLE, sql)
 
-    def _lookup_productos(self, database_name, user_id: int):
+    def _productos_catalog(self, database_name, user_id: int):
         sql = (
             f"SELECT DISTINCT Codigo AS id, "
             "COALESCE(NULLIF(TRIM(`Nombre Corto`), ''), Codigo) AS label "
@@ -2412,24 +2576,21 @@ class VentaCeroPage(BaseView):
             "AND UPPER(COALESCE(Estado, '')) IN ('DISPONIBLE', 'ACTIVO') "
             "ORDER BY Codigo"
         )
-        return self._fetch_distinct(database_name, user_id, sql)
+        return self._catalog(database_name, user_id, "productos", self.PRODUCTOS_TABLE, sql)
+
+    def _lookup_categorias(self, database_name, user_id: int, query=None):
+        return self._categorias_catalog(database_name, user_id).search(query, self.LOOKUP_LIMIT)
+
+    def _lookup_subcategorias(self, database_name, user_id: int, categoria=None, query=None):
+        return self._marcas_catalog(database_name, user_id).search(query, self.LOOKUP_LIMIT)
+
+    def _lookup_productos(self, database_name, user_id: int, query=None):
+        return self._productos_catalog(database_name, user_id).search(query, self.LOOKUP_LIMIT)
 
     def _validate_ceve(self, database_name: str, user_id: int, ceve: str) -> bool:
         if not ceve:
             return False
-        sql = f"SELECT 1 FROM {self.AGENCIAS_TABLE} WHERE CEVE = %s LIMIT 1"
-        return self._value_exists(database_name, user_id, sql, [ceve])
-
-    def _value_exists(self, database_name: str, user_id: int, sql: str, params):
-        engine = self._get_engine(database_name, user_id)
-        sql_named = sql
-        bind_params = {}
-        for idx, value in enumerate(params or []):
-            bind_params[f"p{idx}"] = value
-            sql_named = sql_named.replace("%s", f":p{idx}", 1)
-        with engine.connect() as conn:
-            row = conn.execute(text(sql_named), bind_params).fetchone()
-            return bool(row)
+        return self._agencias_catalog(database_name, user_id).contains(ceve)
 
     def _validate_filter_value(self, database_name, user_id: int, filter_type, filter_value, category_value=None):
         if not filter_value:
@@ -2438,27 +2599,13 @@ class VentaCeroPage(BaseView):
             # Proveedor es un catÃ¡logo cerrado con Ãºnico valor. No validamos contra productos_bimbo
             # para evitar falsos negativos por espacios/case/acento en datos.
             return str(filter_value).strip().upper() == self.PROVEEDOR_BIMBO.upper()
+        # Se valida contra el catálogo en caché (mismas consultas que los lookups).
         if filter_type == "categoria":
-            return self._value_exists(
-                database_name,
-                user_id,
-                f"SELECT 1 FROM {self.PRODUCTOS_TABLE} WHERE `CategorÃ­a` = %s LIMIT 1",
-                [filter_value],
-            )
+            return self._categorias_catalog(database_name, user_id).contains(filter_value)
         if filter_type == "subcategoria":
-            return self._value_exists(
-                database_name,
-                user_id,
-                f"SELECT 1 FROM {self.PRODUCTOS_TABLE} WHERE `Marca` = %s LIMIT 1",
-                [filter_value],
-            )
+            return self._marcas_catalog(database_name, user_id).contains(filter_value)
         if filter_type == "producto":
-            return self._value_exists(
-                database_name,
-                user_id,
-                f"SELECT 1 FROM {self.PRODUCTOS_TABLE} WHERE Codigo = %s AND UPPER(COALESCE(Estado, '')) IN ('DISPONIBLE', 'ACTIVO') LIMIT 1",
-                [filter_value],
-            )
+            return self._productos_catalog(database_name, user_id).contains(filter_value)
         return False
 
     @method_decorator(permission_required("permisos.reportes_bimbo", raise_exception=True))
@@ -2627,7 +2774,7 @@ class VentaCeroPage(BaseView):
                 # El SP para SUBCATEGORIA usa p_familia; p_categoria no es necesaria.
                 "category_value": category_value if filter_type == "categoria" else "",
             }
-            task = venta_cero_task.delay(
+            task_args = (
                 database_name,
                 ceves_code,
                 fecha_ini,
@@ -2636,10 +2783,23 @@ class VentaCeroPage(BaseView):
                 procedure_name,
                 filter_type,
                 filter_value,
-                extra_params={"procedure_params": required_params, **resolved_params},
-                batch_size=batch_size,
             )
+            task_kwargs = {
+                "extra_params": {"procedure_params": required_params, **resolved_params},
+                "batch_size": batch_size,
+            }
+            cached_token = report_cache.lookup("venta_cero_task", *task_args, **task_kwargs)
+            if cached_token:
+                return JsonResponse(
+                    {"success": True, "task_id": cached_token, "cached": True}
+                )
+            task = enqueue_task(venta_cero_task, *task_args, **task_kwargs)
             return JsonResponse({"success": True, "task_id": task.id})
+        except QueueAdmissionError as exc:
+            return JsonResponse(
+                {"success": False, "error_message": str(exc), "running_task_id": exc.job_id},
+                status=429,
+            )
         except Exception as exc:
             logger.error("Error al iniciar tarea Venta Cero: %s", exc)
             return JsonResponse(
@@ -2693,17 +2853,19 @@ class VentaCeroLookupBase(LoginRequiredMixin, View):
         if not database_name:
             return JsonResponse({"results": [], "error": "Seleccione un agente/CEVES."}, status=400)
         categoria = request.GET.get("categoria")
+        # Texto del typeahead: búsqueda por prefijo sobre el catálogo en caché.
+        query = (request.GET.get("q") or "").strip() or None
         page = VentaCeroPage()
         try:
             user_id = request.user.id
             if self.lookup_type == "proveedor":
                 data = page._lookup_proveedores(database_name, user_id)
             elif self.lookup_type == "categoria":
-                data = page._lookup_categorias(database_name, user_id)
+                data = page._lookup_categorias(database_name, user_id, query=query)
             elif self.lookup_type == "subcategoria":
-                data = page._lookup_subcategorias(database_name, user_id, categoria)
+                data = page._lookup_subcategorias(database_name, user_id, categoria, query=query)
             elif self.lookup_type == "producto":
-                data = page._lookup_productos(database_name, user_id)
+                data = page._lookup_productos(database_name, user_id, query=query)
             else:
                 return JsonResponse({"results": [], "error": "Lookup no soportado."}, status=400)
             if not data:
@@ -2819,38 +2981,6 @@ class ReporteadorDataAjaxView(ReporteGenericoPage):
             )
 
 
-def clean_old_media_files(hours=4):
-    """
-    Elimina archivos en la carpeta media/ con extensiones permitidas
-    (.xlsx, .db, .zip, .csv, .txt) que tengan mÃ¡s de 'hours' horas de modificados.
-    """
-    import os
-    import time
-    from pathlib import Path
-
-    MEDIA_DIR = Path("media")
-    EXTENSIONS = {".xlsx", ".db", ".zip", ".csv", ".txt"}
-    now = time.time()
-    removed = []
-    for file in MEDIA_DIR.iterdir():
-        if file.is_file() and file.suffix.lower() in EXTENSIONS:
-            mtime = file.stat().st_mtime
-            age_hours = (now - mtime) / 3600
-
-            if age_hours > hours:
-                try:
-                    file.unlink()
-                    removed.append(str(file))
-                    logger.info(
-                        f"[clean_old_media_files] Archivo eliminado: {file} (antigÃ¼edad: {age_hours:.2f}h)"
-                    )
-                except Exception as e:
-                    logger.error(
-                        f"[clean_old_media_files] Error al eliminar {file}: {e}"
-                    )
-    return removed
-
-
 from django.views.decorators.http import require_POST
 from django.utils.decorators import method_decorator
 from django.contrib.admin.views.decorators import staff_member_required
@@ -1,2 +1,11 @@
 from django.contrib import admin
-# No models yet, pero puedes registrar modelos de monitoreo aquí en el futuro
+
+from .models import TaskRun
+
+
+@admin.register(TaskRun)
+class TaskRunAdmin(admin.ModelAdmin):
+    list_display = ("started_at", "task_name", "database_name", "report_id", "success", "duration", "rows", "db_wait_seconds", "peak_rss_mb")
+    list_filter = ("task_name", "success", "database_name")
+    date_hierarchy = "started_at"
+    search_fields = ("job_id", "database_name")
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_name', models.CharField(max_length=100)),
+                ('database_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('report_id', models.IntegerField(blank=True, null=True)),
+                ('user_id', models.IntegerField(blank=True, null=True)),
+                ('job_id', models.CharField(blank=True, max_length=64, null=True)),
+                ('started_at', models.DateTimeField()),
+                ('success', models.BooleanField(default=True)),
+                ('span_days', models.IntegerField(blank=True, null=True)),
+                ('duration', models.FloatField(help_text='Segundos de la corrida completa')),
+                ('query_seconds', models.FloatField(blank=True, null=True)),
+                ('fetch_seconds', models.FloatField(blank=True, null=True)),
+                ('transform_seconds', models.FloatField(blank=True, null=True)),
+                ('write_seconds', models.FloatField(blank=True, null=True)),
+                ('upload_seconds', models.FloatField(blank=True, null=True)),
+                ('db_wait_seconds', models.FloatField(default=0)),
+                ('db_queries', models.IntegerField(default=0)),
+                ('rows', models.BigIntegerField(default=0)),
+                ('bytes', models.BigIntegerField(default=0)),
+                ('peak_rss_mb', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Corrida de tarea',
+                'verbose_name_plural': 'Corridas de tareas',
+                'db_table': 'monitor_task_run',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['task_name', 'database_name', 'started_at'], name='task_run_serie_idx'), models.Index(fields=['started_at'], name='task_run_fecha_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,5 @@
+from django.db import models
+
 
 class PermisosMonitor:
     class Meta:
@@ -5,3 +7,45 @@ class PermisosMonitor:
         permissions = (
             ("panel_monitor", "Panel de Monitoreo"),
         )
+
+
+class TaskRun(models.Model):
+    """Una corrida de tarea RQ: tiempos por etapa, volumen y recursos (serie de tiempo).
+
+    La escribe ``task_handler`` al terminar cada tarea (ver
+    ``apps.monitor.telemetry``); el panel de rendimiento calcula percentiles
+    y regresiones por tarea, empresa y reporte.
+    """
+
+    task_name = models.CharField(max_length=100)
+    database_name = models.CharField(max_length=100, null=True, blank=True)
+    report_id = models.IntegerField(null=True, blank=True)
+    user_id = models.IntegerField(null=True, blank=True)
+    job_id = models.CharField(max_length=64, null=True, blank=True)
+    started_at = models.DateTimeField()
+    success = models.BooleanField(default=True)
+    span_days = models.IntegerField(null=True, blank=True)
+    duration = models.FloatField(help_text="Segundos de la corrida completa")
+    query_seconds = models.FloatField(null=True, blank=True)
+    fetch_seconds = models.FloatField(null=True, blank=True)
+    transform_seconds = models.FloatField(null=True, blank=True)
+    write_seconds = models.FloatField(null=True, blank=True)
+    upload_seconds = models.FloatField(null=True, blank=True)
+    db_wait_seconds = models.FloatField(default=0)
+    db_queries = models.IntegerField(default=0)
+    rows = models.BigIntegerField(default=0)
+    bytes = models.BigIntegerField(default=0)
+    peak_rss_mb = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.started_at:%Y-%m-%d %H:%M:%S} - {self.task_name} - {self.database_name} - {self.duration:.1f}s"
+
+    class Meta:
+        db_table = "monitor_task_run"
+        verbose_name = "Corrida de tarea"
+        verbose_name_plural = "Corridas de tareas"
+        ordering = ["-started_at"]
+        indexes = [
+            models.Index(fields=["task_name", "database_name", "started_at"], name="task_run_serie_idx"),
+            models.Index(fields=["started_at"], name="task_run_fecha_idx"),
+        ]
@@ -0,0 +1,173 @@
+"""Persistencia y análisis de la telemetría de corridas de tareas.
+
+El worker mide cada corrida con ``scripts.services.task_telemetry`` y
+``task_handler`` la guarda aquí como un :class:`apps.monitor.models.TaskRun`.
+:func:`performance_summary` arma el panel de rendimiento: por tarea, empresa
+y reporte, percentiles de duración, ritmo, espera en la base y memoria, la
+mediana de cada etapa y la detección de regresiones.
+
+Una regresión compara el costo por corrida (segundos por cada mil filas, o
+la duración si la tarea no reporta filas) de la ventana reciente contra la
+mediana de la ventana base anterior. Se marca cuando la mediana reciente
+supera a la base en ``TELEMETRY_REGRESSION_RATIO`` (1.3 por defecto) y ambas
+ventanas tienen al menos ``TELEMETRY_MIN_RUNS`` corridas exitosas.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+REGRESSION_RATIO = float(os.getenv("TELEMETRY_REGRESSION_RATIO", 1.3))
+MIN_RUNS = int(os.getenv("TELEMETRY_MIN_RUNS", 3))
+STAGE_FIELDS = {
+    "query": "query_seconds",
+    "fetch": "fetch_seconds",
+    "transform": "transform_seconds",
+    "write": "write_seconds",
+    "upload": "upload_seconds",
+}
+GROUP_FIELDS = ["task_name", "database_name", "report_id"]
+_VALUE_FIELDS = GROUP_FIELDS + [
+    "started_at",
+    "success",
+    "duration",
+    "rows",
+    "db_wait_seconds",
+    "peak_rss_mb",
+    *STAGE_FIELDS.values(),
+]
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def record_task_run(record: Dict[str, Any], arguments: Dict[str, Any], success: bool, span_days: Optional[int] = None) -> None:
+    """Guarda una corrida medida por ``TaskTelemetry.finish``; un fallo solo se registra en el log."""
+
+    from apps.monitor.models import TaskRun
+
+    stages = record.get("stages") or {}
+    try:
+        TaskRun.objects.create(
+            task_name=record["task_name"],
+            database_name=arguments.get("database_name"),
+            report_id=_as_int(arguments.get("report_id")),
+            user_id=_as_int(arguments.get("user_id")),
+            job_id=record.get("job_id"),
+            started_at=dt.datetime.fromtimestamp(record["started_at"], tz=dt.timezone.utc),
+            success=success,
+            span_days=span_days,
+            duration=record["duration"],
+            db_wait_seconds=record.get("db_wait") or 0,
+            db_queries=record.get("db_queries") or 0,
+            rows=record.get("rows") or 0,
+            bytes=record.get("bytes") or 0,
+            peak_rss_mb=record.get("peak_rss_mb"),
+            **{field: stages.get(name) for name, field in STAGE_FIELDS.items()},
+        )
+    except Exception as exc:
+        # La telemetría es informativa: nunca cambia el resultado de la tarea.
+        logger.warning("No se pudo guardar la telemetría de %s: %s", record.get("task_name"), exc)
+
+
+def _rounded(value: Any, digits: int = 1) -> Optional[float]:
+    return None if value is None or pd.isna(value) else round(float(value), digits)
+
+
+def _cost(df: pd.DataFrame) -> pd.Series:
+    """Segundos por mil filas; la duración cuando la corrida no reporta filas."""
+
+    per_k = df["duration"] / (df["rows"].where(df["rows"] > 0) / 1000)
+    return per_k.fillna(df["duration"])
+
+
+def summarize_runs(
+    df: pd.DataFrame,
+    now: dt.datetime,
+    recent_days: int = 7,
+    ratio: float = REGRESSION_RATIO,
+    min_runs: int = MIN_RUNS,
+) -> List[Dict[str, Any]]:
+    """Percentiles y regresión por (tarea, empresa, reporte) a partir de las corridas."""
+
+    if df.empty:
+        return []
+    df = df.copy()
+    df["report_id"] = df["report_id"].astype("Int64")
+    df["database_name"] = df["database_name"].fillna("")
+    df["cost"] = _cost(df)
+    df["rows_per_second"] = df["rows"] / df["duration"].where(df["duration"] > 0)
+    df["db_wait_share"] = df["db_wait_seconds"] / df["duration"].where(df["duration"] > 0)
+    recent_from = now - dt.timedelta(days=recent_days)
+
+    summary = []
+    for key, group in df.groupby(GROUP_FIELDS, dropna=False, sort=True):
+        ok = group[group["success"]]
+        runs = ok if not ok.empty else group
+        recent = ok[ok["started_at"] >= recent_from]["cost"]
+        baseline = ok[ok["started_at"] < recent_from]["cost"]
+        change = None
+        if len(recent) >= min_runs and len(baseline) >= min_runs and baseline.median() > 0:
+            change = recent.median() / baseline.median()
+        duration = runs["duration"].quantile([0.5, 0.9, 0.95])
+        summary.append(
+            {
+                "task_name": key[0],
+                "database_name": key[1] or None,
+                "report_id": None if pd.isna(key[2]) else int(key[2]),
+                "runs": int(len(group)),
+                "failures": int((~group["success"]).sum()),
+                "last_run": group["started_at"].max(),
+                "p50": round(float(duration[0.5]), 1),
+                "p90": round(float(duration[0.9]), 1),
+                "p95": round(float(duration[0.95]), 1),
+                "rows_p50": int(runs["rows"].median()),
+                "rows_per_second_p50": _rounded(runs["rows_per_second"].median()),
+                "db_wait_share_p50": _rounded(runs["db_wait_share"].median(), 2),
+                "peak_rss_mb_p95": _rounded(runs["peak_rss_mb"].quantile(0.95)),
+                "stages_p50": {
+                    name: _rounded(runs[field].median())
+                    for name, field in STAGE_FIELDS.items()
+                    if runs[field].notna().any()
+                },
+                "recent_runs": int(len(recent)),
+                "baseline_runs": int(len(baseline)),
+                "change": None if change is None else round(float(change), 2),
+                "regression": bool(change is not None and change >= ratio),
+            }
+        )
+    # Regresiones primero, luego las más lentas.
+    summary.sort(key=lambda row: (not row["regression"], -(row["change"] or 0), -row["p95"]))
+    return summary
+
+
+def performance_summary(
+    days: int = 30,
+    recent_days: int = 7,
+    task_name: Optional[str] = None,
+    database_name: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Resumen de las corridas de los últimos ``days`` días (ver :func:`summarize_runs`)."""
+
+    from apps.monitor.models import TaskRun
+
+    now = timezone.now()
+    runs = TaskRun.objects.filter(started_at__gte=now - dt.timedelta(days=days))
+    if task_name:
+        runs = runs.filter(task_name=task_name)
+    if database_name:
+        runs = runs.filter(database_name=database_name)
+    df = pd.DataFrame.from_records(runs.values(*_VALUE_FIELDS), columns=_VALUE_FIELDS)
+    return summarize_runs(df, now, recent_days=recent_days)
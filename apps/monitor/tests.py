@@ -1 +1,69 @@
-# Puedes agregar tests para el dashboard aquí
+import datetime as dt
+
+import pandas as pd
+from django.test import SimpleTestCase
+
+from apps.monitor.telemetry import summarize_runs
+from scripts.services import task_telemetry
+
+
+def _runs(now, durations, days_ago, rows=100_000, task="cubo_ventas_task", empresa="emp_a"):
+    return [
+        {
+            "task_name": task,
+            "database_name": empresa,
+            "report_id": 2,
+            "started_at": now - dt.timedelta(days=ago),
+            "success": True,
+            "duration": duration,
+            "rows": rows,
+            "db_wait_seconds": duration / 2,
+            "peak_rss_mb": 300.0,
+            "query_seconds": 1.0,
+            "fetch_seconds": None,
+            "transform_seconds": None,
+            "write_seconds": None,
+            "upload_seconds": None,
+        }
+        for duration, ago in zip(durations, days_ago)
+    ]
+
+
+class SummarizeRunsTests(SimpleTestCase):
+    now = dt.datetime(2026, 10, 1, tzinfo=dt.timezone.utc)
+
+    def test_detecta_regresion_por_costo_por_fila(self):
+        rows = _runs(self.now, [10, 11, 10, 12], [20, 18, 15, 12]) + _runs(self.now, [20, 22, 21], [3, 2, 1])
+        summary = summarize_runs(pd.DataFrame(rows), self.now, recent_days=7)
+        self.assertEqual(len(summary), 1)
+        self.assertTrue(summary[0]["regression"])
+        self.assertEqual(summary[0]["change"], 2.0)
+        self.assertEqual(summary[0]["stages_p50"], {"query": 1.0})
+        self.assertEqual(summary[0]["db_wait_share_p50"], 0.5)
+
+    def test_mas_filas_no_es_regresion(self):
+        rows = _runs(self.now, [10, 10, 10], [20, 18, 15]) + _runs(self.now, [20, 20, 20], [3, 2, 1], rows=200_000)
+        self.assertFalse(summarize_runs(pd.DataFrame(rows), self.now)[0]["regression"])
+
+    def test_sin_corridas_suficientes_no_compara(self):
+        rows = _runs(self.now, [10], [20]) + _runs(self.now, [50, 60, 70], [3, 2, 1], empresa="emp_b")
+        summary = summarize_runs(pd.DataFrame(rows), self.now)
+        self.assertEqual({row["database_name"] for row in summary}, {"emp_a", "emp_b"})
+        self.assertTrue(all(row["change"] is None for row in summary))
+
+
+class TaskTelemetryTests(SimpleTestCase):
+    def test_etapas_solo_con_telemetria_activa(self):
+        with task_telemetry.stage("write"):
+            pass
+        telemetry = task_telemetry.TaskTelemetry("cubo_ventas_task", "j1")
+        task_telemetry.activate(telemetry)
+        try:
+            with task_telemetry.stage("write"):
+                pass
+            self.assertEqual(list(task_telemetry.timed_iter([1, 2])), [1, 2])
+        finally:
+            task_telemetry.activate(None)
+        record = telemetry.finish(rows=10, size=2048)
+        self.assertEqual(set(record["stages"]), {"write", "fetch"})
+        self.assertEqual((record["rows"], record["bytes"]), (10, 2048))
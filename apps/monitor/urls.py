@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import HomePanelMonitorPage
+from .views import HomePanelMonitorPage, TaskPerformancePage
 
 app_name = 'monitor'
 
 urlpatterns = [
     path('', HomePanelMonitorPage.as_view(), name='dashboard'),
+    path('rendimiento/', TaskPerformancePage.as_view(), name='rendimiento'),
 ]
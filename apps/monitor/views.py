@@ -9,6 +9,8 @@ from django.urls import reverse_lazy
 import time
 from scripts.StaticPage import StaticPage
 from django.core.cache import cache
+from apps.users.audit import get_audit_metrics
+from apps.monitor.telemetry import MIN_RUNS, REGRESSION_RATIO, STAGE_FIELDS, performance_summary
 
 class HomePanelMonitorPage(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
     template_name = 'home/panel_monitor.html'
@@ -60,4 +62,53 @@ class HomePanelMonitorPage(LoginRequiredMixin, UserPassesTestMixin, TemplateView
         user_id = self.request.user.id
         database_name = self.request.session.get("database_name")
         # Aquí puedes agregar lógica para cargar métricas si lo deseas
+        context["audit_metrics"] = get_audit_metrics()
+        return context
+
+
+class TaskPerformancePage(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+    """Percentiles y regresiones de las corridas de tareas por empresa y reporte."""
+
+    template_name = 'home/panel_monitor_rendimiento.html'
+    login_url = reverse_lazy("users_app:user-login")
+    cache_timeout = 60 * 5
+
+    def test_func(self):
+        return self.request.user.has_perm('monitor.panel_monitor') or self.request.user.is_superuser
+
+    def _int_param(self, name, default, maximum):
+        try:
+            return max(1, min(int(self.request.GET.get(name, default)), maximum))
+        except (TypeError, ValueError):
+            return default
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        days = self._int_param("dias", 30, 365)
+        recent_days = min(self._int_param("recientes", 7, 90), days)
+        task_name = self.request.GET.get("tarea") or None
+        database_name = self.request.GET.get("empresa") or None
+        cache_key = f"monitor_rendimiento_{days}_{recent_days}_{task_name}_{database_name}"
+        summary = cache.get(cache_key)
+        if summary is None:
+            summary = performance_summary(
+                days=days,
+                recent_days=recent_days,
+                task_name=task_name,
+                database_name=database_name,
+            )
+            cache.set(cache_key, summary, self.cache_timeout)
+        context.update(
+            {
+                "summary": summary,
+                "regressions": sum(1 for row in summary if row["regression"]),
+                "stages": list(STAGE_FIELDS),
+                "dias": days,
+                "recientes": recent_days,
+                "tarea": task_name or "",
+                "empresa": database_name or "",
+                "regression_ratio": REGRESSION_RATIO,
+                "min_runs": MIN_RUNS,
+            }
+        )
         return context
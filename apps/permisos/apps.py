@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class PermisosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.permisos'
-    verbose_name='Configuración de Permisos'
\ No newline at end of file
+    verbose_name='Configuración de Permisos'
+
+    def ready(self):
+        import apps.permisos.signals  # noqa
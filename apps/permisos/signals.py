@@ -0,0 +1,36 @@
+import logging
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ConfDt, ConfEmpresas, ConfServer, ConfTipo
+
+logger = logging.getLogger(__name__)
+
+
+def _clear_config_cache(database_name=None):
+    # Import diferido: scripts.config arrastra pandas/SQLAlchemy.
+    from scripts.config import ConfigBasic
+
+    try:
+        ConfigBasic.clear_cache(database_name=database_name)
+    except Exception as exc:
+        logger.error(f"No se pudo invalidar la caché de configuración: {exc}")
+
+
+# Cambios en una empresa solo afectan su propia configuración
+@receiver(post_save, sender=ConfEmpresas)
+@receiver(post_delete, sender=ConfEmpresas)
+def conf_empresa_changed(sender, instance, **kwargs):
+    _clear_config_cache(instance.name)
+
+
+# Servidores, credenciales y ventanas de fechas se comparten entre empresas
+@receiver(post_save, sender=ConfServer)
+@receiver(post_delete, sender=ConfServer)
+@receiver(post_save, sender=ConfTipo)
+@receiver(post_delete, sender=ConfTipo)
+@receiver(post_save, sender=ConfDt)
+@receiver(post_delete, sender=ConfDt)
+def conf_compartida_changed(sender, instance, **kwargs):
+    _clear_config_cache()
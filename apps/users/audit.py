@@ -0,0 +1,523 @@
+"""Cola de auditoría asíncrona con escritura por lotes y geolocalización local.
+
+El decorador ``registrar_auditoria`` solo encola el evento (un ``RPUSH`` a Redis
+o, si Redis no responde, una cola en memoria del proceso). Un consumidor en
+segundo plano agrupa los eventos, resuelve la ciudad contra una base MaxMind
+local y los persiste con ``bulk_create``. En la ruta de la petición no hay
+llamadas de red externas.
+
+El consumidor corre como servicio propio (``manage.py procesar_auditoria``) y,
+además, como hilo dentro de cada proceso web. Los eventos de Redis pasan con
+``LMOVE`` a una lista de procesamiento y solo se borran de ella después de
+escribirse, de modo que un proceso que muere a mitad de lote no los pierde.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+try:  # Dependencia opcional: lector de bases MaxMind (.mmdb)
+    import geoip2.database
+    import geoip2.errors
+
+    GEOIP2_AVAILABLE = True
+except ImportError:
+    GEOIP2_AVAILABLE = False
+
+AUDIT_QUEUE_KEY = "audit:events"
+AUDIT_PROCESSING_KEY = "audit:events:processing"
+AUDIT_LOCK_KEY = "audit:consumer:lock"
+AUDIT_METRICS_KEY = "audit:metrics"
+GEO_CACHE_PREFIX = "audit:geo:"
+
+AUDIT_BATCH_SIZE = int(getattr(settings, "AUDIT_BATCH_SIZE", 500))
+AUDIT_FLUSH_INTERVAL = float(getattr(settings, "AUDIT_FLUSH_INTERVAL", 2.0))
+AUDIT_LOCAL_QUEUE_MAXSIZE = int(getattr(settings, "AUDIT_LOCAL_QUEUE_MAXSIZE", 10000))
+GEO_CACHE_TTL = int(getattr(settings, "AUDIT_GEO_CACHE_TTL", 7 * 24 * 3600))
+# Vigencia del turno de consumidor; se renueva tras cada lote escrito.
+AUDIT_LOCK_TTL = int(getattr(settings, "AUDIT_LOCK_TTL", 120))
+
+_LOCAL_QUEUE: "queue.Queue[str]" = queue.Queue(maxsize=AUDIT_LOCAL_QUEUE_MAXSIZE)
+_CONSUMER_LOCK = threading.Lock()
+_CONSUMER: Optional["AuditConsumer"] = None
+
+
+def _get_redis():
+    """Conexión Redis de la caché por defecto, o ``None`` si no está disponible."""
+
+    try:
+        from django_redis import get_redis_connection
+
+        return get_redis_connection("default")
+    except Exception as exc:  # pragma: no cover - depende del entorno
+        logger.debug("Redis no disponible para auditoría: %s", exc)
+        return None
+
+
+# ----------------------------------------------------------------------
+# Geolocalización offline
+# ----------------------------------------------------------------------
+class GeoIPResolver:
+    """Resuelve la ciudad de una IP contra una base MaxMind local.
+
+    Usa un LRU en proceso y, si hay Redis, una caché compartida entre workers.
+    Sin base de datos o sin ``geoip2`` instalado retorna ``None`` sin fallar.
+    """
+
+    def __init__(self, db_path: Optional[str] = None) -> None:
+        self.db_path = db_path or getattr(settings, "GEOIP_CITY_DB", None) or os.getenv(
+            "GEOIP_CITY_DB", os.path.join(str(settings.BASE_DIR), "geoip", "GeoLite2-City.mmdb")
+        )
+        self._reader = None
+        self._reader_lock = threading.Lock()
+        self._lookup = lru_cache(maxsize=4096)(self._lookup_uncached)
+
+    def city(self, ip: str) -> Optional[str]:
+        if not ip:
+            return None
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.is_private or address.is_loopback or address.is_unspecified:
+            return "Local"
+        return self._lookup(ip)
+
+    def _lookup_uncached(self, ip: str) -> Optional[str]:
+        redis_conn = _get_redis()
+        cache_key = f"{GEO_CACHE_PREFIX}{ip}"
+        if redis_conn is not None:
+            try:
+                cached = redis_conn.get(cache_key)
+                if cached is not None:
+                    return cached.decode("utf-8") or None
+            except Exception as exc:
+                logger.debug("Error leyendo caché geo para %s: %s", ip, exc)
+
+        city = self._read_city(ip)
+        if redis_conn is not None:
+            try:
+                redis_conn.set(cache_key, city or "", ex=GEO_CACHE_TTL)
+            except Exception as exc:
+                logger.debug("Error guardando caché geo para %s: %s", ip, exc)
+        return city
+
+    def _read_city(self, ip: str) -> Optional[str]:
+        reader = self._get_reader()
+        if reader is None:
+            return None
+        try:
+            return reader.city(ip).city.name
+        except geoip2.errors.AddressNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning("Error de geolocalización local para IP %s: %s", ip, exc)
+            return None
+
+    def _get_reader(self):
+        if not GEOIP2_AVAILABLE:
+            return None
+        if self._reader is None:
+            with self._reader_lock:
+                if self._reader is None and os.path.exists(self.db_path):
+                    # MODE_MEMORY carga el archivo una vez; las búsquedas no tocan disco.
+                    self._reader = geoip2.database.Reader(
+                        self.db_path, mode=geoip2.database.MODE_MEMORY
+                    )
+        return self._reader
+
+
+_GEO_RESOLVER: Optional[GeoIPResolver] = None
+
+
+def get_geo_resolver() -> GeoIPResolver:
+    global _GEO_RESOLVER
+    if _GEO_RESOLVER is None:
+        _GEO_RESOLVER = GeoIPResolver()
+    return _GEO_RESOLVER
+
+
+# ----------------------------------------------------------------------
+# Productor
+# ----------------------------------------------------------------------
+def encolar_auditoria(
+    usuario_id: int,
+    ip: str,
+    transaccion: str,
+    detalle: Dict[str, Any],
+    database_name: Optional[str],
+) -> None:
+    """Encola un evento de auditoría sin tocar la base de datos."""
+
+    payload = json.dumps(
+        {
+            "usuario_id": usuario_id,
+            "ip": ip,
+            "transaccion": transaccion[:255],
+            "detalle": detalle,
+            "database_name": database_name,
+            "fecha_hora": timezone.now().isoformat(),
+        },
+        default=str,
+    )
+    redis_conn = _get_redis()
+    if redis_conn is not None:
+        try:
+            redis_conn.rpush(AUDIT_QUEUE_KEY, payload)
+            _ensure_consumer()
+            return
+        except Exception as exc:
+            logger.warning("No se pudo encolar auditoría en Redis, usando cola local: %s", exc)
+
+    try:
+        _LOCAL_QUEUE.put_nowait(payload)
+    except queue.Full:
+        logger.error("Cola local de auditoría llena; se descarta el evento de %s", transaccion)
+        _incr_metric("dropped", 1)
+        return
+    _ensure_consumer()
+
+
+# ----------------------------------------------------------------------
+# Consumidor
+# ----------------------------------------------------------------------
+def _pop_batch(redis_conn, batch_size: int) -> List[str]:
+    """Mueve hasta ``batch_size`` eventos a la lista de procesamiento y los retorna.
+
+    Si la lista ya tiene eventos, son de un consumidor que murió antes de
+    confirmarlos: se retornan esos primero.
+    """
+
+    items = redis_conn.lrange(AUDIT_PROCESSING_KEY, 0, -1)
+    if items:
+        logger.warning("Recuperando %s eventos de auditoría sin confirmar", len(items))
+    else:
+        pipe = redis_conn.pipeline(transaction=True)
+        for _ in range(batch_size):
+            pipe.lmove(AUDIT_QUEUE_KEY, AUDIT_PROCESSING_KEY, "LEFT", "RIGHT")
+        items = [item for item in pipe.execute() if item is not None]
+    return [item.decode("utf-8") if isinstance(item, bytes) else item for item in items]
+
+
+def _confirmar_lote(redis_conn) -> None:
+    """Vacía la lista de procesamiento una vez escritos (o reencolados) sus eventos."""
+
+    try:
+        redis_conn.delete(AUDIT_PROCESSING_KEY)
+    except Exception as exc:
+        # Quedan en la lista y se reescriben en el siguiente turno (duplicados, no pérdida).
+        logger.warning("No se pudo confirmar el lote de auditoría: %s", exc)
+
+
+def _tomar_turno(redis_conn) -> Optional[str]:
+    """Un solo consumidor de Redis a la vez: la lista de procesamiento es suya."""
+
+    token = uuid.uuid4().hex
+    try:
+        if redis_conn.set(AUDIT_LOCK_KEY, token, nx=True, ex=AUDIT_LOCK_TTL):
+            return token
+    except Exception as exc:
+        logger.warning("No se pudo tomar el turno de auditoría en Redis: %s", exc)
+    return None
+
+
+def _renovar_turno(redis_conn, token: str) -> None:
+    try:
+        redis_conn.eval(_RENEW_SCRIPT, 1, AUDIT_LOCK_KEY, token, AUDIT_LOCK_TTL)
+    except Exception as exc:
+        logger.debug("No se pudo renovar el turno de auditoría: %s", exc)
+
+
+def _soltar_turno(redis_conn, token: str) -> None:
+    try:
+        redis_conn.eval(_RELEASE_SCRIPT, 1, AUDIT_LOCK_KEY, token)
+    except Exception as exc:
+        logger.debug("No se pudo liberar el turno de auditoría: %s", exc)
+
+
+# Solo actúan si el turno sigue siendo de quien lo tomó.
+_RENEW_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then "
+    "return redis.call('expire', KEYS[1], ARGV[2]) else return 0 end"
+)
+_RELEASE_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then "
+    "return redis.call('del', KEYS[1]) else return 0 end"
+)
+
+
+def _pop_local_batch(batch_size: int) -> List[str]:
+    items: List[str] = []
+    while len(items) < batch_size:
+        try:
+            items.append(_LOCAL_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+
+class AuditRetry(Exception):
+    """La base de datos no respondió; ``payloads`` son los eventos aún sin escribir."""
+
+    def __init__(self, payloads: List[str], cause: Exception) -> None:
+        super().__init__(str(cause))
+        self.payloads = payloads
+
+
+def _build_registro(raw: str, resolver: GeoIPResolver):
+    from apps.users.models import RegistroAuditoria
+
+    try:
+        event = json.loads(raw)
+        return RegistroAuditoria(
+            usuario_id=event["usuario_id"],
+            fecha_hora=parse_datetime(event.get("fecha_hora") or "") or timezone.now(),
+            ip=event.get("ip") or "0.0.0.0",
+            transaccion=event.get("transaccion") or "",
+            detalle=event.get("detalle") or {},
+            database_name=event.get("database_name"),
+            city=resolver.city(event.get("ip") or ""),
+        )
+    except (TypeError, ValueError, KeyError):
+        logger.warning("Evento de auditoría inválido descartado")
+        _incr_metric("dropped", 1)
+        return None
+
+
+def _escribir_por_fila(pendientes: List[tuple]) -> int:
+    """Inserta fila por fila tras fallar el bloque; descarta las filas con datos inválidos."""
+
+    from django.db import DataError, IntegrityError
+
+    from apps.users.models import RegistroAuditoria
+
+    written = 0
+    for index, (raw, registro) in enumerate(pendientes):
+        try:
+            RegistroAuditoria.objects.bulk_create([registro])
+        except (IntegrityError, DataError) as exc:
+            # Reintentarla fallaría igual (p. ej. el usuario ya no existe).
+            logger.error("Evento de auditoría descartado (%s): %s", exc, raw[:500])
+            _incr_metric("dropped", 1)
+        except Exception as exc:
+            raise AuditRetry([pending for pending, _ in pendientes[index:]], exc) from exc
+        else:
+            written += 1
+    return written
+
+
+def escribir_lote(payloads: List[str]) -> int:
+    """Convierte los eventos serializados en registros y los inserta en bloque.
+
+    Si el bloque falla se reintenta fila por fila: las filas que violan
+    restricciones se registran en el log y se descartan, de modo que un evento
+    inválido no bloquea a los demás. Un error de conexión lanza
+    :class:`AuditRetry` con los eventos que faltan por escribir.
+    """
+
+    from apps.users.models import RegistroAuditoria
+
+    if not payloads:
+        return 0
+    resolver = get_geo_resolver()
+    pendientes = []
+    for raw in payloads:
+        registro = _build_registro(raw, resolver)
+        if registro is not None:
+            pendientes.append((raw, registro))
+    if not pendientes:
+        return 0
+
+    start = time.perf_counter()
+    try:
+        RegistroAuditoria.objects.bulk_create(
+            [registro for _, registro in pendientes], batch_size=AUDIT_BATCH_SIZE
+        )
+        written = len(pendientes)
+    except Exception as exc:
+        logger.warning(
+            "Error escribiendo lote de auditoría (%s eventos), se reintenta fila por fila: %s",
+            len(pendientes),
+            exc,
+        )
+        _incr_metric("errors", 1)
+        written = _escribir_por_fila(pendientes)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _record_write(written, elapsed_ms)
+    return written
+
+
+def _reencolar(payloads: List[str]) -> None:
+    """Devuelve eventos a Redis (compartido y persistente); la cola local solo si Redis falla."""
+
+    redis_conn = _get_redis()
+    if redis_conn is not None:
+        try:
+            # Al final de la lista: los eventos nuevos no esperan detrás de los reintentos.
+            redis_conn.rpush(AUDIT_QUEUE_KEY, *payloads)
+            return
+        except Exception as exc:
+            logger.warning("No se pudo reencolar auditoría en Redis: %s", exc)
+    for payload in payloads:
+        try:
+            _LOCAL_QUEUE.put_nowait(payload)
+        except queue.Full:
+            _incr_metric("dropped", 1)
+
+
+def procesar_pendientes(batch_size: int = AUDIT_BATCH_SIZE) -> int:
+    """Drena la cola local y la de Redis. Retorna los registros escritos.
+
+    La cola de Redis solo la drena quien tiene el turno; los demás procesos
+    vacían únicamente su cola local.
+    """
+
+    redis_conn = _get_redis()
+    token = _tomar_turno(redis_conn) if redis_conn is not None else None
+    total = 0
+    try:
+        while True:
+            payloads = _pop_local_batch(batch_size)
+            from_redis = False
+            if token is not None and len(payloads) < batch_size:
+                try:
+                    redis_payloads = _pop_batch(redis_conn, batch_size - len(payloads))
+                    from_redis = bool(redis_payloads)
+                    payloads.extend(redis_payloads)
+                except Exception as exc:
+                    logger.warning("No se pudo leer la cola de auditoría en Redis: %s", exc)
+            if not payloads:
+                return total
+            try:
+                total += escribir_lote(payloads)
+            except AuditRetry as exc:
+                # Base de datos caída: se reintenta en el siguiente ciclo.
+                logger.error("Base de datos no disponible para auditoría (%s eventos pendientes): %s", len(exc.payloads), exc)
+                _reencolar(exc.payloads)
+                if from_redis:
+                    _confirmar_lote(redis_conn)
+                return total
+            if from_redis:
+                _confirmar_lote(redis_conn)
+            if token is not None:
+                _renovar_turno(redis_conn, token)
+    finally:
+        if token is not None:
+            _soltar_turno(redis_conn, token)
+
+
+class AuditConsumer(threading.Thread):
+    """Hilo daemon que drena la cola de auditoría cada ``interval`` segundos."""
+
+    def __init__(self, interval: float = AUDIT_FLUSH_INTERVAL) -> None:
+        super().__init__(name="audit-consumer", daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        from django.db import close_old_connections
+
+        while not self._stop_event.wait(self.interval):
+            try:
+                close_old_connections()
+                procesar_pendientes()
+            except Exception as exc:  # pragma: no cover - logging defensivo
+                logger.error("Error en consumidor de auditoría: %s", exc)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def _ensure_consumer() -> None:
+    global _CONSUMER
+    if not getattr(settings, "AUDIT_INPROCESS_CONSUMER", True):
+        return
+    if _CONSUMER is not None and _CONSUMER.is_alive():
+        return
+    with _CONSUMER_LOCK:
+        if _CONSUMER is None or not _CONSUMER.is_alive():
+            _CONSUMER = AuditConsumer()
+            _CONSUMER.start()
+
+
+# ----------------------------------------------------------------------
+# Métricas
+# ----------------------------------------------------------------------
+_LOCAL_METRICS: Dict[str, float] = {}
+_METRICS_LOCK = threading.Lock()
+
+
+def _incr_metric(name: str, amount: float) -> None:
+    with _METRICS_LOCK:
+        _LOCAL_METRICS[name] = _LOCAL_METRICS.get(name, 0) + amount
+    redis_conn = _get_redis()
+    if redis_conn is not None:
+        try:
+            redis_conn.hincrbyfloat(AUDIT_METRICS_KEY, name, amount)
+        except Exception:
+            pass
+
+
+def _record_write(rows: int, elapsed_ms: float) -> None:
+    _incr_metric("written", rows)
+    _incr_metric("batches", 1)
+    _incr_metric("write_ms_total", elapsed_ms)
+    redis_conn = _get_redis()
+    if redis_conn is not None:
+        try:
+            pipe = redis_conn.pipeline()
+            pipe.hset(AUDIT_METRICS_KEY, "last_write_ms", round(elapsed_ms, 3))
+            pipe.hset(AUDIT_METRICS_KEY, "last_batch_size", rows)
+            pipe.execute()
+        except Exception:
+            pass
+    with _METRICS_LOCK:
+        _LOCAL_METRICS["last_write_ms"] = round(elapsed_ms, 3)
+        _LOCAL_METRICS["last_batch_size"] = rows
+        _LOCAL_METRICS["max_write_ms"] = max(_LOCAL_METRICS.get("max_write_ms", 0), elapsed_ms)
+
+
+def get_audit_metrics() -> Dict[str, Any]:
+    """Profundidad de cola y latencia de escritura (globales si hay Redis)."""
+
+    metrics: Dict[str, Any] = {"local_queue_depth": _LOCAL_QUEUE.qsize()}
+    redis_conn = _get_redis()
+    source: Dict[str, Any] = dict(_LOCAL_METRICS)
+    if redis_conn is not None:
+        try:
+            metrics["redis_queue_depth"] = redis_conn.llen(AUDIT_QUEUE_KEY)
+            metrics["redis_processing_depth"] = redis_conn.llen(AUDIT_PROCESSING_KEY)
+            source = {
+                (k.decode() if isinstance(k, bytes) else k): float(v)
+                for k, v in redis_conn.hgetall(AUDIT_METRICS_KEY).items()
+            }
+        except Exception as exc:
+            logger.debug("No se pudieron leer métricas de auditoría: %s", exc)
+    batches = source.get("batches", 0) or 0
+    metrics.update(
+        {
+            "written": int(source.get("written", 0)),
+            "batches": int(batches),
+            "errors": int(source.get("errors", 0)),
+            "dropped": int(source.get("dropped", 0)),
+            "avg_write_ms": round(source.get("write_ms_total", 0) / batches, 3) if batches else 0.0,
+            "last_write_ms": source.get("last_write_ms", 0.0),
+            "last_batch_size": int(source.get("last_batch_size", 0)),
+        }
+    )
+    return metrics
@@ -9,12 +9,7 @@ from django.utils import timezone
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
-import geocoder
-
-# Remove the GeocoderError import since it doesn't exist in the current version
-# and use a generic Exception instead
-
-from apps.users.models import RegistroAuditoria
+from apps.users.audit import encolar_auditoria, get_geo_resolver
 from scripts.StaticPage import StaticPage
 
 # Configurar logger
@@ -62,6 +57,9 @@ def obtener_ubicacion(ip: str) -> Dict[str, Any]:
     """
     Obtiene información de ubicación a partir de una IP.
 
+    La búsqueda es local (base MaxMind con caché LRU/Redis); no hace
+    llamadas de red.
+
     Args:
         ip: Dirección IP del cliente
 
@@ -69,18 +67,7 @@ def obtener_ubicacion(ip: str) -> Dict[str, Any]:
         Dict: Información de ubicación (ciudad)
     """
     try:
-        if ip in ("127.0.0.1", "localhost", "0.0.0.0", "::1"):
-            return {"city": "Local"}
-
-        # Establecer un timeout para evitar bloquear la aplicación
-        gc = geocoder.ip(ip, timeout=3)
-
-        if gc.ok:
-            return {"city": gc.city}
-        else:
-            logger.warning(f"No se pudo geocodificar la IP: {ip}, Error: {gc.error}")
-            return {"city": None}
-
+        return {"city": get_geo_resolver().city(ip)}
     except Exception as e:
         logger.error(f"Error de geocodificación para IP {ip}: {str(e)}")
         return {"city": None}
@@ -121,7 +108,10 @@ def sanitizar_datos_sensibles(datos: Dict[str, Any]) -> Dict[str, Any]:
 
 def grabar_auditoria(request: HttpRequest, detalle: Dict[str, Any]) -> None:
     """
-    Guarda un registro de auditoría en la base de datos.
+    Encola un registro de auditoría para su escritura en segundo plano.
+
+    La geolocalización y el ``bulk_create`` los hace el consumidor de
+    ``apps.users.audit``; la petición solo paga el encolado.
 
     Args:
         request: La solicitud HTTP
@@ -136,29 +126,20 @@ def grabar_auditoria(request: HttpRequest, detalle: Dict[str, Any]) -> None:
         # Obtener IP del cliente
         ip = obtener_ip_cliente(request)
 
-        # Obtener información de ubicación
-        ubicacion = obtener_ubicacion(ip)
-
         # Sanitizar datos sensibles
         if "datos" in detalle and isinstance(detalle["datos"], dict):
             detalle["datos"] = sanitizar_datos_sensibles(detalle["datos"])
 
-        # Crear y guardar el registro
-        registro = RegistroAuditoria(
-            usuario=request.user,
+        encolar_auditoria(
+            usuario_id=request.user.pk,
             ip=ip,
             transaccion=request.path_info,
             detalle=detalle,
             database_name=getattr(StaticPage, "name", None),
-            city=ubicacion.get("city"),
         )
-        registro.save()
 
     except Exception as e:
         # Loguea el error pero nunca interrumpe el flujo principal
-        import logging
-
-        logger = logging.getLogger(__name__)
         logger.error(f"Error al grabar auditoría: {str(e)}")
         # No relanzar la excepción
 
@@ -0,0 +1,93 @@
+"""Caché compacta de las empresas asignadas a cada usuario.
+
+Se guarda solo la proyección ``(id, name, nmEmpresa)`` ya ordenada por
+``nmEmpresa``, en lugar de un QuerySet con todos los campos de
+``ConfEmpresas``. La clave incluye una versión global (cambios en
+``ConfEmpresas``) y una versión por usuario (cambios en el M2M), de modo que
+invalidar es solo incrementar una versión: las entradas viejas expiran solas.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+EMPRESAS_CACHE_TIMEOUT = 60 * 60  # 1 hora; la validez la garantiza la versión
+_GLOBAL_VERSION_KEY = "user_empresas_version:global"
+_USER_VERSION_KEY = "user_empresas_version:{user_id}"
+_DATA_KEY = "user_empresas:{global_version}:{user_version}:{user_id}"
+
+
+class EmpresaItem(NamedTuple):
+    id: int
+    name: str
+    nmEmpresa: str
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"name": self.name, "nmEmpresa": self.nmEmpresa, "id": self.id}
+
+
+def _data_key(user_id: int) -> str:
+    user_version_key = _USER_VERSION_KEY.format(user_id=user_id)
+    versions = cache.get_many([_GLOBAL_VERSION_KEY, user_version_key])
+    return _DATA_KEY.format(
+        global_version=versions.get(_GLOBAL_VERSION_KEY, 0),
+        user_version=versions.get(user_version_key, 0),
+        user_id=user_id,
+    )
+
+
+def _load_from_db(user) -> Tuple[EmpresaItem, ...]:
+    rows = user.conf_empresas.order_by("nmEmpresa").values_list(
+        "id", "name", "nmEmpresa"
+    )
+    return tuple(EmpresaItem(int(pk), name, nm or "") for pk, name, nm in rows)
+
+
+def get_user_empresas(user) -> Tuple[EmpresaItem, ...]:
+    """Empresas del usuario ordenadas por ``nmEmpresa`` (desde caché si existe)."""
+
+    key = _data_key(user.id)
+    cached = cache.get(key)
+    if cached is not None:
+        return tuple(EmpresaItem(*item) for item in cached)
+
+    empresas = _load_from_db(user)
+    # Se guardan tuplas planas: se deserializan más rápido que objetos de modelo.
+    cache.set(key, [tuple(item) for item in empresas], EMPRESAS_CACHE_TIMEOUT)
+    return empresas
+
+
+def get_user_empresas_context(user) -> Tuple[List[Tuple[str, str]], List[Dict[str, object]]]:
+    """Retorna ``(databases_list, database_list)`` tal como los usan las plantillas."""
+
+    empresas = get_user_empresas(user)
+    return (
+        [(item.name, item.nmEmpresa) for item in empresas],
+        [item.as_dict() for item in empresas],
+    )
+
+
+def find_user_empresa(user, database_name: str) -> Optional[EmpresaItem]:
+    for item in get_user_empresas(user):
+        if item.name == database_name:
+            return item
+    return None
+
+
+def _bump(key: str) -> None:
+    # time_ns evita reutilizar una versión antigua si la clave fue desalojada.
+    cache.set(key, time.time_ns(), None)
+
+
+def invalidate_user_empresas(user_id: int) -> None:
+    _bump(_USER_VERSION_KEY.format(user_id=user_id))
+
+
+def invalidate_all_empresas() -> None:
+    _bump(_GLOBAL_VERSION_KEY)
@@ -0,0 +1,53 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.users.audit import AUDIT_FLUSH_INTERVAL, get_audit_metrics, procesar_pendientes
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Consume la cola de auditoría (Redis) y escribe los registros por lotes con bulk_create."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drena la cola una sola vez y termina",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=AUDIT_FLUSH_INTERVAL,
+            help=f"Segundos entre lotes (default: {AUDIT_FLUSH_INTERVAL})",
+        )
+        parser.add_argument(
+            "--metrics",
+            action="store_true",
+            help="Muestra profundidad de cola y latencia de escritura y termina",
+        )
+
+    def handle(self, *args, **options):
+        if options["metrics"]:
+            for key, value in get_audit_metrics().items():
+                self.stdout.write(f"{key}: {value}")
+            return
+
+        if options["once"]:
+            written = procesar_pendientes()
+            self.stdout.write(self.style.SUCCESS(f"Registros de auditoría escritos: {written}"))
+            return
+
+        self.stdout.write(self.style.SUCCESS("Consumidor de auditoría iniciado"))
+        while True:
+            close_old_connections()
+            try:
+                written = procesar_pendientes()
+                if written:
+                    logger.info("Auditoría: %s registros escritos", written)
+            except Exception as exc:
+                logger.error("Error procesando auditoría: %s", exc)
+            time.sleep(options["interval"])
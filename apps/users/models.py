@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from apps.permisos.models import ConfEmpresas
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
@@ -119,7 +120,8 @@ class UserProfile(models.Model):
 
 class RegistroAuditoria(models.Model):
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    fecha_hora = models.DateTimeField(auto_now_add=True)
+    # La fecha se fija al encolar el evento; la escritura ocurre en segundo plano.
+    fecha_hora = models.DateTimeField(default=timezone.now)
     ip = models.GenericIPAddressField()
     transaccion = models.CharField(max_length=255)
     detalle = models.JSONField()
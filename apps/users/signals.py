@@ -1,31 +1,56 @@
 from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.dispatch import receiver
-from django.core.cache import cache
 from .models import User
+from .empresas_cache import invalidate_all_empresas, invalidate_user_empresas
 from apps.permisos.models import ConfEmpresas
 
 
 # Invalida el caché de empresas del usuario cuando cambian sus empresas asignadas
 def invalidate_user_databases_cache(user_id):
-    cache_key = f"user_databases_{user_id}"
-    cache.delete(cache_key)
+    invalidate_user_empresas(user_id)
 
 
 @receiver(m2m_changed, sender=User.conf_empresas.through)
-def user_empresas_changed(sender, instance, action, **kwargs):
-    if action in ["post_add", "post_remove", "post_clear"]:
+def user_empresas_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ["post_add", "post_remove", "post_clear"]:
+        return
+    if not reverse:
         invalidate_user_databases_cache(instance.id)
+    elif pk_set:
+        # Cambio hecho desde la empresa (empresa.user_set.add(...))
+        for user_id in pk_set:
+            invalidate_user_databases_cache(user_id)
+    else:
+        # post_clear desde la empresa no informa los usuarios afectados
+        invalidate_all_empresas()
+
+
+@receiver(post_save, sender=ConfEmpresas)
+@receiver(post_delete, sender=ConfEmpresas)
+def conf_empresas_changed(sender, instance, **kwargs):
+    invalidate_all_empresas()
 
 
 # Si tienes un modelo de permisos adicionales, puedes agregar señales similares para UserPermission
 from .models import UserPermission
 
 
+def invalidate_user_config_cache(instance):
+    # Los permisos (proveedores/macrozonas) viajan en la configuración cacheada
+    from scripts.config import ConfigBasic
+
+    ConfigBasic.clear_cache(
+        database_name=instance.empresa.name, user_id=instance.user_id
+    )
+
+
 @receiver(post_save, sender=UserPermission)
 def user_permission_saved(sender, instance, **kwargs):
-    invalidate_user_databases_cache(instance.user.id)
+    invalidate_user_databases_cache(instance.user_id)
+    invalidate_user_config_cache(instance)
 
 
 @receiver(post_delete, sender=UserPermission)
 def user_permission_deleted(sender, instance, **kwargs):
-    invalidate_user_databases_cache(instance.user.id)
+    invalidate_user_databases_cache(instance.user_id)
+    invalidate_user_config_cache(instance)
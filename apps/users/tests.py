@@ -1,3 +1,124 @@
-from django.test import TestCase
+import json
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, OperationalError
+from django.test import SimpleTestCase
+
+from apps.users import audit
+
+try:
+    import fakeredis
+
+    FAKEREDIS_AVAILABLE = True
+except ImportError:
+    FAKEREDIS_AVAILABLE = False
+
+
+def _evento(usuario_id):
+    return json.dumps({"usuario_id": usuario_id, "ip": "10.0.0.1", "transaccion": "login"})
+
+
+class AuditTestMixin:
+    redis = None
+
+    def setUp(self):
+        patcher = mock.patch.object(audit, "_get_redis", side_effect=lambda: self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(audit, "_ensure_consumer")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(audit._pop_local_batch, audit.AUDIT_LOCAL_QUEUE_MAXSIZE)
+
+
+class AuditLocalQueueTests(AuditTestMixin, SimpleTestCase):
+    def test_sin_redis_encola_en_memoria(self):
+        audit.encolar_auditoria(1, "10.0.0.1", "login", {}, "emp_a")
+        with mock.patch.object(audit, "escribir_lote", return_value=1) as escribir:
+            self.assertEqual(audit.procesar_pendientes(), 1)
+        (payloads,), _ = escribir.call_args
+        self.assertEqual(json.loads(payloads[0])["database_name"], "emp_a")
+        self.assertEqual(audit._LOCAL_QUEUE.qsize(), 0)
+
+    def test_base_caida_devuelve_los_eventos_a_la_cola_local(self):
+        audit.encolar_auditoria(1, "10.0.0.1", "login", {}, "emp_a")
+        error = audit.AuditRetry(["pendiente"], OperationalError("sin conexión"))
+        with mock.patch.object(audit, "escribir_lote", side_effect=error):
+            self.assertEqual(audit.procesar_pendientes(), 0)
+        self.assertEqual(audit._pop_local_batch(10), ["pendiente"])
+
+
+class AuditEscrituraPorFilaTests(AuditTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("apps.users.models.RegistroAuditoria")
+        self.modelo = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(audit, "_build_registro", side_effect=lambda raw, _: raw)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_descarta_solo_la_fila_invalida(self):
+        self.modelo.objects.bulk_create.side_effect = [
+            IntegrityError("bloque"),
+            None,
+            IntegrityError("usuario inexistente"),
+            None,
+        ]
+        self.assertEqual(audit.escribir_lote(["a", "b", "c"]), 2)
+        filas = [call.args[0] for call in self.modelo.objects.bulk_create.call_args_list[1:]]
+        self.assertEqual(filas, [["a"], ["b"], ["c"]])
+
+    def test_error_de_conexion_retorna_lo_no_escrito(self):
+        self.modelo.objects.bulk_create.side_effect = [
+            OperationalError("bloque"),
+            None,
+            OperationalError("sin conexión"),
+        ]
+        with self.assertRaises(audit.AuditRetry) as ctx:
+            audit.escribir_lote(["a", "b", "c"])
+        self.assertEqual(ctx.exception.payloads, ["b", "c"])
+
+
+@unittest.skipUnless(FAKEREDIS_AVAILABLE, "fakeredis no está instalado")
+class AuditRedisQueueTests(AuditTestMixin, SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        super().setUp()
+        self.redis.rpush(audit.AUDIT_QUEUE_KEY, _evento(1), _evento(2), _evento(3))
+
+    def _cola(self, key=audit.AUDIT_QUEUE_KEY):
+        return [item.decode() for item in self.redis.lrange(key, 0, -1)]
+
+    def test_lote_escrito_se_confirma(self):
+        with mock.patch.object(audit, "escribir_lote", side_effect=len) as escribir:
+            self.assertEqual(audit.procesar_pendientes(batch_size=2), 3)
+        self.assertEqual(escribir.call_count, 2)
+        self.assertEqual(self._cola(), [])
+        self.assertEqual(self._cola(audit.AUDIT_PROCESSING_KEY), [])
+
+    def test_audit_retry_reencola_en_redis(self):
+        def falla(payloads):
+            raise audit.AuditRetry(payloads[1:], OperationalError("sin conexión"))
+
+        with mock.patch.object(audit, "escribir_lote", side_effect=falla):
+            audit.procesar_pendientes()
+        self.assertEqual(self._cola(), [_evento(2), _evento(3)])
+        self.assertEqual(self._cola(audit.AUDIT_PROCESSING_KEY), [])
+        self.assertEqual(audit._LOCAL_QUEUE.qsize(), 0)
+
+    def test_recupera_el_lote_de_un_consumidor_caido(self):
+        # El consumidor anterior movió el evento 1 y murió antes de escribirlo.
+        self.redis.lmove(audit.AUDIT_QUEUE_KEY, audit.AUDIT_PROCESSING_KEY, "LEFT", "RIGHT")
+        with mock.patch.object(audit, "escribir_lote", side_effect=len) as escribir:
+            audit.procesar_pendientes()
+        self.assertEqual(escribir.call_args_list[0].args[0], [_evento(1)])
+        self.assertEqual(self._cola(audit.AUDIT_PROCESSING_KEY), [])
+
+    def test_sin_turno_no_toca_la_cola_de_redis(self):
+        self.redis.set(audit.AUDIT_LOCK_KEY, "otro")
+        with mock.patch.object(audit, "escribir_lote", side_effect=len) as escribir:
+            self.assertEqual(audit.procesar_pendientes(), 0)
+        escribir.assert_not_called()
+        self.assertEqual(len(self._cola()), 3)
@@ -32,6 +32,11 @@ from .forms import (
     UserVerificationForm,
 )
 from .models import User
+from .empresas_cache import (
+    find_user_empresa,
+    get_user_empresas,
+    get_user_empresas_context,
+)
 from apps.permisos.models import ConfEmpresas
 
 import json
@@ -273,37 +278,9 @@ class BaseView(LoginRequiredMixin, TemplateView):
 
         # Obtener empresas asignadas al usuario
         try:
-            # Obtenemos las bases de datos con caché para mejorar rendimiento
-            cache_key = f"user_databases_{self.request.user.id}"
-            databases = cache.get(cache_key)
-
-            if not databases:
-                databases = (
-                    self.request.user.conf_empresas.all()
-                    .select_related()
-                    .order_by("nmEmpresa")
-                )
-                # Guardamos en caché por 5 minutos (ajustar según necesidad)
-                cache.set(cache_key, databases, 300)
-
-            # Crear lista para la plantilla (como tuplas para el selector)
-            databases_list = [
-                (database.name, database.nmEmpresa) for database in databases
-            ]
-
-            # Crear lista para operaciones internas (como diccionarios)
-            database_dict_list = [
-                {
-                    "name": database.name,
-                    "nmEmpresa": database.nmEmpresa,
-                    "id": database.id,
-                }
-                for database in databases
-            ]
-
-            # Ordenar las bases de datos por nombre de empresa
-            sorted_database_list = sorted(
-                database_dict_list, key=lambda x: x["nmEmpresa"]
+            # Proyección compacta (id, name, nmEmpresa) ya ordenada y cacheada
+            databases_list, sorted_database_list = get_user_empresas_context(
+                self.request.user
             )
 
             # Obtener la base de datos seleccionada de la sesión o el POST
@@ -442,10 +419,9 @@ class BaseView(LoginRequiredMixin, TemplateView):
             )
 
         try:
-            # Verificar que la base de datos exista y esté asignada al usuario
-            db_exists = request.user.conf_empresas.filter(name=database_name).exists()
-
-            if not db_exists:
+            # Verificar que la base de datos esté asignada al usuario (caché versionada:
+            # los cambios en la asignación la invalidan)
+            if find_user_empresa(request.user, database_name) is None:
                 return JsonResponse(
                     {
                         "status": "error",
@@ -513,10 +489,8 @@ class BaseView(LoginRequiredMixin, TemplateView):
         try:
             from django.core.cache import cache
 
-            # Invalidar caché de bases de datos del usuario
-            cache_key = f"user_databases_{request.user.id}"
-            cache.delete(cache_key)
-
+            # La lista de empresas no depende de la selección; se invalida por versión
+            # desde apps.users.signals cuando cambian las asignaciones.
             # Invalidar otras cachés relacionadas
             cache_keys = [
                 f"panel_cubo_{request.user.id}",
@@ -546,13 +520,12 @@ def database_list(request):
     Vista para obtener la lista de bases de datos en formato JSON.
     """
     try:
-        databases = request.user.conf_empresas.all().order_by("nmEmpresa")
         databases_list = [
             {
-                "database_name": database.name,
-                "database_nmEmpresa": database.nmEmpresa,
+                "database_name": item.name,
+                "database_nmEmpresa": item.nmEmpresa,
             }
-            for database in databases
+            for item in get_user_empresas(request.user)
         ]
         return JsonResponse({"status": "success", "databases_list": databases_list})
     except Exception as e:
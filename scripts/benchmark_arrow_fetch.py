@@ -0,0 +1,155 @@
+"""Benchmark de lectura: tuplas del cursor -> DataFrame plano vs. lotes Arrow.
+
+Mide filas por segundo, memoria de los DataFrames resultantes
+(``memory_usage(deep=True)``) y pico de RSS de cada camino, cada uno en un
+proceso hijo. Sin ``--dsn`` usa un cursor sintético con las mismas tuplas y
+``description`` que entrega PyMySQL (textos repetidos, DECIMAL, fechas); con
+``--dsn`` y ``--query`` lee de una base real en streaming.
+
+Uso::
+
+    python -m scripts.benchmark_arrow_fetch --filas 200000 1000000
+    python -m scripts.benchmark_arrow_fetch --dsn mysql+pymysql://u:p@host/db \\
+        --query "SELECT * FROM cuboventas LIMIT 500000"
+"""
+
+import argparse
+import datetime
+import multiprocessing as mp
+import resource
+import sys
+import time
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from pymysql.constants import FIELD_TYPE
+
+from scripts.conexion import ARROW_AVAILABLE, DEFAULT_ARROW_BATCH_SIZE, iter_arrow_frames
+
+_DESCRIPTION = [
+    ("id", FIELD_TYPE.LONGLONG, None, 20, 20, 0, False),
+    ("cliente", FIELD_TYPE.VAR_STRING, None, 60, 60, 0, True),
+    ("producto", FIELD_TYPE.VAR_STRING, None, 20, 20, 0, True),
+    ("fecha", FIELD_TYPE.DATE, None, 10, 10, 0, True),
+    ("valor", FIELD_TYPE.NEWDECIMAL, None, 18, 16, 2, True),
+    ("cantidad", FIELD_TYPE.LONG, None, 11, 11, 0, True),
+]
+
+
+class _SyntheticResult:
+    """Imita ``CursorResult``: ``keys()``, ``fetchmany()`` y ``cursor.description``."""
+
+    def __init__(self, total_rows: int) -> None:
+        self.total_rows = total_rows
+        self.offset = 0
+        self.rng = np.random.default_rng(42)
+        self.cursor = type("Cursor", (), {"description": _DESCRIPTION})()
+
+    def keys(self):
+        return [desc[0] for desc in _DESCRIPTION]
+
+    def fetchmany(self, size: int):
+        size = min(size, self.total_rows - self.offset)
+        if size <= 0:
+            return []
+        base = datetime.date(2024, 1, 1)
+        ids = range(self.offset, self.offset + size)
+        dias = self.rng.integers(0, 365, size)
+        valores = self.rng.random(size) * 100000
+        cantidades = self.rng.integers(0, 500, size)
+        rows = [
+            (
+                i,
+                f"CLIENTE {i % 5000:05d}",
+                f"PROD-{i % 800:04d}",
+                base + datetime.timedelta(days=int(dia)),
+                Decimal(f"{valor:.2f}"),
+                int(cantidad),
+            )
+            for i, dia, valor, cantidad in zip(ids, dias, valores, cantidades)
+        ]
+        self.offset += size
+        return rows
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _open_result(args):
+    if not args.dsn:
+        return None, _SyntheticResult(args.total_rows)
+    import sqlalchemy
+
+    engine = sqlalchemy.create_engine(args.dsn)
+    conn = engine.connect()
+    result = conn.execution_options(stream_results=True).execute(sqlalchemy.text(args.query))
+    return conn, result
+
+
+def _frames_tuplas(result, batch_size):
+    columns = list(result.keys())
+    while True:
+        rows = result.fetchmany(batch_size)
+        if not rows:
+            break
+        yield pd.DataFrame(rows, columns=columns)
+
+
+def _frames_arrow(result, batch_size):
+    yield from iter_arrow_frames(result, batch_size)
+
+
+def _run(target, args, queue) -> None:
+    conn, result = _open_result(args)
+    start = time.perf_counter()
+    rows = 0
+    frame_bytes = 0
+    for frame in target(result, args.batch_size):
+        rows += len(frame)
+        frame_bytes = max(frame_bytes, int(frame.memory_usage(deep=True).sum()))
+    elapsed = time.perf_counter() - start
+    if conn is not None:
+        conn.close()
+    queue.put((rows, elapsed, frame_bytes / (1024 * 1024), _peak_rss_mb()))
+
+
+def _measure(target, args):
+    queue = mp.Queue()
+    proc = mp.Process(target=_run, args=(target, args, queue))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError(f"El proceso de benchmark terminó con código {proc.exitcode}")
+    return queue.get()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, nargs="+", default=[200_000, 1_000_000])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_ARROW_BATCH_SIZE)
+    parser.add_argument("--dsn", help="URL SQLAlchemy de una base real (opcional)")
+    parser.add_argument("--query", help="Consulta a leer cuando se usa --dsn")
+    args = parser.parse_args()
+    if args.dsn and not args.query:
+        parser.error("--dsn requiere --query")
+    if not ARROW_AVAILABLE:
+        print("pyarrow no está instalado: ambos caminos usan DataFrames desde tuplas.")
+
+    caminos = [("tuplas -> DataFrame", _frames_tuplas), ("Arrow tipado", _frames_arrow)]
+    tamanos = [None] if args.dsn else args.filas
+
+    print(f"{'camino':<22} {'filas':>10} {'seg':>7} {'filas/s':>10} {'lote MB':>8} {'pico RSS MB':>12}")
+    for total_rows in tamanos:
+        args.total_rows = total_rows
+        for label, target in caminos:
+            rows, elapsed, frame_mb, peak = _measure(target, args)
+            rate = rows / elapsed if elapsed else 0
+            print(f"{label:<22} {rows:>10,} {elapsed:>7.2f} {rate:>10,.0f} {frame_mb:>8.1f} {peak:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark del costo de reportar progreso desde un worker RQ.
+
+Compara el camino anterior (``job.meta.update`` + ``print`` + ``save_meta``
+en cada callback) con :class:`ProgressReporter` sobre el mismo Redis en
+memoria (fakeredis) o uno real (``--redis-url``). Simula un generador que
+reporta por lote y cambia de etapa algunas veces; reporta tiempo por
+callback, escrituras a Redis y bytes enviados.
+
+Uso::
+
+    python -m scripts.benchmark_job_progress --callbacks 2000 --lote-ms 2
+"""
+
+import argparse
+import contextlib
+import io
+import pickle
+import time
+
+from scripts.services.job_progress import ProgressReporter
+
+
+def _connection(redis_url):
+    if redis_url:
+        import redis
+
+        return redis.Redis.from_url(redis_url)
+    import fakeredis
+
+    return fakeredis.FakeRedis()
+
+
+def _updates(total: int):
+    """(progreso, etapa, meta) como los emite CuboVentas: un callback por lote."""
+
+    etapas = ["Extrayendo datos", "Escribiendo archivo", "Finalizando"]
+    for i in range(total):
+        etapa = etapas[min(len(etapas) - 1, i * len(etapas) // total)]
+        yield 5 + (90 * i) // total, etapa, {"records_processed": i * 10_000, "total_records_estimate": total * 10_000}
+
+
+def _run_save_meta(conn, total: int, lote_s: float):
+    from rq.job import Job
+
+    job = Job.create(func=print, connection=conn)
+    job.save()
+    # El meta arrastraba el resultado completo de tareas anteriores (preview, etc.).
+    job.meta["result"] = {"preview": [{"col": "x" * 40} for _ in range(100)]}
+    writes = bytes_sent = 0
+    overhead = 0.0
+    sink = io.StringIO()
+    for progress, stage, meta in _updates(total):
+        time.sleep(lote_s)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sink):
+            print(f"[update_job_progress] job_id={job.id}, progress={progress}, meta={meta}")
+            job.meta.update({**job.meta, **meta, "stage": stage, "progress": progress,
+                             "status": "processing", "updated_at": time.time()})
+            job.save_meta()
+        overhead += time.perf_counter() - start
+        writes += 1
+        bytes_sent += len(pickle.dumps(job.meta))
+    return overhead, writes, bytes_sent
+
+
+class _CountingPipeline:
+    def __init__(self, pipeline, counter):
+        self._pipeline = pipeline
+        self._counter = counter
+
+    def hset(self, key, mapping):
+        self._counter["bytes"] += sum(len(k) + len(v) for k, v in mapping.items())
+        return self._pipeline.hset(key, mapping=mapping)
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+
+class _CountingConnection:
+    """Cuenta los bytes de los campos que el reporter envía a Redis."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.counter = {"bytes": 0}
+
+    def pipeline(self, transaction=True):
+        return _CountingPipeline(self._conn.pipeline(transaction=transaction), self.counter)
+
+
+def _run_reporter(conn, total: int, lote_s: float):
+    counting = _CountingConnection(conn)
+    reporter = ProgressReporter(counting, "bench-job")
+    overhead = 0.0
+    for progress, stage, meta in _updates(total):
+        time.sleep(lote_s)
+        start = time.perf_counter()
+        reporter.update(progress, "processing", {**meta, "stage": stage})
+        overhead += time.perf_counter() - start
+    reporter.update(100, "completed", {"stage": "Completado"})
+    return overhead, reporter.writes, counting.counter["bytes"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--callbacks", type=int, default=1000)
+    parser.add_argument("--lote-ms", type=float, default=2.0, help="Trabajo simulado entre callbacks")
+    parser.add_argument("--redis-url")
+    args = parser.parse_args()
+
+    conn = _connection(args.redis_url)
+    lote_s = args.lote_ms / 1000
+    print(f"{'camino':<22} {'callbacks':>9} {'overhead ms':>12} {'us/callback':>12} {'escrituras':>10} {'KB enviados':>12}")
+    for label, runner in (("save_meta por callback", _run_save_meta), ("ProgressReporter", _run_reporter)):
+        overhead, writes, bytes_sent = runner(conn, args.callbacks, lote_s)
+        print(
+            f"{label:<22} {args.callbacks:>9} {overhead * 1000:>12.1f} "
+            f"{overhead * 1e6 / args.callbacks:>12.1f} {writes:>10} {bytes_sent / 1024:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Benchmark de la comprobación de claves existentes antes de insertar.
+
+Compara el filtro anterior de ``CargueInfoVentas.filtrar_nuevos_registros``
+(un ``SELECT * ... WHERE (claves) = (...)`` por registro y tuplas en Python)
+con :func:`scripts.services.key_probe.missing_keys_mask` por tabla temporal
+y por listas ``IN`` de varias filas. Cada escenario corre en un proceso hijo
+sobre una tabla de hechos con el mismo número de filas que el lote entrante,
+de las que la mitad ya existen.
+
+Sin ``--dsn`` usa un archivo SQLite temporal; con ``--dsn`` una base real
+(se crea y elimina la tabla ``bench_key_probe``).
+
+Uso::
+
+    python -m scripts.benchmark_key_probe --filas 100000 1000000 5000000
+    python -m scripts.benchmark_key_probe --filas 5000000 --metodos temp_table
+    python -m scripts.benchmark_key_probe --dsn mysql+pymysql://u:p@host/db --filas 100000
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from scripts.services.key_probe import DEFAULT_PROBE_BATCH_SIZE, missing_keys_mask
+
+TABLE = "bench_key_probe"
+KEYS = ["factura_id", "producto_id", "tplinea_id", "nro_linea"]
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _keys(start: int, total: int) -> pd.DataFrame:
+    ids = np.arange(start, start + total)
+    return pd.DataFrame(
+        {
+            "factura_id": (ids // 8).astype(str),
+            "producto_id": (ids % 800).astype(str),
+            "tplinea_id": np.where(ids % 2 == 0, "V", "D"),
+            "nro_linea": (ids % 8).astype(str),
+        }
+    )
+
+
+def _prepare(dsn: str, total: int) -> None:
+    """Tabla de hechos con ``total`` filas: las claves [0, total)."""
+
+    engine = create_engine(dsn)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        conn.execute(
+            text(
+                f"CREATE TABLE {TABLE} (factura_id VARCHAR(30) NOT NULL, producto_id VARCHAR(10) NOT NULL, "
+                "tplinea_id VARCHAR(1) NOT NULL, nro_linea VARCHAR(10) NOT NULL, cantidad FLOAT, "
+                "PRIMARY KEY (factura_id, producto_id, tplinea_id, nro_linea))"
+            )
+        )
+        insert = text(
+            f"INSERT INTO {TABLE} VALUES (:factura_id, :producto_id, :tplinea_id, :nro_linea, 1.0)"
+        )
+        for start in range(0, total, 200_000):
+            conn.execute(insert, _keys(start, min(200_000, total - start)).to_dict("records"))
+    engine.dispose()
+
+
+def _legacy(conn, frame: pd.DataFrame, batch_size: int) -> np.ndarray:
+    """Réplica del filtro anterior: una consulta por registro con la fila completa."""
+
+    query = text(
+        f"SELECT * FROM {TABLE} WHERE factura_id = :factura_id AND producto_id = :producto_id "
+        "AND tplinea_id = :tplinea_id AND nro_linea = :nro_linea"
+    )
+    records = frame.to_dict("records")
+    nuevos = []
+    for start in range(0, len(records), batch_size):
+        batch = records[start : start + batch_size]
+        existentes = set()
+        for record in batch:
+            for row in conn.execute(query, record).fetchall():
+                existentes.add(tuple(row._mapping[k] for k in KEYS))
+        nuevos.extend(tuple(r[k] for k in KEYS) not in existentes for r in batch)
+    return np.asarray(nuevos, dtype=bool)
+
+
+def _run(method: str, dsn: str, total: int, batch_size: int, queue) -> None:
+    # Lote entrante: la mitad ya existe en la tabla, la otra mitad es nueva.
+    frame = _keys(total // 2, total)
+    engine = create_engine(dsn)
+    with engine.begin() as conn:
+        start = time.perf_counter()
+        if method == "legacy":
+            mask = _legacy(conn, frame, batch_size)
+        else:
+            mask = missing_keys_mask(conn, TABLE, KEYS, frame, batch_size=batch_size, method=method)
+        elapsed = time.perf_counter() - start
+    engine.dispose()
+    queue.put((int(mask.sum()), elapsed, _peak_rss_mb()))
+
+
+def _measure(method: str, dsn: str, total: int, batch_size: int):
+    queue = mp.Queue()
+    proc = mp.Process(target=_run, args=(method, dsn, total, batch_size, queue))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError(f"El proceso de benchmark terminó con código {proc.exitcode}")
+    return queue.get()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_PROBE_BATCH_SIZE)
+    parser.add_argument("--dsn", help="URL SQLAlchemy de una base real (opcional)")
+    parser.add_argument(
+        "--metodos",
+        nargs="+",
+        choices=["legacy", "in_list", "temp_table"],
+        default=["legacy", "in_list", "temp_table"],
+    )
+    parser.add_argument(
+        "--legacy-max",
+        type=int,
+        default=1_000_000,
+        help="No correr el método anterior por encima de estas filas (tarda demasiado)",
+    )
+    args = parser.parse_args()
+
+    tmp_path = None
+    dsn = args.dsn
+    if not dsn:
+        fd, tmp_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        dsn = f"sqlite:///{tmp_path}"
+
+    print(f"{'método':<12} {'filas':>10} {'nuevas':>10} {'seg':>8} {'filas/s':>11} {'pico RSS MB':>12}")
+    try:
+        for total in args.filas:
+            _prepare(dsn, total)
+            for method in args.metodos:
+                if method == "legacy" and total > args.legacy_max:
+                    print(f"{method:<12} {total:>10,} {'(omitido)':>10}")
+                    continue
+                nuevas, elapsed, peak = _measure(method, dsn, total, args.batch_size)
+                rate = total / elapsed if elapsed else 0
+                print(f"{method:<12} {total:>10,} {nuevas:>10,} {elapsed:>8.2f} {rate:>11,.0f} {peak:>12.1f}")
+    finally:
+        engine = create_engine(dsn)
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        engine.dispose()
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+if __name__ == "__main__":
+    main()
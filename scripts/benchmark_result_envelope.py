@@ -0,0 +1,165 @@
+"""Benchmark del tamaño en Redis de los resultados de tareas.
+
+Compara el resultado completo (como lo devolvían las tareas) con el
+reducido por :func:`scripts.services.result_envelope.detach_large_parts`
+para resultados sintéticos con la forma de los reales: cubo con
+previsualización de 100 filas y ``performance_report``, dashboard de
+Preventa con la primera página de la matriz y una tarea fallida con
+traceback. Cada resultado se guarda serializado con pickle (como lo hace RQ)
+en un Redis en memoria (fakeredis) o uno real (``--redis-url``); con Redis
+real se reporta además ``MEMORY USAGE``. También mide lo que cuesta
+deserializar el resultado en cada sondeo y restituir las partes separadas
+cuando se entrega al navegador.
+
+Uso::
+
+    python -m scripts.benchmark_result_envelope
+    python -m scripts.benchmark_result_envelope --jobs 500 --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import datetime as dt
+import os
+import pickle
+import tempfile
+import time
+from decimal import Decimal
+
+ITERATIONS = 200
+
+
+def _connection(redis_url):
+    if redis_url:
+        import redis
+
+        return redis.Redis.from_url(redis_url)
+    import fakeredis
+
+    return fakeredis.FakeRedis()
+
+
+def _cubo_result():
+    headers = [f"columna_{i}" for i in range(40)]
+    rows = [
+        {h: (Decimal("1234.56") if i % 3 else f"valor {n}-{i}") for i, h in enumerate(headers)}
+        for n in range(100)
+    ]
+    report = "\n".join(f"Etapa {i}: {i * 1.5:.2f}s, {i * 10_000} registros" for i in range(200))
+    return {
+        "success": True,
+        "file_path": "/media/artifacts/x/cubo.xlsx",
+        "file_name": "cubo.xlsx",
+        "artifact_id": "x",
+        "metadata": {"total_records": 1_250_000, "performance_report": report},
+        "preview_headers": headers,
+        "preview_sample": rows,
+    }
+
+
+def _preventa_result():
+    matrix = [
+        {
+            "Zona": f"{z:04d} - ZONA {z}",
+            "FechaDisplay": "2025-01-01 (Miércoles)",
+            "Programados": 40.0,
+            "Atendidos": 35.0,
+            "Cobertura": 87.5,
+            "Pedidos": 30.0,
+            "TicketPromedio": 125_000.0,
+            "Valor Total": 3_750_000.0,
+            "Hora Inicio": "07:01:00",
+            "Hora Fin": "15:30:00",
+            "Tiempo Total": "08:29:00",
+        }
+        for z in range(500)
+    ]
+    return {
+        "success": True,
+        "file_path": "/media/artifacts/y/preventa.xlsx",
+        "file_name": "preventa.xlsx",
+        "dashboard": {
+            "kpis": {"total_pedidos": 15000, "tiempo_promedio": "05:30"},
+            "matrix": matrix,
+            "matrix_total": 4000,
+            "matrix_artifact_id": "z",
+        },
+        "metadata": {"execution_time": 12.5, "fecha": dt.date(2025, 1, 1)},
+    }
+
+
+def _error_result():
+    frames = "".join(
+        f'  File "/app/scripts/extrae_bi/modulo_{i}.py", line {i * 7}, in funcion_{i}\n    llamada_{i}(argumento)\n'
+        for i in range(60)
+    )
+    return {
+        "success": False,
+        "error_message": "Error inesperado en tarea RQ cubo_ventas_task: (pymysql.err.OperationalError) Lost connection",
+        "error_details": f"Traceback (most recent call last):\n{frames}OperationalError: Lost connection\n",
+        "execution_time": 321.0,
+    }
+
+
+def _memory(conn, key, real):
+    if not real:
+        return None
+    return conn.memory_usage(key)
+
+
+def _measure(conn, label, result, jobs, real):
+    from scripts.services.result_envelope import attach_detached, detach_large_parts
+
+    rows = []
+    for variant, value in (("completo", result), ("reducido", detach_large_parts(result, name=label))):
+        data = pickle.dumps(value)
+        keys = [f"bench:result:{label}:{variant}:{n}" for n in range(jobs)]
+        with conn.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hset(key, "result", data)
+            pipe.execute()
+        memory = _memory(conn, keys[0], real)
+
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            pickle.loads(conn.hget(keys[0], "result"))
+        poll_us = (time.perf_counter() - start) * 1e6 / ITERATIONS
+
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            attach_detached(pickle.loads(data))
+        deliver_us = (time.perf_counter() - start) * 1e6 / ITERATIONS
+
+        conn.delete(*keys)
+        rows.append((variant, len(data), memory, poll_us, deliver_us))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=200, help="Resultados guardados por escenario")
+    parser.add_argument("--redis-url")
+    args = parser.parse_args()
+
+    # Los artefactos del benchmark van a un directorio temporal.
+    os.environ.setdefault("ARTIFACTS_ROOT", tempfile.mkdtemp(prefix="bench_result_"))
+    conn = _connection(args.redis_url)
+    real = bool(args.redis_url)
+    scenarios = (("cubo", _cubo_result()), ("preventa", _preventa_result()), ("error", _error_result()))
+
+    print(
+        f"{'escenario':<10} {'variante':<9} {'bytes':>9} {'MEMORY USAGE':>13} "
+        f"{'MB x jobs':>10} {'us/sondeo':>10} {'us/entrega':>11}"
+    )
+    for label, result in scenarios:
+        for variant, size, memory, poll_us, deliver_us in _measure(conn, label, result, args.jobs, real):
+            mem = f"{memory:>13}" if memory is not None else f"{'-':>13}"
+            total_mb = (memory or size) * args.jobs / 1024 / 1024
+            print(
+                f"{label:<10} {variant:<9} {size:>9} {mem} "
+                f"{total_mb:>10.2f} {poll_us:>10.1f} {deliver_us:>11.1f}"
+            )
+    print(f"Artefactos en {os.environ['ARTIFACTS_ROOT']}")
+
+
+if __name__ == "__main__":
+    main()
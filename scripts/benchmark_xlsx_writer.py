@@ -0,0 +1,103 @@
+"""Benchmark de memoria del escritor XLSX en streaming.
+
+Escribe libros sintéticos de distintos tamaños, cada uno en un proceso hijo,
+y reporta el pico de RSS. Con ``StreamingXlsxWriter`` el pico debe mantenerse
+plano aunque crezca el número de filas; con ``--comparar-openpyxl`` se mide
+también el camino anterior (``pd.ExcelWriter`` + ``to_excel`` por chunks).
+
+Uso::
+
+    python -m scripts.benchmark_xlsx_writer --filas 50000 200000 800000
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from scripts.services.xlsx_writer import StreamingXlsxWriter
+
+BATCH_SIZE = 10_000
+
+
+def _batches(total_rows: int):
+    rng = np.random.default_rng(42)
+    for start in range(0, total_rows, BATCH_SIZE):
+        size = min(BATCH_SIZE, total_rows - start)
+        yield pd.DataFrame(
+            {
+                "id": np.arange(start, start + size),
+                "cliente": [f"CLIENTE {i % 5000:05d}\x07" for i in range(start, start + size)],
+                "producto": rng.integers(1000, 9999, size).astype(str),
+                "fecha": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, size), unit="D"),
+                "valor": [Decimal(f"{v:.2f}") for v in rng.random(size) * 100000],
+                "cantidad": rng.integers(0, 500, size),
+            }
+        )
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_streaming(total_rows: int, path: str, queue) -> None:
+    start = time.perf_counter()
+    with StreamingXlsxWriter(path) as writer:
+        writer.write_batches("Datos", _batches(total_rows))
+    queue.put((time.perf_counter() - start, _peak_rss_mb()))
+
+
+def _run_openpyxl(total_rows: int, path: str, queue) -> None:
+    start = time.perf_counter()
+    start_row = 0
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for idx, chunk in enumerate(_batches(total_rows)):
+            # openpyxl rechaza caracteres de control: la limpieza era manual.
+            chunk["cliente"] = chunk["cliente"].str.replace("\x07", "", regex=False)
+            chunk.to_excel(writer, sheet_name="Datos", index=False, header=idx == 0, startrow=start_row)
+            start_row += len(chunk) + (1 if idx == 0 else 0)
+    queue.put((time.perf_counter() - start, _peak_rss_mb()))
+
+
+def _measure(target, total_rows: int):
+    queue = mp.Queue()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.xlsx")
+        proc = mp.Process(target=target, args=(total_rows, path, queue))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0:
+            raise RuntimeError(f"El proceso de benchmark terminó con código {proc.exitcode}")
+        elapsed, peak = queue.get()
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+    return elapsed, peak, size_mb
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, nargs="+", default=[50_000, 200_000, 500_000])
+    parser.add_argument("--comparar-openpyxl", action="store_true")
+    args = parser.parse_args()
+
+    engines = [("xlsxwriter constant_memory", _run_streaming)]
+    if args.comparar_openpyxl:
+        engines.append(("openpyxl to_excel", _run_openpyxl))
+
+    print(f"{'motor':<28} {'filas':>10} {'seg':>8} {'pico RSS MB':>12} {'archivo MB':>11}")
+    for label, target in engines:
+        for total_rows in args.filas:
+            elapsed, peak, size_mb = _measure(target, total_rows)
+            print(f"{label:<28} {total_rows:>10,} {elapsed:>8.1f} {peak:>12.1f} {size_mb:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
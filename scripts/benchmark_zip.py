@@ -0,0 +1,152 @@
+"""Benchmark de la escritura del ZIP de planos.
+
+Compara el camino anterior (``zipfile.ZipFile``, que en el plano escribía
+los miembros sin comprimir, y su variante ``ZIP_DEFLATED`` de un solo hilo)
+con :class:`scripts.services.parallel_zip.ParallelZipWriter` en modo
+``deflate`` con distintos hilos y en modo ``store``. Cada escenario corre en
+un proceso hijo y copia el mismo CSV sintético (con forma de plano) al
+miembro del ZIP en bloques, como lo hace ``InterfacePlano``.
+
+La aceleración depende de los núcleos disponibles: con un solo CPU los
+escenarios ``deflate`` tardan lo mismo que ``zipfile``.
+
+Uso::
+
+    python -m scripts.benchmark_zip --mb 200
+    python -m scripts.benchmark_zip --mb 500 --hilos 1 2 4 8 --nivel 1 6
+    python -m scripts.benchmark_zip --mb 50 --verificar
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+
+from scripts.services.parallel_zip import ParallelZipWriter
+
+CHUNK = 4 * 1024 * 1024
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _generar_csv(path: str, mb: int) -> int:
+    """CSV separado por ``|`` con códigos, textos repetidos e importes."""
+
+    rng = np.random.default_rng(7)
+    target = mb * 1024 * 1024
+    written = 0
+    start = 0
+    with open(path, "wb") as fh:
+        while written < target:
+            ids = np.arange(start, start + 100_000)
+            importes = rng.random(len(ids)) * 100_000
+            lines = "".join(
+                f"{i}|CLI{i % 9973:06d}|Cliente {i % 9973}|ZONA{i % 17}|{i % 3000}|{importe:.2f}\n"
+                for i, importe in zip(ids, importes)
+            ).encode()
+            fh.write(lines)
+            written += len(lines)
+            start += len(ids)
+    return written
+
+
+def _copiar(src: str, member) -> None:
+    with open(src, "rb") as fh:
+        while True:
+            data = fh.read(CHUNK)
+            if not data:
+                break
+            member.write(data)
+
+
+def _run(scenario, src: str, dst: str, queue) -> None:
+    kind, workers, level = scenario
+    start = time.perf_counter()
+    if kind == "zipfile_store":
+        with zipfile.ZipFile(dst, "w") as zf, zf.open("hoja.txt", "w", force_zip64=True) as m:
+            _copiar(src, m)
+    elif kind == "zipfile_deflate":
+        with zipfile.ZipFile(dst, "w", zipfile.ZIP_DEFLATED, compresslevel=level) as zf:
+            with zf.open("hoja.txt", "w", force_zip64=True) as m:
+                _copiar(src, m)
+    else:
+        compression = "store" if kind == "parallel_store" else "deflate"
+        with ParallelZipWriter(dst, compression=compression, level=level, workers=workers) as zw:
+            with zw.open("hoja.txt", file_size=os.path.getsize(src)) as m:
+                _copiar(src, m)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, os.path.getsize(dst), _peak_rss_mb()))
+
+
+def _measure(scenario, src: str, dst: str):
+    queue = mp.Queue()
+    proc = mp.Process(target=_run, args=(scenario, src, dst, queue))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError(f"El proceso de benchmark terminó con código {proc.exitcode}")
+    return queue.get()
+
+
+def _verificar(src: str, dst: str) -> bool:
+    with zipfile.ZipFile(dst) as zf, zf.open("hoja.txt") as member, open(src, "rb") as fh:
+        while True:
+            expected = fh.read(CHUNK)
+            if member.read(len(expected) or 1) != expected:
+                return False
+            if not expected:
+                return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=int, default=200, help="Tamaño del CSV sin comprimir")
+    parser.add_argument("--hilos", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--nivel", type=int, nargs="+", default=[6])
+    parser.add_argument("--verificar", action="store_true", help="Descomprime y compara cada ZIP")
+    args = parser.parse_args()
+
+    scenarios = [("zipfile_store", 1, 0)]
+    for level in args.nivel:
+        scenarios.append(("zipfile_deflate", 1, level))
+        scenarios.extend(("parallel_deflate", workers, level) for workers in args.hilos)
+    scenarios.append(("parallel_store", 1, 0))
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_zip_")
+    src = os.path.join(tmpdir, "plano.txt")
+    try:
+        total = _generar_csv(src, args.mb)
+        print(f"CSV de {total / 1024 / 1024:.1f} MB, {os.cpu_count()} CPU")
+        header = f"{'escenario':<18} {'hilos':>5} {'nivel':>5} {'seg':>8} {'MB/s':>8} {'ZIP MB':>9} {'ratio':>6} {'pico RSS MB':>12}"
+        print(header + ("  ok" if args.verificar else ""))
+        for scenario in scenarios:
+            kind, workers, level = scenario
+            dst = os.path.join(tmpdir, "salida.zip")
+            elapsed, size, peak = _measure(scenario, src, dst)
+            rate = total / 1024 / 1024 / elapsed if elapsed else 0
+            line = (
+                f"{kind:<18} {workers:>5} {level:>5} {elapsed:>8.2f} {rate:>8.1f} "
+                f"{size / 1024 / 1024:>9.1f} {size / total:>6.3f} {peak:>12.1f}"
+            )
+            if args.verificar:
+                line += f"  {'sí' if _verificar(src, dst) else 'NO'}"
+            print(line)
+            os.remove(dst)
+    finally:
+        for name in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,24 @@ import os
 import time
 from contextlib import suppress
 from threading import Lock
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Sequence
 
+import pandas as pd
 import pymysql
 import sqlalchemy
 from cachetools import TTLCache  # type: ignore[import]
+from pymysql.constants import FIELD_TYPE
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.pool import QueuePool
 
+try:
+    import pyarrow as pa
+
+    ARROW_AVAILABLE = True
+except ImportError:  # pragma: no cover - pyarrow es opcional
+    pa = None  # type: ignore[assignment]
+    ARROW_AVAILABLE = False
+
 
 class Conexion:
     """
@@ -673,3 +683,201 @@ class Conexion:
                     logging.warning(
                         f"Error al verificar estado del pool para {key}: {e}"
                     )
+
+
+# ----------------------------------------------------------------------
+# Lectura tipada con Arrow
+# ----------------------------------------------------------------------
+# ``pd.read_sql_query`` y ``pd.DataFrame(result.fetchall())`` crean un objeto
+# Python por celda y columnas ``object`` que luego se intentan reducir con
+# pasadas como ``_optimize_dataframe``. Aquí cada lote del cursor se convierte
+# directamente en un ``RecordBatch`` con el tipo que informa MariaDB en
+# ``cursor.description``: textos con diccionario, DECIMAL como decimal de
+# punto fijo, fechas como ``date32``. Sin pyarrow se conserva el camino
+# anterior (DataFrame desde las tuplas).
+
+DEFAULT_ARROW_BATCH_SIZE = 50_000
+
+_INT_TYPES = {
+    FIELD_TYPE.TINY: "int32",
+    FIELD_TYPE.SHORT: "int32",
+    FIELD_TYPE.INT24: "int32",
+    FIELD_TYPE.YEAR: "int32",
+    # Sin la bandera UNSIGNED en description, INT puede superar int32.
+    FIELD_TYPE.LONG: "int64",
+    FIELD_TYPE.LONGLONG: "int64",
+}
+_DICTIONARY_TYPES = {
+    FIELD_TYPE.VARCHAR,
+    FIELD_TYPE.VAR_STRING,
+    FIELD_TYPE.STRING,
+    FIELD_TYPE.ENUM,
+    FIELD_TYPE.SET,
+}
+_DECIMAL_TYPES = {FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL}
+
+
+def _arrow_type(description: Sequence[Any]):
+    """Tipo Arrow para una columna de ``cursor.description`` (PEP 249).
+
+    Retorna ``None`` cuando conviene inferirlo de los valores (BLOB/TEXT
+    comparten código de tipo, JSON, BIT, geometrías).
+    """
+
+    type_code = description[1]
+    if type_code in _INT_TYPES:
+        return getattr(pa, _INT_TYPES[type_code])()
+    if type_code == FIELD_TYPE.FLOAT:
+        return pa.float32()
+    if type_code == FIELD_TYPE.DOUBLE:
+        return pa.float64()
+    if type_code in _DECIMAL_TYPES:
+        precision = description[4] or 38
+        scale = description[5] or 0
+        return pa.decimal128(max(1, min(int(precision), 38)), max(0, min(int(scale), 38)))
+    if type_code in (FIELD_TYPE.DATE, FIELD_TYPE.NEWDATE):
+        return pa.date32()
+    if type_code in (FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP):
+        return pa.timestamp("us")
+    if type_code == FIELD_TYPE.TIME:
+        return pa.duration("us")
+    if type_code in _DICTIONARY_TYPES:
+        return pa.dictionary(pa.int32(), pa.string())
+    return None
+
+
+def _as_text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode("utf-8", errors="replace")
+    return str(value)
+
+
+def _arrow_column(values: List[Any], arrow_type):
+    if arrow_type is None:
+        return pa.array(values, from_pandas=True)
+    if pa.types.is_dictionary(arrow_type):
+        try:
+            return pa.array(values, type=pa.string()).dictionary_encode()
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Bytes que no son UTF-8 (o valores no textuales): se reemplazan los
+            # caracteres inválidos antes que perder el lote.
+            return pa.array([_as_text(v) for v in values], type=pa.string()).dictionary_encode()
+    # Valores fuera del tipo declarado (BIGINT UNSIGNED, fechas cero...): se
+    # prueba un tipo más amplio y, en último caso, texto, antes que perder el lote.
+    fallbacks = [arrow_type, pa.uint64() if pa.types.is_integer(arrow_type) else None]
+    for candidate in fallbacks:
+        try:
+            if candidate is None:
+                return pa.array(values, from_pandas=True)
+            return pa.array(values, type=candidate)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OverflowError):
+            continue
+    return pa.array([_as_text(v) for v in values], type=pa.string())
+
+
+def iter_arrow_batches(result, batch_size: int = DEFAULT_ARROW_BATCH_SIZE) -> Iterator["pa.RecordBatch"]:
+    """``RecordBatch`` tipados a partir de un ``CursorResult`` de SQLAlchemy.
+
+    Usar con ``execution_options(stream_results=True)`` para que el servidor
+    entregue las filas por lotes en lugar de materializarlas en el cliente.
+    """
+
+    if not ARROW_AVAILABLE:
+        raise RuntimeError("pyarrow no está instalado")
+    columns = list(result.keys())
+    cursor_description = getattr(getattr(result, "cursor", None), "description", None)
+    types = (
+        [_arrow_type(desc) for desc in cursor_description]
+        if cursor_description and len(cursor_description) == len(columns)
+        else [None] * len(columns)
+    )
+    while True:
+        rows = result.fetchmany(batch_size)
+        if not rows:
+            break
+        arrays = [
+            _arrow_column(list(values), arrow_type)
+            for values, arrow_type in zip(zip(*rows), types)
+        ]
+        yield pa.RecordBatch.from_arrays(arrays, names=columns)
+
+
+def _pandas_type(arrow_type):
+    # Los diccionarios pasan a Categorical (el mapeo por defecto); el resto a
+    # dtypes respaldados por Arrow, sin columnas object.
+    if pa.types.is_dictionary(arrow_type):
+        return None
+    return pd.ArrowDtype(arrow_type)
+
+
+def arrow_batch_to_frame(
+    batch: "pa.RecordBatch",
+    categories: bool = True,
+    decimal_as_float: bool = False,
+) -> pd.DataFrame:
+    """DataFrame con dtypes Arrow a partir de un ``RecordBatch``.
+
+    ``categories=False`` decodifica los textos a ``string[pyarrow]`` (para
+    código que les asigna valores nuevos); ``decimal_as_float=True`` pasa los
+    DECIMAL a ``float64``, necesario para escribir en SQLite, que no acepta
+    ``Decimal``.
+    """
+
+    columns = []
+    for column in batch.columns:
+        if not categories and pa.types.is_dictionary(column.type):
+            column = column.dictionary_decode()
+        elif decimal_as_float and pa.types.is_decimal(column.type):
+            column = column.cast(pa.float64())
+        columns.append(column)
+    batch = pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+    return batch.to_pandas(types_mapper=_pandas_type)
+
+
+def iter_arrow_frames(
+    result,
+    batch_size: int = DEFAULT_ARROW_BATCH_SIZE,
+    categories: bool = True,
+    decimal_as_float: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """Lotes del resultado como DataFrames tipados (o planos si no hay pyarrow)."""
+
+    if not ARROW_AVAILABLE:
+        columns = list(result.keys())
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=decimal_as_float)
+        return
+    for batch in iter_arrow_batches(result, batch_size):
+        yield arrow_batch_to_frame(batch, categories=categories, decimal_as_float=decimal_as_float)
+
+
+def read_sql_arrow(
+    connection,
+    query,
+    params: Optional[Dict[str, Any]] = None,
+    chunksize: int = DEFAULT_ARROW_BATCH_SIZE,
+    categories: bool = True,
+    decimal_as_float: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """Reemplazo de ``pd.read_sql_query(..., chunksize=...)`` con dtypes Arrow.
+
+    ``connection`` es una conexión de SQLAlchemy abierta; el generador debe
+    consumirse antes de cerrarla.
+    """
+
+    if isinstance(query, str):
+        query = sqlalchemy.text(query)
+    result = connection.execution_options(stream_results=True).execute(query, params or {})
+    try:
+        if not result.returns_rows:
+            return
+        yield from iter_arrow_frames(
+            result, chunksize, categories=categories, decimal_as_float=decimal_as_float
+        )
+    finally:
+        result.close()
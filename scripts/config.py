@@ -7,7 +7,7 @@ import json
 import logging
 from functools import lru_cache
 from pathlib import Path
-from typing import Any, Callable, Dict, Optional, Union
+from typing import Any, Callable, Dict, Iterable, Optional, Union
 
 import pandas as pd
 from sqlalchemy import text
@@ -15,6 +15,7 @@ from sqlalchemy.sql.elements import TextClause
 
 from scripts.conexion import Conexion as con
 from scripts.repositories.config_repository import ConfigRepository
+from scripts.services.config_cache import build_shared_cache_from_env
 from scripts.services.config_service import ConfigData, ConfigService
 
 logger = logging.getLogger(__name__)
@@ -106,16 +107,45 @@ def default_permissions_loader(
 
 
 def get_default_service(cache_ttl: int = 600) -> ConfigService:
+    """Servicio por proceso; usa Redis como segundo nivel si está configurado."""
+
     global _DEFAULT_SERVICE
     if _DEFAULT_SERVICE is None:
+        shared_cache = build_shared_cache_from_env(ttl=cache_ttl)
         _DEFAULT_SERVICE = ConfigService(
             repository_factory=default_repository_factory,
             permissions_loader=default_permissions_loader,
             cache_ttl=cache_ttl,
+            shared_cache=shared_cache,
+            # Con invalidación por pub/sub la capa local puede ser más corta.
+            local_ttl=min(cache_ttl, 120) if shared_cache else None,
         )
     return _DEFAULT_SERVICE
 
 
+def prewarm_default_service_async() -> None:
+    """Precalienta en segundo plano la configuración de todas las empresas.
+
+    Se invoca al arrancar workers RQ y servidores web (gunicorn/uWSGI, o
+    cualquier proceso con ``CONFIG_PREWARM=1``); se desactiva con
+    ``CONFIG_PREWARM=0``. Los errores solo se registran.
+    """
+
+    import os
+    import threading
+
+    if os.getenv("CONFIG_PREWARM", "1") == "0":
+        return
+
+    def _run() -> None:
+        try:
+            get_default_service().prewarm()
+        except Exception as exc:
+            logger.warning("No se pudo precalentar la configuración: %s", exc)
+
+    threading.Thread(target=_run, name="config-prewarm", daemon=True).start()
+
+
 class ConfigBasic:
     """Contenedor ligero que delega la configuración al ``ConfigService``."""
 
@@ -128,6 +158,7 @@ class ConfigBasic:
         repository_factory: Optional[Callable[[], ConfigRepository]] = None,
         permissions_loader: Optional[PermissionsLoader] = None,
         cache_ttl: int = 600,
+        config_data: Optional[ConfigData] = None,
     ) -> None:
         self.database_name = database_name
         self.user_id = user_id
@@ -145,7 +176,10 @@ class ConfigBasic:
             self._service = get_default_service(cache_ttl)
             self._repository_factory = default_repository_factory
 
-        self._config_data: ConfigData = self._service.get_config(database_name, user_id)
+        # ``bulk`` entrega la configuración ya resuelta por ``get_configs``.
+        self._config_data: ConfigData = config_data or self._service.get_config(
+            database_name, user_id
+        )
         self.config: Dict[str, Any] = self._normalise_config(self._config_data)
 
     def _normalise_config(self, config_data: ConfigData) -> Dict[str, Any]:
@@ -175,6 +209,22 @@ class ConfigBasic:
             return pd.DataFrame()
         return pd.DataFrame(rows)
 
+    @classmethod
+    def bulk(
+        cls, database_names: Iterable[str], user_id: Optional[int] = None
+    ) -> Dict[str, "ConfigBasic"]:
+        """Construye ``ConfigBasic`` para varias empresas con consultas agrupadas.
+
+        Las empresas que no existen en ``conf_empresas`` se omiten del resultado.
+        """
+
+        service = get_default_service()
+        configs = service.get_configs(database_names, user_id)
+        return {
+            name: cls(name, user_id, service=service, config_data=config_data)
+            for name, config_data in configs.items()
+        }
+
     @classmethod
     def clear_cache(
         cls, database_name: Optional[str] = None, user_id: Optional[int] = None
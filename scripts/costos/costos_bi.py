@@ -7,8 +7,9 @@ import pandas as pd
 import logging
 
 # from scripts.conexion import Conexion as con
-from scripts.conexion import Conexion as con
+from scripts.conexion import Conexion as con, read_sql_arrow
 from scripts.config import ConfigBasic
+from scripts.services.sqlite_staging import StagingDatabase
 from sqlalchemy import create_engine, text, inspect
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, OperationalError
 from django.contrib import sessions
@@ -75,10 +76,15 @@ class DataBaseConnection:
         self.engine_mysql_conf = self.create_engine_mysql_conf()
         print(self.engine_mysql_bi)
         print(self.engine_mysql_conf)
-        # Establecer o crear el motor para SQLite
-        self.engine_sqlite = create_engine("sqlite:///mydata.db")
+        # SQLite de staging propio del job (ver scripts.services.sqlite_staging)
+        self.staging = StagingDatabase("costos")
+        self.engine_sqlite = self.staging.engine
         print(self.engine_sqlite)
 
+    def close(self):
+        """Elimina la base SQLite de staging del job."""
+        self.staging.close()
+
     def create_engine_mysql_bi(self):
         """
         Crea un motor SQLAlchemy para la conexión a la base de datos MySQL.
@@ -158,7 +164,7 @@ class DataBaseConnection:
             # Conectar a MySQL y ejecutar la consulta en fragmentos
             with self.engine_mysql_bi.connect() as connection:
                 cursor = connection.execution_options(isolation_level="READ COMMITTED")
-                for chunk in pd.read_sql_query(query, con=cursor, chunksize=chunksize):
+                for chunk in read_sql_arrow(cursor, query, chunksize=chunksize, decimal_as_float=True):
                     # Almacenar cada fragmento en la tabla SQLite
                     chunk.to_sql(
                         name=table_name,
@@ -609,14 +615,17 @@ class CargueHistoricoCostos:
         # Ahora df_fechas debería contener solo fechas únicas
         fechas_unicas = df_fechas["fecha"].drop_duplicates()
 
-        for fecha in fechas_unicas:
-            try:
-                print(f"Procesando datos para la fecha: {fecha}")
-                # Llamar a procesar_datos_por_fecha para cada fecha
-                self.procesar_datos_por_fecha(fecha)
-            except Exception as e:
-                print(f"Error al procesar la fecha {fecha}: {e}")
-                continue
+        try:
+            for fecha in fechas_unicas:
+                try:
+                    print(f"Procesando datos para la fecha: {fecha}")
+                    # Llamar a procesar_datos_por_fecha para cada fecha
+                    self.procesar_datos_por_fecha(fecha)
+                except Exception as e:
+                    print(f"Error al procesar la fecha {fecha}: {e}")
+                    continue
+        finally:
+            self.db_connection.close()
 
     def procesar_datos_por_fecha(self, fecha):
         """Procesa los datos para una fecha específica."""
@@ -11,6 +11,7 @@ import zipfile
 from zipfile import ZipFile
 from scripts.conexion import Conexion as con
 from scripts.config import ConfigBasic
+from scripts.services.sqlite_staging import StagingDatabase
 import json
 import msal
 import requests
@@ -61,11 +62,22 @@ class DataBaseConnection:
         self.engine_mysql_out = (
             mysql_engine if mysql_engine else self.create_engine_mysql_out()
         )
-        self.engine_sqlite = (
-            sqlite_engine if sqlite_engine else create_engine("sqlite:///mydata.db")
-        )
+        # Sin engine explícito se usa un SQLite de staging propio (no mydata.db).
+        self.staging = None if sqlite_engine else StagingDatabase("powerbi")
+        self.engine_sqlite = sqlite_engine if sqlite_engine else self.staging.engine
         # print(self.engine_sqlite)
 
+    def close(self):
+        """Elimina la base SQLite de staging propia (un engine recibido no se toca)."""
+        if self.staging is not None:
+            self.staging.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def create_engine_mysql_bi(self):
         # Simplificación en la obtención de los parámetros de configuración
         user, password, host, port, database = (
@@ -145,7 +157,6 @@ class Api_PowerBi_Config:
         self.config = self.config_basic.config
         self.engine_mysql_bi = self._create_engine_mysql_bi()
         self.engine_mysql_out = self._create_engine_mysql_out()
-        self.engine_sqlite = con.ConexionSqlite()
 
     def _create_engine_mysql_bi(self):
         c = self.config
@@ -183,7 +194,6 @@ class Api_PowerBi:
         self.config_basic = config.config_basic
         self.engine_mysql_bi = config.engine_mysql_bi
         self.engine_mysql_out = config.engine_mysql_out
-        self.engine_sqlite = config.engine_sqlite
         self.IdtReporteIni = IdtReporteIni
         self.IdtReporteFin = IdtReporteFin
         self.user_id = user_id
@@ -1,5 +1,6 @@
 from datetime import datetime
 import time
+import numpy as np
 import pandas as pd
 import logging
 from sqlalchemy import create_engine, text, tuple_
@@ -8,11 +9,12 @@ from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, Integer, Float, String, Date
 from scripts.config import ConfigBasic
-from scripts.conexion import Conexion as con
+from scripts.conexion import ARROW_AVAILABLE, Conexion as con, read_sql_arrow
+from scripts.services.key_probe import missing_keys_mask
+from scripts.services.sqlite_staging import StagingDatabase
 import json
 from django.core.exceptions import ImproperlyConfigured
 import os
-import uuid
 
 # Configuración del logging
 logging.basicConfig(
@@ -43,57 +45,14 @@ class DataBaseConnection:
         print("Inicializando DataBaseConnection")
         self.config = config
         self.engine_mysql_bi = self.create_engine_mysql_bi()
-        # Configuramos el engine SQLite con opciones optimizadas
-        sqlite_table_name = getattr(
-            self, "sqlite_table_name", f"cargueinfoventas_{uuid.uuid4().hex[:8]}"
-        )
-        sqlite_path = os.path.join("media", f"temp_{sqlite_table_name}.db")
-        os.makedirs(os.path.dirname(sqlite_path), exist_ok=True)
-        self.engine_sqlite = create_engine(
-            f"sqlite:///{sqlite_path}",
-            connect_args={
-                "timeout": 60,  # Aumentamos timeout para operaciones largas
-                "check_same_thread": False,
-                "isolation_level": None,  # Autocommit mode para mejor rendimiento
-            },
-            # Optimizaciones de pool de conexiones
-            pool_recycle=1800,  # 30 minutos
-            pool_pre_ping=True,  # Verifica conexiones antes de usarlas
-            pool_size=10,  # Tamaño del pool para paralelización
-            max_overflow=20,  # Conexiones adicionales si el pool está lleno
-        )
-
-        # Aplicamos optimizaciones PRAGMA a SQLite
-        self._optimize_sqlite()
+        # SQLite de staging propio del job: sin archivos compartidos en media/
+        # ni locking_mode EXCLUSIVE (ver scripts.services.sqlite_staging).
+        self.staging = StagingDatabase("cargueinfoventas")
+        self.engine_sqlite = self.staging.engine
 
-    def _optimize_sqlite(self):
-        """Configura optimizaciones para SQLite"""
-        try:
-            with self.engine_sqlite.connect() as conn:
-                # Aumentamos la memoria caché a 200MB para mejorar rendimiento con datasets grandes
-                conn.execute(text("PRAGMA cache_size = -200000"))
-                # Usar modo WAL para mejor concurrencia y rendimiento
-                conn.execute(text("PRAGMA journal_mode = WAL"))
-                # Ajustar sincronización para mejor rendimiento
-                conn.execute(text("PRAGMA synchronous = NORMAL"))
-                # Ajustar tamaño de página para mejor rendimiento
-                conn.execute(
-                    text("PRAGMA page_size = 8192")
-                )  # 8KB para mejor manejo de datos grandes
-                # Tamaño mínimo para vacuum automático
-                conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
-                # Aumentamos el mmap a 2GB para datasets más grandes
-                conn.execute(text("PRAGMA mmap_size = 2147483648"))  # 2GB
-                # Mejora en el manejo de índices
-                conn.execute(
-                    text("PRAGMA temp_store = MEMORY")
-                )  # Usar memoria para temp
-                # Optimizar operaciones secuenciales
-                conn.execute(text("PRAGMA locking_mode = EXCLUSIVE"))
-            print("Optimizaciones SQLite avanzadas aplicadas correctamente")
-        except Exception as e:
-            print(f"Error aplicando optimizaciones SQLite: {e}")
-            logging.warning(f"Error aplicando optimizaciones SQLite: {e}")
+    def close(self):
+        """Elimina la base SQLite de staging del job."""
+        self.staging.close()
 
     def create_engine_mysql_bi(self):
         print("Creando engine para MySQL BI")
@@ -147,8 +106,8 @@ class DataBaseConnection:
 
                     try:
                         # Procesar por chunks para reducir uso de memoria
-                        for chunk in pd.read_sql_query(
-                            query, con=cursor, chunksize=chunksize, params=params
+                        for chunk in read_sql_arrow(
+                            cursor, query, params, chunksize, decimal_as_float=True
                         ):
                             chunk_num += 1
                             total_procesados += len(chunk)
@@ -156,8 +115,10 @@ class DataBaseConnection:
                                 f"Procesando chunk #{chunk_num}: {len(chunk)} registros (Total: {total_procesados})"
                             )
 
-                            # Optimizar tipos de datos para reducir uso de memoria
-                            chunk = self._optimize_dataframe(chunk)
+                            # Con Arrow los tipos ya vienen del cursor (textos como
+                            # categorías); sin pyarrow se reducen a posteriori.
+                            if not ARROW_AVAILABLE:
+                                chunk = self._optimize_dataframe(chunk)
 
                             # Detectar columnas para indexar solo en el primer chunk
                             if chunk_num == 1:
@@ -661,14 +622,12 @@ class CargueInfoVentas:
 
         return df
 
-    def insertar_registros_ignore(self, modelo, data_to_insert):
+    def insertar_registros_ignore(self, modelo, df):
         print(f"Insertando registros en {modelo.__tablename__}")
         inicio = time.time()
 
         # Si no hay datos, retornamos inmediatamente
-        if not data_to_insert or (
-            isinstance(data_to_insert, list) and len(data_to_insert) == 0
-        ):
+        if df is None or df.empty:
             print(f"No hay datos para insertar en {modelo.__tablename__}")
             return
 
@@ -677,58 +636,45 @@ class CargueInfoVentas:
                 # Iniciar transacción para múltiples operaciones
                 trans = connection.begin()
                 try:
-                    nuevos_registros = self.filtrar_nuevos_registros(
-                        modelo, data_to_insert, connection
-                    )
+                    nuevos = self.filtrar_nuevos_registros(modelo, df, connection)
+                    df_nuevos = df[nuevos]
 
-                    if nuevos_registros:
+                    if not df_nuevos.empty:
                         print(
-                            f"Insertando {len(nuevos_registros)} nuevos registros en {modelo.__tablename__}"
+                            f"Insertando {len(df_nuevos)} nuevos registros en {modelo.__tablename__}"
                         )
-                        self.stats["registros_insertados"] += len(nuevos_registros)
+                        self.stats["registros_insertados"] += len(df_nuevos)
 
-                        # Insertamos por lotes optimizados
-                        for chunk in self.chunk_data(
-                            nuevos_registros, batch_size=self.batch_size
-                        ):
-                            # Preparamos los valores para inserción en masa
-                            columnas = list(chunk[0].keys())
-                            valores = []
-
-                            for registro in chunk:
-                                row_values = [
-                                    registro.get(col, None) for col in columnas
-                                ]
-                                valores.append(row_values)
-
-                            # Construir consulta para inserción masiva
-                            placeholders = ", ".join(["%s"] * len(columnas))
-                            columnas_str = ", ".join([f"`{col}`" for col in columnas])
-
-                            insert_query = f"""
-                                INSERT INTO {modelo.__tablename__} ({columnas_str}) 
-                                VALUES ({placeholders})
-                                ON DUPLICATE KEY UPDATE {columnas[0]} = VALUES({columnas[0]})
-                            """
+                        columnas = list(df_nuevos.columns)
+                        columnas_str = ", ".join([f"`{col}`" for col in columnas])
+                        valores_str = ", ".join([f":{col}" for col in columnas])
+                        insert_query = text(
+                            f"""
+                            INSERT INTO {modelo.__tablename__} ({columnas_str})
+                            VALUES ({valores_str})
+                            ON DUPLICATE KEY UPDATE {columnas[0]} = VALUES({columnas[0]})
+                        """
+                        )
 
-                            # Ejecutar la inserción masiva
-                            connection.execute(text(insert_query), valores)
+                        # Insertamos por lotes optimizados
+                        for inicio_lote in range(0, len(df_nuevos), self.batch_size):
+                            lote = df_nuevos.iloc[inicio_lote : inicio_lote + self.batch_size]
+                            registros = (
+                                lote.astype(object).where(lote.notna(), None).to_dict("records")
+                            )
+                            connection.execute(insert_query, registros)
 
                             # Reportamos progreso cada cierto número de registros
-                            if len(chunk) >= 5000:
+                            if len(lote) >= 5000:
                                 print(
-                                    f"Insertados {len(chunk)} registros en {modelo.__tablename__}"
+                                    f"Insertados {len(lote)} registros en {modelo.__tablename__}"
                                 )
 
                         logging.info(
-                            f"{len(nuevos_registros)} registros insertados en {modelo.__tablename__}."
+                            f"{len(df_nuevos)} registros insertados en {modelo.__tablename__}."
                         )
                     else:
-                        self.stats["registros_descartados"] += (
-                            len(data_to_insert)
-                            if hasattr(data_to_insert, "__len__")
-                            else 0
-                        )
+                        self.stats["registros_descartados"] += len(df)
                         logging.info(
                             f"No hay nuevos registros para insertar en {modelo.__tablename__}."
                         )
@@ -767,54 +713,39 @@ class CargueInfoVentas:
                 f"Tiempo transcurrido en insertar_registros_ignore: {tiempo_transcurrido:.2f} segundos."
             )
 
-    def filtrar_nuevos_registros(self, modelo, data_to_insert, connection):
+    def filtrar_nuevos_registros(self, modelo, df, connection):
+        """
+        Máscara booleana sobre ``df``: ``True`` para las filas cuya clave no
+        existe en la tabla del modelo (ver scripts.services.key_probe).
+        """
         print(f"Filtrando nuevos registros para {modelo.__tablename__}")
         inicio = time.time()
         claves_unicas = self.obtener_claves_unicas(modelo)
-        todos_nuevos_registros = []
-
-        for batch in self.chunk_data(data_to_insert, batch_size=50000):
-            batch = [
-                record
-                for record in batch
-                if all(key in record for key in claves_unicas)
-            ]
-            if not batch:
-                continue
-
-            keys_to_check = [
-                self.construct_key(record, claves_unicas) for record in batch
-            ]
-
-            existing_records_query = connection.execute(
-                text(
-                    f"SELECT * FROM {modelo.__tablename__} WHERE ({', '.join(claves_unicas)}) IN ({', '.join(['%s'] * len(claves_unicas))})"
-                ),
-                keys_to_check,
-            ).fetchall()
-
-            existing_records_keys = {
-                self.construct_key(record, claves_unicas)
-                for record in existing_records_query
-            }
-
-            nuevos_registros = [
-                record
-                for record in batch
-                if self.construct_key(record, claves_unicas)
-                not in existing_records_keys
-            ]
-
-            todos_nuevos_registros.extend(nuevos_registros)
+        faltantes = [clave for clave in claves_unicas if clave not in df.columns]
+        if faltantes:
+            # Igual que antes: sin la clave completa no se puede comprobar ni insertar.
+            logging.warning(
+                f"Registros sin columnas clave {faltantes} para {modelo.__tablename__}; se descartan."
+            )
+            return np.zeros(len(df), dtype=bool)
+
+        nuevos = missing_keys_mask(
+            connection,
+            modelo.__tablename__,
+            claves_unicas,
+            df,
+            batch_size=self.batch_size,
+        )
         final = time.time()
         tiempo_transcurrido = final - inicio
         logging.info(
             f"Tiempo transcurrido en filtrar nuevos registros: {tiempo_transcurrido} segundos."
         )
         print(
-            f"Tiempo transcurrido en filtrar nuevos registros: {tiempo_transcurrido} segundos."
+            f"Tiempo transcurrido en filtrar nuevos registros: {tiempo_transcurrido} segundos. "
+            f"Nuevos: {int(nuevos.sum())} de {len(df)}"
         )
-        return todos_nuevos_registros
+        return nuevos
 
     def obtener_claves_unicas(self, modelo):
         return [
@@ -823,55 +754,101 @@ class CargueInfoVentas:
             if columna.primary_key or columna.unique
         ]
 
-    def construct_key(self, record, key_columns):
-        if not record:
-            raise ValueError("El registro no puede estar vacío.")
-        if not key_columns:
-            raise ValueError("Debe proporcionar al menos una columna clave.")
-
-        if isinstance(record, dict):
-            return tuple(record.get(key) for key in key_columns)
-        else:
-            return tuple(getattr(record, key, None) for key in key_columns)
-
-    def chunk_data(self, data, batch_size):
-        for i in range(0, len(data), batch_size):
-            yield data[i : i + batch_size]
+    # Índices que sostienen el marcado por JOIN: la ventana de fechas en
+    # tmp_infoventas y la clave de línea en fact_ventas_items. Se crean una vez
+    # con crear_indices_marcado_infoventas.sql; el cargue solo verifica.
+    _INDICES_MARCADO = (
+        ("tmp_infoventas", "ix_tmp_infoventas_fecha_procesado"),
+        ("fact_ventas_items", "ix_fact_ventas_items_linea"),
+    )
 
-    def marcar_registros_como_procesados(self):
-        print("Marcando registros como procesados")
-        inicio = time.time()
+    def verificar_indices_marcado(self):
+        """Advierte si faltan los índices que usa el marcado por JOIN."""
         try:
             with self.engine_mysql_bi.connect() as connection:
-                facturas_items_ids = {
-                    tuple(row)
+                existentes = {
+                    (row[0], row[1])
                     for row in connection.execute(
                         text(
                             """
-                        SELECT 
-                            factura_id, 
-                            producto_id, 
-                            tplinea_id, 
-                            nro_linea 
-                        FROM fact_ventas_items
-                    """
+                            SELECT DISTINCT TABLE_NAME, INDEX_NAME
+                            FROM information_schema.STATISTICS
+                            WHERE TABLE_SCHEMA = DATABASE()
+                              AND TABLE_NAME IN ('tmp_infoventas', 'fact_ventas_items')
+                            """
                         )
-                    ).fetchall()
+                    )
                 }
-                combined_ids = facturas_items_ids
+        except Exception as e:
+            logging.warning(f"No se pudieron verificar los índices de marcado: {e}")
+            return
+        faltantes = [
+            f"{tabla}.{indice}"
+            for tabla, indice in self._INDICES_MARCADO
+            if (tabla, indice) not in existentes
+        ]
+        if faltantes:
+            # Sin índice el JOIN sigue siendo correcto, solo más lento.
+            mensaje = (
+                f"Faltan índices de marcado ({', '.join(faltantes)}) en {self.database_name}; "
+                "ejecute scripts/extrae_bi/crear_indices_marcado_infoventas.sql"
+            )
+            logging.warning(mensaje)
+            print(mensaje)
 
-                if combined_ids:
-                    connection.execute(
-                        text(
-                            f"""
-                            UPDATE tmp_infoventas
-                            SET procesado = 1
-                            WHERE ({', '.join(['Fac_numero', 'Cod_producto', 'Tipo', 'nbLinea'])}) IN ({', '.join(['%s'] * 4)})
+    def obtener_fechas_pendientes(self, IdtReporteIni, IdtReporteFin):
+        """
+        Fechas del rango con registros sin procesar en tmp_infoventas.
+
+        Sirve de marca de agua: los días ya procesados (sin pendientes) no se
+        vuelven a consultar ni a marcar.
+        """
+        with self.engine_mysql_bi.connect() as connection:
+            rows = connection.execute(
+                text(
+                    """
+                    SELECT DISTINCT t.Fecha
+                    FROM tmp_infoventas t
+                    WHERE t.Fecha BETWEEN :IdtReporteIni AND :IdtReporteFin
+                      AND t.procesado = 0
+                    """
+                ),
+                {"IdtReporteIni": IdtReporteIni, "IdtReporteFin": IdtReporteFin},
+            ).fetchall()
+        return {pd.Timestamp(row[0]).strftime("%Y-%m-%d") for row in rows if row[0]}
+
+    def marcar_registros_como_procesados(self, fecha_inicio, fecha_fin):
+        """
+        Marca como procesadas las filas de la ventana que ya están en
+        fact_ventas_items con un solo UPDATE ... JOIN en el servidor.
+
+        Antes se traía a Python la clave de *toda* la tabla de hechos y se
+        actualizaba fila por fila; ahora el costo depende del tamaño de la
+        ventana, no del histórico.
+        """
+        print(f"Marcando registros como procesados ({fecha_inicio} a {fecha_fin})")
+        inicio = time.time()
+        marcados = 0
+        try:
+            with self.engine_mysql_bi.begin() as connection:
+                result = connection.execute(
+                    text(
                         """
-                        ),
-                        combined_ids,
-                    )
-            logging.info("Registros marcados como procesados.")
+                        UPDATE tmp_infoventas t
+                        JOIN fact_ventas_items f
+                          ON f.factura_id = t.`Fac. numero`
+                         AND f.producto_id = t.`Cod. productto`
+                         AND f.tplinea_id = t.`Tipo`
+                         AND f.nro_linea = t.`nbLinea`
+                        SET t.procesado = 1
+                        WHERE t.Fecha BETWEEN :IdtReporteIni AND :IdtReporteFin
+                          AND t.procesado = 0
+                        """
+                    ),
+                    {"IdtReporteIni": fecha_inicio, "IdtReporteFin": fecha_fin},
+                )
+                marcados = result.rowcount
+            logging.info(f"{marcados} registros marcados como procesados.")
         except Exception as e:
             logging.error(f"Error al marcar registros como procesados: {e}")
             print(f"Error al marcar registros como procesados: {e}")
@@ -884,19 +861,22 @@ class CargueInfoVentas:
             print(
                 f"Tiempo transcurrido en marcar registros como procesados: {tiempo_transcurrido} segundos."
             )
+        return marcados
 
-    def eliminar_registros_procesados(self):
-        print("Eliminando registros procesados")
+    def eliminar_registros_procesados(self, fecha_inicio, fecha_fin):
+        print(f"Eliminando registros procesados ({fecha_inicio} a {fecha_fin})")
         inicio = time.time()
         try:
-            with self.engine_mysql_bi.connect() as connection:
+            with self.engine_mysql_bi.begin() as connection:
                 connection.execute(
                     text(
                         """
                         DELETE FROM tmp_infoventas
-                        WHERE procesado = 1
+                        WHERE Fecha BETWEEN :IdtReporteIni AND :IdtReporteFin
+                          AND procesado = 1
                     """
-                    )
+                    ),
+                    {"IdtReporteIni": fecha_inicio, "IdtReporteFin": fecha_fin},
                 )
             logging.info(
                 "Registros procesados eliminados exitosamente de 'tmp_infoventas'."
@@ -916,6 +896,12 @@ class CargueInfoVentas:
             )
 
     def procesar_cargue_ventas(self):
+        try:
+            return self._procesar_cargue_ventas()
+        finally:
+            self.db_connection.close()
+
+    def _procesar_cargue_ventas(self):
         print(
             f"Procesando cargue de ventas para las fechas {self.IdtReporteIni} - {self.IdtReporteFin}"
         )
@@ -929,6 +915,12 @@ class CargueInfoVentas:
 
         print(f"Total de días a procesar: {total_dias}")
 
+        self.verificar_indices_marcado()
+        fechas_pendientes = self.obtener_fechas_pendientes(
+            self.IdtReporteIni, self.IdtReporteFin
+        )
+        print(f"Días con registros pendientes: {len(fechas_pendientes)}")
+
         # En lugar de procesar día por día, procesamos grupos de días
         # para reducir el número de operaciones de I/O y mejorar el rendimiento
         for fecha_grupo in [fechas[i : i + 5] for i in range(0, total_dias, 5)]:
@@ -938,6 +930,11 @@ class CargueInfoVentas:
             fecha_inicio = fecha_grupo[0].strftime("%Y-%m-%d")
             fecha_fin = fecha_grupo[-1].strftime("%Y-%m-%d")
 
+            # Grupo ya procesado en una corrida anterior: nada que consultar
+            if not any(f.strftime("%Y-%m-%d") in fechas_pendientes for f in fecha_grupo):
+                dias_procesados += len(fecha_grupo)
+                continue
+
             print(
                 f"Procesando grupo de fechas: {fecha_inicio} a {fecha_fin} ({len(fecha_grupo)} días)"
             )
@@ -958,16 +955,15 @@ class CargueInfoVentas:
                 dias_procesados += len(fecha_grupo)
                 continue
 
-            # Insertamos registros de manera eficiente
-            registros = df_temporal.to_dict("records")
-            self.insertar_registros_ignore(FactVentasItems, registros)
+            # Insertamos solo las filas cuya clave aún no existe
+            self.insertar_registros_ignore(FactVentasItems, df_temporal)
 
             # Liberamos memoria del DataFrame
             del df_temporal
 
             # Marcamos como procesados y eliminamos
-            self.marcar_registros_como_procesados()
-            self.eliminar_registros_procesados()
+            self.marcar_registros_como_procesados(fecha_inicio, fecha_fin)
+            self.eliminar_registros_procesados(fecha_inicio, fecha_fin)
 
             # Actualizamos progreso
             dias_procesados += len(fecha_grupo)
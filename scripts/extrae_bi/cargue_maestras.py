@@ -2,14 +2,13 @@ from datetime import datetime
 import time
 import pandas as pd
 import logging
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, OperationalError
 from scripts.config import ConfigBasic
 from scripts.conexion import Conexion as con
 import json
 from django.core.exceptions import ImproperlyConfigured
 import os
-import uuid
 import unicodedata
 import re
 import numbers
@@ -50,25 +49,6 @@ class CargueTablasMaestras:
         self.engine_mysql_bi = self.create_engine_mysql_bi()
         self.advertencias_tablas = {}
         
-        # Configurar SQLite temporal para procesamiento
-        sqlite_table_name = f"maestras_{uuid.uuid4().hex[:8]}"
-        sqlite_path = os.path.join("media", f"temp_{sqlite_table_name}.db")
-        os.makedirs(os.path.dirname(sqlite_path), exist_ok=True)
-        
-        self.engine_sqlite = create_engine(
-            f"sqlite:///{sqlite_path}",
-            connect_args={
-                "timeout": 60,
-                "check_same_thread": False,
-                "isolation_level": None,
-            },
-            pool_recycle=1800,
-            pool_pre_ping=True,
-            pool_size=10,
-            max_overflow=20,
-        )
-        self._optimize_sqlite()
-        
         # Configuración de archivos Excel y mapeo de tablas
         self.archivos_config = {
             'PROVEE-TSOL.xlsx': {
@@ -349,23 +329,6 @@ class CargueTablasMaestras:
             str(user), str(password), str(host), int(port), str(database)
         )
 
-    def _optimize_sqlite(self):
-        """Configurar optimizaciones para SQLite"""
-        try:
-            with self.engine_sqlite.connect() as conn:
-                conn.execute(text("PRAGMA cache_size = -200000"))
-                conn.execute(text("PRAGMA journal_mode = WAL"))
-                conn.execute(text("PRAGMA synchronous = NORMAL"))
-                conn.execute(text("PRAGMA page_size = 8192"))
-                conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
-                conn.execute(text("PRAGMA mmap_size = 2147483648"))
-                conn.execute(text("PRAGMA temp_store = MEMORY"))
-                conn.execute(text("PRAGMA locking_mode = EXCLUSIVE"))
-            print("Optimizaciones SQLite aplicadas correctamente")
-        except Exception as e:
-            print(f"Error aplicando optimizaciones SQLite: {e}")
-            logging.warning(f"Error aplicando optimizaciones SQLite: {e}")
-
     @staticmethod
     def _normalizar_nombre_columna(nombre):
         """Normaliza nombres de columnas para coincidencias flexibles"""
@@ -5,6 +5,7 @@ import logging
 
 from scripts.conexion import Conexion as con
 from scripts.config import ConfigBasic
+from scripts.services.sqlite_staging import StagingDatabase
 from sqlalchemy import create_engine, text, inspect
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, OperationalError
 from django.contrib import sessions
@@ -66,17 +67,15 @@ class DataBaseConnection:
         self.engine_mysql_conf = self.create_engine_mysql_conf()
         print(self.engine_mysql_bi)
         print(self.engine_mysql_conf)
-        # Establecer o crear el motor para SQLite
-        import uuid
-
-        sqlite_table_name = getattr(
-            self, "sqlite_table_name", f"carguezip_{uuid.uuid4().hex[:8]}"
-        )
-        sqlite_path = os.path.join("media", f"temp_{sqlite_table_name}.db")
-        os.makedirs(os.path.dirname(sqlite_path), exist_ok=True)
-        self.engine_sqlite = create_engine(f"sqlite:///{sqlite_path}")
+        # SQLite de staging propio del job (ver scripts.services.sqlite_staging)
+        self.staging = StagingDatabase("carguezip")
+        self.engine_sqlite = self.staging.engine
         print(self.engine_sqlite)
 
+    def close(self):
+        """Elimina la base SQLite de staging del job."""
+        self.staging.close()
+
     def create_engine_mysql_bi(self):
         """
         Crea un motor SQLAlchemy para la conexión a la base de datos MySQL.
@@ -939,6 +938,12 @@ class CargueZip:
             return "default"
 
     def procesar_zip(self):
+        try:
+            return self._procesar_zip()
+        finally:
+            self.db_connection.close()
+
+    def _procesar_zip(self):
         print("listo iniciando aqui en la clase de zip")
         print(self.zip_file_path)
         if not self.zip_file_path or not os.path.isfile(self.zip_file_path):
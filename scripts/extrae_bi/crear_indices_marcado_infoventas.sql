@@ -0,0 +1,12 @@
+-- Índices del marcado por JOIN de cargue_infoventas, solo si no existen (MariaDB/MySQL)
+-- Ejecutar una vez en cada base BI antes de los cargues; el proceso solo verifica que existan
+
+-- Ventana de fechas pendientes en tmp_infoventas
+SET @idx := (SELECT COUNT(1) FROM information_schema.statistics WHERE table_schema=DATABASE() AND table_name='tmp_infoventas' AND index_name='ix_tmp_infoventas_fecha_procesado');
+SET @sql := IF(@idx=0, 'CREATE INDEX ix_tmp_infoventas_fecha_procesado ON tmp_infoventas (Fecha, procesado);', 'SELECT "ix_tmp_infoventas_fecha_procesado ya existe";');
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
+
+-- Clave de línea en fact_ventas_items
+SET @idx := (SELECT COUNT(1) FROM information_schema.statistics WHERE table_schema=DATABASE() AND table_name='fact_ventas_items' AND index_name='ix_fact_ventas_items_linea');
+SET @sql := IF(@idx=0, 'CREATE INDEX ix_fact_ventas_items_linea ON fact_ventas_items (factura_id, producto_id, tplinea_id, nro_linea);', 'SELECT "ix_fact_ventas_items_linea ya existe";');
+PREPARE stmt FROM @sql; EXECUTE stmt; DEALLOCATE PREPARE stmt;
@@ -5,11 +5,23 @@ import time
 import gc
 import logging
 import uuid
+from contextlib import nullcontext
 from sqlalchemy import create_engine, text, bindparam
 from sqlalchemy.exc import SQLAlchemyError
 from openpyxl import Workbook
-from scripts.conexion import Conexion as con
+from scripts.conexion import Conexion as con, iter_arrow_frames
 from scripts.config import ConfigBasic
+from scripts.services import task_telemetry as telemetry
+from scripts.services.artifact_store import get_artifact_store
+from scripts.services.row_estimator import (
+    EtaTracker,
+    best_estimate,
+    date_index_estimate,
+    explain_estimate,
+    history_estimate,
+)
+from scripts.services.sql_filters import InFilter, build_filter_plan, explain_plan, full_scans
+from scripts.services.sqlite_staging import StagingDatabase
 from apps.home.models import Reporte
 import psutil
 from scripts.text_cleaner import TextCleaner
@@ -37,6 +49,9 @@ class CuboVentas:
         progress_callback (callable): Función para reportar el progreso.
     """
 
+    # Clave de la historia de corridas (la registra task_handler con el nombre de la tarea).
+    HISTORY_TASK = "cubo_ventas_task"
+
     def __init__(
         self,
         database_name,
@@ -71,12 +86,17 @@ class CuboVentas:
         self.proveedores = []
         self.macrozonas = []
         self.engine_mysql = None
+        self.staging = None
         self.engine_sqlite = None
         self.sqlite_table_name = f"cubo_{self.database_name}_{self.user_id}_{uuid.uuid4().hex[:8]}"  # Tabla temporal única
         self.file_path = None
         self.file_name = None
+        self.artifact_id = None
         self.total_records_processed = 0
         self.total_records_estimate = 0
+        self.filter_plan = None
+        self.full_scans = []
+        self.eta = None
 
         logger.info(
             f"Inicializando CuboVentas: DB={database_name}, ReporteID={reporte_id}, UserID={user_id}"
@@ -96,9 +116,9 @@ class CuboVentas:
             raise
 
     def _update_progress(
-        self, stage, progress_percent, current_rec=None, total_rec=None
+        self, stage, progress_percent, current_rec=None, total_rec=None, meta=None
     ):
-        """Llama al callback de progreso si está definido."""
+        """Llama al callback de progreso si está definido (``meta``: ETA y fuente de la estimación)."""
         if self.progress_callback:
             try:
                 total = (
@@ -111,7 +131,10 @@ class CuboVentas:
                 )
                 # Asegurar que el progreso esté entre 0 y 100
                 safe_progress = max(0, min(100, int(progress_percent)))
-                self.progress_callback(stage, safe_progress, current, total)
+                if meta:
+                    self.progress_callback(stage, safe_progress, current, total, meta=meta)
+                else:
+                    self.progress_callback(stage, safe_progress, current, total)
                 logger.debug(
                     f"Progreso: {stage} - {safe_progress}% ({current:,}/{total:,})"
                 )
@@ -160,18 +183,10 @@ class CuboVentas:
         self._update_progress("Configurando BD temporal", 3)
         logger.info("Creando y optimizando motor SQLite...")
         try:
-            # Usar archivo temporal único en 'media' para depuración de permisos
-            sqlite_path = os.path.join("media", f"temp_{self.sqlite_table_name}.db")
-            os.makedirs(os.path.dirname(sqlite_path), exist_ok=True)
-            self.engine_sqlite = create_engine(f"sqlite:///{sqlite_path}")
-
-            # Aplicar optimizaciones PRAGMA (con precaución)
-            with self.engine_sqlite.connect() as conn:
-                conn.execute(text("PRAGMA journal_mode = MEMORY;"))
-                conn.execute(text("PRAGMA synchronous = OFF;"))
-                conn.execute(text("PRAGMA cache_size = -100000;"))
-                conn.execute(text("PRAGMA temp_store = MEMORY;"))
-            logger.info(f"Motor SQLite creado y optimizado en {sqlite_path}.")
+            # Archivo propio del job en tmpfs, con los pragmas aplicados en cada conexión.
+            self.staging = StagingDatabase("cubo")
+            self.engine_sqlite = self.staging.engine
+            logger.info(f"Motor SQLite creado y optimizado en {self.staging.path}.")
         except Exception as e:
             logger.error(f"Error creando motor SQLite: {e}", exc_info=True)
             raise
@@ -203,69 +218,19 @@ class CuboVentas:
                 "ff": self.IdtReporteFin,
                 "empresa": self.database_name.upper(),  # Asumiendo que :empresa es un valor
             }
-            if self.reporte_id != 2:
-                # Si es el reporte es diferente de 2, no hay filtros adicionales
-                final_sql_text = text(base_sql)
-                return final_sql_text, params
-            else:
-                # Construir cláusulas WHERE adicionales para filtros
-                where_clauses = []
+            filters = []
+            if self.reporte_id == 2:
+                # Filtros de permisos: inyectados en el WHERE del SELECT principal.
+                # Las listas largas van a una tabla temporal (ver scripts.services.sql_filters).
                 if self.proveedores:
-                    # Usar IN con parámetros múltiples si SQLAlchemy lo soporta bien, o construir dinámicamente
-                    # Forma segura con parámetros individuales para evitar límites:
-                    prov_params = {}
-                    prov_placeholders = []
-                    for i, prov in enumerate(self.proveedores):
-                        param_name = f"prov_{i}"
-                        prov_params[param_name] = prov
-                        prov_placeholders.append(f":{param_name}")
-                    if prov_placeholders:
-                        where_clauses.append(
-                            f"idProveedor IN ({', '.join(prov_placeholders)})"
-                        )
-                        params.update(prov_params)
-                    logger.info(f"Aplicando filtro de proveedores: {self.proveedores}")
-
+                    filters.append(InFilter("idProveedor", self.proveedores, "prov"))
+                    logger.info(f"Aplicando filtro de proveedores: {len(self.proveedores)} valores")
                 if self.macrozonas:
-                    # Similar para macrozonas
-                    macro_params = {}
-                    macro_placeholders = []
-                    for i, macro in enumerate(self.macrozonas):
-                        param_name = f"macro_{i}"
-                        macro_params[param_name] = macro
-                        macro_placeholders.append(f":{param_name}")
-                    if macro_placeholders:
-                        where_clauses.append(
-                            f"macrozona_id IN ({', '.join(macro_placeholders)})"
-                        )  # Ajustar nombre de columna si es diferente
-                        params.update(macro_params)
-                    logger.info(f"Aplicando filtro de macrozonas: {self.macrozonas}")
-
-                # Integrar cláusulas WHERE adicionales de forma segura
-                # Esto asume que la consulta base NO termina con WHERE o GROUP BY/ORDER BY/LIMIT
-                # Se necesita una forma robusta de insertar los filtros.
-                # Opción 1: Marcador específico en la consulta base (ej: -- FILTERS_HERE)
-                if "-- FILTERS_HERE" in base_sql and where_clauses:
-                    filter_sql = " AND " + " AND ".join(where_clauses)
-                    final_sql = base_sql.replace("-- FILTERS_HERE", filter_sql)
-                                # Opción 2: Añadir siempre al final (menos robusto si hay GROUP BY/ORDER BY)
-                elif where_clauses:
-                    # Intentar añadir antes de GROUP BY, ORDER BY, LIMIT si existen
-                    # Esta parte es compleja y depende de la estructura de base_sql
-                    # Solución simple (puede fallar): añadir antes del ';' si existe
-                    parts = base_sql.split(";")
-                    if len(parts) > 1:
-                        parts[0] += " AND " + " AND ".join(where_clauses)
-                        final_sql = ";".join(parts)
-                    else:
-                        final_sql = base_sql + " AND " + " AND ".join(where_clauses)
-                else:
-                    # Si no hay where_clauses, usar la consulta base tal cual
-                    final_sql = base_sql
-            # Asegurar que la consulta final use los parámetros :fi, :ff, :empresa, etc.
-            # Asegurar que la consulta final use los parámetros :fi, :ff, :empresa, etc.
-            # No hacer replace aquí, pasar `params` a execute.
-            final_sql_text = text(final_sql)
+                    filters.append(InFilter("macrozona_id", self.macrozonas, "macro"))
+                    logger.info(f"Aplicando filtro de macrozonas: {len(self.macrozonas)} valores")
+            self.filter_plan = build_filter_plan(base_sql, params, filters)
+            final_sql_text = self.filter_plan.query()
+            params = self.filter_plan.params
             print(f"Consulta SQL generada:\n{final_sql_text}")
 
             logger.info("Consulta SQL final generada.")
@@ -281,15 +246,50 @@ class CuboVentas:
             logger.error(f"Error generando consulta SQL: {e}", exc_info=True)
             raise
 
-    def _estimate_total_records(self, query, params):
-        """Estima el número total de registros ejecutando un COUNT(*)."""
-        # Esta función es opcional y puede ser costosa.
-        # Se podría intentar parsear la query original y reemplazar SELECT ... FROM por SELECT COUNT(*) FROM
-        # O simplemente ejecutarla si no es demasiado lenta.
-        # Por ahora, la omitimos para simplificar y evitar sobrecarga.
-        self.total_records_estimate = 0  # Indicar que no hay estimación
-        logger.info("Estimación de registros totales omitida.")
-        return 0
+    def _explain(self, mysql_conn):
+        """Filas de EXPLAIN de la consulta (vacío si CUBO_EXPLAIN_CHECK=0)."""
+        if os.getenv("CUBO_EXPLAIN_CHECK", "1") == "0":
+            return []
+        return explain_plan(mysql_conn, self.filter_plan)
+
+    def _check_query_plan(self, explain):
+        """Advierte si el EXPLAIN de la consulta recorre completa alguna tabla grande."""
+        self.full_scans = full_scans(explain)
+        for scan in self.full_scans:
+            logger.warning(
+                f"Reporte {self.reporte_id}: recorrido completo de {scan['table']} "
+                f"(~{scan['rows']:,} filas, índices posibles: {scan['possible_keys'] or 'ninguno'}). "
+                "Revisar índices de crear_indices_cuboventas.sql o el rango de fechas."
+            )
+
+    def _estimate_total_records(self, mysql_conn, explain):
+        """
+        Estima el total de registros sin ejecutar un COUNT(*).
+
+        Usa la historia de corridas del mismo reporte, empresa y rango (ver
+        scripts.services.row_estimator) y, si no la hay, la menor de las
+        estimaciones del optimizador: el EXPLAIN de la consulta y el rango
+        de fechas sobre el índice de la tabla principal.
+        """
+        estimate = history_estimate(
+            self.HISTORY_TASK, self.database_name, self.reporte_id, self.IdtReporteIni, self.IdtReporteFin
+        )
+        if estimate is None:
+            estimate = best_estimate(
+                explain_estimate(explain),
+                date_index_estimate(mysql_conn, self.filter_plan.sql, self.filter_plan.params),
+            )
+        self.eta = EtaTracker(estimate, started_at=self.start_time)
+        self.total_records_estimate = self.eta.total()
+        if estimate is None:
+            logger.info("Sin estimación de registros totales.")
+        else:
+            logger.info(
+                f"Registros estimados: {estimate.rows:,} (fuente: {estimate.source}"
+                + (f", ~{estimate.seconds:.0f}s" if estimate.seconds is not None else "")
+                + ")"
+            )
+        return self.total_records_estimate
 
     def _execute_query_to_sqlite(self, query, params, chunksize=10000):
         """Ejecuta la consulta MySQL y guarda los resultados en SQLite en chunks."""
@@ -304,40 +304,61 @@ class CuboVentas:
         columns = None
         start_extract_time = time.time()
         try:
-            with self.engine_mysql.connect() as mysql_conn, self.engine_sqlite.connect() as sqlite_conn:
-                result = mysql_conn.execution_options(stream_results=True).execute(query, params)
+            # Las tablas temporales de filtros viven en la misma sesión que la consulta.
+            with self.engine_mysql.connect() as mysql_conn, self.engine_sqlite.connect() as sqlite_conn, (
+                self.filter_plan.session(mysql_conn) if self.filter_plan else nullcontext()
+            ):
+                if self.filter_plan is not None:
+                    explain = self._explain(mysql_conn)
+                    self._check_query_plan(explain)
+                    self._estimate_total_records(mysql_conn, explain)
+                    self._update_progress(stage_name, 10, 0, meta=self.eta.meta(0))
+                with telemetry.stage("query"):
+                    result = mysql_conn.execution_options(stream_results=True).execute(query, params)
                 columns = result.keys()
-                rows = result.fetchmany(chunksize)
-                if not rows:
+                # Lotes tipados desde el cursor (Arrow): sin columnas object por celda.
+                for df_chunk in telemetry.timed_iter(
+                    iter_arrow_frames(result, chunksize, decimal_as_float=True), "fetch"
+                ):
+                    # Volcado al staging SQLite (etapa "transform" de la telemetría).
+                    with telemetry.stage("transform"):
+                        if first_chunk:
+                            logger.info(
+                                f"Creando tabla SQLite '{self.sqlite_table_name}' con {len(columns)} columnas."
+                            )
+                            df_chunk.to_sql(
+                                name=self.sqlite_table_name,
+                                con=sqlite_conn,
+                                if_exists="replace",
+                                index=False,
+                                method=None,
+                            )
+                            first_chunk = False
+                        else:
+                            df_chunk.to_sql(
+                                name=self.sqlite_table_name,
+                                con=sqlite_conn,
+                                if_exists="append",
+                                index=False,
+                                method="multi",
+                                chunksize=1000,
+                            )
+                    total_processed += len(df_chunk)
+                    self.total_records_processed = total_processed
+                    if self.eta is not None:
+                        # La banda 10-80% avanza según el total estimado (refinado por lote).
+                        meta = self.eta.meta(total_processed)
+                        self.total_records_estimate = meta["total_records_estimate"]
+                        self._update_progress(
+                            stage_name,
+                            10 + 70 * self.eta.fraction(total_processed),
+                            total_processed,
+                            meta=meta,
+                        )
+                if first_chunk:
                     logger.info("La consulta no retornó datos. No se generará archivo.")
                     self.total_records_processed = 0
                     return False  # Indica que no hay datos
-                while rows:
-                    df_chunk = pd.DataFrame(rows, columns=columns)
-                    if first_chunk:
-                        logger.info(
-                            f"Creando tabla SQLite '{self.sqlite_table_name}' con {len(columns)} columnas."
-                        )
-                        df_chunk.to_sql(
-                            name=self.sqlite_table_name,
-                            con=sqlite_conn,
-                            if_exists="replace",
-                            index=False,
-                            method=None,
-                        )
-                        first_chunk = False
-                    else:
-                        df_chunk.to_sql(
-                            name=self.sqlite_table_name,
-                            con=sqlite_conn,
-                            if_exists="append",
-                            index=False,
-                            method="multi",
-                            chunksize=1000,
-                        )
-                    total_processed += len(rows)
-                    self.total_records_processed = total_processed
-                    rows = result.fetchmany(chunksize)
             # Verificar recuento final en SQLite
             with self.engine_sqlite.connect() as sqlite_conn:
                 final_count = sqlite_conn.execute(
@@ -351,8 +372,20 @@ class CuboVentas:
             logger.info(
                 f"Extracción a SQLite completada. Total: {self.total_records_processed:,} registros."
             )
+            self.total_records_estimate = self.total_records_processed
+            eta_meta = None
+            if self.eta is not None:
+                eta_meta = {
+                    "eta_seconds": self.eta.remaining_after_extract(),
+                    "eta_at": time.time(),
+                    "estimate_source": self.eta.source,
+                }
             self._update_progress(
-                "Datos extraídos a BD temporal", 80, self.total_records_processed
+                "Datos extraídos a BD temporal",
+                80,
+                self.total_records_processed,
+                self.total_records_processed,
+                meta=eta_meta,
             )
             return True
         except SQLAlchemyError as e:
@@ -378,15 +411,16 @@ class CuboVentas:
         use_csv = self.total_records_processed > 1000000  # Umbral para CSV
         ext = ".csv" if use_csv else ".xlsx"
         self.file_name = f"{hoja_nombre}_{self.database_name.upper()}_de_{self.IdtReporteIni}_a_{self.IdtReporteFin}_user_{self.user_id}{ext}"
-        self.file_path = os.path.join("media", self.file_name)
-        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
-        logger.info(f"Archivo de salida: {self.file_path}")
+        # Se escribe en un temporal del artefacto; se publica al terminar sin errores.
+        pending = get_artifact_store().reserve(self.file_name, owner=self.user_id)
+        output_path = pending.tmp_path
+        logger.info(f"Archivo de salida: {pending.final_path}")
 
         start_export_time = time.time()
         records_written = 0
 
         try:
-            with self.engine_sqlite.connect() as sqlite_conn:
+            with telemetry.stage("write"), self.engine_sqlite.connect() as sqlite_conn:
                 # Obtener encabezados
                 headers_result = sqlite_conn.execute(
                     text(f"PRAGMA table_info({self.sqlite_table_name})")
@@ -397,7 +431,7 @@ class CuboVentas:
                     logger.info("Exportando a CSV...")
                     # Escribir encabezado
                     pd.DataFrame(columns=header_names).to_csv(
-                        self.file_path, index=False, encoding="utf-8-sig"
+                        output_path, index=False, encoding="utf-8-sig"
                     )  # utf-8-sig para Excel
                     # Escribir datos en chunks
                     for chunk_df in pd.read_sql_query(
@@ -406,7 +440,7 @@ class CuboVentas:
                         chunksize=chunksize,
                     ):
                         chunk_df.to_csv(
-                            self.file_path,
+                            output_path,
                             mode="a",
                             header=False,
                             index=False,
@@ -466,9 +500,9 @@ class CuboVentas:
                             )
                         # No es necesario borrar rows aquí, fetchmany devuelve copias
 
-                    logger.info(f"Guardando archivo Excel en {self.file_path}...")
+                    logger.info(f"Guardando archivo Excel en {output_path}...")
                     save_start = time.time()
-                    wb.save(self.file_path)
+                    wb.save(output_path)
                     logger.info(
                         f"Archivo Excel guardado en {time.time() - save_start:.2f}s"
                     )
@@ -482,37 +516,27 @@ class CuboVentas:
                     f"Discrepancia en escritura: SQLite tenía {self.total_records_processed}, archivo tiene {records_written}"
                 )
 
+            with telemetry.stage("upload"):
+                artifact = pending.commit()
+            self.file_path = artifact.path
+            self.artifact_id = artifact.id
             self._update_progress("Archivo generado", 99, records_written)
 
         except Exception as e:
             logger.error(f"Error generando archivo de salida: {e}", exc_info=True)
             self._update_progress(f"Error archivo: {e}", 100)
-            # Intentar limpiar archivo parcial si existe
-            if self.file_path and os.path.exists(self.file_path):
-                try:
-                    os.remove(self.file_path)
-                    logger.info(f"Archivo parcial eliminado: {self.file_path}")
-                except OSError as oe:
-                    logger.warning(
-                        f"No se pudo eliminar archivo parcial {self.file_path}: {oe}"
-                    )
+            # El archivo parcial nunca se publica: se descarta con su directorio.
+            pending.abort()
             self.file_path = None  # Indicar que no hay archivo válido
             raise
 
     def _cleanup(self):
-        """Limpia recursos como la tabla SQLite temporal."""
-        logger.info(f"Limpiando tabla temporal SQLite: {self.sqlite_table_name}")
+        """Limpia recursos: elimina la base SQLite de staging completa."""
+        logger.info(f"Limpiando staging SQLite: {self.sqlite_table_name}")
         try:
-            if self.engine_sqlite:
-                with self.engine_sqlite.connect() as conn:
-                    conn.execute(text(f"DROP TABLE IF EXISTS {self.sqlite_table_name}"))
-                logger.info("Tabla temporal eliminada.")
-                # Si SQLite era un archivo, eliminarlo:
-                # if "///" in str(self.engine_sqlite.url): # Es archivo
-                #     db_path = str(self.engine_sqlite.url).split("///")[1]
-                #     if os.path.exists(db_path):
-                #         os.remove(db_path)
-                #         logger.info(f"Archivo DB temporal eliminado: {db_path}")
+            if self.staging:
+                self.staging.close()
+                self.engine_sqlite = None
         except Exception as e:
             logger.warning(f"Error durante la limpieza de SQLite: {e}", exc_info=True)
 
@@ -542,6 +566,22 @@ class CuboVentas:
                 report.append(f"Filtro Proveedores: {len(self.proveedores)} aplicados")
             if self.macrozonas:
                 report.append(f"Filtro Macrozonas: {len(self.macrozonas)} aplicados")
+            if self.eta is not None and self.eta.estimate is not None:
+                estimated = self.eta.estimate.rows
+                desvio = (
+                    f", desvío {100 * (estimated - self.total_records_processed) / self.total_records_processed:+.0f}%"
+                    if self.total_records_processed
+                    else ""
+                )
+                report.append(
+                    f"Registros estimados: {estimated:,} (fuente: {self.eta.source}{desvio})"
+                )
+            current = telemetry.current()
+            if current is not None and current.stages:
+                report.append(f"Etapas: {telemetry.summary(current.stages)}")
+                report.append(f"Espera en base de datos: {current.db_wait:.2f}s ({current.db_queries} consultas)")
+            for scan in self.full_scans:
+                report.append(f"Advertencia: recorrido completo de {scan['table']} (~{scan['rows']:,} filas)")
 
             # Memoria
             process = psutil.Process(os.getpid())
@@ -576,10 +616,7 @@ class CuboVentas:
             query, params = self._generate_sql_query()
             print(f"Consulta SQL generada:\n{query}\nParámetros: {params}")
 
-            # 2. (Opcional) Estimar Registros
-            self._estimate_total_records(query, params)
-
-            # 3. Ejecutar Consulta y volcar a SQLite
+            # 2. Ejecutar Consulta y volcar a SQLite
             datos_ok = self._execute_query_to_sqlite(query, params)
             if datos_ok is False or self.total_records_processed == 0:
                 self._update_progress("Sin datos para mostrar", 100, 0, 0)
@@ -592,15 +629,15 @@ class CuboVentas:
                     "metadata": {"total_records": 0},
                 }
 
-            # 4. Generar Archivo de Salida (Excel/CSV) desde SQLite
+            # 3. Generar Archivo de Salida (Excel/CSV) desde SQLite
             reporte = Reporte.objects.get(pk=self.reporte_id)  # Obtener nombre de hoja
             hoja_nombre = reporte.nombre or "CuboVentas"
             self._generate_output_file(hoja_nombre)
 
-            # 5. Limpieza
+            # 4. Limpieza
             self._cleanup()
 
-            # 6. Finalizar y Reportar
+            # 5. Finalizar y Reportar
             execution_time = time.time() - self.start_time
             performance_report = self._generate_performance_report(execution_time)
             logger.info(
@@ -614,6 +651,7 @@ class CuboVentas:
                 "message": f"Cubo de ventas generado exitosamente en {execution_time:.2f} segundos.",
                 "file_path": self.file_path,
                 "file_name": self.file_name,
+                "artifact_id": self.artifact_id,
                 "execution_time": execution_time,
                 "metadata": {
                     "total_records": self.total_records_processed,
@@ -636,6 +674,9 @@ class CuboVentas:
                 "execution_time": execution_time,
                 "metadata": {"total_records": self.total_records_processed},
             }
+        finally:
+            # Idempotente: cubre también los retornos tempranos y los errores.
+            self._cleanup()
 
     # --- Métodos Adicionales (Mantenidos de la versión original si son necesarios) ---
 
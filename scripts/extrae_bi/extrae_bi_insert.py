@@ -27,10 +27,6 @@ class ExtraeBiConfig:
         self.config = self.config_basic.config
         self.engine_mysql_bi = self._create_engine_mysql_bi()
         self.engine_mysql_out = self._create_engine_mysql_out()
-        import os
-
-        db_path = os.path.join("media", "mydata.db")
-        self.engine_sqlite = con.ConexionSqlite(db_path)
 
     def _create_engine_mysql_bi(self):
         c = self.config
@@ -70,7 +66,6 @@ class ExtraeBiExtractor:
         self.config_basic = config.config_basic
         self.engine_mysql_bi = config.engine_mysql_bi
         self.engine_mysql_out = config.engine_mysql_out
-        self.engine_sqlite = config.engine_sqlite
         self.IdtReporteIni = IdtReporteIni
         self.IdtReporteFin = IdtReporteFin
         self.user_id = user_id
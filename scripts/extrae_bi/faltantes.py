@@ -1,4 +1,3 @@
-import os
 import time
 import pandas as pd
 import logging
@@ -8,6 +7,9 @@ from typing import Dict, Any, Optional
 
 from scripts.config import ConfigBasic
 from scripts.conexion import Conexion
+from scripts.services import dashboard_matrix
+from scripts.services.artifact_store import get_artifact_store
+from scripts.services.xlsx_writer import StreamingXlsxWriter
 
 # Configuración de Logs
 logger = logging.getLogger(__name__)
@@ -57,6 +59,7 @@ class FaltantesReport:
         self.engine_mysql: Optional[Engine] = None
         self.file_path: Optional[str] = None
         self.file_name: Optional[str] = None
+        self.artifact_id: Optional[str] = None
         self.total_records = 0
         self.start_time = time.time()
 
@@ -104,7 +107,11 @@ class FaltantesReport:
         return text(call_sql)
 
     def _calculate_dashboard_data(self, df: pd.DataFrame) -> Dict[str, Any]:
-        """Calcula KPIs y Matriz alineado a patrón Venta Cero."""
+        """Calcula KPIs, totales y Matriz alineado a patrón Venta Cero.
+
+        La matriz completa queda como artefacto paginable y el resultado solo
+        lleva la primera página (ver ``scripts.services.dashboard_matrix``).
+        """
         if df.empty:
             return {
                 "kpis": {
@@ -114,17 +121,25 @@ class FaltantesReport:
                     "porcentaje_nivel_servicio": 100.0,
                     "top_producto": "-"
                 },
-                "matrix": []
+                "totals": None,
+                "matrix": [],
+                "matrix_total": 0,
+                "matrix_artifact_id": None,
             }
-        
+
         # Columnas esperadas del SP Refactorizado:
         # fecha, zona, cliente, cod_producto, nom_producto, categoria, valor_unitario, cant_pedida, cant_faltante, valor_faltante
+        def column(name: str) -> pd.Series:
+            if name in df.columns:
+                return dashboard_matrix.to_number(df[name])
+            return pd.Series(0.0, index=df.index)
 
         # Calcular Totales KPI
-        total_valor_faltante = df['valor_faltante'].sum() if 'valor_faltante' in df.columns else 0
-        total_und_faltante = df['cant_faltante'].sum() if 'cant_faltante' in df.columns else 0
-        total_und_pedidas = df['cant_pedida'].sum() if 'cant_pedida' in df.columns else 0
-        
+        valor_faltante = column('valor_faltante')
+        total_valor_faltante = valor_faltante.sum()
+        total_und_faltante = column('cant_faltante').sum()
+        total_und_pedidas = column('cant_pedida').sum()
+
         # Nivel de Servicio (en Unidades)
         ns_pct = 100.0
         if total_und_pedidas > 0:
@@ -135,7 +150,7 @@ class FaltantesReport:
         if 'nom_producto' in df.columns and 'valor_faltante' in df.columns:
             # Usar Nombre Producto si existe, sino Codigo
             prod_col = 'nom_producto' if df['nom_producto'].notnull().any() else 'cod_producto'
-            top_series = df.groupby(prod_col)['valor_faltante'].sum().sort_values(ascending=False)
+            top_series = valor_faltante.groupby(df[prod_col]).sum().sort_values(ascending=False)
             if not top_series.empty:
                 top_name = str(top_series.index[0])
                 if len(top_name) > 30: top_name = top_name[:27] + "..."
@@ -143,16 +158,27 @@ class FaltantesReport:
 
         # Preparar datos de Matriz
         matrix_df = df.copy()
-        
+
         # Formatear fecha para display
         if 'fecha' in matrix_df.columns:
              matrix_df['fecha'] = pd.to_datetime(matrix_df['fecha'], errors='coerce').dt.strftime('%Y-%m-%d')
-        
-        # Rellenar nulos
+
+        # Rellenar nulos (los numéricos quedan en 0 al normalizar)
         matrix_df.fillna({'nom_producto': 'Desconocido', 'categoria': '-'}, inplace=True)
-        matrix_df = matrix_df.where(pd.notnull(matrix_df), 0)
-        
-        matrix_data = matrix_df.to_dict(orient='records')
+
+        # Totales del pie de tabla sobre todas las filas (la tabla se pagina)
+        totals = {
+            "rows": len(df),
+            "cant_faltante": float(total_und_faltante),
+            "valor_faltante": float(total_valor_faltante),
+        }
+
+        base_name = (self.file_name or f"faltantes_{self.ceves_code}").rsplit(".", 1)[0]
+        matrix = dashboard_matrix.matrix_payload(
+            dashboard_matrix.normalize_matrix(matrix_df),
+            f"{base_name}_matriz",
+            owner=self.user_id,
+        )
 
         return {
             "kpis": {
@@ -162,15 +188,14 @@ class FaltantesReport:
                 "porcentaje_nivel_servicio": float(ns_pct),
                 "top_producto": top_prod
             },
-            "matrix": matrix_data
+            "totals": totals,
+            **matrix,
         }
 
     def _run_to_excel(self, query: text) -> pd.DataFrame:
         assert self.engine_mysql is not None
-        os.makedirs("media", exist_ok=True)
         date_str = pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")
         self.file_name = f"faltantes_{self.ceves_code}_{date_str}.xlsx"
-        self.file_path = os.path.join("media", self.file_name)
 
         tipo_filtro = (self.filter_type or "proveedor").upper()
         value_map = {
@@ -204,7 +229,13 @@ class FaltantesReport:
 
                 if not df.empty:
                     self._update_progress("Generando Excel...", 70)
-                    df.to_excel(self.file_path, index=False)
+                    with get_artifact_store().writing(
+                        self.file_name, owner=self.user_id
+                    ) as pending:
+                        with StreamingXlsxWriter(pending.tmp_path) as writer:
+                            writer.write_frame("Faltantes", df, batch_size=self.chunk_size)
+                    self.file_path = pending.artifact.path
+                    self.artifact_id = pending.artifact.id
 
                 return df
 
@@ -227,6 +258,7 @@ class FaltantesReport:
                 "success": True,
                 "file_name": self.file_name,
                 "file_path": self.file_path,
+                "artifact_id": self.artifact_id,
                 "dashboard": dashboard_data,
                 "metadata": {
                     "execution_time": time.time() - self.start_time,
@@ -1,4 +1,3 @@
-import os
 import pandas as pd
 import time
 import gc
@@ -9,6 +8,11 @@ from sqlalchemy.exc import SQLAlchemyError
 from openpyxl import Workbook
 from scripts.conexion import Conexion as con
 from scripts.config import ConfigBasic
+from scripts.services import task_telemetry as telemetry
+from scripts.services.artifact_store import get_artifact_store
+from scripts.services.row_estimator import EtaTracker, history_estimate
+from scripts.services.sheet_extractor import OrderedSheetExtractor
+from scripts.services.xlsx_writer import StreamingXlsxWriter
 import ast
 import psutil
 
@@ -21,6 +25,9 @@ class InterfaceContable:
     Esta versión escribe directamente a Excel en chunks, sin usar SQLite.
     """
 
+    # Clave de la historia de corridas (la registra task_handler con el nombre de la tarea).
+    HISTORY_TASK = "interface_task"
+
     def __init__(
         self,
         database_name,
@@ -41,8 +48,12 @@ class InterfaceContable:
         self.engine_mysql = None
         self.file_path = None
         self.file_name = None
+        self.artifact_id = None
+        self._pending = None
         self.total_records_processed = 0
         self.total_records_estimate = 0
+        self.eta = None
+        self._extract_percent = 10
         self._update_progress("Inicializando", 1)
         try:
             self._configurar_conexiones()
@@ -55,7 +66,7 @@ class InterfaceContable:
             raise
 
     def _update_progress(
-        self, stage, progress_percent, current_rec=None, total_rec=None
+        self, stage, progress_percent, current_rec=None, total_rec=None, meta=None
     ):
         if self.progress_callback:
             try:
@@ -68,7 +79,10 @@ class InterfaceContable:
                     else self.total_records_processed
                 )
                 safe_progress = max(0, min(100, int(progress_percent)))
-                self.progress_callback(stage, safe_progress, current, total)
+                if meta:
+                    self.progress_callback(stage, safe_progress, current, total, meta=meta)
+                else:
+                    self.progress_callback(stage, safe_progress, current, total)
                 logger.debug(
                     f"Progreso: {stage} - {safe_progress}% ({current:,}/{total:,})"
                 )
@@ -116,53 +130,47 @@ class InterfaceContable:
             f"CALL {sql}('{self.IdtReporteIni}','{self.IdtReporteFin}','','{str(hoja)}');"
         )
 
-    def _write_query_to_excel(self, query, hoja, writer, chunksize=10000):
+    def _on_sheet_extracted(self, spill, extracted, total):
+        """Progreso de extracción: las hojas pueden terminar en cualquier orden."""
+        estado = "extraída" if spill.ok else "con error"
+        self._extract_percent = max(self._extract_percent, 10 + int(70 * extracted / total))
+        self._update_progress(
+            f"Hoja {spill.hoja} {estado} ({extracted}/{total})",
+            self._extract_percent,
+            spill.rows,
+        )
+
+    def _on_rows_extracted(self, rows):
+        """Filas leídas entre todas las hojas: total estimado y ETA mientras se extrae."""
+        meta = self.eta.meta(rows)
+        self.total_records_estimate = meta["total_records_estimate"]
+        self._extract_percent = max(
+            self._extract_percent, 10 + int(70 * self.eta.fraction(rows))
+        )
+        self._update_progress(
+            f"Extrayendo datos ({rows:,} filas)",
+            self._extract_percent,
+            rows,
+            meta=meta,
+        )
+
+    def _write_sheet_to_excel(self, spill, writer):
         """
-        Escritura robusta a Excel por chunks, compatible con cualquier consulta/procedimiento.
+        Escribe en el libro una hoja ya extraída (volcada a disco por el extractor), por lotes.
         """
-        stage_name = (
-            f"Extrayendo y escribiendo datos de MySQL para hoja {hoja} (SIN CHUNKS)"
-        )
-        self._update_progress(stage_name, 10)
-        total_processed = 0
-        start_extract_time = time.time()
-        try:
-            # Ejecutar el query (puede ser CALL o SELECT)
-            with self.engine_mysql.connect() as conn:
-                result = conn.execute(query)
-                columns = list(result.keys())
-                all_rows = [
-                    dict(row._mapping) if hasattr(row, "_mapping") else dict(row)
-                    for row in result
-                ]
-                df_all = pd.DataFrame(all_rows)
-                if not df_all.empty:
-                    df_all = df_all.astype(str)
-                    df_all.to_excel(
-                        writer,
-                        sheet_name=hoja,
-                        startrow=0,
-                        index=False,
-                        header=True,
-                    )
-                    total_processed = len(df_all)
-                else:
-                    empty_df = pd.DataFrame(columns=columns)
-                    empty_df.to_excel(writer, sheet_name=hoja, index=False)
-        except SQLAlchemyError as e:
-            logger.error(
-                f"Error de base de datos durante la extracción para {hoja}: {e}",
-                exc_info=True,
+        hoja = spill.hoja
+        if not spill.ok:
+            self._update_progress(f"Error en {hoja}: {spill.error}", 100)
+            raise spill.error
+        # La interface se entrega como texto (como antes con astype(str)),
+        # sin "None"/"nan" en las celdas vacías.
+        with telemetry.stage("write"):
+            total_processed = writer.write_batches(
+                hoja,
+                spill.batches(),
+                all_text=True,
+                columns=spill.columns,
             )
-            self._update_progress(f"Error BD en {hoja}: {e}", 100)
-            raise
-        except Exception as e:
-            logger.error(
-                f"Error inesperado durante la extracción para {hoja}: {e}",
-                exc_info=True,
-            )
-            self._update_progress(f"Error en {hoja}: {e}", 100)
-            raise
         self.total_records_processed = total_processed
         self._update_progress(
             f"Datos extraídos y escritos a Excel para hoja {hoja}",
@@ -208,26 +216,55 @@ class InterfaceContable:
             )
             user_id_str = f"_user_{self.user_id}" if self.user_id else ""
             self.file_name = f"Interface_Contable_{self.database_name}_de_{self.IdtReporteIni}_a_{self.IdtReporteFin}{user_id_str}{reporte_id_str}{ext}"
-            self.file_path = os.path.join("media", self.file_name)
-            output_dir = os.path.dirname(self.file_path)
-            os.makedirs(output_dir, exist_ok=True)
+            # Se escribe en un temporal del artefacto; solo se publica si hay datos.
+            self._pending = get_artifact_store().reserve(
+                self.file_name, owner=self.user_id
+            )
 
-            # Usar openpyxl como engine para ExcelWriter
-            with pd.ExcelWriter(self.file_path, engine="openpyxl") as writer:
-                total_global_records = 0
-                for idx, hoja in enumerate(
-                    self.config["txProcedureInterface"], start=1
-                ):
-                    hoja = str(hoja).strip()
-                    if not hoja:
-                        continue
-                    logger.info(
-                        f"[InterfaceContable] Ejecutando query para extraer datos de la hoja: {hoja}"
+            hojas = [
+                str(hoja).strip()
+                for hoja in self.config["txProcedureInterface"]
+                if str(hoja).strip()
+            ]
+            total_hojas = len(hojas)
+            consultas = []
+            for hoja in hojas:
+                try:
+                    query = self._generate_sqlout(hoja)
+                except Exception as e:
+                    logger.error(
+                        f"[InterfaceContable] Error al generar query para hoja {hoja}: {str(e)}",
+                        exc_info=True,
                     )
+                    continue
+                logger.info(f"[InterfaceContable] Query generado: {query}")
+                consultas.append((hoja, query))
+
+            # Las hojas se extraen en paralelo (una conexión del pool por hoja) y se
+            # escriben en el orden configurado por un único escritor en streaming.
+            total_global_records = 0
+            # Los CALL no admiten EXPLAIN: la estimación inicial sale de corridas anteriores.
+            self.eta = EtaTracker(
+                history_estimate(
+                    self.HISTORY_TASK,
+                    self.database_name,
+                    self.reporte_id,
+                    self.IdtReporteIni,
+                    self.IdtReporteFin,
+                ),
+                started_at=self.start_time,
+            )
+            self.total_records_estimate = self.eta.total()
+            with StreamingXlsxWriter(self._pending.tmp_path) as writer, OrderedSheetExtractor(
+                self.engine_mysql,
+                on_extracted=self._on_sheet_extracted,
+                on_progress=self._on_rows_extracted,
+            ) as extractor:
+                for spill in extractor.run(consultas):
+                    hoja = spill.hoja
+                    idx = spill.hoja_idx
                     try:
-                        query = self._generate_sqlout(hoja)
-                        logger.info(f"[InterfaceContable] Query generado: {query}")
-                        self._write_query_to_excel(query, hoja, writer)
+                        self._write_sheet_to_excel(spill, writer)
                         total_global_records += self.total_records_processed
                     except Exception as e:
                         logger.error(
@@ -235,16 +272,16 @@ class InterfaceContable:
                             exc_info=True,
                         )
                         continue
+                    finally:
+                        spill.discard()
                     # Progreso global por hoja
                     if self.progress_callback:
-                        percent = int(
-                            (idx / len(self.config["txProcedureInterface"])) * 100
-                        )
+                        percent = int((idx / total_hojas) * 100)
                         self.progress_callback(
-                            f"Progreso global: {idx}/{len(self.config['txProcedureInterface'])} hojas",
+                            f"Progreso global: {idx}/{total_hojas} hojas",
                             percent,
                             hoja_idx=idx,
-                            total_hojas=len(self.config["txProcedureInterface"]),
+                            total_hojas=total_hojas,
                         )
 
             execution_time = time.time() - self.start_time
@@ -252,6 +289,7 @@ class InterfaceContable:
                 logger.warning(
                     "[InterfaceContable] No hay datos para mostrar en ninguna hoja."
                 )
+                self._pending.abort()
                 return {
                     "success": False,
                     "error_message": "No hay datos para mostrar en ninguna hoja.",
@@ -260,6 +298,10 @@ class InterfaceContable:
                     "execution_time": execution_time,
                     "metadata": {"total_records": 0},
                 }
+            with telemetry.stage("upload"):
+                artifact = self._pending.commit()
+            self.file_path = artifact.path
+            self.artifact_id = artifact.id
             logger.info(f"[InterfaceContable] Archivo generado en: {self.file_path}")
             logger.info(
                 f"[InterfaceContable] Proceso completado correctamente en {execution_time:.2f} segundos."
@@ -273,6 +315,7 @@ class InterfaceContable:
                 "message": f"Interface contable generada exitosamente en {execution_time:.2f} segundos.",
                 "file_path": self.file_path,
                 "file_name": self.file_name,
+                "artifact_id": self.artifact_id,
                 "execution_time": execution_time,
                 "metadata": {
                     "total_records": total_global_records,
@@ -280,6 +323,8 @@ class InterfaceContable:
             }
         except Exception as e:
             execution_time = time.time() - self.start_time
+            if self._pending is not None:
+                self._pending.abort()
             error_msg = (
                 f"Error fatal en InterfaceContable.run: {type(e).__name__} - {e}"
             )
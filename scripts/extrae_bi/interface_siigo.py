@@ -1,4 +1,3 @@
-import os
 import pandas as pd
 import time
 import gc
@@ -13,6 +12,8 @@ from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
 from openpyxl.utils import get_column_letter, column_index_from_string
 from scripts.conexion import Conexion as con
 from scripts.config import ConfigBasic
+from scripts.services.artifact_store import get_artifact_store
+from scripts.services.sheet_extractor import OrderedSheetExtractor
 from scripts.text_cleaner import TextCleaner
 import ast
 import psutil
@@ -46,6 +47,8 @@ class InterfaceContable:
         self.engine_mysql = None
         self.file_path = None
         self.file_name = None
+        self.artifact_id = None
+        self._pending = None
         self.total_records_processed = 0
         self.total_records_estimate = 0
         self._update_progress("Inicializando", 1)
@@ -121,16 +124,24 @@ class InterfaceContable:
             f"CALL {sql}('{self.IdtReporteIni}','{self.IdtReporteFin}','','{str(hoja)}');"
         )
 
-    def _write_query_to_excel(self, query, hoja, writer, chunksize=10000):
+    def _on_sheet_extracted(self, spill, extracted, total):
+        """Progreso de extracción: las hojas pueden terminar en cualquier orden."""
+        estado = "extraída" if spill.ok else "con error"
+        self._update_progress(
+            f"Hoja {spill.hoja} {estado} ({extracted}/{total})",
+            10 + int(70 * extracted / total),
+            spill.rows,
+        )
+
+    def _write_sheet_to_excel(self, spill, writer):
         """
-        Escritura robusta a Excel por chunks, compatible con cualquier consulta/procedimiento.
+        Escribe en el libro una hoja ya extraída (volcada a disco por el extractor).
+        Siigo necesita la hoja completa en memoria para aplicar el formato de plantilla.
         """
-        stage_name = (
-            f"Extrayendo y escribiendo datos de MySQL para hoja {hoja} (SIN CHUNKS)"
-        )
-        self._update_progress(stage_name, 10)
+        hoja = spill.hoja
+        stage_name = f"Escribiendo datos de la hoja {hoja} en Excel"
+        self._update_progress(stage_name, 80, 0, spill.rows)
         total_processed = 0
-        start_extract_time = time.time()
 
         def _normalize_col_name(name: object) -> str:
             raw = "" if name is None else str(name)
@@ -147,105 +158,100 @@ class InterfaceContable:
             value = "".join(ch for ch in value if ord(ch) >= 32 or ch in "\t\n\r")
             return unicodedata.normalize("NFKD", value)
         try:
-            # Ejecutar el query (puede ser CALL o SELECT)
-            with self.engine_mysql.connect() as conn:
-                result = conn.execute(query)
-                columns = list(result.keys())
-                all_rows = [
-                    dict(row._mapping) if hasattr(row, "_mapping") else dict(row)
-                    for row in result
-                ]
-                df_all = pd.DataFrame(all_rows)
-                if not df_all.empty:
-                    # Limpieza: sanitizar strings para evitar caracteres ilegales en Excel.
-                    object_columns = df_all.select_dtypes(include=["object"]).columns
-                    for col_name in object_columns:
-                        is_terceros = str(hoja).strip().upper() == "TERCEROS"
-                        is_direccion = _normalize_col_name(col_name) == "DIRECCION"
-
-                        if is_terceros and is_direccion:
-                            # IMPORTANTE: NO colapsar espacios; Siigo pide barrio + 42 espacios + dirección DIAN
-                            df_all[col_name] = df_all[col_name].apply(
-                                lambda v: _clean_string_preserve_spaces(v)
-                                if isinstance(v, str)
-                                else v
-                            )
-                        else:
-                            df_all[col_name] = df_all[col_name].apply(
-                                lambda v: TextCleaner.clean_for_excel(v)
-                                if isinstance(v, str)
-                                else v
-                            )
-
-                    # Asegurar que los Decimals se conviertan a float para que Excel los trate como números.
-                    for col_name in df_all.columns:
+            if not spill.ok:
+                raise spill.error
+            columns = spill.columns
+            df_all = spill.to_frame()
+            if not df_all.empty:
+                # Limpieza: sanitizar strings para evitar caracteres ilegales en Excel.
+                object_columns = df_all.select_dtypes(include=["object"]).columns
+                for col_name in object_columns:
+                    is_terceros = str(hoja).strip().upper() == "TERCEROS"
+                    is_direccion = _normalize_col_name(col_name) == "DIRECCION"
+
+                    if is_terceros and is_direccion:
+                        # IMPORTANTE: NO colapsar espacios; Siigo pide barrio + 42 espacios + dirección DIAN
                         df_all[col_name] = df_all[col_name].apply(
-                            lambda value: float(value)
-                            if isinstance(value, Decimal)
-                            else value
+                            lambda v: _clean_string_preserve_spaces(v)
+                            if isinstance(v, str)
+                            else v
+                        )
+                    else:
+                        df_all[col_name] = df_all[col_name].apply(
+                            lambda v: TextCleaner.clean_for_excel(v)
+                            if isinstance(v, str)
+                            else v
                         )
 
-                    # Siigo: en la hoja TERCEROS algunas columnas deben ser numéricas para que el
-                    # number_format (miles/decimales) se refleje.
-                    if str(hoja).strip().upper() == "TERCEROS":
-                        integer_cols = {
-                            "A",
-                            "B",
-                            "C",
-                            "N",
-                            "O",
-                            "Q",
-                            "R",
-                            "S",
-                            "T",
-                            "U",
-                            "V",
-                            "W",
-                            "Y",
-                            "Z",
-                            "AA",
-                            "AB",
-                            "AQ",
-                            "AR",
-                            "AT",
-                            "AU",
-                            "AV",
-                            "AW",
-                            "AY",
-                            "BA",
-                            "BB",
-                            "BC",
-                            "BD",
-                            "BE",
-                            "BF",
-                            "BI",
-                            "BJ",
-                            "BL",
-                            "BM",
-                            "BV",
-                            "BW",
-                        }
-                        decimal_cols = {"AM", "AO", "AP", "AX"}
-
-                        for col_letter in integer_cols.union(decimal_cols):
-                            idx = column_index_from_string(col_letter) - 1
-                            if idx < len(df_all.columns):
-                                series = df_all.iloc[:, idx]
-                                # Mantener vacíos como NaN para que Excel quede en blanco
-                                series = series.replace("", pd.NA)
-                                df_all.iloc[:, idx] = pd.to_numeric(series, errors="coerce")
-
-                    df_all.to_excel(
-                        writer,
-                        sheet_name=hoja,
-                        startrow=0,
-                        index=False,
-                        header=True,
+                # Asegurar que los Decimals se conviertan a float para que Excel los trate como números.
+                for col_name in df_all.columns:
+                    df_all[col_name] = df_all[col_name].apply(
+                        lambda value: float(value)
+                        if isinstance(value, Decimal)
+                        else value
                     )
-                    total_processed = len(df_all)
-                else:
-                    empty_df = pd.DataFrame(columns=columns)
-                    empty_df.to_excel(writer, sheet_name=hoja, index=False)
+
+                # Siigo: en la hoja TERCEROS algunas columnas deben ser numéricas para que el
+                # number_format (miles/decimales) se refleje.
+                if str(hoja).strip().upper() == "TERCEROS":
+                    integer_cols = {
+                        "A",
+                        "B",
+                        "C",
+                        "N",
+                        "O",
+                        "Q",
+                        "R",
+                        "S",
+                        "T",
+                        "U",
+                        "V",
+                        "W",
+                        "Y",
+                        "Z",
+                        "AA",
+                        "AB",
+                        "AQ",
+                        "AR",
+                        "AT",
+                        "AU",
+                        "AV",
+                        "AW",
+                        "AY",
+                        "BA",
+                        "BB",
+                        "BC",
+                        "BD",
+                        "BE",
+                        "BF",
+                        "BI",
+                        "BJ",
+                        "BL",
+                        "BM",
+                        "BV",
+                        "BW",
+                    }
+                    decimal_cols = {"AM", "AO", "AP", "AX"}
+
+                    for col_letter in integer_cols.union(decimal_cols):
+                        idx = column_index_from_string(col_letter) - 1
+                        if idx < len(df_all.columns):
+                            series = df_all.iloc[:, idx]
+                            # Mantener vacíos como NaN para que Excel quede en blanco
+                            series = series.replace("", pd.NA)
+                            df_all.iloc[:, idx] = pd.to_numeric(series, errors="coerce")
+
+                df_all.to_excel(
+                    writer,
+                    sheet_name=hoja,
+                    startrow=0,
+                    index=False,
+                    header=True,
+                )
+                total_processed = len(df_all)
+            else:
+                empty_df = pd.DataFrame(columns=columns)
+                empty_df.to_excel(writer, sheet_name=hoja, index=False)
         except SQLAlchemyError as e:
             logger.error(
                 f"Error de base de datos durante la extracción para {hoja}: {e}",
@@ -660,26 +666,42 @@ class InterfaceContable:
             )
             user_id_str = f"_user_{self.user_id}" if self.user_id else ""
             self.file_name = f"Interface_Contable_{empresa_slug}_de_{self.IdtReporteIni}_a_{self.IdtReporteFin}{user_id_str}{reporte_id_str}{ext}"
-            self.file_path = os.path.join("media", self.file_name)
-            output_dir = os.path.dirname(self.file_path)
-            os.makedirs(output_dir, exist_ok=True)
-
-            # Usar openpyxl como engine para ExcelWriter
-            with pd.ExcelWriter(self.file_path, engine="openpyxl") as writer:
-                total_global_records = 0
-                for idx, hoja in enumerate(
-                    self.config["txProcedureInterface"], start=1
-                ):
-                    hoja = str(hoja).strip()
-                    if not hoja:
-                        continue
-                    logger.info(
-                        f"[InterfaceContable] Ejecutando query para extraer datos de la hoja: {hoja}"
+            # Se escribe en un temporal del artefacto; solo se publica si hay datos.
+            self._pending = get_artifact_store().reserve(
+                self.file_name, owner=self.user_id
+            )
+
+            hojas = [
+                str(hoja).strip()
+                for hoja in self.config["txProcedureInterface"]
+                if str(hoja).strip()
+            ]
+            total_hojas = len(hojas)
+            consultas = []
+            for hoja in hojas:
+                try:
+                    query = self._generate_sqlout(hoja)
+                except Exception as e:
+                    logger.error(
+                        f"[InterfaceContable] Error al generar query para hoja {hoja}: {str(e)}",
+                        exc_info=True,
                     )
+                    continue
+                logger.info(f"[InterfaceContable] Query generado: {query}")
+                consultas.append((hoja, query))
+
+            # Las hojas se extraen en paralelo (una conexión del pool por hoja); el
+            # formato Siigo exige openpyxl, que escribe cada hoja en el orden configurado.
+            total_global_records = 0
+            with pd.ExcelWriter(self._pending.tmp_path, engine="openpyxl") as writer, OrderedSheetExtractor(
+                self.engine_mysql,
+                on_extracted=self._on_sheet_extracted,
+            ) as extractor:
+                for spill in extractor.run(consultas):
+                    hoja = spill.hoja
+                    idx = spill.hoja_idx
                     try:
-                        query = self._generate_sqlout(hoja)
-                        logger.info(f"[InterfaceContable] Query generado: {query}")
-                        self._write_query_to_excel(query, hoja, writer)
+                        self._write_sheet_to_excel(spill, writer)
                         self._aplicar_formato_siigo(
                             workbook=writer.book, sheet_name=hoja, start_row=1
                         )
@@ -690,16 +712,16 @@ class InterfaceContable:
                             exc_info=True,
                         )
                         continue
+                    finally:
+                        spill.discard()
                     # Progreso global por hoja
                     if self.progress_callback:
-                        percent = int(
-                            (idx / len(self.config["txProcedureInterface"])) * 100
-                        )
+                        percent = int((idx / total_hojas) * 100)
                         self.progress_callback(
-                            f"Progreso global: {idx}/{len(self.config['txProcedureInterface'])} hojas",
+                            f"Progreso global: {idx}/{total_hojas} hojas",
                             percent,
                             hoja_idx=idx,
-                            total_hojas=len(self.config["txProcedureInterface"]),
+                            total_hojas=total_hojas,
                         )
 
             execution_time = time.time() - self.start_time
@@ -707,6 +729,7 @@ class InterfaceContable:
                 logger.warning(
                     "[InterfaceContable] No hay datos para mostrar en ninguna hoja."
                 )
+                self._pending.abort()
                 return {
                     "success": False,
                     "error_message": "No hay datos para mostrar en ninguna hoja.",
@@ -715,6 +738,9 @@ class InterfaceContable:
                     "execution_time": execution_time,
                     "metadata": {"total_records": 0},
                 }
+            artifact = self._pending.commit()
+            self.file_path = artifact.path
+            self.artifact_id = artifact.id
             logger.info(f"[InterfaceContable] Archivo generado en: {self.file_path}")
             logger.info(
                 f"[InterfaceContable] Proceso completado correctamente en {execution_time:.2f} segundos."
@@ -728,6 +754,7 @@ class InterfaceContable:
                 "message": f"Interface contable generada exitosamente en {execution_time:.2f} segundos.",
                 "file_path": self.file_path,
                 "file_name": self.file_name,
+                "artifact_id": self.artifact_id,
                 "execution_time": execution_time,
                 "metadata": {
                     "total_records": total_global_records,
@@ -735,6 +762,8 @@ class InterfaceContable:
             }
         except Exception as e:
             execution_time = time.time() - self.start_time
+            if self._pending is not None:
+                self._pending.abort()
             error_msg = (
                 f"Error fatal en InterfaceContable.run: {type(e).__name__} - {e}"
             )
@@ -1,16 +1,16 @@
-import os
 import pandas as pd
 import time
 import gc
 import logging
 import uuid
-from decimal import Decimal
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 from openpyxl import Workbook
 from scripts.conexion import Conexion as con
 from scripts.config import ConfigBasic
-from scripts.text_cleaner import TextCleaner
+from scripts.services.artifact_store import get_artifact_store
+from scripts.services.sheet_extractor import OrderedSheetExtractor
+from scripts.services.xlsx_writer import StreamingXlsxWriter
 import ast
 import psutil
 
@@ -43,6 +43,8 @@ class MatrixVentas:
         self.engine_mysql = None
         self.file_path = None
         self.file_name = None
+        self.artifact_id = None
+        self._pending = None
         self.total_records_processed = 0
         self.total_records_estimate = 0
         self._update_progress("Inicializando", 1)
@@ -118,75 +120,32 @@ class MatrixVentas:
             f"CALL {sql}('{self.IdtReporteIni}','{self.IdtReporteFin}','','{str(hoja)}');"
         )
 
-    def _write_query_to_excel(self, query, hoja, writer, chunksize=10000):
+    def _on_sheet_extracted(self, spill, extracted, total):
+        """Progreso de extracción: las hojas pueden terminar en cualquier orden."""
+        estado = "extraída" if spill.ok else "con error"
+        self._update_progress(
+            f"Hoja {spill.hoja} {estado} ({extracted}/{total})",
+            10 + int(70 * extracted / total),
+            spill.rows,
+        )
+
+    def _write_sheet_to_excel(self, spill, writer):
         """
-        Escritura robusta a Excel por chunks, compatible con cualquier consulta/procedimiento.
+        Escribe en el libro una hoja ya extraída (volcada a disco por el extractor), por lotes.
         """
-        stage_name = (
-            f"Extrayendo y escribiendo datos de MySQL para hoja {hoja} (SIN CHUNKS)"
+        hoja = spill.hoja
+        if not spill.ok:
+            self._update_progress(f"Error en {hoja}: {spill.error}", 100)
+            raise spill.error
+        # 'Cod. produccto' se escribe como texto para preservar ceros iniciales;
+        # el resto de columnas pasa por la coerción estándar (Decimal→float,
+        # limpieza de caracteres de control).
+        total_processed = writer.write_batches(
+            hoja,
+            spill.batches(),
+            text_columns=["Cod. produccto"],
+            columns=spill.columns,
         )
-        self._update_progress(stage_name, 10)
-        total_processed = 0
-        start_extract_time = time.time()
-        try:
-            # Ejecutar el query (puede ser CALL o SELECT)
-            with self.engine_mysql.connect() as conn:
-                # Configurar timeouts extendidos usando método centralizado
-                con.configurar_timeouts_extendidos(conn)
-                
-                result = conn.execute(query)
-                columns = list(result.keys())
-                all_rows = [
-                    dict(row._mapping) if hasattr(row, "_mapping") else dict(row)
-                    for row in result
-                ]
-                df_all = pd.DataFrame(all_rows)
-                if not df_all.empty:
-                    # PRIMERO: Manejo específico para la columna problemática ANTES de otras conversiones
-                    if 'Cod. produccto' in df_all.columns:
-                        # Forzar como string para preservar ceros iniciales
-                        df_all['Cod. produccto'] = df_all['Cod. produccto'].astype(str)
-                        logger.info("Columna 'Cod. produccto' convertida a texto para preservar códigos")
-                    
-                    # LIMPIEZA: Sanitizar todas las columnas de tipo object (strings) para eliminar
-                    # caracteres de control que puedan provocar errores en openpyxl al escribir a Excel.
-                    object_columns = df_all.select_dtypes(include=["object"]).columns
-                    for col in object_columns:
-                        df_all[col] = df_all[col].apply(
-                            lambda v: TextCleaner.clean_for_excel(v) if isinstance(v, str) else v
-                        )
-
-                    # SEGUNDO: Conversión de Decimal a float en las demás columnas
-                    # Convertir Decimal a float donde aplique (evitar conversión en strings ya limpias)
-                    for column in df_all.columns:
-                        df_all[column] = df_all[column].apply(
-                            lambda value: float(value) if isinstance(value, Decimal) else value
-                        )
-                    df_all.to_excel(
-                        writer,
-                        sheet_name=hoja,
-                        startrow=0,
-                        index=False,
-                        header=True,
-                    )
-                    total_processed = len(df_all)
-                else:
-                    empty_df = pd.DataFrame(columns=columns)
-                    empty_df.to_excel(writer, sheet_name=hoja, index=False)
-        except SQLAlchemyError as e:
-            logger.error(
-                f"Error de base de datos durante la extracción para {hoja}: {e}",
-                exc_info=True,
-            )
-            self._update_progress(f"Error BD en {hoja}: {e}", 100)
-            raise
-        except Exception as e:
-            logger.error(
-                f"Error inesperado durante la extracción para {hoja}: {e}",
-                exc_info=True,
-            )
-            self._update_progress(f"Error en {hoja}: {e}", 100)
-            raise
         self.total_records_processed = total_processed
         self._update_progress(
             f"Datos extraídos y escritos a Excel para hoja {hoja}",
@@ -232,26 +191,43 @@ class MatrixVentas:
             )
             user_id_str = f"_user_{self.user_id}" if self.user_id else ""
             self.file_name = f"Matrix_Ventas_{self.database_name}_de_{self.IdtReporteIni}_a_{self.IdtReporteFin}{user_id_str}{reporte_id_str}{ext}"
-            self.file_path = os.path.join("media", self.file_name)
-            output_dir = os.path.dirname(self.file_path)
-            os.makedirs(output_dir, exist_ok=True)
+            # Se escribe en un temporal del artefacto; solo se publica si hay datos.
+            self._pending = get_artifact_store().reserve(
+                self.file_name, owner=self.user_id
+            )
 
-            # Usar openpyxl como engine para ExcelWriter
-            with pd.ExcelWriter(self.file_path, engine="openpyxl") as writer:
-                total_global_records = 0
-                for idx, hoja in enumerate(
-                    self.config["txProcedureExcel"], start=1
-                ):
-                    hoja = str(hoja).strip()
-                    if not hoja:
-                        continue
-                    logger.info(
-                        f"[MatrixVentas] Ejecutando query para extraer datos de la hoja: {hoja}"
+            hojas = [
+                str(hoja).strip()
+                for hoja in self.config["txProcedureExcel"]
+                if str(hoja).strip()
+            ]
+            total_hojas = len(hojas)
+            consultas = []
+            for hoja in hojas:
+                try:
+                    query = self._generate_sqlout(hoja)
+                except Exception as e:
+                    logger.error(
+                        f"[MatrixVentas] Error al generar query para hoja {hoja}: {str(e)}",
+                        exc_info=True,
                     )
+                    continue
+                logger.info(f"[MatrixVentas] Query generado: {query}")
+                consultas.append((hoja, query))
+
+            # Las hojas se extraen en paralelo (una conexión del pool por hoja) y se
+            # escriben en el orden configurado por un único escritor en streaming.
+            total_global_records = 0
+            with StreamingXlsxWriter(self._pending.tmp_path) as writer, OrderedSheetExtractor(
+                self.engine_mysql,
+                prepare_connection=con.configurar_timeouts_extendidos,
+                on_extracted=self._on_sheet_extracted,
+            ) as extractor:
+                for spill in extractor.run(consultas):
+                    hoja = spill.hoja
+                    idx = spill.hoja_idx
                     try:
-                        query = self._generate_sqlout(hoja)
-                        logger.info(f"[MatrixVentas] Query generado: {query}")
-                        self._write_query_to_excel(query, hoja, writer)
+                        self._write_sheet_to_excel(spill, writer)
                         total_global_records += self.total_records_processed
                     except Exception as e:
                         logger.error(
@@ -259,16 +235,16 @@ class MatrixVentas:
                             exc_info=True,
                         )
                         continue
+                    finally:
+                        spill.discard()
                     # Progreso global por hoja
                     if self.progress_callback:
-                        percent = int(
-                            (idx / len(self.config["txProcedureExcel"])) * 100
-                        )
+                        percent = int((idx / total_hojas) * 100)
                         self.progress_callback(
-                            f"Progreso global: {idx}/{len(self.config['txProcedureExcel'])} hojas",
+                            f"Progreso global: {idx}/{total_hojas} hojas",
                             percent,
                             hoja_idx=idx,
-                            total_hojas=len(self.config["txProcedureExcel"]),
+                            total_hojas=total_hojas,
                         )
 
             execution_time = time.time() - self.start_time
@@ -276,6 +252,7 @@ class MatrixVentas:
                 logger.warning(
                     "[MatrixVentas] No hay datos para mostrar en ninguna hoja."
                 )
+                self._pending.abort()
                 return {
                     "success": False,
                     "error_message": "No hay datos para mostrar en ninguna hoja.",
@@ -284,6 +261,9 @@ class MatrixVentas:
                     "execution_time": execution_time,
                     "metadata": {"total_records": 0},
                 }
+            artifact = self._pending.commit()
+            self.file_path = artifact.path
+            self.artifact_id = artifact.id
             logger.info(f"[MatrixVentas] Archivo generado en: {self.file_path}")
             logger.info(
                 f"[MatrixVentas] Proceso completado correctamente en {execution_time:.2f} segundos."
@@ -297,6 +277,7 @@ class MatrixVentas:
                 "message": f"Matrix generada exitosamente en {execution_time:.2f} segundos.",
                 "file_path": self.file_path,
                 "file_name": self.file_name,
+                "artifact_id": self.artifact_id,
                 "execution_time": execution_time,
                 "metadata": {
                     "total_records": total_global_records,
@@ -304,6 +285,8 @@ class MatrixVentas:
             }
         except Exception as e:
             execution_time = time.time() - self.start_time
+            if self._pending is not None:
+                self._pending.abort()
             error_msg = (
                 f"Error fatal en MatrixVentas.run: {type(e).__name__} - {e}"
             )
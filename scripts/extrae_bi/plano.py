@@ -7,13 +7,18 @@ import logging
 from scripts.StaticPage import StaticPage
 from scripts.conexion import Conexion as con
 from scripts.config import ConfigBasic
+from scripts.services import task_telemetry as telemetry
+from scripts.services.artifact_store import get_artifact_store
+from scripts.services.csv_stream import CsvEncoder
+from scripts.services.parallel_zip import ParallelZipWriter, zip_options_from_env
+from scripts.services.row_estimator import EtaTracker, history_estimate
+from scripts.services.sheet_extractor import OrderedSheetExtractor
 import ast
+from functools import partial
 import xlsxwriter
 import zipfile
 from zipfile import ZipFile
-import psutil
 import time
-import gc
 
 # Configuración del logging
 logging.basicConfig(
@@ -30,6 +35,9 @@ class InterfacePlano:
     Clase para la generación de archivos planos comprimidos en ZIP, similar en estructura a Interface.
     """
 
+    # Clave de la historia de corridas (la registra task_handler con el nombre de la tarea).
+    HISTORY_TASK = "plano_task"
+
     def __init__(
         self,
         database_name,
@@ -38,6 +46,8 @@ class InterfacePlano:
         user_id=None,
         reporte_id=None,
         progress_callback=None,
+        compression=None,
+        compression_level=None,
     ):
         self.database_name = database_name
         self.IdtReporteIni = IdtReporteIni
@@ -46,10 +56,20 @@ class InterfacePlano:
         self.reporte_id = reporte_id
         self.config = None
         self.engine_mysql = None
-        self.engine_sqlite = None
         self.file_path = None
         self.archivo_plano = None
         self.progress_callback = progress_callback
+        self.start_time = time.time()
+        self.total_records = 0
+        self.eta = None
+        self._extract_percent = 0
+        # "deflate" (default) o "store" para transferencias internas; lo no
+        # indicado sale de ZIP_COMPRESSION / ZIP_COMPRESSION_LEVEL / ZIP_WORKERS.
+        self.zip_options = zip_options_from_env()
+        if compression is not None:
+            self.zip_options["compression"] = compression
+        if compression_level is not None:
+            self.zip_options["level"] = compression_level
         self._setup()
 
     def _setup(self):
@@ -62,10 +82,6 @@ class InterfacePlano:
             int(self.config.get("portServerIn")),
             str(self.config.get("dbBi")),
         )
-        import os
-
-        db_path = os.path.join("media", "mydata.db")
-        self.engine_sqlite = con.ConexionSqlite(db_path)
 
     def _generate_sql(self, hoja, proc_key):
         sql = self.config[proc_key]
@@ -77,82 +93,26 @@ class InterfacePlano:
             f"CALL {sql}('{self.IdtReporteIni}','{self.IdtReporteFin}','','{str(hoja)}');"
         )
 
-    def _guardar_datos_csv(
-        self,
-        table_name,
-        buffer,
-        sep="|",
-        float_fmt="%.2f",
-        header=True,
-        hoja=None,
-        total_records=None,
-    ):
-        chunksize = 50000
+    def _guardar_datos_csv(self, spill, buffer, hoja=None, total_records=None):
+        """Copia al miembro del ZIP el CSV que el extractor ya codificó por lotes."""
         processed = 0
+        last_percent = -1
         start_export_time = time.time()
-        last_progress = 0
-        for chunk in pd.read_sql_query(
-            f"SELECT * FROM {table_name}", self.engine_sqlite, chunksize=chunksize
-        ):
-            if not chunk.empty:
-                chunk.to_csv(
-                    buffer, sep=sep, index=False, float_format=float_fmt, header=header
-                )
-                processed += len(chunk)
-                if self.progress_callback and total_records:
-                    percent = min(99, int((processed / total_records) * 100))
-                    # Asegura que la barra de progreso nunca retroceda
-                    if percent < last_progress:
-                        percent = last_progress
-                    else:
-                        last_progress = percent
-                    logger.info(
-                        f"[PLANO] CSV: {processed} registros escritos, progreso: {percent}%, memoria: {psutil.Process(os.getpid()).memory_info().rss / (1024*1024):.1f} MB, tiempo: {time.time() - start_export_time:.2f}s"
-                    )
+        for data, rows in spill.encoded_chunks():
+            buffer.write(data)
+            if not rows:
+                continue
+            processed += rows
+            if self.progress_callback and total_records:
+                percent = min(99, int((processed / total_records) * 100))
+                if percent > last_percent:
+                    last_percent = percent
                     self.progress_callback(
                         f"Procesando hoja {hoja}", percent, processed, total_records
                     )
-                gc.collect()
-
-    def _ejecutar_query_mysql_chunked(self, query, table_name, chunksize=50000):
-        # Elimina la tabla si existe
-        with self.engine_sqlite.connect() as conn:
-            conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
-            # Desactivar restricciones y optimizar PRAGMAs para inserción masiva
-            conn.execute(text("PRAGMA journal_mode = MEMORY;"))
-            conn.execute(text("PRAGMA synchronous = OFF;"))
-            conn.execute(text("PRAGMA cache_size = -100000;"))
-            conn.execute(text("PRAGMA temp_store = MEMORY;"))
-            # Inserción masiva SIN transacción explícita (evita error de transacción anidada)
-            with self.engine_mysql.connect() as connection:
-                cursor = connection.execution_options(isolation_level="READ COMMITTED")
-                for chunk in pd.read_sql_query(query, con=cursor, chunksize=chunksize):
-                    chunk.to_sql(
-                        name=table_name,
-                        con=conn,
-                        if_exists="append",
-                        index=False,
-                        method="multi",  # Inserta múltiples filas por statement
-                        chunksize=1000,   # Ajusta según memoria
-                    )
-        # Crear índice solo si existe una columna de fecha relevante
-        with self.engine_sqlite.connect() as conn:
-            try:
-                columns_info = conn.execute(text(f"PRAGMA table_info({table_name})")).fetchall()
-                column_names = [col[1] for col in columns_info]
-                posibles_fechas = ["dtContabilizacion", "fecha", "date", "dtFecha", "created_at"]
-                fecha_col = next((col for col in posibles_fechas if col in column_names), None)
-                if fecha_col:
-                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{fecha_col} ON {table_name}({fecha_col});"))
-                    logger.info(f"Índice creado en {table_name} sobre {fecha_col}")
-                else:
-                    logger.info(f"No se encontró columna de fecha para indexar en {table_name}")
-            except Exception as e:
-                logger.warning(f"No se pudo crear índice en {table_name}: {e}")
-            total_records = conn.execute(
-                text(f"SELECT COUNT(*) FROM {table_name}")
-            ).fetchone()[0]
-        return total_records
+        logger.info(
+            f"[PLANO] Hoja {hoja}: {processed} registros escritos en {time.time() - start_export_time:.2f}s"
+        )
 
     def _call_progress(
         self,
@@ -179,27 +139,46 @@ class InterfacePlano:
             cb_kwargs.update(kwargs)
             self.progress_callback(stage, percent, current_rec, total_rec, **cb_kwargs)
 
+    def _on_sheet_extracted(self, spill, extracted, total):
+        """Progreso de extracción: las hojas pueden terminar en cualquier orden."""
+        estado = "extraída" if spill.ok else "con error"
+        self._extract_percent = max(self._extract_percent, int(50 * extracted / total))
+        self._call_progress(
+            f"Hoja {spill.hoja} {estado} ({extracted}/{total})",
+            self._extract_percent,
+            spill.rows,
+            spill.rows,
+        )
+
+    def _on_rows_extracted(self, rows):
+        """Filas leídas entre todas las hojas: total estimado y ETA mientras se extrae."""
+        meta = self.eta.meta(rows)
+        self._extract_percent = max(self._extract_percent, int(50 * self.eta.fraction(rows)))
+        self._call_progress(
+            f"Extrayendo datos ({rows:,} filas)",
+            self._extract_percent,
+            rows,
+            meta["total_records_estimate"],
+            meta=meta,
+        )
+
     def _procesar_hoja(
         self,
-        hoja,
+        spill,
         buffer,
-        proc_key,
-        sep,
-        float_fmt,
-        header,
         hoja_idx=None,
         total_hojas=None,
     ):
+        hoja = spill.hoja
         try:
             print(f"Procesando hoja: {hoja}")
             # Progreso inicial > 0 para mejor UX
             self._call_progress(
                 f"Iniciando hoja {hoja}", 5, hoja_idx=hoja_idx, total_hojas=total_hojas
             )
-            sqlout = self._generate_sql(hoja, proc_key)
-            print(f"SQL generado para hoja {hoja}: {sqlout}")
-            table_name = f"my_table_{self.database_name}_{hoja}"
-            total_records = self._ejecutar_query_mysql_chunked(sqlout, table_name)
+            if not spill.ok:
+                raise spill.error
+            total_records = spill.rows
             print(f"Total records para hoja {hoja}: {total_records}")
             if total_records == 0:
                 print(f"Hoja {hoja} sin datos")
@@ -224,16 +203,11 @@ class InterfacePlano:
                 total_hojas=total_hojas,
             )
             self._guardar_datos_csv(
-                table_name,
+                spill,
                 buffer,
-                sep=sep,
-                float_fmt=float_fmt,
-                header=header,
                 hoja=hoja,
                 total_records=total_records,
             )
-            with self.engine_sqlite.connect() as conn:
-                conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
             print(f"Finalizada hoja {hoja}")
             self._call_progress(
                 f"Finalizada hoja {hoja}",
@@ -314,35 +288,82 @@ class InterfacePlano:
             result["metadata"] = {
                 "total_hojas": total_hojas,
                 "hojas_con_datos": hojas_con_datos,
+                "total_records": self.total_records,
             }
         return result
 
     def _procesar(self, hojas, proc_key, sep, float_fmt, header, total_hojas):
         self._generar_nombre_archivo()
+        # El ZIP se arma en un temporal del artefacto y solo se publica si tiene datos.
+        pending = get_artifact_store().reserve(self.archivo_plano, owner=self.user_id)
+        try:
+            result, hojas_con_datos = self._escribir_zip(
+                pending.tmp_path, hojas, proc_key, sep, float_fmt, header, total_hojas
+            )
+        except BaseException:
+            pending.abort()
+            raise
+        if not result.get("success"):
+            pending.abort()
+            return result, hojas_con_datos
+        with telemetry.stage("upload"):
+            artifact = pending.commit()
+        self.file_path = artifact.path
+        result.update({"file_path": artifact.path, "artifact_id": artifact.id})
+        return result, hojas_con_datos
+
+    def _escribir_zip(self, zip_path, hojas, proc_key, sep, float_fmt, header, total_hojas):
         hoja_idx = 0
         hojas_con_datos = 0
-        with zipfile.ZipFile(self.file_path, "w") as zf:
-            for hoja in hojas:
-                hoja_idx += 1
-                with zf.open(hoja + ".txt", "w") as buffer:
-                    result = self._procesar_hoja(
-                        hoja,
-                        buffer,
-                        proc_key,
-                        sep,
-                        float_fmt,
-                        header,
-                        hoja_idx=hoja_idx,
-                        total_hojas=total_hojas,
-                    )
-                    if result is not True:
-                        if isinstance(result, dict) and "No hay datos" in result.get(
-                            "error_message", ""
-                        ):
-                            continue
-                        return result, hojas_con_datos
-                    else:
-                        hojas_con_datos += 1
+        consultas = []
+        for hoja in hojas:
+            sqlout = self._generate_sql(hoja, proc_key)
+            print(f"SQL generado para hoja {hoja}: {sqlout}")
+            consultas.append((hoja, sqlout))
+        # Las hojas se extraen en paralelo (una conexión del pool por hoja) y el ZIP
+        # se escribe en el orden configurado a medida que cada hoja queda lista.
+        # Cada hilo codifica el CSV directamente desde los lotes del cursor; el
+        # total de filas de cada hoja sale del mismo stream.
+        encoder = partial(CsvEncoder, sep=sep, float_fmt=float_fmt, header=header)
+        # Los CALL no admiten EXPLAIN: la estimación inicial sale de corridas anteriores.
+        self.eta = EtaTracker(
+            history_estimate(
+                self.HISTORY_TASK,
+                self.database_name,
+                self.reporte_id,
+                self.IdtReporteIni,
+                self.IdtReporteFin,
+            ),
+            started_at=self.start_time,
+        )
+        with ParallelZipWriter(zip_path, **self.zip_options) as zf, OrderedSheetExtractor(
+            self.engine_mysql,
+            batch_size=50000,
+            on_extracted=self._on_sheet_extracted,
+            encoder=encoder,
+            on_progress=self._on_rows_extracted,
+        ) as extractor:
+            for spill in extractor.run(consultas):
+                hoja_idx = spill.hoja_idx
+                try:
+                    file_size = sum(size for size, _ in spill.chunks)
+                    with telemetry.stage("write"), zf.open(spill.hoja + ".txt", file_size=file_size) as buffer:
+                        result = self._procesar_hoja(
+                            spill,
+                            buffer,
+                            hoja_idx=hoja_idx,
+                            total_hojas=total_hojas,
+                        )
+                finally:
+                    spill.discard()
+                if result is not True:
+                    if isinstance(result, dict) and "No hay datos" in result.get(
+                        "error_message", ""
+                    ):
+                        continue
+                    return result, hojas_con_datos
+                hojas_con_datos += 1
+                self.total_records += spill.rows
                 self._call_progress(
                     f"Progreso global: {hoja_idx}/{total_hojas} hojas",
                     int((hoja_idx / total_hojas) * 100),
@@ -371,7 +392,6 @@ class InterfacePlano:
             }, hojas_con_datos
         return {
             "success": True,
-            "file_path": self.file_path,
             "file_name": self.archivo_plano,
         }, hojas_con_datos
 
@@ -400,7 +420,7 @@ class InterfacePlano:
 
     def _generar_nombre_archivo(self):
         """
-        Genera el nombre y la ruta del archivo plano ZIP de salida y los asigna a self.file_path y self.archivo_plano.
+        Genera el nombre del archivo plano ZIP de salida y lo asigna a self.archivo_plano.
         Incluye user_id y reporte_id si están disponibles para mayor unicidad.
         """
         ext = ".zip"
@@ -409,7 +429,4 @@ class InterfacePlano:
             f"_reporte_{self.reporte_id}" if self.reporte_id is not None else ""
         )
         nombre = f"Plano_{self.database_name}_de_{self.IdtReporteIni}_a_{self.IdtReporteFin}{user_part}{reporte_part}{ext}"
-        ruta = os.path.join("media", nombre)
-        os.makedirs(os.path.dirname(ruta), exist_ok=True)
-        self.file_path = ruta
         self.archivo_plano = nombre
@@ -1,4 +1,3 @@
-import os
 import time
 import logging
 from typing import Any, Callable, Dict, List, Optional
@@ -11,6 +10,9 @@ from sqlalchemy.sql.elements import TextClause
 
 from scripts.conexion import Conexion as con
 from scripts.config import ConfigBasic
+from scripts.services import dashboard_matrix
+from scripts.services.artifact_store import get_artifact_store
+from scripts.services.xlsx_writer import StreamingXlsxWriter
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +49,7 @@ class PreventaReport:
         self.engine_mysql: Optional[Engine] = None
         self.file_path: Optional[str] = None
         self.file_name: Optional[str] = None
+        self.artifact_id: Optional[str] = None
         self.total_records = 0
         self.start_time = time.time()
 
@@ -90,7 +93,12 @@ class PreventaReport:
         return text(call_sql)
 
     def _calculate_dashboard_data(self, df: pd.DataFrame) -> Dict[str, Any]:
-        """Calcula KPIs y Matriz para el Dashboard usando columnas del SP."""
+        """Calcula KPIs, totales y Matriz para el Dashboard usando columnas del SP.
+
+        Los derivados por fila se calculan por columnas (sin ``apply``) y la
+        matriz completa queda como artefacto paginable; el resultado solo
+        lleva la primera página (ver ``scripts.services.dashboard_matrix``).
+        """
         if df.empty:
             return {
                 "kpis": {
@@ -101,96 +109,74 @@ class PreventaReport:
                     "valor_promedio": 0,
                     "tiempo_promedio": "00:00"
                 },
-                "matrix": []
+                "totals": None,
+                "matrix": [],
+                "matrix_total": 0,
+                "matrix_artifact_id": None,
             }
 
         # Mapeo de columnas según sp_reporte_preventa_diaria
         # Columnas: fecha, zona_id, zona_nm, clientescom, totalpedidos, pedidos_ruta, pedidos_extraruta, totalpendientes, horai, horaf, tiempo_prom, TotalCLi, ValorT, ValorC, pednuevo
-        
+        def column(name: str) -> pd.Series:
+            if name in df.columns:
+                return dashboard_matrix.to_number(df[name])
+            return pd.Series(0.0, index=df.index)
+
         # Totales Globales
-        total_pedidos = df['totalpedidos'].sum() if 'totalpedidos' in df.columns else 0
-        clientes_atendidos = df['TotalCLi'].sum() if 'TotalCLi' in df.columns else (df['clientescom'].sum() if 'clientescom' in df.columns else 0)
-        clientes_nuevos = df['pednuevo'].sum() if 'pednuevo' in df.columns else 0
-        valor_total = df['ValorT'].sum() if 'ValorT' in df.columns else 0
+        total_pedidos = column('totalpedidos').sum()
+        clientes_atendidos = column('TotalCLi').sum() if 'TotalCLi' in df.columns else column('clientescom').sum()
+        clientes_nuevos = column('pednuevo').sum()
+        valor_total = column('ValorT').sum()
         valor_promedio = valor_total / total_pedidos if total_pedidos > 0 else 0
-        
-        # Tiempo promedio (asumiendo que tiempo_prom está en algún formato manejable o segundos)
+
+        # Tiempo promedio: TIME de MySQL (timedelta) o segundos
         tiempo_promedio_str = "00:00"
         if 'tiempo_prom' in df.columns:
-            try:
-                # Si es numérico (segundos)
-                if pd.api.types.is_numeric_dtype(df['tiempo_prom']):
-                    avg_seconds = df['tiempo_prom'].mean()
-                    mins, secs = divmod(int(avg_seconds), 60)
-                    tiempo_promedio_str = f"{mins:02d}:{secs:02d}"
-                else:
-                    # Si ya viene como string o timedelta
-                    tiempo_promedio_str = str(df['tiempo_prom'].iloc[0])[:5] 
-            except:
-                pass
+            avg = dashboard_matrix.as_timedelta(df['tiempo_prom']).mean()
+            if pd.notna(avg):
+                mins, secs = divmod(int(avg.total_seconds()), 60)
+                tiempo_promedio_str = f"{mins:02d}:{secs:02d}"
 
         # Matriz por Zona (zona_nm)
-        # Queremos Zona (ID - Nombre), Clientes Programados, Atendidos, Cobertura, Pedidos (Ruta, Extra), Valor Total, Promedio, Cambio, Horas
-        
-        # Preparar columnas compuestas
         # "que la zona tenga el código del vendedor" => Usar codigo_agente si existe
+        matrix_df = df.copy()
         if 'zona_nm' in df.columns:
             code_col = 'codigo_agente' if 'codigo_agente' in df.columns else ('zona_id' if 'zona_id' in df.columns else None)
-            
             if code_col:
-                df['ZonaLabel'] = df[code_col].astype(str) + " - " + df['zona_nm'].astype(str)
+                matrix_df['ZonaLabel'] = df[code_col].astype(str) + " - " + df['zona_nm'].astype(str)
                 col_zona = 'ZonaLabel'
             else:
                 col_zona = 'zona_nm'
         else:
             col_zona = 'zona_id' if 'zona_id' in df.columns else 'fecha'
 
-        # Preparar etiqueta de Fecha para agrupación visual
+        # Etiqueta de Fecha para agrupación visual
         if 'fecha' in df.columns:
-             # Formato string seguro
-             df['FechaStr'] = df['fecha'].astype(str)
-             if 'dia_semana' in df.columns:
-                 df['FechaDisplay'] = df['FechaStr'] + " (" + df['dia_semana'].astype(str) + ")"
-             else:
-                 df['FechaDisplay'] = df['FechaStr']
+            fecha = df['fecha'].astype(str)
+            if 'dia_semana' in df.columns:
+                matrix_df['FechaDisplay'] = fecha + " (" + df['dia_semana'].astype(str) + ")"
+            else:
+                matrix_df['FechaDisplay'] = fecha
         else:
-             df['FechaDisplay'] = 'General'
+            matrix_df['FechaDisplay'] = 'General'
 
-        # Helper para agregación de tiempos (min/max)
-        # El usuario solicita NO AGRUPAR/ACUMULAR cuando se seleccionan varios días.
-        # "Mantener la estructura de la tabla". Por lo tanto, usamos el DF tal cual viene del SP.
-        
-        matrix_df = df.copy()
-
-        # Cálculos derivados en la matriz (fila a fila)
+        # El usuario solicita NO AGRUPAR/ACUMULAR cuando se seleccionan varios días:
+        # la matriz mantiene las filas del SP.
         matrix_df['Cobertura'] = 0.0
-        if 'TotalCLi' in matrix_df.columns and 'clientescom' in matrix_df.columns:
-            matrix_df['Cobertura'] = matrix_df.apply(lambda x: (x['TotalCLi'] / x['clientescom'] * 100) if x['clientescom'] > 0 else 0, axis=1)
+        if 'TotalCLi' in df.columns and 'clientescom' in df.columns:
+            matrix_df['Cobertura'] = dashboard_matrix.safe_ratio(df['TotalCLi'], df['clientescom'], 100)
 
         matrix_df['TicketPromedio'] = 0.0
-        if 'ValorT' in matrix_df.columns and 'totalpedidos' in matrix_df.columns:
-             matrix_df['TicketPromedio'] = matrix_df.apply(lambda x: (x['ValorT'] / x['totalpedidos']) if x['totalpedidos'] > 0 else 0, axis=1)
+        if 'ValorT' in df.columns and 'totalpedidos' in df.columns:
+            matrix_df['TicketPromedio'] = dashboard_matrix.safe_ratio(df['ValorT'], df['totalpedidos'])
 
-        # Calcular Tiempo Total
-        # Convertimos las columnas horai/horaf a timedelta para restar
+        # Tiempo Total = horaf - horai, sin pasar por texto
         matrix_df['Tiempo Total'] = '-'
-        if 'horai' in matrix_df.columns and 'horaf' in matrix_df.columns:
-            try:
-                # Convertir a cadena y luego a timedelta
-                # Nota: si vienen nulos o NaT, to_timedelta con errors='coerce' devuelve NaT
-                start_deltas = pd.to_timedelta(matrix_df['horai'].astype(str), errors='coerce')
-                end_deltas = pd.to_timedelta(matrix_df['horaf'].astype(str), errors='coerce')
-                
-                diffs = end_deltas - start_deltas
-                
-                # Convertir a string HH:MM:SS (eliminando '0 days ' si aparece)
-                # components devuelve dataframe con days, hours, minutes, seconds...
-                # Una forma rápida es usar str accesors después de astype(str)
-                matrix_df['Tiempo Total'] = diffs.astype(str).str.replace('0 days ', '').str.split('.').str[0]
-                matrix_df['Tiempo Total'] = matrix_df['Tiempo Total'].replace({'NaT': '-', 'nan': '-'})
-            except Exception:
-                pass
-
+        for col in ('horai', 'horaf'):
+            if col in df.columns:
+                matrix_df[col] = dashboard_matrix.as_timedelta(df[col])
+        if 'horai' in df.columns and 'horaf' in df.columns:
+            matrix_df['Tiempo Total'] = dashboard_matrix.format_duration(matrix_df['horaf'] - matrix_df['horai'])
 
         # Renombrar para JS
         rename_map = {
@@ -208,14 +194,30 @@ class PreventaReport:
             'horaf': 'Hora Fin'
         }
         matrix_df.rename(columns=rename_map, inplace=True)
-        
-        # Formateo de Tiempos (timedelta a str si es necesario)
-        for col in ['Hora Inicio', 'Hora Fin']:
-            if col in matrix_df.columns:
-                matrix_df[col] = matrix_df[col].astype(str).str.replace('0 days ', '').str[:8] # Simple cleanup
 
-        matrix_df = matrix_df.where(pd.notnull(matrix_df), 0)
-        matrix_data = matrix_df.to_dict(orient='records')
+        # Totales del pie de tabla sobre todas las filas (la tabla se pagina)
+        programados = column('clientescom').sum()
+        atendidos = column('TotalCLi').sum()
+        totals = {
+            "rows": len(df),
+            "prog": float(programados),
+            "aten": float(atendidos),
+            "ped": float(total_pedidos),
+            "vto": float(valor_total),
+            "vca": float(column('ValorC').sum()),
+            "pru": float(column('pedidos_ruta').sum()),
+            "pex": float(column('pedidos_extraruta').sum()),
+            "pen": float(column('totalpendientes').sum()),
+            "cobertura": float(atendidos / programados * 100) if programados > 0 else 0.0,
+            "ticket": float(valor_promedio),
+        }
+
+        base_name = (self.file_name or f"preventa_{self.ceves_code}").rsplit(".", 1)[0]
+        matrix = dashboard_matrix.matrix_payload(
+            dashboard_matrix.normalize_matrix(matrix_df),
+            f"{base_name}_matriz",
+            owner=self.user_id,
+        )
 
         return {
             "kpis": {
@@ -226,15 +228,14 @@ class PreventaReport:
                 "valor_promedio": float(valor_promedio),
                 "tiempo_promedio": tiempo_promedio_str
             },
-            "matrix": matrix_data
+            "totals": totals,
+            **matrix,
         }
 
     def _run_to_excel(self, query: TextClause) -> pd.DataFrame:
         assert self.engine_mysql is not None
-        os.makedirs("media", exist_ok=True)
         date_str = pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")
         self.file_name = f"preventa_{self.ceves_code}_{date_str}.xlsx"
-        self.file_path = os.path.join("media", self.file_name)
 
         params = {
             "p_ceve": int(self.ceves_code) if str(self.ceves_code).isdigit() else self.ceves_code,
@@ -258,7 +259,13 @@ class PreventaReport:
                 
                 if not df.empty:
                     self._update_progress("Generando archivo Excel...", 70)
-                    df.to_excel(self.file_path, index=False)
+                    with get_artifact_store().writing(
+                        self.file_name, owner=self.user_id
+                    ) as pending:
+                        with StreamingXlsxWriter(pending.tmp_path) as writer:
+                            writer.write_frame("Preventa", df, batch_size=self.chunk_size)
+                    self.file_path = pending.artifact.path
+                    self.artifact_id = pending.artifact.id
                 
                 return df
                 
@@ -283,6 +290,7 @@ class PreventaReport:
                 "success": True,
                 "file_name": self.file_name,
                 "file_path": self.file_path,
+                "artifact_id": self.artifact_id,
                 "dashboard": dashboard_data,
                 "metadata": {
                     "execution_time": time.time() - self.start_time,
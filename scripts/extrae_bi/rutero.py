@@ -1,4 +1,3 @@
-import os
 import time
 import logging
 from typing import Any, Callable, Dict, List, Optional
@@ -11,6 +10,8 @@ from sqlalchemy.sql.elements import TextClause
 
 from scripts.conexion import Conexion as con
 from scripts.config import ConfigBasic
+from scripts.services.artifact_store import get_artifact_store
+from scripts.services.xlsx_writer import StreamingXlsxWriter, iter_result_batches
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +44,7 @@ class RuteroReport:
         self.engine_mysql: Optional[Engine] = None
         self.file_path: Optional[str] = None
         self.file_name: Optional[str] = None
+        self.artifact_id: Optional[str] = None
         self.preview_headers: List[str] = []
         self.preview_sample: List[Dict[Any, Any]] = []
         self.total_records = 0
@@ -90,10 +92,8 @@ class RuteroReport:
 
     def _run_to_excel(self, query: TextClause) -> None:
         assert self.engine_mysql is not None
-        os.makedirs("media", exist_ok=True)
         date_str = pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")
         self.file_name = f"rutero_{self.ceves_code}_{date_str}.xlsx"
-        self.file_path = os.path.join("media", self.file_name)
 
         params = {
             "p_ceve": int(self.ceves_code) if str(self.ceves_code).isdigit() else self.ceves_code
@@ -105,43 +105,38 @@ class RuteroReport:
         except Exception:
             pass
 
-        start_row = 0
         self._update_progress("Consultando base de datos", 10)
         
-        with self.engine_mysql.connect() as connection:
+        with get_artifact_store().writing(
+            self.file_name, owner=self.user_id
+        ) as pending, self.engine_mysql.connect() as connection:
             try:
-                # pandas read_sql_query con chunksize para manejar grandes volúmenes
-                result_iter = pd.read_sql_query(
-                    sql=query, con=connection, params=params, chunksize=self.chunk_size
+                # Cursor del lado del servidor: las filas llegan por lotes sin cargar todo el resultado
+                result = connection.execution_options(stream_results=True).execute(
+                    query, params
                 )
                 
-                with pd.ExcelWriter(self.file_path, engine="openpyxl") as writer:
-                    has_data = False
-                    for idx, chunk in enumerate(result_iter):
-                        has_data = True
+                with StreamingXlsxWriter(pending.tmp_path) as writer:
+                    for idx, chunk in enumerate(
+                        iter_result_batches(result, self.chunk_size)
+                    ):
                         if idx == 0:
                             self.preview_headers = list(chunk.columns)
                             self.preview_sample = (
                                 chunk.head(10).astype(str).to_dict(orient="records")
                             )
 
-                        chunk.to_excel(
-                            writer,
-                            sheet_name="Rutero",
-                            index=False,
-                            header=(idx == 0),
-                            startrow=start_row,
+                        self.total_records += writer.write_frame(
+                            "Rutero", chunk, batch_size=self.chunk_size
                         )
-                        start_row += len(chunk)
-                        self.total_records += len(chunk)
                         
                         # Progreso ficticio pero informativo basado en chunks
                         progress = min(90, 10 + int(idx * 5))
                         self._update_progress(f"Procesando lote {idx+1}", progress)
                     
-                    if not has_data:
+                    if self.total_records == 0:
                          # Si no hubo datos, creamos un excel vacío con headers genéricos o avisamos
-                         pd.DataFrame(columns=["Mensaje"]).to_excel(writer, sheet_name="Rutero", index=False)
+                         writer.ensure_sheet("Rutero", ["Mensaje"])
 
             except SQLAlchemyError as exc:
                 logger.error("Error de base de datos en Rutero: %s", exc)
@@ -150,6 +145,9 @@ class RuteroReport:
                 logger.error("Error generando Excel Rutero: %s", exc)
                 raise
 
+        self.file_path = pending.artifact.path
+        self.artifact_id = pending.artifact.id
+
     def execute(self) -> Dict[str, Any]:
         """Método principal de orquestación."""
         try:
@@ -165,6 +163,7 @@ class RuteroReport:
                 "success": True,
                 "file_path": self.file_path,
                 "file_name": self.file_name,
+                "artifact_id": self.artifact_id,
                 "ceves": self.ceves_code,
                 "total_records": self.total_records,
                 "preview_headers": self.preview_headers,
@@ -1,4 +1,3 @@
-import os
 import time
 import logging
 from typing import Any, Callable, Dict, List, Optional
@@ -11,6 +10,8 @@ from sqlalchemy.sql.elements import TextClause
 
 from scripts.conexion import Conexion as con
 from scripts.config import ConfigBasic
+from scripts.services.artifact_store import get_artifact_store
+from scripts.services.xlsx_writer import StreamingXlsxWriter, iter_result_batches
 
 logger = logging.getLogger(__name__)
 
@@ -82,6 +83,7 @@ class VentaCeroReport:
         self.engine_mysql: Optional[Engine] = None
         self.file_path: Optional[str] = None
         self.file_name: Optional[str] = None
+        self.artifact_id: Optional[str] = None
         self.preview_headers: List[str] = []
         self.preview_sample: List[Dict[Any, Any]] = []
         self.total_records = 0
@@ -167,11 +169,9 @@ class VentaCeroReport:
 
     def _run_to_excel(self, query: TextClause) -> None:
         assert self.engine_mysql is not None
-        os.makedirs("media", exist_ok=True)
         self.file_name = (
             f"venta_cero_{self.database_name}_de_{self.fecha_desde}_a_{self.fecha_hasta}.xlsx"
         )
-        self.file_path = os.path.join("media", self.file_name)
         proc = self._resolve_procedure()
         param_order_raw = proc.get("params")
         param_order = list(param_order_raw) if isinstance(param_order_raw, (list, tuple)) else []
@@ -216,17 +216,18 @@ class VentaCeroReport:
         except Exception:
             pass
 
-        start_row = 0
         self._update_progress("Extrayendo resultados", 10)
-        with self.engine_mysql.connect() as connection:
+        with get_artifact_store().writing(
+            self.file_name, owner=self.user_id
+        ) as pending, self.engine_mysql.connect() as connection:
             try:
-                result_iter = pd.read_sql_query(
-                    sql=query, con=connection, params=params, chunksize=self.chunk_size
+                result = connection.execution_options(stream_results=True).execute(
+                    query, params
                 )
-                with pd.ExcelWriter(self.file_path, engine="openpyxl") as writer:
-                    for idx, chunk in enumerate(result_iter):
-                        if chunk.empty:
-                            continue
+                with StreamingXlsxWriter(pending.tmp_path) as writer:
+                    for idx, chunk in enumerate(
+                        iter_result_batches(result, self.chunk_size)
+                    ):
                         if not self.preview_headers:
                             self.preview_headers = list(chunk.columns)
                             self.preview_sample = (
@@ -234,15 +235,9 @@ class VentaCeroReport:
                                 .astype(str)
                                 .to_dict(orient="records")
                             )
-                        chunk.to_excel(
-                            writer,
-                            sheet_name="VentaCero",
-                            index=False,
-                            header=idx == 0,
-                            startrow=start_row,
+                        self.total_records += writer.write_frame(
+                            "VentaCero", chunk, batch_size=self.chunk_size
                         )
-                        start_row += len(chunk)
-                        self.total_records += len(chunk)
                         progress = min(90, 10 + int(idx * 5))
                         self._update_progress("Procesando resultados", progress)
             except SQLAlchemyError as exc:
@@ -252,14 +247,12 @@ class VentaCeroReport:
                 logger.error("Error inesperado en Venta Cero: %s", exc)
                 raise
 
-        if self.total_records == 0:
-            # Si no hubo filas, eliminar archivo vacío
-            if self.file_path and os.path.exists(self.file_path):
-                try:
-                    os.remove(self.file_path)
-                except OSError:
-                    pass
-            raise ValueError("No hay datos para los filtros seleccionados")
+            if self.total_records == 0:
+                # Sin filas no se publica el artefacto (writing descarta el archivo).
+                raise ValueError("No hay datos para los filtros seleccionados")
+
+        self.file_path = pending.artifact.path
+        self.artifact_id = pending.artifact.id
 
     # --- Punto de entrada principal ---
     def run(self) -> Dict[str, object]:
@@ -276,6 +269,7 @@ class VentaCeroReport:
                 "message": "Reporte de Venta Cero generado correctamente.",
                 "file_path": self.file_path,
                 "file_name": self.file_name,
+                "artifact_id": self.artifact_id,
                 "metadata": {
                     "total_records": self.total_records,
                     "procedure": self._resolve_procedure().get("procedure"),
@@ -3,9 +3,9 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Any, Callable, Dict, Optional, Sequence, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union
 
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from sqlalchemy.engine import Engine, RowMapping
 from sqlalchemy.sql.elements import TextClause
 
@@ -131,37 +131,7 @@ class ConfigRepository:
                 f"No se encontró configuración para la empresa {database_name}"
             )
 
-        return EmpresaConfig(
-            id=row.get("id"),
-            nm_empresa=row.get("nmEmpresa"),
-            name=row.get("name", database_name),
-            dir_actual=row.get("name", database_name),  # dir_actual es el name de la empresa
-            nm_dt=None,  # nmDt no existe en conf_empresas, debe obtenerse de conf_dt
-            nb_server_sidis=row.get("nbServerSidis"),
-            db_sidis=row.get("dbSidis"),
-            nb_server_bi=row.get("nbServerBi"),
-            db_bi=row.get("dbBi"),
-            tx_procedure_extrae=row.get("txProcedureExtrae"),
-            tx_procedure_cargue=row.get("txProcedureCargue"),
-            nm_procedure_excel=row.get("nmProcedureExcel"),
-            tx_procedure_excel=row.get("txProcedureExcel"),
-            nm_procedure_interface=row.get("nmProcedureInterface"),
-            tx_procedure_interface=row.get("txProcedureInterface"),
-            nm_procedure_excel2=row.get("nmProcedureExcel2"),
-            tx_procedure_excel2=row.get("txProcedureExcel2"),
-            nm_procedure_csv=row.get("nmProcedureCsv"),
-            tx_procedure_csv=row.get("txProcedureCsv"),
-            nm_procedure_csv2=row.get("nmProcedureCsv2"),
-            tx_procedure_csv2=row.get("txProcedureCsv2"),
-            nm_procedure_sql=row.get("nmProcedureSql"),
-            tx_procedure_sql=row.get("txProcedureSql"),
-            group_id_powerbi=row.get("group_id_powerbi"),
-            report_id_powerbi=row.get("report_id_powerbi"),
-            dataset_id_powerbi=row.get("dataset_id_powerbi"),
-            url_powerbi=row.get("url_powerbi"),
-            id_tsol=row.get("id_tsol"),
-            raw=dict(row),
-        )
+        return self._build_empresa(row, database_name)
 
     def get_date_window(self, nm_dt: str) -> Optional[DateWindow]:
         stmt = text(
@@ -233,9 +203,171 @@ class ConfigRepository:
             return None
         return Credential(username=row.get("nmUsr"), password=row.get("txPass"))
 
+    # ------------------------------------------------------------------
+    # API por lotes: una consulta por tabla sin importar cuántas empresas
+    # ------------------------------------------------------------------
+    def list_empresa_names(self) -> List[str]:
+        stmt = text("SELECT name FROM powerbi_adm.conf_empresas WHERE name IS NOT NULL")
+        return [row["name"] for row in self._run_query(stmt)]
+
+    def get_empresa_configs(
+        self, database_names: Optional[Iterable[str]] = None
+    ) -> Dict[str, EmpresaConfig]:
+        """Configuración de varias empresas (todas si ``database_names`` es ``None``)."""
+
+        cols = ", ".join(self._EMPRESA_COLUMNS)
+        if database_names is None:
+            stmt = text(f"SELECT {cols} FROM powerbi_adm.conf_empresas")
+            params: Dict[str, Any] = {}
+        else:
+            names = sorted(set(database_names))
+            if not names:
+                return {}
+            stmt = text(
+                f"SELECT {cols} FROM powerbi_adm.conf_empresas WHERE name IN :names"
+            ).bindparams(bindparam("names", expanding=True))
+            params = {"names": names}
+        return {
+            row["name"]: self._build_empresa(row, row["name"])
+            for row in self._run_query(stmt, params)
+        }
+
+    def get_server_configs(
+        self, identifiers: Iterable[Optional[object]]
+    ) -> Dict[str, ServerConfig]:
+        """Servidores y sus credenciales en una sola consulta (JOIN con conf_tipo)."""
+
+        ids = sorted({str(value) for value in identifiers if value not in (None, "")})
+        if not ids:
+            return {}
+        stmt = text(
+            """
+            SELECT s.nbServer, s.nmServer, s.nbTipo, s.hostServer, s.portServer,
+                   t.nbTipo AS credTipo, t.nmUsr, t.txPass
+            FROM powerbi_adm.conf_server s
+            LEFT JOIN powerbi_adm.conf_tipo t ON t.nbTipo = s.nbTipo
+            WHERE s.nbServer IN :ids
+            """
+        ).bindparams(bindparam("ids", expanding=True))
+        servers: Dict[str, ServerConfig] = {}
+        for row in self._run_query(stmt, {"ids": ids}):
+            credential = (
+                Credential(username=row.get("nmUsr"), password=row.get("txPass"))
+                if row.get("credTipo") is not None
+                else None
+            )
+            servers[str(row.get("nbServer"))] = ServerConfig(
+                identifier=row.get("nbServer"),
+                name=row.get("nmServer"),
+                type_code=row.get("nbTipo"),
+                host=row.get("hostServer"),
+                port=row.get("portServer"),
+                credential=credential,
+            )
+        return servers
+
+    def get_credentials_many(self, nb_tipos: Iterable[str]) -> Dict[str, Credential]:
+        tipos = sorted({str(value) for value in nb_tipos})
+        if not tipos:
+            return {}
+        stmt = text(
+            """
+            SELECT nbTipo, nmUsr, txPass
+            FROM powerbi_adm.conf_tipo
+            WHERE nbTipo IN :tipos
+            """
+        ).bindparams(bindparam("tipos", expanding=True))
+        return {
+            str(row.get("nbTipo")): Credential(
+                username=row.get("nmUsr"), password=row.get("txPass")
+            )
+            for row in self._run_query(stmt, {"tipos": tipos})
+        }
+
+    def get_date_windows(
+        self, nm_dts: Iterable[str]
+    ) -> Dict[str, Optional[DateWindow]]:
+        """Ventanas de fechas para varios ``nmDt``.
+
+        Las expresiones ``txDtIni``/``txDtFin`` son SQL almacenado; se ejecuta
+        cada expresión distinta una sola vez, reutilizando la misma conexión.
+        """
+
+        keys = sorted({value for value in nm_dts if value})
+        if not keys:
+            return {}
+        stmt = text(
+            """
+            SELECT nmDt, txDtIni, txDtFin
+            FROM powerbi_adm.conf_dt
+            WHERE nmDt IN :nm_dts
+            """
+        ).bindparams(bindparam("nm_dts", expanding=True))
+
+        windows: Dict[str, Optional[DateWindow]] = {key: None for key in keys}
+        engine = self._engine_factory()
+        with engine.connect() as connection:
+            rows = connection.execute(stmt, {"nm_dts": keys}).mappings().all()
+            evaluated: Dict[str, Optional[RowMapping]] = {}
+
+            def evaluate(expression: Any) -> Optional[RowMapping]:
+                sql = str(expression)
+                if sql not in evaluated:
+                    result = connection.execute(self._coerce_to_text(sql))
+                    evaluated[sql] = result.mappings().first()
+                return evaluated[sql]
+
+            for row in rows:
+                tx_dt_ini = row.get("txDtIni")
+                tx_dt_fin = row.get("txDtFin")
+                if not tx_dt_ini or not tx_dt_fin:
+                    continue
+                reporte_ini = evaluate(tx_dt_ini)
+                reporte_fin = evaluate(tx_dt_fin)
+                if not reporte_ini or not reporte_fin:
+                    continue
+                windows[row["nmDt"]] = DateWindow(
+                    report_start=str(reporte_ini.get("IdtReporteIni")),
+                    report_end=str(reporte_fin.get("IdtReporteFin")),
+                )
+        return windows
+
     # ------------------------------------------------------------------
     # Utilidades internas
     # ------------------------------------------------------------------
+    def _build_empresa(self, row: RowMapping, database_name: str) -> EmpresaConfig:
+        return EmpresaConfig(
+            id=row.get("id"),
+            nm_empresa=row.get("nmEmpresa"),
+            name=row.get("name", database_name),
+            dir_actual=row.get("name", database_name),  # dir_actual es el name de la empresa
+            nm_dt=None,  # nmDt no existe en conf_empresas, debe obtenerse de conf_dt
+            nb_server_sidis=row.get("nbServerSidis"),
+            db_sidis=row.get("dbSidis"),
+            nb_server_bi=row.get("nbServerBi"),
+            db_bi=row.get("dbBi"),
+            tx_procedure_extrae=row.get("txProcedureExtrae"),
+            tx_procedure_cargue=row.get("txProcedureCargue"),
+            nm_procedure_excel=row.get("nmProcedureExcel"),
+            tx_procedure_excel=row.get("txProcedureExcel"),
+            nm_procedure_interface=row.get("nmProcedureInterface"),
+            tx_procedure_interface=row.get("txProcedureInterface"),
+            nm_procedure_excel2=row.get("nmProcedureExcel2"),
+            tx_procedure_excel2=row.get("txProcedureExcel2"),
+            nm_procedure_csv=row.get("nmProcedureCsv"),
+            tx_procedure_csv=row.get("txProcedureCsv"),
+            nm_procedure_csv2=row.get("nmProcedureCsv2"),
+            tx_procedure_csv2=row.get("txProcedureCsv2"),
+            nm_procedure_sql=row.get("nmProcedureSql"),
+            tx_procedure_sql=row.get("txProcedureSql"),
+            group_id_powerbi=row.get("group_id_powerbi"),
+            report_id_powerbi=row.get("report_id_powerbi"),
+            dataset_id_powerbi=row.get("dataset_id_powerbi"),
+            url_powerbi=row.get("url_powerbi"),
+            id_tsol=row.get("id_tsol"),
+            raw=dict(row),
+        )
+
     def _coerce_to_text(self, statement: Any) -> TextClause:
         return statement if isinstance(statement, TextClause) else text(str(statement))
 
@@ -0,0 +1,310 @@
+"""Almacén de artefactos generados por las tareas (reportes, planos, ZIP).
+
+Reemplaza la carpeta plana ``media/`` con nombres ad-hoc:
+
+* Cada artefacto vive en su propio directorio ``<raíz>/<artifact_id>/``, así
+  dos tareas con el mismo nombre de archivo nunca se pisan.
+* La escritura es atómica: el generador escribe en un archivo temporal del
+  mismo directorio y :meth:`PendingArtifact.commit` lo renombra al nombre
+  final. Un archivo a medio escribir nunca se registra ni se sirve.
+* Un índice SQLite (``index.sqlite3``) guarda dueño, tamaño, creación y
+  último acceso de cada artefacto, más el total de bytes ocupados.
+* Al superar la cuota se desalojan los artefactos con acceso más antiguo.
+  El índice por ``last_access`` permite hacerlo en O(desalojados), sin
+  listar el directorio; lo mismo aplica a la expiración por antigüedad.
+
+El índice se abre con WAL y transacciones ``IMMEDIATE``, por lo que lo
+comparten sin problema los procesos de gunicorn y los workers RQ del mismo
+host.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOT = os.path.join("media", "artifacts")
+DEFAULT_QUOTA_MB = 10 * 1024
+_INDEX_NAME = "index.sqlite3"
+_PARTIAL_PREFIX = ".partial-"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    id TEXT PRIMARY KEY,
+    owner INTEGER,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    job_id TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_artifacts_last_access ON artifacts (last_access);
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total_bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO usage (id, total_bytes) VALUES (1, 0);
+"""
+
+
+@dataclass(frozen=True)
+class Artifact:
+    id: str
+    owner: Optional[int]
+    name: str
+    path: str
+    size: int
+    created: float
+    last_access: float
+    job_id: Optional[str] = None
+
+
+class PendingArtifact:
+    """Artefacto en escritura: el generador escribe en ``tmp_path``."""
+
+    def __init__(self, store: "ArtifactStore", artifact_id: str, name: str,
+                 owner: Optional[int], job_id: Optional[str]) -> None:
+        self.store = store
+        self.id = artifact_id
+        self.name = name
+        self.owner = owner
+        self.job_id = job_id
+        self.directory = os.path.join(store.root, artifact_id)
+        self.final_path = os.path.join(self.directory, name)
+        # Se conserva la extensión: algunos escritores (pandas.ExcelWriter) la validan.
+        self.tmp_path = os.path.join(self.directory, f"{_PARTIAL_PREFIX}{name}")
+        self.artifact: Optional[Artifact] = None
+
+    def commit(self) -> Artifact:
+        """Publica el archivo temporal con su nombre final y lo registra."""
+
+        if self.artifact is not None:
+            return self.artifact
+        os.replace(self.tmp_path, self.final_path)
+        self.artifact = self.store._register(self)
+        return self.artifact
+
+    def abort(self) -> None:
+        """Descarta lo escrito (el directorio queda vacío y se elimina)."""
+
+        if self.artifact is None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ArtifactStore:
+    def __init__(self, root: str = DEFAULT_ROOT, quota_bytes: Optional[int] = None) -> None:
+        self.root = root
+        self.quota_bytes = quota_bytes if quota_bytes is not None else DEFAULT_QUOTA_MB * 1024 * 1024
+        self.index_path = os.path.join(root, _INDEX_NAME)
+        os.makedirs(root, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    # ------------------------------------------------------------------
+    # Índice
+    # ------------------------------------------------------------------
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    def reserve(self, name: str, owner: Optional[int] = None,
+                job_id: Optional[str] = None) -> PendingArtifact:
+        """Crea el directorio del artefacto y retorna dónde escribirlo."""
+
+        safe_name = os.path.basename(name) or "artefacto"
+        if job_id is None:
+            job_id = _current_job_id()
+        pending = PendingArtifact(self, uuid.uuid4().hex, safe_name, owner, job_id)
+        os.makedirs(pending.directory, exist_ok=True)
+        return pending
+
+    @contextmanager
+    def writing(self, name: str, owner: Optional[int] = None,
+                job_id: Optional[str] = None) -> Iterator[PendingArtifact]:
+        """``with store.writing(nombre) as pending:`` publica solo si no hay error."""
+
+        pending = self.reserve(name, owner=owner, job_id=job_id)
+        try:
+            yield pending
+        except BaseException:
+            pending.abort()
+            raise
+        pending.commit()
+
+    def _register(self, pending: PendingArtifact) -> Artifact:
+        now = time.time()
+        artifact = Artifact(
+            id=pending.id,
+            owner=pending.owner,
+            name=pending.name,
+            path=pending.final_path,
+            size=os.path.getsize(pending.final_path),
+            created=now,
+            last_access=now,
+            job_id=pending.job_id,
+        )
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO artifacts (id, owner, name, path, size, created, last_access, job_id)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (artifact.id, artifact.owner, artifact.name, artifact.path, artifact.size,
+                 artifact.created, artifact.last_access, artifact.job_id),
+            )
+            conn.execute("UPDATE usage SET total_bytes = total_bytes + ? WHERE id = 1", (artifact.size,))
+            evicted = self._evict_over_quota(conn, keep=artifact.id)
+        self._remove_dirs(evicted)
+        logger.info("Artefacto %s publicado: %s (%s bytes)", artifact.id, artifact.name, artifact.size)
+        return artifact
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def get(self, artifact_id: str, touch: bool = True) -> Optional[Artifact]:
+        """Artefacto por id (actualiza su último acceso) o ``None``."""
+
+        if not artifact_id:
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, owner, name, path, size, created, last_access, job_id"
+                " FROM artifacts WHERE id = ?",
+                (artifact_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            artifact = Artifact(*row)
+            if touch and os.path.isfile(artifact.path):
+                now = time.time()
+                conn.execute("UPDATE artifacts SET last_access = ? WHERE id = ?", (now, artifact_id))
+                artifact = replace(artifact, last_access=now)
+        if not os.path.isfile(artifact.path):
+            # El archivo desapareció por fuera del almacén: se depura la entrada.
+            self.delete(artifact_id)
+            return None
+        return artifact
+
+    @property
+    def total_bytes(self) -> int:
+        with self._connect() as conn:
+            return int(conn.execute("SELECT total_bytes FROM usage WHERE id = 1").fetchone()[0])
+
+    # ------------------------------------------------------------------
+    # Eliminación
+    # ------------------------------------------------------------------
+    def delete(self, artifact_id: str) -> bool:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT path, size FROM artifacts WHERE id = ?", (artifact_id,)).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM artifacts WHERE id = ?", (artifact_id,))
+            conn.execute("UPDATE usage SET total_bytes = MAX(0, total_bytes - ?) WHERE id = 1", (row[1],))
+        self._remove_dirs([artifact_id])
+        return True
+
+    def expire(self, max_age_seconds: float) -> List[str]:
+        """Elimina los artefactos sin acceso en ``max_age_seconds``; retorna sus rutas."""
+
+        cutoff = time.time() - max_age_seconds
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, path, size FROM artifacts WHERE last_access < ?", (cutoff,)
+            ).fetchall()
+            self._delete_rows(conn, rows)
+        self._remove_dirs([row[0] for row in rows])
+        return [row[1] for row in rows]
+
+    def _evict_over_quota(self, conn: sqlite3.Connection, keep: Optional[str] = None) -> List[str]:
+        total = conn.execute("SELECT total_bytes FROM usage WHERE id = 1").fetchone()[0]
+        evicted: List[str] = []
+        while total > self.quota_bytes:
+            rows = conn.execute(
+                "SELECT id, path, size FROM artifacts WHERE id != ?"
+                " ORDER BY last_access LIMIT 16",
+                (keep or "",),
+            ).fetchall()
+            if not rows:
+                break
+            batch = []
+            for row in rows:
+                if total <= self.quota_bytes:
+                    break
+                batch.append(row)
+                total -= row[2]
+            self._delete_rows(conn, batch)
+            evicted.extend(row[0] for row in batch)
+        if evicted:
+            logger.info("Cuota de artefactos excedida: %s desalojados", len(evicted))
+        return evicted
+
+    @staticmethod
+    def _delete_rows(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+        if not rows:
+            return
+        conn.executemany("DELETE FROM artifacts WHERE id = ?", [(row[0],) for row in rows])
+        conn.execute(
+            "UPDATE usage SET total_bytes = MAX(0, total_bytes - ?) WHERE id = 1",
+            (sum(row[2] for row in rows),),
+        )
+
+    def _remove_dirs(self, artifact_ids: List[str]) -> None:
+        for artifact_id in artifact_ids:
+            shutil.rmtree(os.path.join(self.root, artifact_id), ignore_errors=True)
+
+
+def _current_job_id() -> Optional[str]:
+    try:
+        from rq import get_current_job
+    except ImportError:
+        return None
+    job = get_current_job()
+    return job.id if job else None
+
+
+_DEFAULT_STORE: Optional[ArtifactStore] = None
+_DEFAULT_STORE_LOCK = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Almacén por proceso configurado con ``ARTIFACTS_ROOT`` y ``ARTIFACTS_QUOTA_MB``."""
+
+    global _DEFAULT_STORE
+    if _DEFAULT_STORE is None:
+        with _DEFAULT_STORE_LOCK:
+            if _DEFAULT_STORE is None:
+                quota_mb = int(os.getenv("ARTIFACTS_QUOTA_MB", DEFAULT_QUOTA_MB))
+                _DEFAULT_STORE = ArtifactStore(
+                    os.getenv("ARTIFACTS_ROOT", DEFAULT_ROOT),
+                    quota_bytes=quota_mb * 1024 * 1024,
+                )
+    return _DEFAULT_STORE
@@ -0,0 +1,400 @@
+"""Servicio de calendario laboral colombiano con operaciones vectorizadas."""
+
+from __future__ import annotations
+
+import datetime
+import logging
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DateLike = Union[datetime.date, str, pd.Timestamp, np.datetime64]
+DatesLike = Union[pd.Series, pd.Index, np.ndarray, Iterable[DateLike]]
+
+ANNO_MIN = 1900
+ANNO_MAX = 2100
+
+WEEKMASK_CON_SABADOS = "1111110"
+WEEKMASK_SIN_SABADOS = "1111100"
+
+DIAS_SEMANA = (
+    "Lunes",
+    "Martes",
+    "Miércoles",
+    "Jueves",
+    "Viernes",
+    "Sábado",
+    "Domingo",
+)
+
+# Festivos que no se trasladan.
+_FESTIVOS_FIJOS: Tuple[Tuple[int, int, str], ...] = (
+    (1, 1, "Año Nuevo"),
+    (5, 1, "Día del Trabajo"),
+    (7, 20, "Día de la Independencia"),
+    (8, 7, "Batalla de Boyacá"),
+    (12, 8, "Día de la Inmaculada Concepción"),
+    (12, 25, "Navidad"),
+)
+
+# Festivos que la Ley 51 de 1983 (Emiliani) traslada al lunes siguiente.
+_FESTIVOS_EMILIANI: Tuple[Tuple[int, int, str], ...] = (
+    (1, 6, "Reyes Magos"),
+    (3, 19, "San José"),
+    (6, 29, "San Pedro y San Pablo"),
+    (8, 15, "Asunción de la Virgen"),
+    (10, 12, "Día de la Raza"),
+    (11, 1, "Todos los Santos"),
+    (11, 11, "Independencia de Cartagena"),
+)
+
+# Festivos relativos a Pascua (desplazamiento en días desde el domingo de Pascua).
+# Ascensión, Corpus Christi y Sagrado Corazón ya quedan en lunes.
+_FESTIVOS_PASCUA: Tuple[Tuple[int, str], ...] = (
+    (-3, "Jueves Santo"),
+    (-2, "Viernes Santo"),
+    (43, "Ascensión del Señor"),
+    (64, "Corpus Christi"),
+    (71, "Sagrado Corazón"),
+)
+
+
+def validar_anno(year: int) -> None:
+    if not isinstance(year, int) or year < ANNO_MIN or year > ANNO_MAX:
+        raise ValueError(
+            f"El año debe ser un entero dentro de un rango razonable ({ANNO_MIN}-{ANNO_MAX})."
+        )
+
+
+@lru_cache(maxsize=None)
+def calcular_pascua(year: int) -> datetime.date:
+    """Calcula el domingo de Pascua con el algoritmo de Meeus/Jones/Butcher."""
+
+    validar_anno(year)
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = ((h + l - 7 * m + 114) % 31) + 1
+    return datetime.date(year, month, day)
+
+
+def trasladar_a_lunes(fecha: datetime.date) -> datetime.date:
+    """Traslada una fecha al lunes siguiente si no cae en lunes (regla Emiliani)."""
+
+    return fecha + datetime.timedelta(days=(7 - fecha.weekday()) % 7)
+
+
+@lru_cache(maxsize=None)
+def festivos_del_anno(year: int) -> Mapping[datetime.date, str]:
+    """Devuelve los festivos del año como un mapeo inmutable ``fecha -> descripción``.
+
+    El resultado se memoiza por año, de modo que llamadas repetidas (por
+    instancia, por fila o por worker) no recalculan Pascua ni los traslados.
+    """
+
+    validar_anno(year)
+    festivos: Dict[datetime.date, str] = {}
+    for mes, dia, descripcion in _FESTIVOS_FIJOS:
+        festivos[datetime.date(year, mes, dia)] = descripcion
+    for mes, dia, descripcion in _FESTIVOS_EMILIANI:
+        festivos.setdefault(
+            trasladar_a_lunes(datetime.date(year, mes, dia)), descripcion
+        )
+    pascua = calcular_pascua(year)
+    for desplazamiento, descripcion in _FESTIVOS_PASCUA:
+        festivos.setdefault(
+            pascua + datetime.timedelta(days=desplazamiento), descripcion
+        )
+    return MappingProxyType(dict(sorted(festivos.items())))
+
+
+@lru_cache(maxsize=256)
+def _festivos_array(anno_ini: int, anno_fin: int) -> np.ndarray:
+    fechas = [
+        fecha
+        for year in range(anno_ini, anno_fin + 1)
+        for fecha in festivos_del_anno(year)
+    ]
+    return np.array(fechas, dtype="datetime64[D]")
+
+
+@lru_cache(maxsize=32)
+def _busdaycalendar(weekmask: str, anno_ini: int, anno_fin: int) -> np.busdaycalendar:
+    return np.busdaycalendar(
+        weekmask=weekmask, holidays=_festivos_array(anno_ini, anno_fin)
+    )
+
+
+def _to_datetime64(fechas: DatesLike) -> np.ndarray:
+    valores = pd.to_datetime(pd.Series(fechas) if not isinstance(fechas, pd.Series) else fechas)
+    return valores.to_numpy(dtype="datetime64[D]")
+
+
+class CalendarService:
+    """Calendario laboral colombiano con operaciones vectorizadas sobre fechas.
+
+    Todas las operaciones se apoyan en ``numpy.busdaycalendar`` y trabajan sobre
+    Series o arreglos completos, sin recorrer día a día en Python. No modifica
+    la configuración regional del proceso, por lo que es seguro en workers.
+
+    Args:
+        incluir_sabados: Si ``True`` los sábados se consideran días hábiles.
+        anno_ini: Primer año cubierto por el calendario de festivos.
+        anno_fin: Último año cubierto por el calendario de festivos.
+    """
+
+    def __init__(
+        self,
+        incluir_sabados: bool = True,
+        anno_ini: int = 2000,
+        anno_fin: int = 2050,
+    ) -> None:
+        validar_anno(anno_ini)
+        validar_anno(anno_fin)
+        if anno_ini > anno_fin:
+            raise ValueError("anno_ini no puede ser mayor que anno_fin")
+        self.incluir_sabados = incluir_sabados
+        self.anno_ini = anno_ini
+        self.anno_fin = anno_fin
+        self.weekmask = (
+            WEEKMASK_CON_SABADOS if incluir_sabados else WEEKMASK_SIN_SABADOS
+        )
+        self.calendar = _busdaycalendar(self.weekmask, anno_ini, anno_fin)
+
+    # ------------------------------------------------------------------
+    # Consultas puntuales
+    # ------------------------------------------------------------------
+    def festivos(self, year: int) -> Mapping[datetime.date, str]:
+        return festivos_del_anno(year)
+
+    def es_festivo(self, fecha: datetime.date) -> bool:
+        return fecha in festivos_del_anno(fecha.year)
+
+    def descripcion(self, fecha: datetime.date) -> str:
+        return festivos_del_anno(fecha.year).get(fecha, "")
+
+    def es_dia_habil(self, fecha: datetime.date) -> bool:
+        if fecha.weekday() == 6 or (fecha.weekday() == 5 and not self.incluir_sabados):
+            return False
+        return not self.es_festivo(fecha)
+
+    # ------------------------------------------------------------------
+    # Operaciones vectorizadas
+    # ------------------------------------------------------------------
+    def es_habil(self, fechas: DatesLike) -> pd.Series:
+        """Indica, para cada fecha, si es día hábil. Los nulos devuelven ``False``."""
+
+        valores = _to_datetime64(fechas)
+        validos = ~np.isnat(valores)
+        resultado = np.zeros(len(valores), dtype=bool)
+        if validos.any():
+            resultado[validos] = np.is_busday(
+                valores[validos], busdaycal=self._calendar_para(valores[validos])
+            )
+        return pd.Series(resultado, index=self._index_de(fechas), name="boHabil")
+
+    def contar_habiles(self, inicio: DatesLike, fin: DatesLike) -> pd.Series:
+        """Cuenta días hábiles en el intervalo ``[inicio, fin]`` fila a fila.
+
+        Ambos extremos se incluyen, que es como lo cuentan los reportes. Si
+        ``fin`` es anterior a ``inicio`` el resultado es negativo.
+        """
+
+        ini = _to_datetime64(inicio)
+        fin_arr = _to_datetime64(fin)
+        if len(ini) != len(fin_arr):
+            raise ValueError("inicio y fin deben tener la misma longitud")
+        validos = ~(np.isnat(ini) | np.isnat(fin_arr))
+        resultado = pd.array([pd.NA] * len(ini), dtype="Int64")
+        if validos.any():
+            ini_v = ini[validos]
+            fin_v = fin_arr[validos]
+            # busday_count excluye el extremo final; se suma un día para incluirlo.
+            calendar = self._calendar_para(np.concatenate([ini_v, fin_v]))
+            conteo = np.busday_count(
+                ini_v, fin_v + np.timedelta64(1, "D"), busdaycal=calendar
+            )
+            invertidos = fin_v < ini_v
+            if invertidos.any():
+                conteo[invertidos] = -np.busday_count(
+                    fin_v[invertidos],
+                    ini_v[invertidos] + np.timedelta64(1, "D"),
+                    busdaycal=calendar,
+                )
+            resultado[validos] = conteo
+        return pd.Series(resultado, index=self._index_de(inicio), name="nbHabiles")
+
+    def sumar_habiles(
+        self, fechas: DatesLike, dias: Union[int, DatesLike], roll: str = "forward"
+    ) -> pd.Series:
+        """Desplaza cada fecha ``dias`` días hábiles (``numpy.busday_offset``).
+
+        Args:
+            fechas: Fechas base.
+            dias: Entero o secuencia de enteros con el desplazamiento por fila.
+            roll: Regla para fechas base no hábiles (``forward``, ``backward``...).
+        """
+
+        valores = _to_datetime64(fechas)
+        offsets = np.broadcast_to(np.asarray(dias, dtype="int64"), valores.shape)
+        validos = ~np.isnat(valores)
+        resultado = np.full(len(valores), np.datetime64("NaT"), dtype="datetime64[D]")
+        if validos.any():
+            resultado[validos] = np.busday_offset(
+                valores[validos],
+                offsets[validos],
+                roll=roll,
+                busdaycal=self._calendar_para(valores[validos], holgura=True),
+            )
+        return pd.Series(
+            pd.to_datetime(resultado), index=self._index_de(fechas), name="dtFecha"
+        )
+
+    # ------------------------------------------------------------------
+    # Tabla de calendario
+    # ------------------------------------------------------------------
+    def generar_dim_calendario(self, anno_ini: int, anno_fin: int) -> pd.DataFrame:
+        """Construye la dimensión ``dim_calendario`` para un rango de años.
+
+        Incluye las columnas históricas de ``CalendarioLaboral.dias_habiles_del_anno_df``
+        más los indicadores de día hábil y el consecutivo de días hábiles del mes,
+        para que reportes SQL y pandas hagan join en lugar de recalcular.
+        """
+
+        validar_anno(anno_ini)
+        validar_anno(anno_fin)
+        if anno_ini > anno_fin:
+            raise ValueError("anno_ini no puede ser mayor que anno_fin")
+
+        fechas = pd.date_range(
+            f"{anno_ini}-01-01", f"{anno_fin}-12-31", freq="D"
+        )
+        dias = fechas.to_numpy(dtype="datetime64[D]")
+        festivos = {
+            pd.Timestamp(fecha): descripcion
+            for year in range(anno_ini, anno_fin + 1)
+            for fecha, descripcion in festivos_del_anno(year).items()
+        }
+        calendar = self._calendar_rango(anno_ini, anno_fin)
+
+        dia_semana = fechas.dayofweek
+        descripcion = pd.Series(fechas.map(festivos.get), dtype="object").fillna("")
+        es_festivo = descripcion.ne("").to_numpy()
+        bo_habil = np.is_busday(dias, busdaycal=calendar)
+
+        df = pd.DataFrame(
+            {
+                "id": np.arange(1, len(fechas) + 1, dtype="int32"),
+                "idFecha": (
+                    fechas.year * 10000 + fechas.month * 100 + fechas.day
+                ).astype("int32"),
+                "ds": "",
+                "nmDia": pd.Categorical.from_codes(dia_semana, categories=DIAS_SEMANA),
+                "dtFecha": fechas.date,
+                "nbDia": fechas.day.astype("int8"),
+                "nbDiaSemana": (dia_semana + 1).astype("int8"),
+                "nbSemanaIso": fechas.isocalendar().week.to_numpy().astype("int8"),
+                "nbMes": fechas.month.astype("int8"),
+                "nbAnno": fechas.year.astype("int16"),
+                "txDescripcion": descripcion.to_numpy(),
+                "boFestivo": (es_festivo | (dia_semana == 6)).astype("int8"),
+                "boHabil": bo_habil.astype("int8"),
+            }
+        )
+        periodo = df["nbAnno"].astype("int32") * 100 + df["nbMes"]
+        df["nbHabilMes"] = (
+            df["boHabil"].groupby(periodo).cumsum().where(df["boHabil"] == 1, 0)
+        ).astype("int8")
+        df["nbHabilesMes"] = (
+            df["boHabil"].groupby(periodo).transform("sum").astype("int8")
+        )
+        return df
+
+    def materializar_dim_calendario(
+        self,
+        engine: Any,
+        anno_ini: int,
+        anno_fin: int,
+        tabla: str = "dim_calendario",
+        schema: Optional[str] = None,
+    ) -> int:
+        """Escribe ``dim_calendario`` en la base indicada y retorna las filas escritas.
+
+        La tabla se reemplaza completa; en MySQL/MariaDB se agrega la llave
+        primaria sobre ``dtFecha`` para que los joins de los reportes usen índice.
+        """
+
+        from sqlalchemy import text  # import local: el servicio no exige SQLAlchemy
+
+        df = self.generar_dim_calendario(anno_ini, anno_fin)
+        df["nmDia"] = df["nmDia"].astype(str)
+        df.to_sql(
+            tabla,
+            con=engine,
+            schema=schema,
+            if_exists="replace",
+            index=False,
+            chunksize=5000,
+        )
+        if engine.dialect.name in ("mysql", "mariadb"):
+            nombre = f"{schema}.{tabla}" if schema else tabla
+            with engine.begin() as connection:
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {nombre} ADD PRIMARY KEY (dtFecha), "
+                        f"ADD UNIQUE KEY idx_{tabla}_idFecha (idFecha)"
+                    )
+                )
+        logger.info(
+            "dim_calendario materializada en %s (%s filas, %s-%s)",
+            tabla,
+            len(df),
+            anno_ini,
+            anno_fin,
+        )
+        return len(df)
+
+    def _calendar_rango(self, anno_ini: int, anno_fin: int) -> np.busdaycalendar:
+        if self.anno_ini <= anno_ini and anno_fin <= self.anno_fin:
+            return self.calendar
+        return _busdaycalendar(
+            self.weekmask, max(anno_ini, ANNO_MIN), min(anno_fin, ANNO_MAX)
+        )
+
+    def _calendar_para(
+        self, valores: np.ndarray, holgura: bool = False
+    ) -> np.busdaycalendar:
+        """Calendario que cubre los años de ``valores`` (y uno más si hay desplazamientos)."""
+
+        if not len(valores):
+            return self.calendar
+        anno_ini = int(valores.min().astype("datetime64[Y]").astype(int)) + 1970
+        anno_fin = int(valores.max().astype("datetime64[Y]").astype(int)) + 1970
+        if holgura:
+            anno_ini, anno_fin = anno_ini - 1, anno_fin + 1
+        return self._calendar_rango(anno_ini, anno_fin)
+
+    @staticmethod
+    def _index_de(fechas: DatesLike) -> Optional[pd.Index]:
+        if isinstance(fechas, pd.Series):
+            return fechas.index
+        return None
+
+
+@lru_cache(maxsize=4)
+def get_calendar_service(incluir_sabados: bool = True) -> CalendarService:
+    """Instancia compartida por proceso del calendario laboral."""
+
+    return CalendarService(incluir_sabados=incluir_sabados)
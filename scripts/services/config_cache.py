@@ -0,0 +1,351 @@
+"""Capa compartida (Redis) para la caché de configuración.
+
+Complementa la ``TTLCache`` local de ``ConfigService``:
+
+* Las entradas compartidas usan claves versionadas; invalidar consiste en
+  incrementar una versión (global, por empresa o por usuario), por lo que una
+  entrada vieja nunca se vuelve a leer aunque siga en Redis.
+* Cada invalidación se publica en un canal pub/sub; todos los procesos
+  (gunicorn y workers RQ) suscritos limpian su caché local al recibirla.
+* ``load_once`` evita la estampida en arranque en frío: solo un proceso
+  consulta la base administrativa por clave mientras los demás esperan el
+  resultado en Redis.
+
+Los valores se guardan como JSON (nunca ``pickle``): leer Redis no ejecuta
+código y los llamadores deciden qué campos publican; las credenciales se
+quedan en la caché local de cada proceso.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+INVALIDATION_CHANNEL = "datazenith:config:invalidate"
+_PREFIX = "datazenith:config"
+_GLOBAL_VERSION_KEY = f"{_PREFIX}:version"
+_EMPRESA_VERSION_KEY = _PREFIX + ":version:empresa:{database_name}"
+_USER_VERSION_KEY = _PREFIX + ":version:user:{user_id}"
+# Espera máxima de cada lectura del suscriptor (menor que el ``socket_timeout``).
+LISTEN_POLL_SECONDS = 1.0
+
+InvalidationListener = Callable[[Optional[str], Optional[int]], None]
+
+
+def redis_url_from_env() -> Optional[str]:
+    """URL de Redis para la caché de configuración, o ``None`` si no hay Redis.
+
+    Prioriza ``CONFIG_CACHE_REDIS_URL``; si no existe usa ``REDIS_HOST`` y
+    ``REDIS_PORT`` (los mismos del docker-compose) sobre la base 1.
+    """
+
+    url = os.getenv("CONFIG_CACHE_REDIS_URL")
+    if url:
+        return url
+    host = os.getenv("REDIS_HOST")
+    if not host:
+        return None
+    port = os.getenv("REDIS_PORT", "6379")
+    return f"redis://{host}:{port}/1"
+
+
+class SharedConfigCache:
+    """Caché L2 en Redis con versionado, pub/sub y protección de estampida."""
+
+    def __init__(
+        self,
+        client: Any,
+        ttl: int = 600,
+        lock_timeout: float = 15.0,
+        wait_timeout: float = 10.0,
+        poll_interval: float = 0.05,
+    ) -> None:
+        self._client = client
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._listeners: List[InvalidationListener] = []
+        self._listener_thread: Optional[threading.Thread] = None
+        self._listener_lock = threading.Lock()
+        # Locks por franjas: acotados aunque las claves cambien con cada versión.
+        self._local_locks = [threading.Lock() for _ in range(64)]
+        self._origin = uuid.uuid4().hex
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "SharedConfigCache":
+        from redis import Redis
+
+        client = Redis.from_url(
+            url, socket_connect_timeout=2, socket_timeout=5, health_check_interval=30
+        )
+        return cls(client, **kwargs)
+
+    # ------------------------------------------------------------------
+    # Claves versionadas
+    # ------------------------------------------------------------------
+    def empresa_key(self, database_name: str) -> str:
+        global_version, empresa_version = self._versions(
+            [_GLOBAL_VERSION_KEY, _EMPRESA_VERSION_KEY.format(database_name=database_name)]
+        )
+        return f"{_PREFIX}:empresa:{global_version}:{empresa_version}:{database_name}"
+
+    def empresa_keys(self, database_names: List[str]) -> Dict[str, str]:
+        """Claves versionadas de varias empresas en un solo viaje a Redis."""
+
+        if not database_names:
+            return {}
+        version_keys = [_GLOBAL_VERSION_KEY] + [
+            _EMPRESA_VERSION_KEY.format(database_name=name) for name in database_names
+        ]
+        global_version, *empresa_versions = self._versions(version_keys)
+        return {
+            name: f"{_PREFIX}:empresa:{global_version}:{version}:{name}"
+            for name, version in zip(database_names, empresa_versions)
+        }
+
+    def permisos_key(self, database_name: str, user_id: Optional[int]) -> str:
+        global_version, empresa_version, user_version = self._versions(
+            [
+                _GLOBAL_VERSION_KEY,
+                _EMPRESA_VERSION_KEY.format(database_name=database_name),
+                _USER_VERSION_KEY.format(user_id=user_id),
+            ]
+        )
+        return (
+            f"{_PREFIX}:permisos:{global_version}:{empresa_version}:{user_version}:"
+            f"{database_name}:{user_id if user_id is not None else 'anon'}"
+        )
+
+    def _versions(self, keys: List[str]) -> Tuple[int, ...]:
+        values = self._client.mget(keys)
+        return tuple(int(value) if value is not None else 0 for value in values)
+
+    # ------------------------------------------------------------------
+    # Lectura / escritura
+    # ------------------------------------------------------------------
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(key)
+        if raw is None:
+            return None
+        try:
+            return json.loads(raw)
+        except (TypeError, ValueError) as exc:
+            logger.warning("Entrada de configuración corrupta en %s: %s", key, exc)
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        self._client.set(key, _dumps(value), ex=self.ttl)
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        if not keys:
+            return {}
+        found: Dict[str, Any] = {}
+        for key, raw in zip(keys, self._client.mget(keys)):
+            if raw is None:
+                continue
+            try:
+                found[key] = json.loads(raw)
+            except (TypeError, ValueError):
+                continue
+        return found
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        pipe = self._client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(key, _dumps(value), ex=self.ttl)
+        pipe.execute()
+
+    def try_lock(self, name: str, timeout: Optional[float] = None) -> Optional[str]:
+        """Intenta tomar un lock con nombre; retorna el token o ``None``."""
+
+        token = uuid.uuid4().hex
+        acquired = self._client.set(
+            f"{_PREFIX}:lock:{name}",
+            token,
+            nx=True,
+            px=int((timeout or self.lock_timeout) * 1000),
+        )
+        return token if acquired else None
+
+    def release_lock(self, name: str, token: str) -> None:
+        self._release_lock(f"{_PREFIX}:lock:{name}", token)
+
+    def load_once(self, key: str, loader: Callable[[], T]) -> T:
+        """Obtiene ``key`` o la carga con ``loader`` garantizando un solo cargador.
+
+        Dentro del proceso se serializa con un ``threading.Lock`` por clave;
+        entre procesos con un ``SET NX`` en Redis. Quien no obtiene el lock
+        espera a que el valor aparezca y, si vence ``wait_timeout``, carga por
+        su cuenta para no bloquear indefinidamente.
+        """
+
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        with self._local_lock(key):
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+
+            lock_key = f"{key}:lock"
+            token = uuid.uuid4().hex
+            acquired = bool(
+                self._client.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000))
+            )
+            if not acquired:
+                deadline = time.monotonic() + self.wait_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(self.poll_interval)
+                    cached = self.get(key)
+                    if cached is not None:
+                        return cached
+                    if not self._client.exists(lock_key):
+                        break
+                logger.debug("Timeout esperando carga de %s; se carga localmente", key)
+
+            try:
+                value = loader()
+                self.set(key, value)
+                return value
+            finally:
+                if acquired:
+                    self._release_lock(lock_key, token)
+
+    def _release_lock(self, lock_key: str, token: str) -> None:
+        # Solo se libera si el lock sigue siendo nuestro.
+        script = (
+            "if redis.call('get', KEYS[1]) == ARGV[1] then "
+            "return redis.call('del', KEYS[1]) else return 0 end"
+        )
+        try:
+            self._client.eval(script, 1, lock_key, token)
+        except Exception as exc:
+            logger.debug("No se pudo liberar lock %s: %s", lock_key, exc)
+
+    def _local_lock(self, key: str) -> threading.Lock:
+        return self._local_locks[hash(key) % len(self._local_locks)]
+
+    # ------------------------------------------------------------------
+    # Invalidación
+    # ------------------------------------------------------------------
+    def invalidate(self, database_name: Optional[str] = None, user_id: Optional[int] = None) -> None:
+        """Incrementa la versión correspondiente y notifica a todos los procesos."""
+
+        if database_name is None and user_id is None:
+            version_key = _GLOBAL_VERSION_KEY
+        elif user_id is not None:
+            # Los permisos dependen del usuario; la configuración de la empresa se conserva.
+            version_key = _USER_VERSION_KEY.format(user_id=user_id)
+        else:
+            version_key = _EMPRESA_VERSION_KEY.format(database_name=database_name)
+
+        pipe = self._client.pipeline(transaction=False)
+        pipe.incr(version_key)
+        pipe.publish(
+            INVALIDATION_CHANNEL,
+            json.dumps(
+                {"database_name": database_name, "user_id": user_id, "origin": self._origin}
+            ),
+        )
+        pipe.execute()
+
+    def subscribe(self, listener: InvalidationListener) -> None:
+        """Registra ``listener`` y arranca (una vez) el hilo suscriptor."""
+
+        with self._listener_lock:
+            self._listeners.append(listener)
+            if self._listener_thread is None or not self._listener_thread.is_alive():
+                self._listener_thread = threading.Thread(
+                    target=self._listen, name="config-cache-invalidation", daemon=True
+                )
+                self._listener_thread.start()
+
+    def _listen(self) -> None:
+        from redis.exceptions import TimeoutError as RedisTimeoutError
+
+        backoff = 1.0
+        lost = False
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                if lost:
+                    # Lo publicado mientras no había suscripción se perdió: limpieza total local.
+                    self._notify(None, None)
+                    lost = False
+                backoff = 1.0
+                while True:
+                    try:
+                        # ``get_message`` espera sin bloquear el socket: un canal sin
+                        # tráfico no agota el ``socket_timeout`` del cliente.
+                        message = pubsub.get_message(timeout=LISTEN_POLL_SECONDS)
+                    except RedisTimeoutError:
+                        continue
+                    if message is not None:
+                        self._dispatch(message.get("data"))
+            except Exception as exc:
+                logger.warning(
+                    "Suscripción de invalidación de configuración caída: %s. Reintento en %.0fs",
+                    exc,
+                    backoff,
+                )
+                lost = True
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _dispatch(self, data: Any) -> None:
+        try:
+            payload = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        if payload.get("origin") == self._origin:
+            return  # El proceso emisor ya limpió su caché local.
+        self._notify(payload.get("database_name"), payload.get("user_id"))
+
+    def _notify(self, database_name: Optional[str], user_id: Optional[int]) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(database_name, user_id)
+            except Exception as exc:  # pragma: no cover - logging defensivo
+                logger.error("Error aplicando invalidación de configuración: %s", exc)
+
+
+def _dumps(value: Any) -> str:
+    # Fechas o decimales de la fila cruda se guardan como texto.
+    return json.dumps(value, default=str)
+
+
+def build_shared_cache_from_env(ttl: int = 600) -> Optional[SharedConfigCache]:
+    """Crea la caché compartida si hay Redis configurado y accesible."""
+
+    url = redis_url_from_env()
+    if not url:
+        return None
+    try:
+        shared = SharedConfigCache.from_url(url, ttl=ttl)
+        shared._client.ping()
+        return shared
+    except Exception as exc:
+        logger.warning("Caché compartida de configuración deshabilitada: %s", exc)
+        return None
+
@@ -4,12 +4,14 @@ from __future__ import annotations
 
 import hashlib
 import logging
+import threading
 import time
-from dataclasses import dataclass
-from typing import Any, Callable, Dict, Optional, Tuple
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 from cachetools import TTLCache  # type: ignore[import]
 
+from scripts.services.config_cache import SharedConfigCache
 from scripts.repositories.config_repository import (
     ConfigRepository,
     Credential,
@@ -21,6 +23,18 @@ from scripts.repositories.config_repository import (
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class EmpresaBundle:
+    """Configuración de la empresa independiente del usuario (compartible)."""
+
+    empresa: EmpresaConfig
+    date_window: Optional[DateWindow]
+    server_out: Optional[ServerConfig]
+    server_in: Optional[ServerConfig]
+    powerbi_credentials: Optional[Credential]
+    correo_credentials: Optional[Credential]
+
+
 @dataclass(frozen=True)
 class ConfigData:
     """Carga completa que expone el servicio de configuración."""
@@ -80,18 +94,37 @@ class ConfigData:
 
 
 class ConfigService:
-    """Orquesta la obtención de configuración de empresas y usuarios."""
+    """Orquesta la obtención de configuración de empresas y usuarios.
+
+    La caché tiene dos niveles: una ``TTLCache`` local por proceso y, si se
+    provee ``shared_cache``, una capa Redis compartida por todos los workers.
+    La parte de empresa (servidores, ventana de fechas) se comparte entre
+    usuarios; los permisos se guardan por usuario. Las credenciales nunca se
+    publican en Redis: cada proceso las guarda en su propia ``TTLCache`` por
+    ``nbTipo`` y las completa al leer una entrada compartida.
+    """
 
     def __init__(
         self,
         repository_factory: Callable[[], ConfigRepository],
         permissions_loader: Callable[[str, Optional[int]], Dict[str, Any]],
         cache_ttl: int = 600,
+        shared_cache: Optional[SharedConfigCache] = None,
+        local_ttl: Optional[int] = None,
     ) -> None:
         self._repository_factory = repository_factory
         self._permissions_loader = permissions_loader
-        self._cache = TTLCache(maxsize=256, ttl=cache_ttl)
+        self._cache = TTLCache(maxsize=256, ttl=local_ttl or cache_ttl)
+        # Configuración de empresa sin permisos; la llena también el precalentamiento.
+        self._bundle_cache = TTLCache(maxsize=512, ttl=local_ttl or cache_ttl)
+        # Credenciales por ``nbTipo``; solo viven en memoria del proceso.
+        self._credential_cache = TTLCache(maxsize=64, ttl=local_ttl or cache_ttl)
         self._cache_index: Dict[str, Tuple[str, Optional[int]]] = {}
+        # La invalidación llega desde el hilo suscriptor de pub/sub.
+        self._cache_lock = threading.RLock()
+        self._shared = shared_cache
+        if self._shared is not None:
+            self._shared.subscribe(self._clear_local)
 
     def get_config(self, database_name: str, user_id: Optional[int]) -> ConfigData:
         cache_key = self._build_cache_key(database_name, user_id)
@@ -101,35 +134,22 @@ class ConfigService:
             return cached
 
         start_time = time.time()
-        repository = self._repository_factory()
-        empresa = repository.get_empresa_config(database_name)
-        # Si nmDt no está configurado, usar dir_actual (rango del mes por defecto)
-        nm_dt = empresa.nm_dt or empresa.dir_actual or "puente1dia"
-        date_window = repository.get_date_window(nm_dt)
-        server_out = repository.get_server_config(empresa.nb_server_sidis)
-        server_in = repository.get_server_config(empresa.nb_server_bi)
-        powerbi_credentials = repository.get_credentials("3")
-        correo_credentials = repository.get_credentials("11")
-        try:
-            permisos = self._permissions_loader(database_name, user_id)
-        except Exception:  # pragma: no cover - depende del entorno Django
-            logger.exception(
-                "Fallo obteniendo permisos para %s/%s", database_name, user_id
-            )
-            permisos = {}
+        bundle = self._get_empresa_bundle(database_name)
+        permisos = self._get_permissions(database_name, user_id)
 
         config_data = ConfigData(
-            empresa=empresa,
-            date_window=date_window,
-            server_out=server_out,
-            server_in=server_in,
-            powerbi_credentials=powerbi_credentials,
-            correo_credentials=correo_credentials,
+            empresa=bundle.empresa,
+            date_window=bundle.date_window,
+            server_out=bundle.server_out,
+            server_in=bundle.server_in,
+            powerbi_credentials=bundle.powerbi_credentials,
+            correo_credentials=bundle.correo_credentials,
             permisos=permisos,
         )
 
-        self._cache[cache_key] = config_data
-        self._cache_index[cache_key] = (database_name, user_id)
+        with self._cache_lock:
+            self._cache[cache_key] = config_data
+            self._cache_index[cache_key] = (database_name, user_id)
         logger.debug(
             "ConfigService caching result for %s en %.3fs",
             cache_key,
@@ -140,23 +160,353 @@ class ConfigService:
     def clear_cache(
         self, database_name: Optional[str] = None, user_id: Optional[int] = None
     ) -> None:
-        if database_name is None and user_id is None:
-            self._cache.clear()
-            self._cache_index.clear()
-            return
-
-        keys_to_remove = []
-        for key, value in list(self._cache_index.items()):
-            db_name, cached_user = value
-            if database_name is not None and db_name != database_name:
-                continue
-            if user_id is not None and cached_user != user_id:
+        """Invalida la caché local y, si existe, la compartida en todo el clúster."""
+
+        self._clear_local(database_name, user_id)
+        if self._shared is not None:
+            try:
+                self._shared.invalidate(database_name, user_id)
+            except Exception as exc:
+                logger.warning(
+                    "No se pudo propagar la invalidación de configuración: %s", exc
+                )
+
+    def get_configs(
+        self, database_names: Iterable[str], user_id: Optional[int] = None
+    ) -> Dict[str, ConfigData]:
+        """Configuración de varias empresas con un número fijo de consultas.
+
+        Las empresas ya cacheadas (local o Redis) no se consultan; las demás se
+        resuelven juntas con ``load_empresa_bundles``.
+        """
+
+        names = list(dict.fromkeys(database_names))
+        bundles = self._get_empresa_bundles(names)
+        result: Dict[str, ConfigData] = {}
+        for name in names:
+            bundle = bundles.get(name)
+            if bundle is None:
                 continue
-            keys_to_remove.append(key)
+            result[name] = ConfigData(
+                empresa=bundle.empresa,
+                date_window=bundle.date_window,
+                server_out=bundle.server_out,
+                server_in=bundle.server_in,
+                powerbi_credentials=bundle.powerbi_credentials,
+                correo_credentials=bundle.correo_credentials,
+                permisos=self._get_permissions(name, user_id),
+            )
+        return result
+
+    def prewarm(self, database_names: Optional[Iterable[str]] = None) -> int:
+        """Precarga la configuración de empresas (todas por defecto).
+
+        Con caché compartida solo un proceso consulta la base administrativa;
+        los demás toman lo que ya esté en Redis. Retorna las empresas cargadas.
+        """
+
+        start_time = time.time()
+        token: Optional[str] = None
+        if self._shared is not None:
+            try:
+                token = self._shared.try_lock("prewarm", timeout=60)
+            except Exception as exc:
+                logger.debug("No se pudo tomar el lock de precalentamiento: %s", exc)
+        try:
+            if self._shared is not None and token is None:
+                # Otro proceso está consultando: solo se copian las entradas compartidas.
+                names = list(database_names or [])
+                bundles = self._read_shared_bundles(names) if names else {}
+            else:
+                if database_names is None:
+                    names = self._repository_factory().list_empresa_names()
+                else:
+                    names = list(dict.fromkeys(database_names))
+                bundles = self._get_empresa_bundles(names)
+        finally:
+            if token is not None:
+                self._shared.release_lock("prewarm", token)
+        logger.info(
+            "ConfigService precalentado con %s empresas en %.3fs",
+            len(bundles),
+            time.time() - start_time,
+        )
+        return len(bundles)
+
+    def load_empresa_bundles(
+        self, database_names: Optional[Iterable[str]] = None
+    ) -> Dict[str, EmpresaBundle]:
+        """Resuelve N empresas en consultas agrupadas, sin pasar por la caché."""
+
+        repository = self._repository_factory()
+        empresas = repository.get_empresa_configs(database_names)
+        if not empresas:
+            return {}
+        server_ids = [
+            value
+            for empresa in empresas.values()
+            for value in (empresa.nb_server_sidis, empresa.nb_server_bi)
+        ]
+        servers = repository.get_server_configs(server_ids)
+        credentials = repository.get_credentials_many(["3", "11"])
+        nm_dts = {
+            name: empresa.nm_dt or empresa.dir_actual or "puente1dia"
+            for name, empresa in empresas.items()
+        }
+        windows = repository.get_date_windows(nm_dts.values())
+
+        def server(identifier: Optional[object]) -> Optional[ServerConfig]:
+            if identifier in (None, ""):
+                return None
+            return servers.get(str(identifier))
+
+        bundles = {
+            name: EmpresaBundle(
+                empresa=empresa,
+                date_window=windows.get(nm_dts[name]),
+                server_out=server(empresa.nb_server_sidis),
+                server_in=server(empresa.nb_server_bi),
+                powerbi_credentials=credentials.get("3"),
+                correo_credentials=credentials.get("11"),
+            )
+            for name, empresa in empresas.items()
+        }
+        for bundle in bundles.values():
+            self._remember_credentials(bundle)
+        return bundles
+
+    # ------------------------------------------------------------------
+    # Carga por niveles
+    # ------------------------------------------------------------------
+    def _get_empresa_bundle(self, database_name: str) -> EmpresaBundle:
+        bundle = self._bundle_cache.get(database_name)
+        if bundle is not None:
+            return bundle
+        if self._shared is None:
+            bundle = self._load_empresa_bundle(database_name)
+        else:
+            try:
+                key = self._shared.empresa_key(database_name)
+                data = self._shared.load_once(
+                    key,
+                    lambda: self._bundle_to_shared(self._load_empresa_bundle(database_name)),
+                )
+                bundle = self._bundle_from_shared(data)
+            except Exception as exc:
+                logger.warning(
+                    "Caché compartida no disponible para %s, cargando directo: %s",
+                    database_name,
+                    exc,
+                )
+                bundle = self._load_empresa_bundle(database_name)
+        with self._cache_lock:
+            self._bundle_cache[database_name] = bundle
+        return bundle
+
+    def _get_permissions(
+        self, database_name: str, user_id: Optional[int]
+    ) -> Dict[str, Any]:
+        if self._shared is None or user_id is None:
+            return self._load_permissions(database_name, user_id)
+        try:
+            key = self._shared.permisos_key(database_name, user_id)
+            return self._shared.load_once(
+                key, lambda: self._load_permissions(database_name, user_id)
+            )
+        except Exception as exc:
+            logger.warning(
+                "Caché compartida no disponible para permisos %s/%s: %s",
+                database_name,
+                user_id,
+                exc,
+            )
+            return self._load_permissions(database_name, user_id)
+
+    def _get_empresa_bundles(self, names: List[str]) -> Dict[str, EmpresaBundle]:
+        bundles: Dict[str, EmpresaBundle] = {}
+        missing: List[str] = []
+        for name in names:
+            bundle = self._bundle_cache.get(name)
+            if bundle is None:
+                missing.append(name)
+            else:
+                bundles[name] = bundle
+
+        shared_keys: Dict[str, str] = {}
+        if missing and self._shared is not None:
+            try:
+                shared_keys = self._shared.empresa_keys(missing)
+                found = self._shared.get_many(list(shared_keys.values()))
+                for name, key in shared_keys.items():
+                    if key in found:
+                        bundles[name] = self._bundle_from_shared(found[key])
+                missing = [name for name in missing if name not in bundles]
+            except Exception as exc:
+                logger.warning("Caché compartida no disponible en carga masiva: %s", exc)
+                shared_keys = {}
+
+        if missing:
+            loaded = self.load_empresa_bundles(missing)
+            bundles.update(loaded)
+            if self._shared is not None and shared_keys:
+                try:
+                    self._shared.set_many(
+                        {
+                            shared_keys[name]: self._bundle_to_shared(bundle)
+                            for name, bundle in loaded.items()
+                        }
+                    )
+                except Exception as exc:
+                    logger.debug("No se pudo publicar la carga masiva en Redis: %s", exc)
+
+        with self._cache_lock:
+            for name, bundle in bundles.items():
+                self._bundle_cache[name] = bundle
+        return bundles
+
+    def _read_shared_bundles(self, names: List[str]) -> Dict[str, EmpresaBundle]:
+        keys = self._shared.empresa_keys(names)
+        found = self._shared.get_many(list(keys.values()))
+        bundles = {
+            name: self._bundle_from_shared(found[key])
+            for name, key in keys.items()
+            if key in found
+        }
+        with self._cache_lock:
+            for name, bundle in bundles.items():
+                self._bundle_cache[name] = bundle
+        return bundles
+
+    def _load_empresa_bundle(self, database_name: str) -> EmpresaBundle:
+        repository = self._repository_factory()
+        empresa = repository.get_empresa_config(database_name)
+        # Si nmDt no está configurado, usar dir_actual (rango del mes por defecto)
+        nm_dt = empresa.nm_dt or empresa.dir_actual or "puente1dia"
+        bundle = EmpresaBundle(
+            empresa=empresa,
+            date_window=repository.get_date_window(nm_dt),
+            server_out=repository.get_server_config(empresa.nb_server_sidis),
+            server_in=repository.get_server_config(empresa.nb_server_bi),
+            powerbi_credentials=repository.get_credentials("3"),
+            correo_credentials=repository.get_credentials("11"),
+        )
+        self._remember_credentials(bundle)
+        return bundle
+
+    # ------------------------------------------------------------------
+    # Formato compartido (JSON sin credenciales)
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _bundle_to_shared(bundle: EmpresaBundle) -> Dict[str, Any]:
+        def server(config: Optional[ServerConfig]) -> Optional[Dict[str, Any]]:
+            if config is None:
+                return None
+            data = asdict(config)
+            data.pop("credential")
+            data["has_credential"] = config.credential is not None
+            return data
+
+        return {
+            "empresa": asdict(bundle.empresa),
+            "date_window": asdict(bundle.date_window) if bundle.date_window else None,
+            "server_out": server(bundle.server_out),
+            "server_in": server(bundle.server_in),
+        }
+
+    def _bundle_from_shared(self, data: Dict[str, Any]) -> EmpresaBundle:
+        servers = [data.get("server_out"), data.get("server_in")]
+        tipos = {"3", "11"} | {
+            str(item["type_code"])
+            for item in servers
+            if item and item.get("has_credential") and item.get("type_code") is not None
+        }
+        credentials = self._get_credentials(tipos)
+
+        def server(item: Optional[Dict[str, Any]]) -> Optional[ServerConfig]:
+            if not item:
+                return None
+            fields = {key: value for key, value in item.items() if key != "has_credential"}
+            credential = (
+                credentials.get(str(item.get("type_code")))
+                if item.get("has_credential")
+                else None
+            )
+            return ServerConfig(credential=credential, **fields)
+
+        window = data.get("date_window")
+        return EmpresaBundle(
+            empresa=EmpresaConfig(**data["empresa"]),
+            date_window=DateWindow(**window) if window else None,
+            server_out=server(data.get("server_out")),
+            server_in=server(data.get("server_in")),
+            powerbi_credentials=credentials.get("3"),
+            correo_credentials=credentials.get("11"),
+        )
+
+    def _get_credentials(self, tipos: Iterable[str]) -> Dict[str, Optional[Credential]]:
+        """Credenciales por ``nbTipo`` desde la caché local o en una sola consulta."""
+
+        found: Dict[str, Optional[Credential]] = {}
+        missing: List[str] = []
+        for tipo in tipos:
+            if tipo in self._credential_cache:
+                found[tipo] = self._credential_cache[tipo]
+            else:
+                missing.append(tipo)
+        if missing:
+            loaded = self._repository_factory().get_credentials_many(missing)
+            with self._cache_lock:
+                for tipo in missing:
+                    found[tipo] = loaded.get(tipo)
+                    self._credential_cache[tipo] = found[tipo]
+        return found
+
+    def _remember_credentials(self, bundle: EmpresaBundle) -> None:
+        with self._cache_lock:
+            for config in (bundle.server_out, bundle.server_in):
+                if config is not None and config.credential is not None:
+                    self._credential_cache[str(config.type_code)] = config.credential
+            self._credential_cache["3"] = bundle.powerbi_credentials
+            self._credential_cache["11"] = bundle.correo_credentials
+
+    def _load_permissions(
+        self, database_name: str, user_id: Optional[int]
+    ) -> Dict[str, Any]:
+        try:
+            return self._permissions_loader(database_name, user_id)
+        except Exception:  # pragma: no cover - depende del entorno Django
+            logger.exception(
+                "Fallo obteniendo permisos para %s/%s", database_name, user_id
+            )
+            return {}
+
+    def _clear_local(
+        self, database_name: Optional[str] = None, user_id: Optional[int] = None
+    ) -> None:
+        with self._cache_lock:
+            if database_name is None and user_id is None:
+                self._cache.clear()
+                self._cache_index.clear()
+                self._bundle_cache.clear()
+                self._credential_cache.clear()
+                return
+            if user_id is None:
+                self._bundle_cache.pop(database_name, None)
+                # Las credenciales son compartidas entre empresas: se releen todas.
+                self._credential_cache.clear()
+
+            keys_to_remove = []
+            for key, value in list(self._cache_index.items()):
+                db_name, cached_user = value
+                if database_name is not None and db_name != database_name:
+                    continue
+                if user_id is not None and cached_user != user_id:
+                    continue
+                keys_to_remove.append(key)
 
-        for key in keys_to_remove:
-            self._cache.pop(key, None)
-            self._cache_index.pop(key, None)
+            for key in keys_to_remove:
+                self._cache.pop(key, None)
+                self._cache_index.pop(key, None)
 
     @staticmethod
     def _build_cache_key(database_name: str, user_id: Optional[int]) -> str:
@@ -0,0 +1,91 @@
+"""Codificación CSV directa desde lotes de un cursor.
+
+Los planos escribían cada lote con ``DataFrame.to_csv``: armar el DataFrame,
+inferir tipos y formatear celda por celda en pandas cuesta más que la propia
+consulta. :class:`CsvEncoder` recibe las tuplas tal como las entrega
+``fetchmany`` y las pasa al ``csv.writer`` de la librería estándar (en C),
+formateando en Python solo las columnas que lo requieren:
+
+* ``float`` y ``Decimal`` → ``float_fmt`` (``"%.2f"``, ``"%.0f"``...), como
+  hacía el plano original al pasar por SQLite; ``NaN`` → vacío.
+* ``None`` → vacío.
+* Resto (texto, enteros, fechas) → ``str()``.
+
+Los campos con separador, comillas o saltos de línea se citan igual que en
+``to_csv`` (``QUOTE_MINIMAL``). La salida es UTF-8 con fin de línea ``\\n``.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import math
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence
+
+_FORMATTED_TYPES = (float, Decimal)
+
+
+class CsvEncoder:
+    """Convierte lotes de filas en bytes CSV con las reglas del plano."""
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        sep: str = "|",
+        float_fmt: Optional[str] = "%.2f",
+        header: bool = True,
+    ) -> None:
+        self.columns = [str(c) for c in columns]
+        self.sep = sep
+        self.float_fmt = float_fmt
+        self.include_header = header
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(
+            self._buffer,
+            delimiter=sep,
+            quotechar='"',
+            quoting=csv.QUOTE_MINIMAL,
+            lineterminator="\n",
+        )
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def header(self) -> bytes:
+        """Línea de encabezado, o ``b""`` si el formato no lleva encabezado."""
+
+        if not self.include_header:
+            return b""
+        self._writer.writerow(self.columns)
+        return self._drain()
+
+    def _format_number(self, value: Any) -> Any:
+        if value is None:
+            return None
+        if isinstance(value, float):
+            return "" if math.isnan(value) else self.float_fmt % value
+        if isinstance(value, Decimal):
+            return "" if value.is_nan() else self.float_fmt % value
+        return value
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        """Bytes CSV de ``rows`` (tuplas o ``Row`` de SQLAlchemy)."""
+
+        if not rows:
+            return b""
+        if self.float_fmt is None:
+            self._writer.writerows(rows)
+            return self._drain()
+        columns: List[Sequence[Any]] = list(zip(*rows))
+        formatted = False
+        for idx, values in enumerate(columns):
+            types = set(map(type, values))
+            if any(issubclass(t, _FORMATTED_TYPES) for t in types):
+                columns[idx] = list(map(self._format_number, values))
+                formatted = True
+        self._writer.writerows(zip(*columns) if formatted else rows)
+        return self._drain()
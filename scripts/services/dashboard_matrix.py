@@ -0,0 +1,211 @@
+"""Matrices de dashboards persistidas como artefacto columnar y paginadas.
+
+Preventa y Faltantes devolvían la matriz completa del SP como
+``to_dict(orient="records")`` dentro del resultado del job; ese resultado se
+deserializaba y re-serializaba en cada sondeo de ``CheckTaskStatusView``. Con
+este módulo:
+
+* la matriz se normaliza a tipos simples (números ``float``, textos, tiempos
+  ``HH:MM:SS``) y se guarda como Parquet en el almacén de artefactos, en
+  grupos de filas del tamaño de una página;
+* el resultado del job solo lleva los KPIs, los totales, la primera página y
+  el id del artefacto;
+* :func:`read_matrix_page` lee únicamente los grupos de filas que cubren la
+  página pedida.
+
+Sin ``pyarrow`` la matriz se guarda como JSON columnar (``orient="split"``) y
+se pagina cargándola completa.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from scripts.services.artifact_store import get_artifact_store
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    PARQUET_AVAILABLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    pa = None
+    pq = None
+    PARQUET_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MATRIX_PAGE_SIZE = int(os.getenv("DASHBOARD_MATRIX_PAGE_SIZE", 500))
+MAX_PAGE_SIZE = 5000
+
+
+def to_number(series: pd.Series) -> pd.Series:
+    """Columna numérica ``float`` (``Decimal``/texto incluidos); no convertibles → 0."""
+
+    return pd.to_numeric(series, errors="coerce").fillna(0).astype(float)
+
+
+def safe_ratio(numerator: pd.Series, denominator: pd.Series, scale: float = 1.0) -> np.ndarray:
+    """``numerator / denominator * scale`` por fila, 0 donde el denominador no es positivo."""
+
+    num = to_number(numerator).to_numpy()
+    den = to_number(denominator).to_numpy()
+    out = np.zeros(len(num), dtype=float)
+    np.divide(num * scale, den, out=out, where=den > 0)
+    return out
+
+
+def as_timedelta(series: pd.Series) -> pd.Series:
+    """Columna ``TIME`` de MySQL (``timedelta``, texto o segundos) como ``timedelta64``."""
+
+    if pd.api.types.is_timedelta64_dtype(series):
+        return series
+    if pd.api.types.is_numeric_dtype(series):
+        return pd.to_timedelta(series, unit="s", errors="coerce")
+    return pd.to_timedelta(series, errors="coerce")
+
+
+def format_duration(series: pd.Series, missing: str = "-") -> pd.Series:
+    """``timedelta64`` → ``HH:MM:SS``; nulos o negativos → ``missing``."""
+
+    seconds = series.dt.total_seconds()
+    valid = seconds.notna() & (seconds >= 0)
+    total = seconds.where(valid, 0).astype("int64")
+    text = (
+        (total // 3600).astype(str).str.zfill(2)
+        + ":"
+        + (total % 3600 // 60).astype(str).str.zfill(2)
+        + ":"
+        + (total % 60).astype(str).str.zfill(2)
+    )
+    return text.where(valid, missing).astype(object)
+
+
+def normalize_matrix(df: pd.DataFrame, fill_value: Any = 0) -> pd.DataFrame:
+    """Tipos aptos para JSON y Parquet.
+
+    Los tipos se deciden por columna con ``infer_dtype`` (sin recorrer filas
+    en Python): ``Decimal`` y números en columnas ``object`` pasan a
+    ``float``, fechas a texto ISO, tiempos a ``HH:MM:SS`` y el resto a texto.
+    Los nulos numéricos quedan en ``fill_value`` (como hacía
+    ``where(notnull, 0)``) y los de texto en ``None``; los códigos con ceros a
+    la izquierda se conservan como texto.
+    """
+
+    columns: Dict[str, pd.Series] = {}
+    for name in df.columns:
+        series = df[name]
+        if pd.api.types.is_bool_dtype(series):
+            columns[str(name)] = series.astype(int)
+        elif pd.api.types.is_integer_dtype(series):
+            columns[str(name)] = series
+        elif pd.api.types.is_numeric_dtype(series):
+            columns[str(name)] = series.astype(float).fillna(fill_value)
+        elif pd.api.types.is_timedelta64_dtype(series):
+            columns[str(name)] = format_duration(series)
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            text = series.dt.strftime("%Y-%m-%d %H:%M:%S").str.replace(" 00:00:00", "", regex=False)
+            columns[str(name)] = text.astype(object).where(series.notna(), None)
+        else:
+            kind = pd.api.types.infer_dtype(series, skipna=True)
+            if kind in ("decimal", "integer", "floating", "mixed-integer-float"):
+                columns[str(name)] = to_number(series) if fill_value == 0 else (
+                    pd.to_numeric(series, errors="coerce").astype(float).fillna(fill_value)
+                )
+            elif kind == "timedelta":
+                columns[str(name)] = format_duration(as_timedelta(series))
+            else:
+                columns[str(name)] = series.astype(str).astype(object).where(series.notna(), None)
+    return pd.DataFrame(columns, index=df.index).reset_index(drop=True)
+
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    return df.to_dict(orient="records")
+
+
+def save_matrix(df: pd.DataFrame, name: str, owner: Optional[int] = None) -> Optional[str]:
+    """Guarda la matriz (ya pasada por :func:`normalize_matrix`) y retorna el id del artefacto."""
+
+    if df.empty:
+        return None
+    base, _ = os.path.splitext(name)
+    if PARQUET_AVAILABLE:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with get_artifact_store().writing(f"{base}.parquet", owner=owner) as pending:
+            pq.write_table(table, pending.tmp_path, row_group_size=MATRIX_PAGE_SIZE, compression="zstd")
+    else:
+        with get_artifact_store().writing(f"{base}.json", owner=owner) as pending:
+            df.to_json(pending.tmp_path, orient="split", index=False)
+    return pending.artifact.id if pending.artifact else None
+
+
+def matrix_payload(
+    df: pd.DataFrame,
+    name: str,
+    owner: Optional[int] = None,
+    page_size: int = MATRIX_PAGE_SIZE,
+) -> Dict[str, Any]:
+    """Campos de la matriz para el resultado del job: primera página e id del artefacto.
+
+    Si la matriz cabe en una página no se crea artefacto.
+    """
+
+    total = len(df)
+    payload: Dict[str, Any] = {
+        "matrix": _records(df.head(page_size)),
+        "matrix_total": total,
+        "matrix_page_size": page_size,
+        "matrix_artifact_id": None,
+    }
+    if total > page_size:
+        try:
+            payload["matrix_artifact_id"] = save_matrix(df, name, owner=owner)
+        except Exception as exc:
+            # Sin artefacto el dashboard sigue mostrando la primera página.
+            logger.warning("No se pudo guardar la matriz %s: %s", name, exc)
+    return payload
+
+
+def _read_parquet_page(path: str, offset: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+    parquet = pq.ParquetFile(path)
+    total = parquet.metadata.num_rows
+    groups: List[int] = []
+    first_row = None
+    start = 0
+    for idx in range(parquet.num_row_groups):
+        rows = parquet.metadata.row_group(idx).num_rows
+        end = start + rows
+        if end > offset and start < offset + limit:
+            groups.append(idx)
+            if first_row is None:
+                first_row = start
+        start = end
+    if not groups:
+        return [], total
+    table = parquet.read_row_groups(groups).slice(offset - first_row, limit)
+    return table.to_pylist(), total
+
+
+def read_matrix_page(path: str, offset: int = 0, limit: int = MATRIX_PAGE_SIZE) -> Dict[str, Any]:
+    """Página ``[offset, offset + limit)`` de una matriz guardada con :func:`save_matrix`."""
+
+    offset = max(0, int(offset))
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    if path.endswith(".parquet"):
+        if not PARQUET_AVAILABLE:
+            raise RuntimeError("pyarrow no está instalado")
+        rows, total = _read_parquet_page(path, offset, limit)
+    else:
+        with open(path, "r", encoding="utf-8") as fh:
+            split = json.load(fh)
+        data = split.get("data", [])
+        total = len(data)
+        columns: Sequence[str] = split.get("columns", [])
+        rows = [dict(zip(columns, row)) for row in data[offset : offset + limit]]
+    return {"rows": rows, "offset": offset, "limit": limit, "total": total}
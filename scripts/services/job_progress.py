@@ -0,0 +1,255 @@
+"""Reporte de progreso de jobs RQ con escrituras agrupadas.
+
+Antes cada callback de progreso hacía ``job.save_meta()``: volvía a
+serializar (pickle) el ``meta`` completo, que además podía incluir el
+resultado entero de la tarea, y lo escribía en Redis. Los generadores
+llaman al callback por cada lote, así que un reporte largo hacía cientos de
+escrituras de varios KB para mover la barra un punto.
+
+:class:`ProgressReporter` agrupa esas llamadas:
+
+* Solo escribe si pasaron ``min_interval`` segundos **y** el progreso avanzó
+  al menos ``min_delta`` puntos desde la última escritura.
+* Un cambio de ``stage`` o ``status`` (transición de etapa) o un estado
+  terminal se escribe de inmediato, junto con lo que estuviera pendiente.
+* Escribe en un hash pequeño (``rq:job-progress:<job_id>``) solo los campos
+  que cambiaron, codificados en JSON; ``meta`` del job no se toca.
+* Cada escritura publica además el estado compacto en el canal
+  ``rq:job-progress-events:<job_id>``, del que se alimenta el stream SSE
+  (:func:`stream_progress`).
+
+Las vistas leen el hash con :func:`read_progress` y lo combinan con
+``job.meta`` para seguir entendiendo jobs encolados antes del cambio.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_KEY = "rq:job-progress:{job_id}"
+PROGRESS_CHANNEL = "rq:job-progress-events:{job_id}"
+PROGRESS_TTL_SECONDS = 24 * 3600
+DEFAULT_MIN_INTERVAL = float(os.getenv("JOB_PROGRESS_MIN_INTERVAL", 1.0))
+DEFAULT_MIN_DELTA = int(os.getenv("JOB_PROGRESS_MIN_DELTA", 1))
+TERMINAL_STATUSES = frozenset({"completed", "failed", "stopped"})
+# Campos que cuentan como transición de etapa.
+_TRANSITION_FIELDS = ("stage", "status")
+
+
+def progress_key(job_id: str) -> str:
+    return PROGRESS_KEY.format(job_id=job_id)
+
+
+def progress_channel(job_id: str) -> str:
+    return PROGRESS_CHANNEL.format(job_id=job_id)
+
+
+def is_terminal(state: Dict[str, Any]) -> bool:
+    return state.get("status") in TERMINAL_STATUSES
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, default=str, separators=(",", ":"))
+
+
+class ProgressReporter:
+    """Agrupa las actualizaciones de progreso de un job y las escribe en Redis."""
+
+    def __init__(
+        self,
+        connection: Any,
+        job_id: str,
+        min_interval: float = DEFAULT_MIN_INTERVAL,
+        min_delta: int = DEFAULT_MIN_DELTA,
+        clock=time.monotonic,
+    ) -> None:
+        self.connection = connection
+        self.job_id = job_id
+        self.key = progress_key(job_id)
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._written: Dict[str, str] = {}
+        self._state: Dict[str, Any] = {}
+        self._pending: Dict[str, Any] = {}
+        self._last_flush: Optional[float] = None
+        self._last_progress: Optional[int] = None
+        self.writes = 0
+
+    def update(
+        self,
+        progress: int,
+        status: str = "processing",
+        meta: Optional[Dict[str, Any]] = None,
+        force: bool = False,
+    ) -> bool:
+        """Registra una actualización; retorna ``True`` si se escribió en Redis."""
+
+        progress = max(0, min(100, int(progress)))
+        fields = dict(meta or {})
+        fields["progress"] = progress
+        fields["status"] = status
+        with self._lock:
+            transition = any(
+                name in fields and _encode(fields[name]) != self._written.get(name)
+                for name in _TRANSITION_FIELDS
+            )
+            self._pending.update(fields)
+            if force or transition or status in TERMINAL_STATUSES or self._due(progress):
+                return self._flush_locked()
+            return False
+
+    def flush(self) -> bool:
+        """Escribe lo pendiente sin esperar el intervalo."""
+
+        with self._lock:
+            return self._flush_locked()
+
+    def _due(self, progress: int) -> bool:
+        if self._last_flush is None:
+            return True
+        if self._clock() - self._last_flush < self.min_interval:
+            return False
+        return self._last_progress is None or abs(progress - self._last_progress) >= self.min_delta
+
+    def _flush_locked(self) -> bool:
+        if not self._pending:
+            return False
+        pending, self._pending = self._pending, {}
+        changed = {}
+        for name, value in pending.items():
+            encoded = _encode(value)
+            if self._written.get(name) != encoded:
+                changed[name] = encoded
+        self._last_flush = self._clock()
+        self._last_progress = pending.get("progress", self._last_progress)
+        if not changed:
+            return False
+        now = time.time()
+        changed["updated_at"] = _encode(now)
+        state = {**self._state, **pending, "updated_at": now}
+        try:
+            pipe = self.connection.pipeline(transaction=False)
+            pipe.hset(self.key, mapping=changed)
+            pipe.expire(self.key, PROGRESS_TTL_SECONDS)
+            pipe.publish(progress_channel(self.job_id), _encode(state))
+            pipe.execute()
+        except Exception as exc:
+            # El progreso es informativo: un fallo de Redis no debe tumbar la tarea.
+            logger.warning("No se pudo escribir el progreso del job %s: %s", self.job_id, exc)
+            return False
+        self._written.update(changed)
+        self._state = state
+        self.writes += 1
+        return True
+
+
+_REPORTERS: Dict[str, ProgressReporter] = {}
+_REPORTERS_LOCK = threading.Lock()
+
+
+def reporter_for(job: Any) -> ProgressReporter:
+    """Reporter del job (uno por job y proceso), sobre la conexión Redis de RQ."""
+
+    with _REPORTERS_LOCK:
+        reporter = _REPORTERS.get(job.id)
+        if reporter is None:
+            reporter = ProgressReporter(job.connection, job.id)
+            _REPORTERS[job.id] = reporter
+        return reporter
+
+
+def release_reporter(job_id: str) -> None:
+    """Escribe lo pendiente y olvida el reporter del job."""
+
+    with _REPORTERS_LOCK:
+        reporter = _REPORTERS.pop(job_id, None)
+    if reporter is not None:
+        reporter.flush()
+
+
+def read_progress(connection: Any, job_id: str) -> Dict[str, Any]:
+    """Campos de progreso del job (vacío si aún no reporta o ya expiró)."""
+
+    try:
+        raw = connection.hgetall(progress_key(job_id))
+    except Exception as exc:
+        logger.warning("No se pudo leer el progreso del job %s: %s", job_id, exc)
+        return {}
+    progress: Dict[str, Any] = {}
+    for name, value in raw.items():
+        if isinstance(name, bytes):
+            name = name.decode("utf-8")
+        try:
+            progress[name] = json.loads(value)
+        except (TypeError, ValueError):
+            progress[name] = value.decode("utf-8") if isinstance(value, bytes) else value
+    return progress
+
+
+def job_progress_meta(job: Any) -> Dict[str, Any]:
+    """``job.meta`` combinado con el hash de progreso (el hash tiene prioridad)."""
+
+    meta = dict(getattr(job, "meta", None) or {})
+    meta.update(read_progress(job.connection, job.id))
+    return meta
+
+
+def _decode_message(data: Any) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(data)
+    except (TypeError, ValueError):
+        return None
+
+
+def stream_progress(
+    connection: Any,
+    job_id: str,
+    heartbeat_seconds: float = 15.0,
+    max_seconds: float = 55.0,
+) -> Iterator[Optional[Dict[str, Any]]]:
+    """Estados de progreso del job a medida que el worker los publica.
+
+    Entrega primero el estado actual del hash y luego cada publicación;
+    ``None`` es un latido (para mantener viva la conexión). Termina al llegar
+    a un estado terminal o tras ``max_seconds``, para no retener
+    indefinidamente un worker web: el cliente se reconecta y retoma.
+    """
+
+    pubsub = connection.pubsub(ignore_subscribe_messages=True)
+    try:
+        # Suscribirse antes de leer el hash para no perder una publicación intermedia.
+        pubsub.subscribe(progress_channel(job_id))
+        state = read_progress(connection, job_id)
+        if state:
+            yield state
+            if is_terminal(state):
+                return
+        deadline = time.monotonic() + max_seconds
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=min(1.0, heartbeat_seconds))
+            if message and message.get("type") == "message":
+                state = _decode_message(message.get("data"))
+                if state is None:
+                    continue
+                last_sent = time.monotonic()
+                yield state
+                if is_terminal(state):
+                    return
+            elif time.monotonic() - last_sent >= heartbeat_seconds:
+                last_sent = time.monotonic()
+                yield None
+    finally:
+        try:
+            pubsub.close()
+        except Exception:
+            pass
@@ -0,0 +1,190 @@
+"""Comprobación por lotes de qué claves de un DataFrame ya existen en una tabla.
+
+Los cargues filtraban los registros nuevos con
+``SELECT * FROM <tabla> WHERE (k1, k2, ...) IN (%s, ...)`` ejecutado como
+``executemany``: una consulta por registro, trayendo filas completas, y luego
+reconstruían tuplas en Python de ambos lados.
+
+:func:`missing_keys_mask` retorna una máscara booleana alineada con las filas
+del DataFrame (``True`` = la clave no existe en la tabla) con dos
+estrategias:
+
+* ``"temp_table"`` (por defecto): carga las claves del lote, con su posición,
+  en una tabla temporal creada con los mismos tipos y collation que la tabla
+  destino (``CREATE TEMPORARY TABLE ... AS SELECT ... WHERE 1 = 0``) y hace un
+  JOIN por la clave; el servidor solo devuelve las posiciones que existen.
+* ``"in_list"``: consultas ``(k1, ...) IN ((...), (...))`` de varias filas,
+  con lotes dimensionados según ``max_allowed_packet``; útil cuando el
+  usuario no puede crear tablas temporales. En SQLite es lenta (no usa el
+  índice para listas largas de tuplas); ver ``scripts/benchmark_key_probe.py``.
+"""
+
+from __future__ import annotations
+
+import logging
+import uuid
+from typing import Any, Iterator, List, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROBE_BATCH_SIZE = 50_000
+# Tope de filas por consulta IN aunque el paquete permita más.
+MAX_IN_LIST_ROWS = 5_000
+_DEFAULT_PACKET_BYTES = 16 * 1024 * 1024
+
+
+def _key_values(frame: pd.DataFrame, key_columns: Sequence[str]) -> np.ndarray:
+    """Claves como texto (``None`` para nulos), igual que las columnas VARCHAR destino.
+
+    Se retorna un arreglo ``object`` (filas x columnas clave) y no un
+    DataFrame para que pandas no vuelva a inferir tipos ni cambie ``None``
+    por ``NaN``.
+    """
+
+    keys = np.empty((len(frame), len(key_columns)), dtype=object)
+    for j, column in enumerate(key_columns):
+        series = frame[column]
+        null = series.isna().to_numpy()
+        keys[:, j] = [None if is_null else str(value) for value, is_null in zip(series.to_numpy(), null)]
+    return keys
+
+
+def _batches(total: int, size: int) -> Iterator[slice]:
+    for start in range(0, total, size):
+        yield slice(start, min(start + size, total))
+
+
+def _quote(connection: Any, name: str) -> str:
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+def _probe_temp_table(
+    connection: Any,
+    table: str,
+    key_columns: Sequence[str],
+    keys: np.ndarray,
+    batch_size: int,
+) -> np.ndarray:
+    exists = np.zeros(len(keys), dtype=bool)
+    probe = f"tmp_key_probe_{uuid.uuid4().hex[:8]}"
+    quoted = [_quote(connection, c) for c in key_columns]
+    params = [f"k{i}" for i in range(len(key_columns))]
+    table_q = _quote(connection, table)
+    connection.execute(
+        text(
+            f"CREATE TEMPORARY TABLE {probe} AS "
+            f"SELECT 0 AS pos, {', '.join(quoted)} FROM {table_q} WHERE 1 = 0"
+        )
+    )
+    insert = text(
+        f"INSERT INTO {probe} (pos, {', '.join(quoted)}) "
+        f"VALUES (:pos, {', '.join(':' + p for p in params)})"
+    )
+    join = " AND ".join(f"t.{q} = p.{q}" for q in quoted)
+    select = text(f"SELECT p.pos FROM {probe} p JOIN {table_q} t ON {join}")
+    try:
+        for window in _batches(len(keys), batch_size):
+            rows = [
+                {"pos": pos, **dict(zip(params, row))}
+                for pos, row in zip(range(window.start, window.stop), keys[window])
+            ]
+            connection.execute(insert, rows)
+            found = [row[0] for row in connection.execute(select)]
+            if found:
+                exists[np.asarray(found, dtype=np.int64)] = True
+            connection.execute(text(f"DELETE FROM {probe}"))
+    finally:
+        connection.execute(text(f"DROP TABLE IF EXISTS {probe}"))
+    return exists
+
+
+def _in_list_batch_size(connection: Any, keys: np.ndarray, batch_size: int) -> int:
+    """Filas por consulta IN para no superar ``max_allowed_packet`` (con margen)."""
+
+    packet = _DEFAULT_PACKET_BYTES
+    if connection.dialect.name in ("mysql", "mariadb"):
+        try:
+            packet = int(connection.execute(text("SELECT @@max_allowed_packet")).scalar())
+        except Exception as exc:
+            logger.debug("No se pudo leer max_allowed_packet: %s", exc)
+    sample = keys[:1000]
+    avg_row = (
+        sum(len(v) + 8 if v is not None else 8 for row in sample for v in row) / len(sample)
+        if len(sample)
+        else 64
+    )
+    rows = min(batch_size, MAX_IN_LIST_ROWS, int(packet * 0.5 / max(avg_row, 1)))
+    if connection.dialect.name == "sqlite":
+        # SQLite limita los parámetros por sentencia (32766 desde 3.32).
+        rows = min(rows, 32_000 // max(keys.shape[1], 1))
+    return max(1, rows)
+
+
+def _probe_in_list(
+    connection: Any,
+    table: str,
+    key_columns: Sequence[str],
+    keys: np.ndarray,
+    batch_size: int,
+) -> np.ndarray:
+    quoted = [_quote(connection, c) for c in key_columns]
+    table_q = _quote(connection, table)
+    rows_per_query = _in_list_batch_size(connection, keys, batch_size)
+    found: List[tuple] = []
+    for window in _batches(len(keys), rows_per_query):
+        chunk = keys[window]
+        names = []
+        params = {}
+        for i, row in enumerate(chunk):
+            placeholders = []
+            for j, value in enumerate(row):
+                name = f"p{i}_{j}"
+                params[name] = value
+                placeholders.append(f":{name}")
+            names.append(f"({', '.join(placeholders)})")
+        query = text(
+            f"SELECT {', '.join(quoted)} FROM {table_q} "
+            f"WHERE ({', '.join(quoted)}) IN ({', '.join(names)})"
+        )
+        found.extend(
+            tuple(None if v is None else str(v) for v in row)
+            for row in connection.execute(query, params)
+        )
+    if not found:
+        return np.zeros(len(keys), dtype=bool)
+    existing = set(found)
+    return np.fromiter((tuple(row) in existing for row in keys), dtype=bool, count=len(keys))
+
+
+def missing_keys_mask(
+    connection: Any,
+    table: str,
+    key_columns: Sequence[str],
+    frame: pd.DataFrame,
+    batch_size: int = DEFAULT_PROBE_BATCH_SIZE,
+    method: str = "temp_table",
+) -> np.ndarray:
+    """Máscara booleana por fila de ``frame``: ``True`` si su clave no está en ``table``.
+
+    ``connection`` es una conexión SQLAlchemy abierta (la tabla temporal vive
+    en su sesión). Las filas con algún componente nulo nunca coinciden, igual
+    que en SQL.
+    """
+
+    if frame.empty:
+        return np.zeros(0, dtype=bool)
+    missing_columns = [c for c in key_columns if c not in frame.columns]
+    if missing_columns:
+        raise KeyError(f"El DataFrame no tiene las columnas clave: {missing_columns}")
+    keys = _key_values(frame, key_columns)
+    if method == "temp_table":
+        exists = _probe_temp_table(connection, table, key_columns, keys, batch_size)
+    elif method == "in_list":
+        exists = _probe_in_list(connection, table, key_columns, keys, batch_size)
+    else:
+        raise ValueError(f"Método de comprobación desconocido: {method}")
+    return ~exists
@@ -0,0 +1,165 @@
+"""Resultados de tareas RQ con las partes grandes fuera de Redis.
+
+Las tareas devolvían en el resultado del job la muestra de previsualización
+(``preview_sample``/``preview_headers``), la matriz del dashboard, el
+``performance_report`` del cubo y el traceback completo de los errores. RQ
+guarda ese resultado serializado en Redis durante ``result_ttl`` y cada
+``Job.fetch`` de ``CheckTaskStatusView`` lo deserializa completo.
+
+:func:`detach_large_parts` saca esas claves del resultado cuando en conjunto
+superan ``RESULT_INLINE_LIMIT`` bytes, las guarda como un artefacto JSON
+comprimido con gzip y deja en su lugar una referencia de tamaño fijo::
+
+    {"success": True, "file_path": ..., "detached": {
+        "artifact_id": "…", "keys": ["preview_sample", ...], "bytes": 183204}}
+
+:func:`attach_detached` hace lo inverso y solo lo llaman los endpoints que
+entregan el resultado al navegador. Si el artefacto ya expiró se devuelve el
+resultado sin esas claves.
+
+Las claves anidadas se indican con punto (``metadata.performance_report``).
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from scripts.services.artifact_store import get_artifact_store
+
+logger = logging.getLogger(__name__)
+
+RESULT_INLINE_LIMIT = int(os.getenv("RESULT_INLINE_LIMIT", 4 * 1024))
+DETACHABLE_KEYS: Tuple[str, ...] = (
+    "preview_sample",
+    "preview_headers",
+    "dashboard",
+    "error_details",
+    "metadata.performance_report",
+)
+DETACHED_KEY = "detached"
+
+
+def _json_default(value: Any) -> Any:
+    # Igual que DjangoJSONEncoder: fechas en ISO y el resto (Decimal, UUID) como texto.
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+
+def _lookup(result: Dict[str, Any], dotted: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Diccionario que contiene la clave ``dotted`` y la última parte de la ruta."""
+
+    parent: Any = result
+    *path, leaf = dotted.split(".")
+    for part in path:
+        parent = parent.get(part) if isinstance(parent, dict) else None
+    if not isinstance(parent, dict):
+        return None, leaf
+    return parent, leaf
+
+
+def _copy_path(result: Dict[str, Any], dotted: str) -> Dict[str, Any]:
+    """Copia superficial de los diccionarios intermedios de ``dotted``."""
+
+    out = dict(result)
+    node = out
+    for part in dotted.split(".")[:-1]:
+        if not isinstance(node.get(part), dict):
+            break
+        node[part] = dict(node[part])
+        node = node[part]
+    return out
+
+
+def detach_large_parts(
+    result: Dict[str, Any],
+    name: str = "resultado",
+    owner: Optional[int] = None,
+    keys: Iterable[str] = DETACHABLE_KEYS,
+    limit: int = RESULT_INLINE_LIMIT,
+) -> Dict[str, Any]:
+    """Resultado con las claves grandes movidas a un artefacto gzip.
+
+    Retorna un diccionario nuevo (no modifica ``result``). Si las claves
+    suman menos de ``limit`` bytes, o el resultado ya fue reducido, se
+    retorna tal cual.
+    """
+
+    if not isinstance(result, dict) or DETACHED_KEY in result:
+        return result
+
+    parts: Dict[str, Any] = {}
+    for dotted in keys:
+        parent, leaf = _lookup(result, dotted)
+        if parent is not None and leaf in parent and parent[leaf] not in (None, "", [], {}):
+            parts[dotted] = parent[leaf]
+    if not parts:
+        return result
+
+    payload = _dumps(parts)
+    if len(payload) < limit:
+        return result
+
+    base, _ = os.path.splitext(os.path.basename(name) or "resultado")
+    try:
+        with get_artifact_store().writing(f"{base}.json.gz", owner=owner) as pending:
+            with gzip.open(pending.tmp_path, "wb", compresslevel=6) as fh:
+                fh.write(payload)
+    except Exception as exc:
+        # Sin artefacto el resultado viaja completo, como antes.
+        logger.warning("No se pudo guardar la parte grande del resultado %s: %s", name, exc)
+        return result
+
+    slim = result
+    for dotted in parts:
+        slim = _copy_path(slim, dotted)
+        parent, leaf = _lookup(slim, dotted)
+        parent.pop(leaf, None)
+    slim[DETACHED_KEY] = {
+        "artifact_id": pending.artifact.id,
+        "keys": list(parts),
+        "bytes": len(payload),
+    }
+    logger.debug(
+        "Resultado %s: %s bytes fuera de Redis (%s)", name, len(payload), ", ".join(parts)
+    )
+    return slim
+
+
+def attach_detached(result: Any) -> Any:
+    """Resultado con las claves separadas por :func:`detach_large_parts` restituidas."""
+
+    if not isinstance(result, dict) or DETACHED_KEY not in result:
+        return result
+    ref = result[DETACHED_KEY] or {}
+    full = {k: v for k, v in result.items() if k != DETACHED_KEY}
+    artifact = get_artifact_store().get(ref.get("artifact_id") or "")
+    if artifact is None:
+        logger.warning("La parte grande del resultado (%s) ya no está disponible", ref.get("artifact_id"))
+        return full
+    try:
+        with gzip.open(artifact.path, "rb") as fh:
+            parts: Dict[str, Any] = json.loads(fh.read())
+    except (OSError, ValueError) as exc:
+        logger.warning("No se pudo leer la parte grande del resultado %s: %s", artifact.id, exc)
+        return full
+    for dotted, value in parts.items():
+        full = _copy_path(full, dotted)
+        parent, leaf = _lookup(full, dotted)
+        if parent is None:
+            # El contenedor intermedio (p. ej. ``metadata``) viajaba vacío.
+            node = full
+            for part in dotted.split(".")[:-1]:
+                node = node.setdefault(part, {})
+            parent = node
+        parent[leaf] = value
+    return full
+
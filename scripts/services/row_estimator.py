@@ -0,0 +1,310 @@
+"""Estimación de filas y ETA para los generadores de reportes largos.
+
+``CuboVentas`` no estimaba el total (``total_records_estimate = 0``) y
+Plano/Interface solo conocían las filas de cada hoja al terminar de
+extraerla, de modo que el progreso de la extracción no decía cuánto faltaba.
+Este módulo da una estimación barata desde el inicio y la refina mientras
+llegan los lotes:
+
+* :class:`RunHistory` guarda en Redis las corridas exitosas por tarea y
+  empresa (reporte, días del rango, filas y segundos). Con corridas del
+  mismo reporte se estiman las filas (mediana de filas por día × días del
+  rango, o la mediana directa si hay corridas con el mismo rango) y los
+  segundos por fila. Lo registra ``task_handler`` al terminar cada tarea y
+  lo consulta ``enqueue_task`` para enrutar por filas estimadas.
+* :func:`explain_estimate` multiplica las filas estimadas por ``EXPLAIN``
+  (``rows × filtered``) de las tablas del SELECT principal.
+* :func:`date_index_estimate` pide al optimizador el rango de la columna de
+  fecha (``EXPLAIN SELECT 1 FROM t WHERE fecha BETWEEN :fi AND :ff``); con
+  índice sobre la fecha MariaDB lo calcula con *index dives*, sin leer filas.
+* :class:`EtaTracker` combina la estimación inicial con el ritmo observado:
+  el total nunca queda por debajo de lo ya leído y el ritmo histórico pesa
+  menos a medida que avanza la extracción.
+
+Las consultas de estimación nunca impiden el reporte: ante cualquier error
+se retorna ``None`` y el progreso sigue como antes.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+
+from scripts.services.sql_filters import main_table
+from scripts.services.task_queues import date_span_days
+
+logger = logging.getLogger(__name__)
+
+HISTORY_KEY = "rq:run-history:{task}:{company}"
+HISTORY_LENGTH = int(os.getenv("RUN_HISTORY_LENGTH", 50))
+HISTORY_TTL_SECONDS = int(os.getenv("RUN_HISTORY_TTL", 90 * 24 * 3600))
+# Segundos de extracción antes de confiar en el ritmo observado.
+MIN_OBSERVED_SECONDS = 2.0
+
+_DATE_PREDICATE = re.compile(
+    r"((?:`?\w+`?\.)?`?(\w+)`?)\s*(?:>=|>|BETWEEN)\s*:fi\b", re.IGNORECASE
+)
+
+
+@dataclass(frozen=True)
+class Estimate:
+    """Filas estimadas, de dónde salen y segundos por fila de la corrida completa (si hay historia)."""
+
+    rows: int
+    source: str
+    seconds_per_row: Optional[float] = None
+    samples: int = 0
+
+    @property
+    def seconds(self) -> Optional[float]:
+        if self.seconds_per_row is None:
+            return None
+        return self.rows * self.seconds_per_row
+
+
+def history_connection() -> Any:
+    """Conexión Redis del job RQ en curso (``None`` fuera de un worker)."""
+
+    try:
+        from rq import get_current_job
+    except ImportError:  # pragma: no cover - depende del entorno
+        return None
+    job = get_current_job()
+    return job.connection if job is not None else None
+
+
+class RunHistory:
+    """Corridas recientes por tarea y empresa, en una lista Redis acotada."""
+
+    def __init__(self, connection: Any, clock: Callable[[], float] = time.time) -> None:
+        self.connection = connection
+        self._clock = clock
+
+    @staticmethod
+    def key(task: str, company: str) -> str:
+        return HISTORY_KEY.format(task=task, company=company)
+
+    def record(
+        self,
+        task: str,
+        company: str,
+        report: Any,
+        span_days: Optional[int],
+        rows: int,
+        seconds: float,
+    ) -> None:
+        if not self.connection or not company or rows <= 0 or seconds <= 0:
+            return
+        entry = {
+            "report": None if report is None else str(report),
+            "span_days": span_days,
+            "rows": int(rows),
+            "seconds": round(float(seconds), 3),
+            "finished_at": round(self._clock(), 3),
+        }
+        key = self.key(task, company)
+        try:
+            pipe = self.connection.pipeline(transaction=False)
+            pipe.lpush(key, json.dumps(entry))
+            pipe.ltrim(key, 0, HISTORY_LENGTH - 1)
+            pipe.expire(key, HISTORY_TTL_SECONDS)
+            pipe.execute()
+        except Exception as exc:
+            logger.warning("No se pudo registrar la corrida de %s/%s: %s", task, company, exc)
+
+    def runs(self, task: str, company: str, report: Any = None) -> List[Dict[str, Any]]:
+        """Corridas más recientes primero; con ``report`` solo las de ese reporte."""
+
+        if not self.connection or not company:
+            return []
+        try:
+            raw = self.connection.lrange(self.key(task, company), 0, -1)
+        except Exception as exc:
+            logger.warning("No se pudo leer la historia de %s/%s: %s", task, company, exc)
+            return []
+        wanted = None if report is None else str(report)
+        runs = []
+        for item in raw:
+            try:
+                entry = json.loads(item)
+            except (TypeError, ValueError):
+                continue
+            if wanted is None or entry.get("report") == wanted:
+                runs.append(entry)
+        return runs
+
+    def estimate(
+        self, task: str, company: str, report: Any = None, span_days: Optional[int] = None
+    ) -> Optional[Estimate]:
+        runs = [r for r in self.runs(task, company, report) if r.get("rows") and r.get("seconds")]
+        if not runs:
+            return None
+        same_span = [r for r in runs if span_days is not None and r.get("span_days") == span_days]
+        if same_span:
+            rows = statistics.median(r["rows"] for r in same_span)
+        else:
+            per_day = [r["rows"] / r["span_days"] for r in runs if r.get("span_days")]
+            if not per_day or not span_days:
+                rows = statistics.median(r["rows"] for r in runs)
+            else:
+                rows = statistics.median(per_day) * span_days
+        seconds_per_row = statistics.median(r["seconds"] / r["rows"] for r in runs)
+        return Estimate(int(rows), "historial", seconds_per_row, len(same_span or runs))
+
+
+def history_estimate(task: str, company: str, report: Any, start: Any, end: Any) -> Optional[Estimate]:
+    """Estimación por historia para el rango ``[start, end]`` (``None`` sin corridas previas)."""
+
+    return RunHistory(history_connection()).estimate(task, company, report, date_span_days(start, end))
+
+
+def _explain(connection: Any, query: Any, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    rows = connection.execute(query, params).mappings().all()
+    return [{str(k).lower(): v for k, v in row.items()} for row in rows]
+
+
+def rows_from_explain(explain: Sequence[Dict[str, Any]]) -> Optional[int]:
+    """Filas de salida según ``EXPLAIN``: producto de ``rows × filtered`` del SELECT principal."""
+
+    main = [row for row in explain if str(row.get("id") or "1") == "1"]
+    if not main:
+        return None
+    total = 1.0
+    for row in main:
+        table = str(row.get("table") or "")
+        if table.startswith("tmp_filtro_") or table.startswith("<subquery"):
+            # Valores de filtros (semi-join): restringen filas, no las multiplican.
+            continue
+        rows = row.get("rows")
+        if rows is None:
+            return None
+        filtered = row.get("filtered")
+        factor = float(filtered) / 100 if filtered not in (None, "") else 1.0
+        total *= max(float(rows), 1.0) * min(max(factor, 0.0), 1.0)
+    return int(total)
+
+
+def explain_estimate(explain: Sequence[Dict[str, Any]]) -> Optional[Estimate]:
+    rows = rows_from_explain(explain)
+    return Estimate(rows, "explain") if rows is not None else None
+
+
+def date_column(sql: str) -> Optional[str]:
+    """Columna comparada con ``:fi`` en la consulta (sin alias de tabla)."""
+
+    match = _DATE_PREDICATE.search(sql)
+    return match.group(2) if match else None
+
+
+def date_index_estimate(connection: Any, sql: str, params: Dict[str, Any]) -> Optional[Estimate]:
+    """Filas de la tabla principal en el rango ``[:fi, :ff]`` según el índice de la fecha."""
+
+    table, column = main_table(sql), date_column(sql)
+    if not table or not column or "fi" not in params or "ff" not in params:
+        return None
+    try:
+        explain = _explain(
+            connection,
+            text(f"EXPLAIN SELECT 1 FROM {table} WHERE {column} BETWEEN :fi AND :ff"),
+            {"fi": params["fi"], "ff": params["ff"]},
+        )
+    except Exception as exc:
+        logger.debug("Sin estimación por índice de %s.%s: %s", table, column, exc)
+        return None
+    if not explain or str(explain[0].get("type") or "").lower() not in ("range", "ref", "index_merge"):
+        # Sin índice utilizable la cifra sería el tamaño de la tabla.
+        return None
+    return Estimate(int(explain[0].get("rows") or 0), "indice_fecha")
+
+
+def best_estimate(*estimates: Optional[Estimate]) -> Optional[Estimate]:
+    """La historia manda; entre estimaciones del optimizador (cotas superiores), la menor."""
+
+    available = [e for e in estimates if e is not None and e.rows >= 0]
+    if not available:
+        return None
+    for estimate in available:
+        if estimate.source == "historial":
+            return estimate
+    return min(available, key=lambda e: e.rows)
+
+
+class EtaTracker:
+    """Total estimado y segundos restantes, refinados con las filas ya leídas.
+
+    ``started_at`` es el inicio de la corrida (el ETA histórico cubre la
+    corrida completa); el ritmo observado se mide desde la creación.
+    """
+
+    def __init__(
+        self,
+        estimate: Optional[Estimate],
+        started_at: Optional[float] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.estimate = estimate
+        self._clock = clock
+        self._origin = clock()
+        self.started_at = started_at if started_at is not None else self._origin
+
+    @property
+    def source(self) -> Optional[str]:
+        return self.estimate.source if self.estimate else None
+
+    def total(self, done: int = 0) -> int:
+        estimated = self.estimate.rows if self.estimate else 0
+        return max(estimated, done)
+
+    def fraction(self, done: int) -> float:
+        """Avance de la extracción en ``[0, 1)``; 0 sin estimación."""
+
+        total = self.total(done)
+        if not total or not self.estimate:
+            return 0.0
+        return min(done / total, 0.99)
+
+    def update(self, done: int) -> Tuple[int, Optional[float]]:
+        """``(total_estimado, segundos_restantes)`` tras leer ``done`` filas."""
+
+        total = self.total(done)
+        now = self._clock()
+        observed = now - self._origin
+        history_spr = self.estimate.seconds_per_row if self.estimate else None
+        if done > 0 and observed >= MIN_OBSERVED_SECONDS:
+            observed_spr = observed / done
+            if history_spr is not None:
+                weight = self.fraction(done)
+                spr = weight * observed_spr + (1 - weight) * history_spr
+            else:
+                spr = observed_spr
+            return total, max(0.0, (total - done) * spr)
+        if history_spr is not None and total:
+            # Antes de medir: lo que tarda una corrida de este tamaño menos lo transcurrido.
+            return total, max(0.0, total * history_spr - (now - self.started_at))
+        return total, None
+
+    def remaining_after_extract(self) -> Optional[float]:
+        """ETA al terminar la extracción: el resto de la corrida según la historia."""
+
+        if not self.estimate or self.estimate.seconds is None:
+            return None
+        return max(0.0, self.estimate.seconds - (self._clock() - self.started_at))
+
+    def meta(self, done: int) -> Dict[str, Any]:
+        """Campos de progreso: ``total_records_estimate``, ``eta_seconds`` (calculado en ``eta_at``) y ``estimate_source``."""
+
+        total, eta = self.update(done)
+        return {
+            "total_records_estimate": total,
+            "eta_seconds": None if eta is None else round(eta, 1),
+            "eta_at": round(self._clock(), 3),
+            "estimate_source": self.source,
+        }
@@ -0,0 +1,269 @@
+"""Extracción concurrente de hojas con consumo en el orden configurado.
+
+Las interfaces multi-hoja (``txProcedureInterface``, ``txProcedureExcel``,
+``txProcedureCsv``) ejecutan un ``CALL`` independiente por hoja. Aquí cada
+hoja se ejecuta en un hilo del pool, con su propia conexión del pool de
+SQLAlchemy, y sus filas se vuelcan a un archivo temporal (*spill*) por lotes.
+
+El hilo que llama a :meth:`OrderedSheetExtractor.run` recibe las hojas en el
+orden configurado: la hoja ``n`` se entrega en cuanto termina, aunque la
+``n + 1`` siga ejecutándose, de modo que un único escritor arma el libro o el
+ZIP sin esperar a que terminen todas.
+
+Con ``encoder`` (p. ej. :class:`scripts.services.csv_stream.CsvEncoder`) el
+hilo codifica cada lote del cursor directamente a bytes y el spill guarda el
+archivo ya listo para copiarse (planos CSV), sin pasar por ``DataFrame``.
+
+Los callbacks de progreso se invocan siempre desde el hilo consumidor: el
+``update_job_progress`` de RQ depende de ``get_current_job()``, que solo
+existe en el hilo del job. ``on_progress`` recibe las filas leídas entre
+todas las hojas cada ``progress_interval`` segundos mientras el consumidor
+espera, para refinar la estimación y el ETA (ver
+``scripts.services.row_estimator``) antes de que termine cada hoja.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from scripts.services import task_telemetry as telemetry
+from scripts.services.xlsx_writer import DEFAULT_BATCH_SIZE, iter_result_batches
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def max_workers_from_env() -> int:
+    """Hilos de extracción por reporte (``SHEETS_MAX_WORKERS``, default 4)."""
+
+    try:
+        return max(1, int(os.getenv("SHEETS_MAX_WORKERS", DEFAULT_MAX_WORKERS)))
+    except ValueError:
+        return DEFAULT_MAX_WORKERS
+
+
+@dataclass
+class SheetSpill:
+    """Resultado de extraer una hoja: filas en disco o el error ocurrido."""
+
+    hoja: str
+    hoja_idx: int
+    path: Optional[str] = None
+    columns: List[str] = field(default_factory=list)
+    rows: int = 0
+    elapsed: float = 0.0
+    error: Optional[BaseException] = None
+    # Solo con encoder: (bytes, filas) de cada bloque escrito en el spill.
+    chunks: List[Tuple[int, int]] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def batches(self) -> Iterator[pd.DataFrame]:
+        """Relee los lotes en el mismo orden en que llegaron del cursor."""
+
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as fh:
+            while True:
+                try:
+                    yield pickle.load(fh)
+                except EOFError:
+                    break
+
+    def encoded_chunks(self) -> Iterator[Tuple[bytes, int]]:
+        """Bloques ya codificados con las filas que contiene cada uno."""
+
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as fh:
+            for size, rows in self.chunks:
+                yield fh.read(size), rows
+
+    def to_frame(self) -> pd.DataFrame:
+        """Hoja completa en memoria (solo para escritores que la necesitan)."""
+
+        frames = list(self.batches())
+        if not frames:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def discard(self) -> None:
+        if self.path and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+SheetCallback = Callable[[SheetSpill, int, int], None]
+# Recibe las filas leídas hasta el momento entre todas las hojas.
+RowsCallback = Callable[[int], None]
+# Recibe las columnas del resultado; retorna un objeto con header() y encode(rows).
+EncoderFactory = Callable[[List[str]], Any]
+
+
+class OrderedSheetExtractor:
+    """Ejecuta las consultas de varias hojas en paralelo y las entrega en orden.
+
+    Uso::
+
+        with OrderedSheetExtractor(engine) as extractor:
+            for spill in extractor.run([(hoja, query), ...]):
+                escribir(spill)
+                spill.discard()
+    """
+
+    def __init__(
+        self,
+        engine: Any,
+        max_workers: Optional[int] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        prepare_connection: Optional[Callable[[Any], None]] = None,
+        on_extracted: Optional[SheetCallback] = None,
+        spill_dir: Optional[str] = None,
+        encoder: Optional[EncoderFactory] = None,
+        on_progress: Optional[RowsCallback] = None,
+        progress_interval: float = 2.0,
+    ) -> None:
+        self.engine = engine
+        self.max_workers = max_workers or max_workers_from_env()
+        self.batch_size = batch_size
+        self.prepare_connection = prepare_connection
+        self.on_extracted = on_extracted
+        self.spill_dir = spill_dir or os.getenv("SHEETS_SPILL_DIR") or None
+        self.encoder = encoder
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self._tmpdir: Optional[str] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __enter__(self) -> "OrderedSheetExtractor":
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+        self._tmpdir = tempfile.mkdtemp(prefix="sheets_", dir=self.spill_dir)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._executor is not None:
+            # Las consultas en curso no se pueden interrumpir; las pendientes sí.
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    def run(self, sheets: Sequence[Tuple[str, Any]]) -> Iterator[SheetSpill]:
+        """Lanza todas las hojas y las entrega en el orden de ``sheets``."""
+
+        if self._tmpdir is None:
+            raise RuntimeError("OrderedSheetExtractor debe usarse como context manager")
+        if not sheets:
+            return
+
+        workers = min(self.max_workers, len(sheets))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sheet")
+        # Los spills se crean aquí para que el consumidor vea ``rows`` mientras los hilos leen.
+        spills = [
+            SheetSpill(hoja=hoja, hoja_idx=idx, path=os.path.join(self._tmpdir, f"{idx:03d}.pkl"))
+            for idx, (hoja, _) in enumerate(sheets, start=1)
+        ]
+        futures: List[Future] = [
+            self._executor.submit(self._extract, spill, query)
+            for spill, (_, query) in zip(spills, sheets)
+        ]
+        logger.info("Extrayendo %s hojas con %s hilos", len(futures), workers)
+
+        notified = set()
+        extracted = 0
+        timeout = self.progress_interval if self.on_progress is not None else None
+        reported = -1
+        for future in futures:
+            while True:
+                for done in futures:
+                    if done.done() and done not in notified:
+                        notified.add(done)
+                        extracted += 1
+                        self._notify(done.result(), extracted, len(futures))
+                if future.done():
+                    break
+                wait([f for f in futures if not f.done()], timeout=timeout, return_when=FIRST_COMPLETED)
+                reported = self._report_rows(spills, reported)
+            yield future.result()
+
+    def _notify(self, spill: SheetSpill, extracted: int, total: int) -> None:
+        if self.on_extracted is None:
+            return
+        try:
+            self.on_extracted(spill, extracted, total)
+        except Exception as exc:
+            logger.warning("Error en callback de hoja extraída %s: %s", spill.hoja, exc)
+
+    def _report_rows(self, spills: Sequence[SheetSpill], reported: int) -> int:
+        if self.on_progress is None:
+            return reported
+        rows = sum(spill.rows for spill in spills)
+        if rows != reported:
+            try:
+                self.on_progress(rows)
+            except Exception as exc:
+                logger.warning("Error en callback de progreso de filas: %s", exc)
+        return rows
+
+    def _extract(self, spill: SheetSpill, query: Any) -> SheetSpill:
+        hoja = spill.hoja
+        start = time.perf_counter()
+        try:
+            with self.engine.connect() as conn:
+                if self.prepare_connection is not None:
+                    self.prepare_connection(conn)
+                with telemetry.stage("query"):
+                    result = conn.execution_options(stream_results=True).execute(query)
+                if not result.returns_rows:
+                    return spill
+                spill.columns = list(result.keys())
+                with open(spill.path, "wb") as fh:
+                    if self.encoder is not None:
+                        self._spill_encoded(result, spill, fh)
+                    else:
+                        for batch in telemetry.timed_iter(iter_result_batches(result, self.batch_size)):
+                            pickle.dump(batch, fh, protocol=pickle.HIGHEST_PROTOCOL)
+                            spill.rows += len(batch)
+        except Exception as exc:
+            logger.error("Error extrayendo hoja %s: %s", hoja, exc, exc_info=True)
+            spill.error = exc
+        finally:
+            spill.elapsed = time.perf_counter() - start
+        logger.info("Hoja %s extraída: %s filas en %.2fs", hoja, spill.rows, spill.elapsed)
+        return spill
+
+    def _spill_encoded(self, result: Any, spill: SheetSpill, fh: Any) -> None:
+        encoder = self.encoder(spill.columns)
+        while True:
+            with telemetry.stage("fetch"):
+                rows = result.fetchmany(self.batch_size)
+            if not rows:
+                break
+            if not spill.rows:
+                # El encabezado solo se escribe si la hoja trae filas.
+                header = encoder.header()
+                if header:
+                    fh.write(header)
+                    spill.chunks.append((len(header), 0))
+            with telemetry.stage("transform"):
+                data = encoder.encode(rows)
+            fh.write(data)
+            spill.chunks.append((len(data), len(rows)))
+            spill.rows += len(rows)
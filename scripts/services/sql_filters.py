@@ -0,0 +1,339 @@
+"""Inyección de filtros de permisos en consultas base de reportes.
+
+El cubo (reporte 2) agregaba ``AND idProveedor IN (:prov_0, ...)`` al final
+del texto SQL (o antes del primer ``;``). Si la consulta tenía ``GROUP BY``
+el filtro quedaba después, y si no tenía ``WHERE`` la sentencia quedaba
+inválida. Además se generaba un parámetro por valor.
+
+:func:`inject_predicates` recorre la consulta respetando literales,
+comentarios y paréntesis y ubica las cláusulas del SELECT principal (nivel
+0). Con eso:
+
+* si hay ``WHERE``, la condición existente se envuelve en paréntesis
+  (``WHERE (<cond>) AND <filtros>``), sin alterar la precedencia de sus
+  ``OR``;
+* si no hay ``WHERE``, se agrega uno antes de ``GROUP BY``/``HAVING``/
+  ``ORDER BY``/``LIMIT`` o al final de la sentencia;
+* el marcador ``-- FILTERS_HERE`` sigue teniendo prioridad si la consulta lo
+  trae;
+* con ``UNION`` en el nivel principal la consulta se envuelve como tabla
+  derivada (``SELECT * FROM (...) AS filtrada WHERE ...``).
+
+:func:`build_filter_plan` decide cómo filtrar cada lista: hasta
+``TEMP_TABLE_THRESHOLD`` valores con un ``IN`` expandido por SQLAlchemy
+(``bindparam(expanding=True)``) y, por encima, con una tabla temporal con
+los mismos tipos y collation que la columna filtrada
+(``CREATE TEMPORARY TABLE ... AS SELECT ... WHERE 1 = 0``, como en
+``scripts.services.key_probe``) y ``col IN (SELECT v FROM tmp)``, que
+MariaDB resuelve como semi-join usando el índice de la columna. Las tablas
+temporales viven en la sesión: :meth:`FilterPlan.prepare` y
+:meth:`FilterPlan.release` se llaman sobre la misma conexión que ejecuta la
+consulta.
+
+:func:`explain_plan` ejecuta ``EXPLAIN`` y :func:`full_scans` retorna las
+tablas que el optimizador recorrería completas, para advertirlo en el log
+antes de extraer; el mismo ``EXPLAIN`` sirve para estimar las filas (ver
+``scripts.services.row_estimator``).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.sql.elements import TextClause
+
+logger = logging.getLogger(__name__)
+
+TEMP_TABLE_THRESHOLD = int(os.getenv("SQL_FILTER_TEMP_TABLE_THRESHOLD", 100))
+FULL_SCAN_MIN_ROWS = int(os.getenv("SQL_EXPLAIN_FULL_SCAN_ROWS", 100_000))
+FILTERS_MARKER = "-- FILTERS_HERE"
+
+# Cláusulas que cierran el WHERE del SELECT principal.
+_CLAUSE_END = {"GROUP", "HAVING", "ORDER", "LIMIT", "WINDOW", "FOR", "LOCK", "INTO", "PROCEDURE"}
+_SET_OPERATORS = {"UNION", "INTERSECT", "EXCEPT"}
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_$]*")
+
+
+@dataclass(frozen=True)
+class _Word:
+    upper: str
+    start: int
+    end: int
+
+
+def _scan(sql: str) -> Tuple[List[_Word], int]:
+    """Palabras de nivel 0 (fuera de literales, comentarios y paréntesis) y fin de la sentencia."""
+
+    words: List[_Word] = []
+    depth = 0
+    i = 0
+    n = len(sql)
+    while i < n:
+        c = sql[i]
+        if c in ("'", '"', "`"):
+            j = i + 1
+            while j < n:
+                if sql[j] == "\\" and c != "`":
+                    j += 2
+                    continue
+                if sql[j] == c:
+                    if j + 1 < n and sql[j + 1] == c:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            i = j + 1
+        elif sql.startswith("--", i) or c == "#":
+            j = sql.find("\n", i)
+            i = n if j < 0 else j + 1
+        elif sql.startswith("/*", i):
+            j = sql.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+        elif c == "(":
+            depth += 1
+            i += 1
+        elif c == ")":
+            depth -= 1
+            i += 1
+        elif c == ";" and depth == 0:
+            return words, i
+        elif c.isalpha() or c == "_":
+            match = _IDENTIFIER.match(sql, i)
+            if depth == 0:
+                words.append(_Word(match.group(0).upper(), match.start(), match.end()))
+            i = match.end()
+        else:
+            i += 1
+    return words, n
+
+
+def _main_select(words: List[_Word]) -> List[_Word]:
+    """Palabras del SELECT principal (omite el ``WITH`` inicial, cuyos cuerpos van entre paréntesis)."""
+
+    for idx, word in enumerate(words):
+        if word.upper == "SELECT":
+            return words[idx:]
+    return words
+
+
+def inject_predicates(sql: str, predicates: Sequence[str]) -> str:
+    """``sql`` con ``predicates`` (unidos por ``AND``) en el ``WHERE`` del SELECT principal."""
+
+    if not predicates:
+        return sql
+    condition = " AND ".join(predicates)
+
+    if FILTERS_MARKER in sql:
+        return sql.replace(FILTERS_MARKER, f" AND {condition}\n", 1)
+
+    words, stmt_end = _scan(sql)
+    statement, rest = sql[:stmt_end], sql[stmt_end:]
+    main = _main_select(words)
+
+    if any(w.upper in _SET_OPERATORS for w in main):
+        logger.info("Consulta con UNION: los filtros se aplican sobre la tabla derivada")
+        return f"SELECT * FROM (\n{statement.rstrip()}\n) AS filtrada\nWHERE {condition}{rest}"
+
+    where = next((w for w in main if w.upper == "WHERE"), None)
+    from_word = next((w for w in main if w.upper == "FROM"), None)
+    start_after = where.end if where else (from_word.end if from_word else 0)
+    clause_end = next(
+        (w.start for w in main if w.start >= start_after and w.upper in _CLAUSE_END),
+        len(statement),
+    )
+    head, tail = statement[:clause_end], statement[clause_end:]
+    if where is not None:
+        existing = statement[where.end:clause_end].strip()
+        # Saltos de línea: un comentario "--" al final de la condición no se come el paréntesis.
+        new_head = f"{statement[:where.end]} (\n{existing}\n) AND {condition}\n"
+    else:
+        new_head = f"{head.rstrip()}\nWHERE {condition}\n"
+    return f"{new_head}{tail}{rest}"
+
+
+def main_table(sql: str) -> Optional[str]:
+    """Primera tabla del ``FROM`` del SELECT principal, o ``None`` si es una subconsulta."""
+
+    words, stmt_end = _scan(sql)
+    main = _main_select(words)
+    for idx, word in enumerate(main):
+        if word.upper == "FROM":
+            following = sql[word.end:stmt_end].lstrip()
+            if following.startswith("("):
+                return None
+            match = re.match(r"`?([A-Za-z0-9_$]+)`?(?:\.`?([A-Za-z0-9_$]+)`?)?", following)
+            if not match:
+                return None
+            return ".".join(part for part in match.groups() if part)
+    return None
+
+
+@dataclass(frozen=True)
+class InFilter:
+    """``column IN values``; ``name`` prefija parámetros y tablas temporales."""
+
+    column: str
+    values: Sequence[Any]
+    name: str
+
+
+@dataclass
+class _TempValues:
+    table: str
+    column: str
+    source: Optional[str]
+    values: List[Any]
+
+
+@dataclass
+class FilterPlan:
+    """Consulta filtrada, sus parámetros y las tablas temporales que necesita."""
+
+    sql: str
+    params: Dict[str, Any]
+    expanding: List[str] = field(default_factory=list)
+    temp_tables: List[_TempValues] = field(default_factory=list)
+
+    def query(self, prefix: str = "") -> TextClause:
+        """``TextClause`` listo para ``execute(query, params)``; ``prefix`` permite ``EXPLAIN``."""
+
+        clause = text(f"{prefix}{self.sql}")
+        if self.expanding:
+            clause = clause.bindparams(*(bindparam(name, expanding=True) for name in self.expanding))
+        return clause
+
+    def prepare(self, connection: Any) -> None:
+        """Crea y llena las tablas temporales en la sesión de ``connection``."""
+
+        for temp in self.temp_tables:
+            connection.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {temp.table}"))
+            created = False
+            if temp.source:
+                try:
+                    # Mismo tipo y collation que la columna filtrada: la comparación usa su índice.
+                    connection.execute(
+                        text(
+                            f"CREATE TEMPORARY TABLE {temp.table} AS "
+                            f"SELECT {temp.column} AS v FROM {temp.source} WHERE 1 = 0"
+                        )
+                    )
+                    created = True
+                except Exception as exc:
+                    logger.debug("Tabla temporal %s sin tipo de %s: %s", temp.table, temp.source, exc)
+            if not created:
+                connection.execute(text(f"CREATE TEMPORARY TABLE {temp.table} (v VARCHAR(255))"))
+            connection.execute(
+                text(f"INSERT INTO {temp.table} (v) VALUES (:v)"),
+                [{"v": value} for value in temp.values],
+            )
+            connection.execute(text(f"ALTER TABLE {temp.table} ADD INDEX (v)"))
+
+    @contextmanager
+    def session(self, connection: Any) -> Iterator["FilterPlan"]:
+        """``with plan.session(conn):`` tablas temporales creadas dentro y eliminadas al salir."""
+
+        self.prepare(connection)
+        try:
+            yield self
+        finally:
+            self.release(connection)
+
+    def release(self, connection: Any) -> None:
+        """Elimina las tablas temporales (la conexión vuelve al pool con ellas si no)."""
+
+        for temp in self.temp_tables:
+            try:
+                connection.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {temp.table}"))
+            except Exception as exc:
+                logger.warning("No se pudo eliminar la tabla temporal %s: %s", temp.table, exc)
+
+
+def build_filter_plan(
+    base_sql: str,
+    params: Dict[str, Any],
+    filters: Iterable[InFilter],
+    threshold: int = TEMP_TABLE_THRESHOLD,
+) -> FilterPlan:
+    """Plan para ejecutar ``base_sql`` con los filtros ``IN`` indicados."""
+
+    plan_params = dict(params)
+    predicates: List[str] = []
+    expanding: List[str] = []
+    temp_tables: List[_TempValues] = []
+    source = main_table(base_sql)
+    suffix = uuid.uuid4().hex[:8]
+    for flt in filters:
+        values = list(dict.fromkeys(v for v in flt.values if v is not None))
+        if not values:
+            continue
+        if len(values) > threshold:
+            table = f"tmp_filtro_{flt.name}_{suffix}"
+            temp_tables.append(_TempValues(table, flt.column, source, values))
+            predicates.append(f"{flt.column} IN (SELECT v FROM {table})")
+            logger.info(
+                "Filtro %s: %s valores en tabla temporal %s", flt.column, len(values), table
+            )
+        else:
+            plan_params[flt.name] = values
+            expanding.append(flt.name)
+            predicates.append(f"{flt.column} IN :{flt.name}")
+    return FilterPlan(inject_predicates(base_sql, predicates), plan_params, expanding, temp_tables)
+
+
+def explain_plan(connection: Any, plan: FilterPlan) -> List[Dict[str, Any]]:
+    """Filas de ``EXPLAIN`` de la consulta (claves en minúsculas).
+
+    Debe llamarse después de :meth:`FilterPlan.prepare` en la misma conexión.
+    Si el ``EXPLAIN`` falla se retorna una lista vacía: la verificación nunca
+    impide el reporte.
+    """
+
+    try:
+        rows = connection.execute(plan.query("EXPLAIN "), plan.params).mappings().all()
+    except Exception as exc:
+        logger.debug("EXPLAIN no disponible: %s", exc)
+        return []
+    return [{str(k).lower(): v for k, v in row.items()} for row in rows]
+
+
+def full_scans(explain: Iterable[Dict[str, Any]], min_rows: int = FULL_SCAN_MIN_ROWS) -> List[Dict[str, Any]]:
+    """Filas de ``EXPLAIN`` con recorrido completo (``type = ALL``) de al menos ``min_rows``.
+
+    Las tablas derivadas y temporales no cuentan.
+    """
+
+    scans = []
+    for row in explain:
+        table = str(row.get("table") or "")
+        if str(row.get("type") or "").upper() != "ALL":
+            continue
+        if table.startswith("<") or table.startswith("tmp_filtro_"):
+            continue
+        if int(row.get("rows") or 0) < min_rows:
+            continue
+        scans.append(
+            {
+                "table": table,
+                "rows": int(row.get("rows") or 0),
+                "possible_keys": row.get("possible_keys"),
+                "extra": row.get("extra"),
+            }
+        )
+    return scans
+
+
+def explain_full_scans(
+    connection: Any,
+    plan: FilterPlan,
+    min_rows: int = FULL_SCAN_MIN_ROWS,
+) -> List[Dict[str, Any]]:
+    """:func:`explain_plan` + :func:`full_scans` en una llamada."""
+
+    return full_scans(explain_plan(connection, plan), min_rows)
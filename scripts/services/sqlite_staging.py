@@ -0,0 +1,175 @@
+"""Bases SQLite de staging aisladas por job.
+
+Los cargues y el cubo vuelcan datos intermedios a SQLite. Antes cada clase
+creaba su propio archivo en ``media/`` (o compartía ``mydata.db``) con
+pragmas distintos, nunca lo borraba y algunas fijaban
+``locking_mode = EXCLUSIVE``, lo que bloquea incluso a las otras conexiones
+del mismo pool.
+
+:class:`StagingDatabase` entrega a cada job su propio archivo:
+
+* En ``SQLITE_STAGING_DIR`` o, si no está definido, en ``/dev/shm`` (tmpfs)
+  cuando es escribible y tiene al menos ``SQLITE_STAGING_MIN_FREE_MB`` libres
+  (en Docker ``/dev/shm`` es de 64 MB salvo ``shm_size``); si no, en el
+  directorio temporal del sistema.
+* Con los pragmas aplicados en *cada* conexión del pool (WAL, ``page_size``,
+  ``mmap_size``, ``temp_store`` en memoria, caché y ``busy_timeout``).
+* Con limpieza explícita (``close()`` o ``with``) que elimina el archivo y sus
+  ``-wal``/``-shm``. Los workers RQ terminan el proceso hijo con
+  ``os._exit`` (sin ``atexit``), así que además cada archivo lleva host y PID
+  en el nombre y al crear uno nuevo se barren los de procesos del mismo host
+  que ya no existen.
+"""
+
+from __future__ import annotations
+
+import glob
+import logging
+import os
+import re
+import shutil
+import socket
+import tempfile
+import uuid
+import weakref
+from typing import Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 8192
+DEFAULT_CACHE_KIB = 200_000
+DEFAULT_MMAP_SIZE = 1024 * 1024 * 1024
+DEFAULT_BUSY_TIMEOUT_MS = 60_000
+DEFAULT_MIN_FREE_MB = 1024
+_FILE_PREFIX = "staging_"
+_FILE_RE = re.compile(rf"^{_FILE_PREFIX}([A-Za-z0-9-]+)_(\d+)_")
+_HOST = re.sub(r"[^A-Za-z0-9-]+", "-", socket.gethostname()) or "local"
+_LABEL_RE = re.compile(r"[^A-Za-z0-9_]+")
+
+
+def staging_dir() -> str:
+    """Directorio de staging: ``SQLITE_STAGING_DIR``, tmpfs o el temporal del sistema."""
+
+    configured = os.getenv("SQLITE_STAGING_DIR")
+    if configured:
+        os.makedirs(configured, exist_ok=True)
+        return configured
+    min_free = int(os.getenv("SQLITE_STAGING_MIN_FREE_MB", DEFAULT_MIN_FREE_MB)) * 1024 * 1024
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        if shutil.disk_usage("/dev/shm").free >= min_free:
+            return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_files(path: str) -> None:
+    for candidate in (path, f"{path}-wal", f"{path}-shm", f"{path}-journal"):
+        try:
+            os.remove(candidate)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            logger.warning("No se pudo eliminar %s: %s", candidate, exc)
+
+
+def sweep_orphans(directory: Optional[str] = None) -> int:
+    """Elimina archivos de staging de procesos que ya terminaron."""
+
+    directory = directory or staging_dir()
+    removed = 0
+    for path in glob.glob(os.path.join(directory, f"{_FILE_PREFIX}*.db")):
+        match = _FILE_RE.match(os.path.basename(path))
+        # Solo se juzgan los PID de este host (el directorio puede ser compartido).
+        if not match or match.group(1) != _HOST or _pid_alive(int(match.group(2))):
+            continue
+        _remove_files(path)
+        removed += 1
+    if removed:
+        logger.info("Staging SQLite: %s archivos huérfanos eliminados", removed)
+    return removed
+
+
+def _dispose(engine: Engine, path: str) -> None:
+    engine.dispose()
+    _remove_files(path)
+
+
+class StagingDatabase:
+    """Archivo SQLite privado de un job, con su ``Engine`` y limpieza al cerrar.
+
+    Uso::
+
+        with StagingDatabase("cubo") as staging:
+            df.to_sql("datos", staging.engine)
+    """
+
+    def __init__(
+        self,
+        label: str,
+        directory: Optional[str] = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        cache_kib: int = DEFAULT_CACHE_KIB,
+        mmap_size: int = DEFAULT_MMAP_SIZE,
+    ) -> None:
+        directory = directory or staging_dir()
+        sweep_orphans(directory)
+        safe_label = _LABEL_RE.sub("_", label)[:48] or "job"
+        self.path = os.path.join(
+            directory,
+            f"{_FILE_PREFIX}{_HOST}_{os.getpid()}_{safe_label}_{uuid.uuid4().hex[:12]}.db",
+        )
+        self.engine = create_engine(
+            f"sqlite:///{self.path}",
+            connect_args={"timeout": DEFAULT_BUSY_TIMEOUT_MS / 1000, "check_same_thread": False},
+            pool_size=5,
+            max_overflow=5,
+            pool_pre_ping=True,
+        )
+        pragmas = (
+            # page_size solo tiene efecto antes de crear la primera tabla.
+            f"PRAGMA page_size = {int(page_size)}",
+            "PRAGMA journal_mode = WAL",
+            "PRAGMA synchronous = NORMAL",
+            "PRAGMA temp_store = MEMORY",
+            f"PRAGMA cache_size = -{int(cache_kib)}",
+            f"PRAGMA mmap_size = {int(mmap_size)}",
+            f"PRAGMA busy_timeout = {DEFAULT_BUSY_TIMEOUT_MS}",
+        )
+
+        @event.listens_for(self.engine, "connect")
+        def _apply_pragmas(dbapi_connection, _record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+
+        # Respaldo si el dueño se pierde sin llamar close() (GC o salida normal).
+        self._finalizer = weakref.finalize(self, _dispose, self.engine, self.path)
+        logger.info("Staging SQLite creado en %s", self.path)
+
+    def close(self) -> None:
+        """Cierra las conexiones y elimina el archivo (idempotente)."""
+
+        if self._finalizer.alive:
+            self._finalizer()
+            logger.info("Staging SQLite eliminado: %s", self.path)
+
+    def __enter__(self) -> "StagingDatabase":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
@@ -0,0 +1,491 @@
+"""Clases de colas RQ, reglas de enrutamiento y admisión por empresa.
+
+Todos los workers atendían la cola ``default``: un ``extrae_bi_task`` de
+horas o una actualización de Power BI esperando al servicio externo dejaban
+detrás a reportes rápidos como ``rutero_task`` o ``faltantes_task``. Aquí se
+definen cuatro clases de cola, cada una con su pool de workers dedicado
+(ver ``docker-compose.rq.yml`` y el comando ``rqpool``):
+
+* ``interactive``: reportes que el usuario espera en pantalla.
+* ``bulk_load``: cargues de archivos y tablas hacia la base de la empresa.
+* ``long_extract``: extracciones largas (``extrae_bi``) y reportes cuyo
+  rango o tamaño estimado los saca de la clase interactiva.
+* ``external_wait``: tareas que pasan la mayor parte del tiempo esperando a
+  un servicio externo (refresco de Power BI).
+
+:func:`route_task` elige la cola según el tipo de tarea y, para las tareas
+sensibles al tamaño, según los días del rango o las filas estimadas.
+:class:`CompanyAdmission` limita cuántos jobs de una misma empresa pueden
+estar encolados o en ejecución por clase; el cupo se libera con los
+callbacks de RQ (:func:`release_on_success` / :func:`release_on_failure`);
+si el work-horse muere sin correrlos, :func:`admit` descarta los cupos de
+jobs que RQ ya no ejecuta y, como último respaldo, vencen tras el timeout
+de la clase.
+
+:func:`claim_job` deduplica encolados idénticos (misma tarea y argumentos
+normalizados, p.ej. un doble clic o dos usuarios con los mismos permisos
+pidiendo lo mismo): el segundo pedido recibe el ``job_id`` del que sigue
+activo. Además, las tareas
+de un mismo grupo de conflicto (:data:`CONFLICT_GROUPS`, p.ej. cargue ZIP
+vs. cargue de infoventas) se excluyen por empresa.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+import hashlib
+import json
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis.exceptions import WatchError
+from rq.job import Job
+from rq.utils import utcparse
+
+logger = logging.getLogger(__name__)
+
+QUEUE_INTERACTIVE = "interactive"
+QUEUE_BULK_LOAD = "bulk_load"
+QUEUE_LONG_EXTRACT = "long_extract"
+QUEUE_EXTERNAL_WAIT = "external_wait"
+# Cola histórica: los workers interactivos la siguen atendiendo para drenar
+# jobs encolados antes del cambio y las tareas programadas (limpieza de media).
+QUEUE_LEGACY = "default"
+
+_BASE_TIMEOUT = int(os.getenv("RQ_TASK_TIMEOUT", os.getenv("RQ_DEFAULT_TIMEOUT", 28800)))
+
+ADMISSION_KEY = "rq:admission:{queue}:{company}"
+# Margen sobre el timeout antes de dar por perdido un cupo sin liberar.
+ADMISSION_GRACE_SECONDS = 600
+# Un cupo sin job en Redis es válido este tiempo (entre ``admit`` y el encolado).
+ADMISSION_PENDING_SECONDS = 60
+# Un job ``started`` sin latido del worker en este tiempo se da por muerto
+# (el worker RQ lo actualiza cada ``job_monitoring_interval``, 30 s por defecto).
+ADMISSION_HEARTBEAT_SECONDS = int(os.getenv("RQ_ADMISSION_HEARTBEAT_SECONDS", 600))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+@dataclass(frozen=True)
+class QueueClass:
+    """Configuración de una clase de cola y de su pool de workers."""
+
+    name: str
+    timeout: int
+    company_limit: int
+    # Colas que atiende el pool, en orden de prioridad.
+    listens: Tuple[str, ...]
+    description: str
+
+
+QUEUE_CLASSES: Dict[str, QueueClass] = {
+    QUEUE_INTERACTIVE: QueueClass(
+        name=QUEUE_INTERACTIVE,
+        timeout=_env_int("RQ_INTERACTIVE_TIMEOUT", _BASE_TIMEOUT),
+        company_limit=_env_int("RQ_INTERACTIVE_COMPANY_LIMIT", 3),
+        listens=(QUEUE_INTERACTIVE, QUEUE_LEGACY),
+        description="Reportes que el usuario espera en pantalla",
+    ),
+    QUEUE_BULK_LOAD: QueueClass(
+        name=QUEUE_BULK_LOAD,
+        timeout=_env_int("RQ_BULK_LOAD_TIMEOUT", _BASE_TIMEOUT),
+        # Dos cargues simultáneos sobre la misma base compiten por los mismos locks.
+        company_limit=_env_int("RQ_BULK_LOAD_COMPANY_LIMIT", 1),
+        listens=(QUEUE_BULK_LOAD,),
+        description="Cargues de archivos y tablas maestras",
+    ),
+    QUEUE_LONG_EXTRACT: QueueClass(
+        name=QUEUE_LONG_EXTRACT,
+        timeout=_env_int("RQ_LONG_EXTRACT_TIMEOUT", _BASE_TIMEOUT),
+        company_limit=_env_int("RQ_LONG_EXTRACT_COMPANY_LIMIT", 1),
+        listens=(QUEUE_LONG_EXTRACT,),
+        description="Extracciones largas y reportes de rango amplio",
+    ),
+    QUEUE_EXTERNAL_WAIT: QueueClass(
+        name=QUEUE_EXTERNAL_WAIT,
+        timeout=_env_int("RQ_EXTERNAL_WAIT_TIMEOUT", _BASE_TIMEOUT),
+        company_limit=_env_int("RQ_EXTERNAL_WAIT_COMPANY_LIMIT", 2),
+        listens=(QUEUE_EXTERNAL_WAIT,),
+        description="Tareas que esperan a servicios externos (Power BI)",
+    ),
+}
+
+# Clase base de cada tarea; las no listadas van a la clase interactiva.
+TASK_ROUTES: Dict[str, str] = {
+    "cubo_ventas_task": QUEUE_INTERACTIVE,
+    "matrix_task": QUEUE_INTERACTIVE,
+    "interface_task": QUEUE_INTERACTIVE,
+    "interface_siigo_task": QUEUE_INTERACTIVE,
+    "venta_cero_task": QUEUE_INTERACTIVE,
+    "rutero_task": QUEUE_INTERACTIVE,
+    "preventa_task": QUEUE_INTERACTIVE,
+    "faltantes_task": QUEUE_INTERACTIVE,
+    "plano_task": QUEUE_INTERACTIVE,
+    "cargue_zip_task": QUEUE_BULK_LOAD,
+    "cargue_plano_task": QUEUE_BULK_LOAD,
+    "cargue_infoventas_task": QUEUE_BULK_LOAD,
+    "cargue_maestras_task": QUEUE_BULK_LOAD,
+    "cargue_infoproducto_task": QUEUE_BULK_LOAD,
+    "cargue_tabla_individual_task": QUEUE_BULK_LOAD,
+    "extrae_bi_task": QUEUE_LONG_EXTRACT,
+    "actualiza_bi_task": QUEUE_EXTERNAL_WAIT,
+}
+
+# Tareas interactivas que pasan a long_extract cuando el trabajo es grande.
+SIZE_AWARE_TASKS = frozenset(
+    {"cubo_ventas_task", "matrix_task", "interface_task", "interface_siigo_task", "plano_task", "venta_cero_task"}
+)
+LONG_EXTRACT_MIN_DAYS = _env_int("RQ_LONG_EXTRACT_MIN_DAYS", 93)
+LONG_EXTRACT_MIN_ROWS = _env_int("RQ_LONG_EXTRACT_MIN_ROWS", 2_000_000)
+
+
+# Tareas que escriben las mismas tablas de la empresa: solo una a la vez.
+CONFLICT_GROUPS: Dict[str, frozenset] = {
+    "cargue_ventas": frozenset(
+        {
+            "cargue_zip_task",
+            "cargue_plano_task",
+            "cargue_infoventas_task",
+            "extrae_bi_task",
+        }
+    ),
+    "cargue_maestras": frozenset({"cargue_maestras_task", "cargue_tabla_individual_task"}),
+}
+# Argumentos que no cambian el resultado: no distinguen pedidos duplicados.
+# ``user_id`` sí lo cambia (permisos de proveedor/macrozona): solo se ignora
+# cuando el llamador pasa el alcance de permisos ya resuelto (ver dedup_key).
+DEDUP_IGNORED_ARGS = frozenset({"batch_size"})
+DEDUP_KEY = "rq:dedup:{task}:{digest}"
+COMPANY_LOCK_KEY = "rq:company-lock:{group}:{company}"
+_ACTIVE_JOB_STATUSES = frozenset({"queued", "started", "deferred", "scheduled"})
+
+
+class QueueAdmissionError(Exception):
+    """La empresa ya tiene el máximo de jobs permitidos en la clase de cola."""
+
+    job_id: Optional[str] = None
+
+    def __init__(self, company: str, queue_class: QueueClass, active: int) -> None:
+        self.company = company
+        self.queue_class = queue_class
+        self.active = active
+        super().__init__(
+            f"Ya hay {active} tarea(s) de tipo '{queue_class.description.lower()}' "
+            f"en cola o en ejecución para {company} (máximo {queue_class.company_limit}). "
+            "Espere a que terminen e intente de nuevo."
+        )
+
+
+class QueueConflictError(QueueAdmissionError):
+    """Otra tarea del mismo grupo de conflicto está activa para la empresa."""
+
+    def __init__(self, company: str, group: str, job_id: str) -> None:
+        self.company = company
+        self.group = group
+        self.job_id = job_id
+        Exception.__init__(
+            self,
+            f"Ya hay un proceso de {group.replace('_', ' ')} en curso para {company} "
+            f"(tarea {job_id}). Espere a que termine e intente de nuevo.",
+        )
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value[:10], "%Y-%m-%d").date()
+        except ValueError:
+            return None
+    return None
+
+
+def date_span_days(start: Any, end: Any) -> Optional[int]:
+    """Días del rango ``[start, end]`` (``None`` si alguna fecha no es válida)."""
+
+    start_date, end_date = _parse_date(start), _parse_date(end)
+    if start_date is None or end_date is None:
+        return None
+    return abs((end_date - start_date).days) + 1
+
+
+def route_task(
+    task_name: str,
+    days: Optional[int] = None,
+    estimated_rows: Optional[int] = None,
+) -> str:
+    """Cola donde debe encolarse la tarea según su tipo y tamaño estimado."""
+
+    queue = TASK_ROUTES.get(task_name, QUEUE_INTERACTIVE)
+    if queue == QUEUE_INTERACTIVE and task_name in SIZE_AWARE_TASKS:
+        if estimated_rows is not None and estimated_rows >= LONG_EXTRACT_MIN_ROWS:
+            return QUEUE_LONG_EXTRACT
+        if days is not None and days >= LONG_EXTRACT_MIN_DAYS:
+            return QUEUE_LONG_EXTRACT
+    return queue
+
+
+def admission_key(queue: str, company: str) -> str:
+    return ADMISSION_KEY.format(queue=queue, company=company)
+
+
+class CompanyAdmission:
+    """Cupos por empresa y clase de cola en un sorted set de Redis.
+
+    Cada miembro es un ``job_id`` con score igual a su vencimiento; los
+    vencidos no cuentan, así un worker caído no bloquea la empresa para
+    siempre. La toma del cupo es atómica (``WATCH``/``MULTI``).
+    """
+
+    def __init__(self, connection: Any, clock=time.time) -> None:
+        self.connection = connection
+        self._clock = clock
+
+    def active(self, queue: str, company: str) -> int:
+        return int(self.connection.zcount(admission_key(queue, company), self._clock(), "+inf"))
+
+    def acquire(self, queue: str, company: str, job_id: str, limit: int, ttl: int) -> Tuple[bool, int]:
+        """Reserva un cupo; retorna ``(admitido, jobs activos antes de admitir)``."""
+
+        key = admission_key(queue, company)
+        with self.connection.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    now = self._clock()
+                    active = int(pipe.zcount(key, now, "+inf"))
+                    if active >= limit:
+                        pipe.unwatch()
+                        return False, active
+                    pipe.multi()
+                    pipe.zremrangebyscore(key, "-inf", now)
+                    pipe.zadd(key, {job_id: now + ttl})
+                    pipe.expire(key, int(ttl) + ADMISSION_GRACE_SECONDS)
+                    pipe.execute()
+                    return True, active
+                except WatchError:
+                    # Otro proceso tomó o liberó un cupo entre WATCH y EXEC.
+                    continue
+
+    def release(self, queue: str, company: str, job_id: str) -> None:
+        self.connection.zrem(admission_key(queue, company), job_id)
+
+    def prune(self, queue: str, company: str, ttl: int) -> List[str]:
+        """Quita los cupos de jobs que RQ ya no ejecuta; retorna sus ids.
+
+        Un work-horse muerto (OOM, SIGKILL) no corre los callbacks que liberan
+        el cupo, que de otro modo duraría todo el ``ttl``. Se libera si el job
+        terminó, si su hash ya no existe (pasado :data:`ADMISSION_PENDING_SECONDS`
+        desde la admisión) o si sigue ``started`` sin latido del worker.
+        """
+
+        key = admission_key(queue, company)
+        now = self._clock()
+        stale = []
+        for member, expires_at in self.connection.zrangebyscore(key, now, "+inf", withscores=True):
+            job_id = _decode(member)
+            if _job_lost(self.connection, job_id, admitted_at=expires_at - ttl, now=now):
+                stale.append(job_id)
+        if stale:
+            self.connection.zrem(key, *stale)
+            logger.warning(
+                "Cupos de %s/%s liberados de jobs que ya no se ejecutan: %s", queue, company, ", ".join(stale)
+            )
+        return stale
+
+
+def admit(connection: Any, queue: str, company: str, job_id: str) -> Dict[str, Any]:
+    """Reserva el cupo del job o lanza :class:`QueueAdmissionError`.
+
+    Retorna el bloque que se guarda en ``job.meta["admission"]`` para que los
+    callbacks liberen el cupo.
+    """
+
+    queue_class = QUEUE_CLASSES[queue]
+    ttl = queue_class.timeout + ADMISSION_GRACE_SECONDS
+    admission = CompanyAdmission(connection)
+    admission.prune(queue, company, ttl)
+    admitted, active = admission.acquire(
+        queue,
+        company,
+        job_id,
+        limit=queue_class.company_limit,
+        ttl=ttl,
+    )
+    if not admitted:
+        raise QueueAdmissionError(company, queue_class, active)
+    return {"queue": queue, "company": company}
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_normalize(v) for v in value]
+        return sorted(items, key=repr) if isinstance(value, (set, frozenset)) else items
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def dedup_key(task_name: str, arguments: Dict[str, Any], scope: Optional[Dict[str, Any]] = None) -> str:
+    """Clave de idempotencia: nombre de la tarea y argumentos normalizados.
+
+    Con ``scope`` (los filtros de permisos resueltos del usuario) el
+    ``user_id`` se reemplaza por ese alcance: dos usuarios con los mismos
+    permisos comparten el job y dos con permisos distintos no.
+    """
+
+    relevant = {k: v for k, v in arguments.items() if k not in DEDUP_IGNORED_ARGS}
+    if scope is not None and "user_id" in relevant:
+        del relevant["user_id"]
+        relevant["__scope__"] = scope
+    payload = json.dumps(_normalize(relevant), sort_keys=True, default=str, separators=(",", ":"))
+    digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+    return DEDUP_KEY.format(task=task_name, digest=digest)
+
+
+def conflict_lock_keys(task_name: str, company: Optional[str]) -> List[str]:
+    if not company:
+        return []
+    return [
+        COMPANY_LOCK_KEY.format(group=group, company=company)
+        for group, tasks in sorted(CONFLICT_GROUPS.items())
+        if task_name in tasks
+    ]
+
+
+def _decode(value: Any) -> Optional[str]:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def _job_active(connection: Any, job_id: Optional[str]) -> bool:
+    if not job_id:
+        return False
+    return _decode(connection.hget(Job.key_for(job_id), "status")) in _ACTIVE_JOB_STATUSES
+
+
+def _job_lost(connection: Any, job_id: str, admitted_at: float, now: float) -> bool:
+    """El job de un cupo ya no se ejecuta ni se ejecutará (ver :meth:`CompanyAdmission.prune`)."""
+
+    status, heartbeat = (_decode(v) for v in connection.hmget(Job.key_for(job_id), "status", "last_heartbeat"))
+    if status is None:
+        return now - admitted_at >= ADMISSION_PENDING_SECONDS
+    if status not in _ACTIVE_JOB_STATUSES:
+        return True
+    if status == "started" and heartbeat:
+        try:
+            # rq guarda el latido en UTC sin zona: sin tzinfo se leería como hora local.
+            last_beat = utcparse(heartbeat).replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            return False
+        return now - last_beat >= ADMISSION_HEARTBEAT_SECONDS
+    return False
+
+
+def claim_job(
+    connection: Any,
+    task_name: str,
+    arguments: Dict[str, Any],
+    job_id: str,
+    ttl: int,
+    company: Optional[str] = None,
+    scope: Optional[Dict[str, Any]] = None,
+) -> Tuple[Optional[str], List[str]]:
+    """Reserva la clave de idempotencia y los locks de conflicto del job.
+
+    Retorna ``(job_id_existente, claves)``: si ya hay un job activo con la
+    misma tarea y argumentos se retorna su id y nada se reserva; si no, el
+    primer valor es ``None`` y ``claves`` son las reservadas (van a
+    ``job.meta["claims"]`` para liberarlas al terminar). Lanza
+    :class:`QueueConflictError` si otra tarea del grupo está activa para la
+    empresa. Las claves de jobs ya terminados se consideran libres.
+    ``scope`` se pasa a :func:`dedup_key`.
+    """
+
+    key = dedup_key(task_name, arguments, scope)
+    lock_keys = conflict_lock_keys(task_name, company)
+    with connection.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key, *lock_keys)
+                existing = _decode(pipe.get(key))
+                if _job_active(pipe, existing):
+                    pipe.unwatch()
+                    return existing, []
+                for lock_key in lock_keys:
+                    holder = _decode(pipe.get(lock_key))
+                    if _job_active(pipe, holder):
+                        pipe.unwatch()
+                        group = lock_key.split(":")[2]
+                        raise QueueConflictError(company, group, holder)
+                pipe.multi()
+                for claimed in (key, *lock_keys):
+                    pipe.set(claimed, job_id, ex=int(ttl))
+                pipe.execute()
+                return None, [key, *lock_keys]
+            except WatchError:
+                continue
+
+
+def release_claims(connection: Any, job_id: str, keys: List[str]) -> None:
+    """Borra las claves reservadas que aún pertenecen al job."""
+
+    for key in keys:
+        if _decode(connection.get(key)) == job_id:
+            connection.delete(key)
+
+
+def release_job(job: Any, connection: Any = None) -> None:
+    """Libera el cupo y las claves registrados en ``job.meta`` (idempotente)."""
+
+    meta = getattr(job, "meta", None) or {}
+    connection = connection or job.connection
+    admission = meta.get("admission")
+    try:
+        if admission:
+            CompanyAdmission(connection).release(admission["queue"], admission["company"], job.id)
+        release_claims(connection, job.id, meta.get("claims") or [])
+    except Exception as exc:
+        logger.warning("No se pudo liberar el cupo del job %s: %s", job.id, exc)
+
+
+def release_on_success(job: Any, connection: Any, result: Any, *args, **kwargs) -> None:
+    release_job(job, connection)
+
+
+def release_on_failure(job: Any, connection: Any, *exc_info, **kwargs) -> None:
+    release_job(job, connection)
+
+
+# Pool de un solo worker que atiende todas las colas (desarrollo local).
+POOL_ALL = "all"
+
+
+def worker_queues(pool: str) -> Tuple[str, ...]:
+    """Colas que atiende el pool de workers de la clase ``pool``.
+
+    :data:`POOL_ALL` retorna todas, en el orden de prioridad de las clases.
+    """
+
+    if pool == POOL_ALL:
+        queues: List[str] = []
+        for queue_class in QUEUE_CLASSES.values():
+            queues.extend(q for q in queue_class.listens if q not in queues)
+        return tuple(queues)
+    try:
+        return QUEUE_CLASSES[pool].listens
+    except KeyError:
+        raise ValueError(
+            f"Pool de workers desconocido: {pool}. Opciones: {', '.join([*QUEUE_CLASSES, POOL_ALL])}"
+        ) from None
@@ -0,0 +1,202 @@
+"""Telemetría estructurada por corrida de tarea RQ.
+
+``CuboVentas`` armaba un texto de rendimiento que solo se mostraba una vez y
+el resto de las tareas dejaba los tiempos en ``print``. Aquí cada corrida
+acumula en un :class:`TaskTelemetry`:
+
+* segundos por etapa (:data:`STAGES`: ``query``, ``fetch``, ``transform``,
+  ``write``, ``upload``), medidos con :func:`stage` / :func:`timed_iter`
+  desde los generadores (también desde los hilos de extracción: los tiempos
+  de hilos en paralelo se suman);
+* filas y bytes producidos (``metadata.total_records`` y el archivo del
+  resultado, los fija ``task_handler``);
+* espera en la base de datos: tiempo dentro de ``cursor.execute`` de los
+  ``Engine`` de SQLAlchemy (salvo el staging SQLite), medido con eventos
+  del motor;
+* pico de memoria (RSS) del proceso del job.
+
+``task_handler`` activa la telemetría al iniciar el job y la persiste al
+terminar (ver ``apps.monitor.telemetry``). Fuera de un job no hay
+telemetría activa y las mediciones no hacen nada.
+
+RQ ejecuta cada job en un proceso hijo (*work horse*), así que hay a lo sumo
+una telemetría activa por proceso y el pico de ``ru_maxrss`` es el del job.
+"""
+
+from __future__ import annotations
+
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Optional, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import resource
+
+    RESOURCE_AVAILABLE = True
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+    RESOURCE_AVAILABLE = False
+
+try:
+    import psutil
+
+    PSUTIL_AVAILABLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    psutil = None
+    PSUTIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("query", "fetch", "transform", "write", "upload")
+
+T = TypeVar("T")
+
+_active: Optional["TaskTelemetry"] = None
+_active_lock = threading.Lock()
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Pico de RSS del proceso en MB (``ru_maxrss``; RSS actual si no está disponible)."""
+
+    if RESOURCE_AVAILABLE:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reporta KB; macOS, bytes.
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    if PSUTIL_AVAILABLE:
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+    return None
+
+
+class TaskTelemetry:
+    """Mediciones de una corrida; los métodos son seguros entre hilos."""
+
+    def __init__(self, task_name: str, job_id: Optional[str] = None, clock=time.perf_counter) -> None:
+        self.task_name = task_name
+        self.job_id = job_id
+        self.started_at = time.time()
+        self._clock = clock
+        self._start = clock()
+        self._lock = threading.Lock()
+        self.stages: Dict[str, float] = {}
+        self.db_wait = 0.0
+        self.db_queries = 0
+        self.duration: Optional[float] = None
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_db_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.db_wait += seconds
+            self.db_queries += 1
+
+    def finish(self, rows: int = 0, size: int = 0) -> Dict[str, Any]:
+        """Cierra la medición y retorna el registro con las filas y bytes del resultado."""
+
+        self.duration = self._clock() - self._start
+        with self._lock:
+            return {
+                "task_name": self.task_name,
+                "job_id": self.job_id,
+                "started_at": self.started_at,
+                "duration": round(self.duration, 3),
+                "stages": {name: round(self.stages[name], 3) for name in self.stages},
+                "rows": int(rows or 0),
+                "bytes": int(size or 0),
+                "db_wait": round(self.db_wait, 3),
+                "db_queries": self.db_queries,
+                "peak_rss_mb": _peak_rss_mb(),
+            }
+
+
+def activate(telemetry: Optional[TaskTelemetry]) -> None:
+    """Fija (o con ``None`` limpia) la telemetría del proceso."""
+
+    global _active
+    _install_db_listeners()
+    with _active_lock:
+        _active = telemetry
+
+
+def current() -> Optional[TaskTelemetry]:
+    return _active
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """``with stage("write"):`` suma la duración del bloque a la etapa."""
+
+    telemetry = _active
+    if telemetry is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        telemetry.add_stage(name, time.perf_counter() - start)
+
+
+def timed_iter(iterable: Iterable[T], name: str = "fetch") -> Iterator[T]:
+    """Itera ``iterable`` sumando a la etapa solo el tiempo de producir cada elemento."""
+
+    iterator = iter(iterable)
+    while True:
+        telemetry = _active
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            if telemetry is not None:
+                telemetry.add_stage(name, time.perf_counter() - start)
+            return
+        if telemetry is not None:
+            telemetry.add_stage(name, time.perf_counter() - start)
+        yield item
+
+
+_listeners_installed = False
+
+
+def _install_db_listeners() -> None:
+    """Mide la espera en ``cursor.execute`` de todos los motores (una sola vez por proceso)."""
+
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    _listeners_installed = True
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        # El staging SQLite local no es espera de la base de datos.
+        if _active is not None and conn.dialect.name != "sqlite":
+            conn.info.setdefault("telemetry_start", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("telemetry_start")
+        if starts:
+            elapsed = time.perf_counter() - starts.pop()
+            telemetry = _active
+            if telemetry is not None:
+                telemetry.add_db_wait(elapsed)
+
+    @event.listens_for(Engine, "handle_error")
+    def _error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("telemetry_start"):
+            conn.info["telemetry_start"].pop()
+
+
+def summary(stages: Dict[str, float]) -> str:
+    """Etapas en orden como ``query 1.2s, fetch 30.5s, ...`` para los reportes de texto."""
+
+    ordered = [name for name in STAGES if name in stages] + sorted(set(stages) - set(STAGES))
+    return ", ".join(f"{name} {stages[name]:.1f}s" for name in ordered)
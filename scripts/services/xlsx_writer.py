@@ -0,0 +1,309 @@
+"""Escritor XLSX en streaming compartido por los generadores de reportes.
+
+Usa ``xlsxwriter`` en modo ``constant_memory``: cada fila se vuelca a un
+archivo temporal apenas se escribe la siguiente, así que la memoria del
+proceso no crece con el número de filas (a diferencia de openpyxl en modo
+normal, que conserva un objeto por celda hasta guardar).
+
+El escritor consume lotes (``DataFrame`` o filas de un cursor) y aplica una
+coerción vectorizada por columna antes de escribir:
+
+* ``Decimal`` → ``float`` para que Excel trate los valores como números.
+* Limpieza de caracteres de control que invalidan el XML del libro.
+* ``NaN``/``NaT``/``None`` → celda vacía.
+
+Soporta varias hojas en el mismo libro; si una hoja supera el límite de
+filas de Excel se continúa automáticamente en ``"<hoja> (2)"``.
+
+Restricción de ``constant_memory``: las filas de una hoja deben escribirse en
+orden, por eso el escritor solo permite *agregar* filas al final.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import pandas as pd
+import xlsxwriter
+
+logger = logging.getLogger(__name__)
+
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_MAX_SHEET_NAME = 31
+DEFAULT_BATCH_SIZE = 10_000
+
+# Mismos rangos que openpyxl considera ilegales (conserva \t, \n y \r).
+_ILLEGAL_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_INVALID_SHEET_CHARS_RE = re.compile(r"[\[\]:*?/\\]")
+
+BatchCallback = Callable[[str, int, int], None]
+
+
+def iter_result_batches(result: Any, batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[pd.DataFrame]:
+    """Convierte un ``CursorResult`` de SQLAlchemy en lotes ``DataFrame``.
+
+    Para que el cursor no traiga todo el resultado a memoria la conexión debe
+    ejecutarse con ``execution_options(stream_results=True)``.
+    """
+
+    columns = list(result.keys())
+    while True:
+        rows = result.fetchmany(batch_size)
+        if not rows:
+            break
+        yield pd.DataFrame.from_records(rows, columns=columns)
+
+
+def coerce_frame(
+    df: pd.DataFrame,
+    text_columns: Optional[Iterable[str]] = None,
+    all_text: bool = False,
+) -> pd.DataFrame:
+    """Normaliza tipos de un lote para escribirlo en Excel.
+
+    Las columnas en ``text_columns`` (o todas si ``all_text``) se escriben como
+    texto, p. ej. códigos con ceros a la izquierda.
+    """
+
+    forced_text = set(df.columns) if all_text else set(text_columns or ())
+    coerced: Dict[Any, pd.Series] = {}
+    for column in df.columns:
+        series = df[column]
+        if column in forced_text:
+            coerced[column] = _clean_text(_as_text(series))
+        elif series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+            coerced[column] = _coerce_object(series)
+        elif isinstance(series.dtype, pd.DatetimeTZDtype):
+            coerced[column] = series.dt.tz_localize(None)
+        else:
+            coerced[column] = series
+    return pd.DataFrame(coerced, index=df.index, columns=df.columns)
+
+
+def _as_text(series: pd.Series) -> pd.Series:
+    mask = series.notna()
+    result = series.astype(object)
+    result[mask] = series[mask].astype(str)
+    return result
+
+
+def _coerce_object(series: pd.Series) -> pd.Series:
+    non_null = series.dropna()
+    if non_null.empty:
+        return series
+    sample = non_null.iloc[0]
+    if isinstance(sample, Decimal):
+        try:
+            return series.astype(float)
+        except (TypeError, ValueError):
+            # Columna mixta: solo se convierten los Decimal.
+            return series.map(lambda v: float(v) if isinstance(v, Decimal) else v)
+    if isinstance(sample, str):
+        return _clean_text(series)
+    if isinstance(sample, (bytes, bytearray)):
+        return _clean_text(series.map(_decode_bytes))
+    return series
+
+
+def _decode_bytes(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode("utf-8", errors="replace")
+    return value
+
+
+def _clean_text(series: pd.Series) -> pd.Series:
+    # .str ignora los valores no-string (quedan como NaN): se conservan los originales.
+    cleaned = series.str.replace(_ILLEGAL_CHARS_RE, "", regex=True)
+    return cleaned.where(cleaned.notna(), series)
+
+
+def _safe_sheet_name(name: str) -> str:
+    cleaned = _INVALID_SHEET_CHARS_RE.sub("_", str(name)).strip("'") or "Hoja"
+    return cleaned[:EXCEL_MAX_SHEET_NAME]
+
+
+@dataclass
+class _SheetState:
+    worksheet: Any
+    columns: List[str]
+    next_row: int = 1
+    part: int = 1
+
+
+@dataclass
+class SheetStats:
+    rows: int = 0
+    parts: List[str] = field(default_factory=list)
+
+
+class StreamingXlsxWriter:
+    """Libro XLSX de memoria constante con una o varias hojas.
+
+    Uso típico::
+
+        with StreamingXlsxWriter(path) as writer:
+            with engine.connect() as conn:
+                result = conn.execution_options(stream_results=True).execute(query)
+                writer.write_batches("Datos", iter_result_batches(result))
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_rows_per_sheet: int = EXCEL_MAX_ROWS,
+        header_bold: bool = True,
+    ) -> None:
+        self.path = path
+        self.max_rows_per_sheet = max_rows_per_sheet
+        self._workbook = xlsxwriter.Workbook(
+            path,
+            {
+                "constant_memory": True,
+                "strings_to_numbers": False,
+                "strings_to_formulas": False,
+                "strings_to_urls": False,
+                "remove_timezone": True,
+                "default_date_format": "yyyy-mm-dd",
+            },
+        )
+        self._header_format = self._workbook.add_format({"bold": True}) if header_bold else None
+        self._datetime_format = self._workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+        self._sheets: Dict[str, _SheetState] = {}
+        self.stats: Dict[str, SheetStats] = {}
+        self._closed = False
+
+    # ------------------------------------------------------------------
+    # Contexto
+    # ------------------------------------------------------------------
+    def __enter__(self) -> "StreamingXlsxWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if not self._sheets:
+            # xlsxwriter crea una hoja vacía, pero se deja explícito el nombre.
+            self._workbook.add_worksheet("Hoja1")
+        self._workbook.close()
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+    @property
+    def total_rows(self) -> int:
+        return sum(stat.rows for stat in self.stats.values())
+
+    def ensure_sheet(self, sheet: str, columns: Sequence[Any]) -> None:
+        """Crea la hoja con encabezados aunque no lleguen filas."""
+
+        if sheet not in self._sheets:
+            self._open_sheet(sheet, [str(c) for c in columns])
+
+    def write_frame(
+        self,
+        sheet: str,
+        df: pd.DataFrame,
+        text_columns: Optional[Iterable[str]] = None,
+        all_text: bool = False,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> int:
+        """Agrega ``df`` al final de ``sheet``; retorna las filas escritas."""
+
+        self.ensure_sheet(sheet, df.columns)
+        written = 0
+        for start in range(0, len(df), batch_size):
+            batch = coerce_frame(df.iloc[start : start + batch_size], text_columns, all_text)
+            written += self._append_rows(sheet, batch)
+        return written
+
+    def write_batches(
+        self,
+        sheet: str,
+        batches: Iterable[pd.DataFrame],
+        text_columns: Optional[Iterable[str]] = None,
+        all_text: bool = False,
+        on_batch: Optional[BatchCallback] = None,
+        columns: Optional[Sequence[Any]] = None,
+    ) -> int:
+        """Consume lotes (p. ej. de :func:`iter_result_batches`) y los agrega a ``sheet``.
+
+        ``on_batch(sheet, indice_lote, filas_acumuladas)`` se invoca tras cada
+        lote escrito. ``columns`` permite crear la hoja con encabezados aunque
+        el resultado venga vacío.
+        """
+
+        if columns is not None:
+            self.ensure_sheet(sheet, columns)
+        written = 0
+        for idx, batch in enumerate(batches):
+            if batch.empty:
+                self.ensure_sheet(sheet, batch.columns)
+                continue
+            written += self.write_frame(
+                sheet, batch, text_columns=text_columns, all_text=all_text, batch_size=len(batch)
+            )
+            if on_batch is not None:
+                on_batch(sheet, idx, written)
+        return written
+
+    def write_result(
+        self,
+        sheet: str,
+        result: Any,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        **kwargs: Any,
+    ) -> int:
+        """Atajo para escribir un ``CursorResult`` por lotes de ``fetchmany``."""
+
+        kwargs.setdefault("columns", list(result.keys()))
+        return self.write_batches(sheet, iter_result_batches(result, batch_size), **kwargs)
+
+    # ------------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------------
+    def _open_sheet(self, sheet: str, columns: List[str], part: int = 1) -> _SheetState:
+        base = _safe_sheet_name(sheet)
+        if part > 1:
+            suffix = f" ({part})"
+            base = base[: EXCEL_MAX_SHEET_NAME - len(suffix)] + suffix
+        worksheet = self._workbook.add_worksheet(base)
+        worksheet.write_row(0, 0, columns, self._header_format)
+        state = _SheetState(worksheet=worksheet, columns=columns, part=part)
+        self._sheets[sheet] = state
+        self.stats.setdefault(sheet, SheetStats()).parts.append(base)
+        return state
+
+    def _append_rows(self, sheet: str, batch: pd.DataFrame) -> int:
+        state = self._sheets[sheet]
+        # Las fechas puras usan ``default_date_format``; solo las columnas con hora
+        # se reescriben con formato de fecha-hora.
+        datetime_cols = [
+            i
+            for i, (_, series) in enumerate(batch.items())
+            if pd.api.types.is_datetime64_any_dtype(series.dtype)
+            and (series.dropna() != series.dropna().dt.normalize()).any()
+        ]
+        # object + None: xlsxwriter omite las celdas vacías sin formato.
+        values = batch.astype(object).where(batch.notna(), None)
+        write_row = state.worksheet.write_row
+        write_datetime = state.worksheet.write_datetime
+        for row in values.itertuples(index=False, name=None):
+            if state.next_row >= self.max_rows_per_sheet:
+                state = self._open_sheet(sheet, state.columns, state.part + 1)
+                write_row = state.worksheet.write_row
+                write_datetime = state.worksheet.write_datetime
+            write_row(state.next_row, 0, row)
+            for col in datetime_cols:
+                if row[col] is not None:
+                    write_datetime(state.next_row, col, row[col], self._datetime_format)
+            state.next_row += 1
+        self.stats[sheet].rows += len(values)
+        return len(values)
@@ -0,0 +1,90 @@
+// ---------Seguimiento del progreso de tareas RQ-----------
+// Escucha el stream SSE de la tarea (task_progress_stream) y, si el servidor
+// no lo ofrece (responde 204) o el navegador no soporta EventSource, consulta
+// cada pocos segundos el estado barato (task_progress). Cuando la tarea
+// termina llama a onDone una sola vez: ahí la página pide el resultado final
+// a check_task_status.
+var _taskProgressWatchers = {};
+
+function watchTaskProgress(taskId, options) {
+  if (_taskProgressWatchers[taskId]) {
+    return _taskProgressWatchers[taskId];
+  }
+  var onProgress = options.onProgress || function () {};
+  var onDone = options.onDone || function () {};
+  var pollInterval = options.pollInterval || 3000;
+  var source = null;
+  var pollTimer = null;
+  var finished = false;
+  var received = false;
+
+  function stop() {
+    if (source) source.close();
+    if (pollTimer) clearTimeout(pollTimer);
+    source = null;
+    pollTimer = null;
+    delete _taskProgressWatchers[taskId];
+  }
+
+  function finish(payload) {
+    if (finished) return;
+    finished = true;
+    stop();
+    onDone(payload);
+  }
+
+  function handle(payload) {
+    if (payload.done) {
+      finish(payload);
+    } else {
+      onProgress(payload);
+    }
+  }
+
+  function poll() {
+    pollTimer = null;
+    var xhr = new XMLHttpRequest();
+    xhr.open("GET", options.statusUrl + "?t=" + new Date().getTime(), true);
+    xhr.onreadystatechange = function () {
+      if (this.readyState !== XMLHttpRequest.DONE || finished) return;
+      if (this.status === 200) {
+        try {
+          handle(JSON.parse(this.responseText));
+        } catch (e) {
+          console.error("Error procesando task_progress:", e, this.responseText);
+        }
+      }
+      if (!finished) pollTimer = setTimeout(poll, pollInterval);
+    };
+    xhr.send();
+  }
+
+  function listen() {
+    source = new EventSource(options.streamUrl);
+    source.addEventListener("progress", function (event) {
+      received = true;
+      handle(JSON.parse(event.data));
+    });
+    source.addEventListener("done", function (event) {
+      received = true;
+      finish(JSON.parse(event.data));
+    });
+    source.onerror = function () {
+      // Con CONNECTING el navegador reintenta solo (fin normal del stream).
+      // CLOSED sin eventos indica 204/error: se pasa a consultar el estado.
+      if (source && source.readyState === EventSource.CLOSED) {
+        source = null;
+        if (!finished && !received) poll();
+        else if (!finished) listen();
+      }
+    };
+  }
+
+  if (window.EventSource && options.streamUrl) {
+    listen();
+  } else {
+    poll();
+  }
+  _taskProgressWatchers[taskId] = { stop: stop };
+  return _taskProgressWatchers[taskId];
+}